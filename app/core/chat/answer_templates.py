@@ -0,0 +1,109 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Template-rendered answers for single-value financial results
+'''
+
+import re
+from typing import Any, Dict, Optional
+
+from app.core.database.metric_classification import classify_metric, get_metric_type_info
+
+# Answer templates keyed on metric type; {date} is appended with DATE_SUFFIX when the result has one
+TEMPLATES = {
+    'value': "{company}'s {consolidation} {metric} for {term} was {value}",
+    'ratio': "{company}'s {consolidation} {metric} for {term} stood at {value}",
+    'per_share': "{company}'s {consolidation} {metric} for {term} was {value} per share",
+    'growth': "{company}'s {consolidation} {metric} for {term} was {value}",
+    'ttm': "{company}'s {consolidation} trailing twelve-month {metric} was {value}",
+}
+DATE_SUFFIX = " (period ended {date})"
+
+GROWTH_GROUPS = (2, 5)
+PERCENT_GROUPS = (2, 3, 4, 5)
+PER_SHARE_NAMES = ('eps', 'earnings per share')
+PER_SHARE_SUFFIX = re.compile(r'\s*(?:per share|/share|per-share)\s*$', re.IGNORECASE)
+
+
+def metric_type(metric: str, term: Optional[str] = None) -> str:
+    """
+    Template key for a metric: 'growth', 'per_share', 'ttm', 'ratio' or 'value'
+
+    Args:
+        metric: Metric name as asked or as returned by the database
+        term: Term of the result; 'TTM' selects the trailing twelve-month template
+
+    Returns:
+        Key of TEMPLATES
+    """
+    is_dissection, group_id, _ = get_metric_type_info(metric)
+    if is_dissection and group_id in GROWTH_GROUPS:
+        return 'growth'
+    if (is_dissection and group_id == 1) or metric.strip().lower() in PER_SHARE_NAMES:
+        return 'per_share'
+    if isinstance(term, str) and term.strip().upper() == 'TTM':
+        return 'ttm'
+    if classify_metric(metric) == 'ratio' or (is_dissection and group_id in PERCENT_GROUPS):
+        return 'ratio'
+    return 'value'
+
+
+def format_value(value: float, unit: Optional[str], percent: bool = False, signed: bool = False) -> str:
+    """
+    Format a value with thousands separators and its unit
+
+    Args:
+        value: Numeric value
+        unit: Unit from the database, may be empty
+        percent: Whether a value without unit is a percentage
+        signed: Whether to show the sign of positive values (growth rates)
+
+    Returns:
+        Formatted value, e.g. '4,000.00 PKR mn' or '+12.50%'
+    """
+    number = f"{value:+,.2f}" if signed else f"{value:,.2f}"
+    unit = unit.strip() if isinstance(unit, str) else ''
+    if unit == '%' or (not unit and percent):
+        return f"{number}%"
+    return f"{number} {unit}" if unit else number
+
+
+def render_answer(financial_data: Dict[str, Any], metric: Optional[str] = None) -> Optional[str]:
+    """
+    Render the answer for a single-value result of get_financial_data without the LLM
+
+    Args:
+        financial_data: Result of FinancialDatabase.get_financial_data
+        metric: Metric as the user asked for it; classifies dissection metrics whose database
+            name is the underlying head
+
+    Returns:
+        One-sentence answer, or None when the result is not a single value
+    """
+    value = financial_data.get('value')
+    if 'error' in financial_data or value is None or not financial_data.get('company'):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    name = financial_data.get('metric') or metric or ''
+    kind = metric_type(metric or name, financial_data.get('term'))
+    _, group_id, _ = get_metric_type_info(metric or name)
+    if kind == 'per_share':
+        name = PER_SHARE_SUFFIX.sub('', metric or name)
+    elif kind == 'growth' and metric:
+        name = metric
+
+    answer = TEMPLATES[kind].format(
+        company=financial_data['company'],
+        consolidation=str(financial_data.get('consolidation') or '').lower() or 'reported',
+        metric=name,
+        term=financial_data.get('term') or 'the period',
+        value=format_value(value, financial_data.get('unit'), percent=group_id in PERCENT_GROUPS,
+                           signed=kind == 'growth'),
+    )
+    if financial_data.get('date'):
+        answer += DATE_SUFFIX.format(date=financial_data['date'])
+    return answer + "."
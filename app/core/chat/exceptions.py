@@ -0,0 +1,40 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Exceptions raised by the Mistral inference worker pool
+'''
+
+from typing import Optional
+
+
+class InferenceError(Exception):
+    """
+    Base class for errors raised by InferencePool
+    """
+
+
+class InferenceQueueFull(InferenceError):
+    """
+    Every worker is busy and the request queue is at capacity
+    """
+
+    def __init__(self, capacity: int, timeout: Optional[float]):
+        self.capacity = capacity
+        self.timeout = timeout
+        super().__init__(f"Inference queue full ({capacity} requests) after {timeout} s")
+
+
+class InferenceTimeout(InferenceError):
+    """
+    A request passed its deadline, queued or while generating, and was cancelled
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        super().__init__(f"Inference cancelled after {timeout} s deadline")
+
+
+class InferenceCancelled(InferenceError):
+    """
+    A request was cancelled by the caller before it finished
+    """
@@ -0,0 +1,493 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Process-isolated Mistral inference workers behind a bounded request queue
+'''
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils import logger
+from app.core.chat.exceptions import InferenceCancelled, InferenceError, InferenceQueueFull, InferenceTimeout
+
+# Outcome a worker reports for a request
+DONE, CANCELLED, EXPIRED, FAILED, READY, TOKEN = 'done', 'cancelled', 'expired', 'failed', 'ready', 'token'
+OUTCOME_COUNTERS = {DONE: 'completed', CANCELLED: 'cancelled', EXPIRED: 'expired', FAILED: 'failed'}
+
+
+def load_model(model_path: str, threads: int):
+    """
+    Load the GGUF model with ctransformers in CPU mode, generating with a fixed thread count
+
+    Args:
+        model_path: Path to the Mistral model file
+        threads: Number of threads the model generates with
+
+    Returns:
+        ctransformers model
+    """
+    import ctransformers
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+    return ctransformers.AutoModelForCausalLM.from_pretrained(model_path, model_type="mistral", gpu_layers=0,
+                                                              threads=threads)
+
+
+def _worker_main(loader: Callable, model_path: str, threads: int, requests, results, cancel_flags) -> None:
+    """
+    Worker process: load the model once, then generate for the requests sent on its pipe until
+    the None sentinel
+
+    Tokens are streamed so the cancel flag of the request's slot and its deadline are checked
+    between tokens; every request gets exactly one result, preceded by its tokens when the
+    caller streams.
+    """
+    try:
+        llm = loader(model_path, threads)
+    except Exception as e:
+        results.send((None, FAILED, f"{type(e).__name__}: {e}"))
+        return
+    results.send((None, READY, os.getpid()))
+
+    while True:
+        try:
+            item = requests.recv()
+        except EOFError:
+            return
+        if item is None:
+            return
+        slot, prompt, generation, deadline, stream = item
+        if cancel_flags[slot]:
+            results.send((slot, CANCELLED, None))
+            continue
+        if deadline is not None and time.time() > deadline:
+            results.send((slot, EXPIRED, None))
+            continue
+        try:
+            tokens = []
+            status = DONE
+            for token in llm(prompt, stream=True, **generation):
+                tokens.append(token)
+                if stream:
+                    results.send((slot, TOKEN, token))
+                if cancel_flags[slot]:
+                    status = CANCELLED
+                    break
+                if deadline is not None and time.time() > deadline:
+                    status = EXPIRED
+                    break
+            results.send((slot, status, ''.join(tokens)))
+        except Exception as e:
+            results.send((slot, FAILED, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """
+    One worker process, the parent's ends of its request / result pipes, and the slot it is
+    generating for (None while idle)
+    """
+
+    def __init__(self, context, name: str, loader: Callable, model_path: str, threads: int, cancel_flags):
+        request_reader, self.requests = context.Pipe(duplex=False)
+        self.results, result_writer = context.Pipe(duplex=False)
+        self.process = context.Process(target=_worker_main, daemon=True, name=name,
+                                       args=(loader, model_path, threads, request_reader, result_writer,
+                                             cancel_flags))
+        self.process.start()
+        # The worker holds its own copies; closing ours lets recv() see EOF when it exits
+        request_reader.close()
+        result_writer.close()
+        self.ready = False
+        self.slot: Optional[int] = None
+
+    def close(self) -> None:
+        self.requests.close()
+        self.results.close()
+
+
+class InferencePool:
+    """
+    Pool of worker processes, each holding its own copy of the model
+
+    Generation runs outside the server process, so it neither holds the server's GIL nor
+    blocks its event loop. At most workers + queue_size requests are in flight; each one holds
+    a slot whose shared flag cancels it, and a deadline after which the worker drops it.
+
+    Requests wait in the pool's backlog and are sent to an idle worker one at a time, so the
+    pool knows which request each worker is running. A worker that dies (a crash in the model
+    library, an OOM kill) fails that request, frees its slot and is replaced by a new process.
+    """
+
+    def __init__(self, model_path: str, workers: int = 2, threads: int = 4, queue_size: int = 8,
+                 timeout: Optional[float] = 120.0, queue_timeout: float = 0.0,
+                 loader: Callable = load_model, start_timeout: float = 600.0):
+        """
+        Start the worker processes and wait until each has loaded the model
+
+        Args:
+            model_path: Path to the Mistral model file
+            workers: Number of worker processes
+            threads: Generation threads per worker
+            queue_size: Requests that may wait while every worker is generating
+            timeout: Default deadline of a request in seconds, None for no deadline
+            queue_timeout: Seconds submit waits for a free slot before raising InferenceQueueFull
+            loader: Picklable function (model_path, threads) -> model, run in each worker
+            start_timeout: Seconds to wait for the workers to load the model
+
+        Raises:
+            InferenceError: If a worker could not load the model in time
+        """
+        if workers < 1:
+            raise ValueError("InferencePool needs at least one worker")
+        self.context = multiprocessing.get_context('spawn')
+        self.model_path = model_path
+        self.loader = loader
+        self.workers = workers
+        self.threads = threads
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.cancel_flags = self.context.RawArray('b', self.capacity)
+        # Wakes the dispatcher out of wait() when the pool closes
+        self.wakeup_reader, self.wakeup = self.context.Pipe(duplex=False)
+
+        self.lock = threading.Condition()
+        self.free_slots = list(range(self.capacity))
+        self.pending: Dict[int, Future] = {}
+        # Submitted requests no worker has taken yet, oldest first
+        self.backlog = deque()
+        self.counters = {'submitted': 0, 'completed': 0, 'rejected': 0, 'expired': 0, 'cancelled': 0, 'failed': 0,
+                         'respawned': 0}
+        self.closed = False
+        self.spawned = 0
+
+        self.pool_workers: List[_Worker] = [self._spawn() for _ in range(workers)]
+        try:
+            self._wait_ready(start_timeout)
+        except Exception:
+            self._stop_workers()
+            raise
+
+        self.dispatcher = threading.Thread(target=self._dispatch, name="inference-dispatcher", daemon=True)
+        self.dispatcher.start()
+        logger.info(f"Inference pool started: {workers} workers x {threads} threads, {queue_size} queued requests")
+
+    @property
+    def processes(self) -> List[multiprocessing.Process]:
+        return [worker.process for worker in self.pool_workers]
+
+    def _spawn(self) -> _Worker:
+        """Start a worker process; it reports READY on its result pipe once the model is loaded"""
+        name = f"inference-worker-{self.spawned}"
+        self.spawned += 1
+        return _Worker(self.context, name, self.loader, self.model_path, self.threads, self.cancel_flags)
+
+    def _wait_ready(self, start_timeout: float) -> None:
+        """Block until every worker reported the model loaded"""
+        deadline = time.monotonic() + start_timeout
+        for worker in self.pool_workers:
+            try:
+                if not worker.results.poll(max(deadline - time.monotonic(), 0)):
+                    raise InferenceError(f"Inference workers did not load the model within {start_timeout} s")
+                _, status, detail = worker.results.recv()
+            except EOFError:
+                raise InferenceError(f"Inference worker exited with code {worker.process.exitcode} "
+                                     f"while loading the model")
+            if status != READY:
+                raise InferenceError(f"Inference worker could not load the model: {detail}")
+            worker.ready = True
+
+    def _assign(self) -> None:
+        """Send backlog requests to idle workers; called with the lock held"""
+        for worker in self.pool_workers:
+            if not self.backlog:
+                return
+            if not worker.ready or worker.slot is not None:
+                continue
+            request = self.backlog.popleft()
+            try:
+                worker.requests.send(request)
+            except OSError:
+                # The worker is exiting; the dispatcher replaces it once its sentinel fires
+                self.backlog.appendleft(request)
+                worker.ready = False
+                continue
+            worker.slot = request[0]
+
+    def _dispatch(self) -> None:
+        """
+        Resolve the future of each result the workers report and free its slot, and replace
+        workers whose process exited
+        """
+        while True:
+            with self.lock:
+                workers = list(self.pool_workers)
+            sources = {self.wakeup_reader: None}
+            for worker in workers:
+                sources[worker.results] = worker
+                sources[worker.process.sentinel] = worker
+            ready = wait(list(sources))
+            if self.wakeup_reader in ready:
+                return
+            exited = []
+            for source in ready:
+                worker = sources[source]
+                # Results the worker sent before exiting are read before its exit is handled
+                if not self._receive(worker) or source == worker.process.sentinel:
+                    exited.append(worker)
+            for worker in dict.fromkeys(exited):
+                self._worker_exited(worker)
+
+    def _receive(self, worker: _Worker) -> bool:
+        """Handle every message waiting on a worker's result pipe; False once the pipe is closed"""
+        try:
+            while worker.results.poll():
+                self._handle(worker, worker.results.recv())
+        except (EOFError, OSError):
+            return False
+        return True
+
+    def _handle(self, worker: _Worker, message) -> None:
+        slot, status, text = message
+        if status == READY:
+            with self.lock:
+                worker.ready = True
+                self._assign()
+            return
+        if slot is None:
+            logger.error(f"Inference worker {worker.process.name} could not load the model: {text}")
+            return
+        if status == TOKEN:
+            with self.lock:
+                future = self.pending.get(slot)
+            if future is not None and future.tokens is not None:
+                future.tokens.put(text)
+            return
+        with self.lock:
+            future = self.pending.pop(slot, None)
+            worker.slot = None
+            self.free_slots.append(slot)
+            self.counters[OUTCOME_COUNTERS[status]] += 1
+            self._assign()
+            self.lock.notify()
+        self._resolve(future, status, text)
+
+    def _worker_exited(self, worker: _Worker) -> None:
+        """
+        Fail the request a dead worker was running, free its slot and start a replacement
+
+        A worker that exits before loading the model is not replaced, so a model that cannot
+        load does not respawn forever; once no worker is left, queued requests fail too.
+        """
+        worker.process.join(5)
+        exitcode = worker.process.exitcode
+        with self.lock:
+            if worker not in self.pool_workers:
+                return
+            index = self.pool_workers.index(worker)
+            slot = worker.slot
+            future = self.pending.pop(slot, None) if slot is not None else None
+            if slot is not None:
+                self.free_slots.append(slot)
+                self.counters['failed'] += 1
+            failed = []
+            if self.closed:
+                del self.pool_workers[index]
+            elif worker.ready:
+                self.pool_workers[index] = self._spawn()
+                self.counters['respawned'] += 1
+            else:
+                del self.pool_workers[index]
+                if not self.pool_workers:
+                    failed = [self.pending.pop(request[0]) for request in self.backlog]
+                    self.free_slots.extend(request[0] for request in self.backlog)
+                    self.backlog.clear()
+                    self.counters['failed'] += len(failed)
+            self.lock.notify_all()
+        worker.close()
+        if not self.closed:
+            logger.error(f"Inference worker {worker.process.name} exited with code {exitcode}"
+                         + (f" while generating for slot {slot}" if slot is not None else "")
+                         + (", starting a replacement" if worker.ready else ""))
+        self._resolve(future, FAILED, f"Inference worker exited with code {exitcode}")
+        for future in failed:
+            self._resolve(future, FAILED, "No inference worker could load the model")
+
+    def _resolve(self, future: Optional[Future], status: str, text: Optional[str]) -> None:
+        """Set the outcome a request ended with on its future"""
+        if future is None or future.done():
+            return
+        if future.tokens is not None:
+            future.tokens.put(None)
+        if status == DONE:
+            future.set_result(text)
+        elif status == EXPIRED:
+            future.set_exception(InferenceTimeout(future.timeout))
+        elif status == CANCELLED:
+            future.set_exception(InferenceCancelled("Inference request cancelled"))
+        else:
+            future.set_exception(InferenceError(f"Inference failed: {text}"))
+
+    def submit(self, prompt: str, timeout: Optional[float] = None, queue_timeout: Optional[float] = None,
+               stream: bool = False, **generation: Any) -> Future:
+        """
+        Queue a prompt for the next free worker
+
+        Args:
+            prompt: Formatted prompt
+            timeout: Deadline in seconds from now; defaults to the pool timeout
+            queue_timeout: Seconds to wait for a free slot; defaults to the pool queue_timeout
+            stream: Whether the worker sends each token as it is generated, to future.tokens
+            **generation: Generation parameters for the model (max_new_tokens, temperature, ...)
+
+        Returns:
+            Future resolving to the generated text
+
+        Raises:
+            InferenceQueueFull: If no slot became free within queue_timeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        queue_timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        with self.lock:
+            if not self.lock.wait_for(lambda: self.free_slots or self.closed, queue_timeout):
+                self.counters['rejected'] += 1
+                raise InferenceQueueFull(self.capacity, queue_timeout)
+            if self.closed:
+                raise InferenceError("Inference pool is closed")
+            if not self.pool_workers:
+                raise InferenceError("No inference worker is running")
+            slot = self.free_slots.pop()
+            self.cancel_flags[slot] = 0
+            future = Future()
+            future.slot = slot
+            future.timeout = timeout
+            future.tokens = queue.Queue() if stream else None
+            self.pending[slot] = future
+            self.counters['submitted'] += 1
+            deadline = time.time() + timeout if timeout is not None else None
+            self.backlog.append((slot, prompt, generation, deadline, stream))
+            self._assign()
+        return future
+
+    def cancel(self, future: Future) -> bool:
+        """
+        Cancel a submitted request; a queued request is skipped and a running one stops at the next token
+
+        Args:
+            future: Future returned by submit
+
+        Returns:
+            True if the request had not finished yet
+        """
+        with self.lock:
+            if self.pending.get(future.slot) is not future:
+                return False
+            self.cancel_flags[future.slot] = 1
+        return True
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **generation: Any) -> str:
+        """
+        Generate text for a prompt, waiting at most until the request's deadline
+
+        Args:
+            prompt: Formatted prompt
+            timeout: Deadline in seconds; defaults to the pool timeout
+            **generation: Generation parameters for the model
+
+        Returns:
+            Generated text
+
+        Raises:
+            InferenceQueueFull: If the queue stayed full
+            InferenceTimeout: If the deadline passed before generation finished
+        """
+        future = self.submit(prompt, timeout=timeout, **generation)
+        try:
+            return future.result(timeout=future.timeout)
+        except FutureTimeoutError:
+            self.cancel(future)
+            raise InferenceTimeout(future.timeout)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **generation: Any) -> Iterator[str]:
+        """
+        Generate text for a prompt, yielding tokens as the worker produces them
+
+        Closing the iterator early, e.g. when the client disconnected, cancels the request.
+
+        Args:
+            prompt: Formatted prompt
+            timeout: Deadline in seconds; defaults to the pool timeout
+            **generation: Generation parameters for the model
+
+        Yields:
+            Generated tokens
+
+        Raises:
+            InferenceQueueFull: If the queue stayed full
+            InferenceTimeout: If the deadline passed before generation finished
+        """
+        future = self.submit(prompt, timeout=timeout, stream=True, **generation)
+        deadline = time.monotonic() + future.timeout if future.timeout is not None else None
+        try:
+            while True:
+                try:
+                    token = future.tokens.get(timeout=max(deadline - time.monotonic(), 0) if deadline else None)
+                except queue.Empty:
+                    raise InferenceTimeout(future.timeout)
+                if token is None:
+                    break
+                yield token
+            # Raises the outcome of a request that expired, was cancelled or failed
+            future.result()
+        finally:
+            if not future.done():
+                self.cancel(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker layout, queue occupancy and request outcome counters"""
+        with self.lock:
+            return {'workers': self.workers, 'threads': self.threads, 'capacity': self.capacity,
+                    'in_flight': self.capacity - len(self.free_slots),
+                    'alive': sum(process.is_alive() for process in self.processes), **self.counters}
+
+    def _stop_workers(self, timeout: float = 5.0) -> None:
+        with self.lock:
+            workers = list(self.pool_workers)
+        for worker in workers:
+            try:
+                worker.requests.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def close(self) -> None:
+        """Cancel outstanding requests and stop the workers"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for slot in self.pending:
+                self.cancel_flags[slot] = 1
+            self.lock.notify_all()
+        self._stop_workers()
+        self.wakeup.send(None)
+        self.dispatcher.join()
+        with self.lock:
+            pending, self.pending = list(self.pending.values()), {}
+            self.backlog.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(InferenceCancelled("Inference pool closed"))
+            if future.tokens is not None:
+                future.tokens.put(None)
@@ -5,20 +5,45 @@ Description: Mistral model integration for the FinRAG system
 '''
 
 import os
-from typing import Dict, List, Optional, Tuple, Any
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 from utils import logger
 import ctransformers
 
+from conf import config
+from app.core.chat.answer_templates import render_answer
+from app.core.chat.exceptions import InferenceQueueFull
+from app.core.chat.inference_pool import InferencePool
+
+# Generation parameters for chat and RAG answers
+GENERATION = {'max_new_tokens': 512, 'temperature': 0.7, 'top_p': 0.95, 'repetition_penalty': 1.1}
+
+BUSY_MESSAGE = "I'm sorry, the model is busy with other questions right now. Please try again shortly."
+
 class MistralChat:
-    def __init__(self, model_path: str = "Mistral-7B-Instruct-v0.1.Q4_K_M.gguf"):
+    def __init__(self, model_path: str = "Mistral-7B-Instruct-v0.1.Q4_K_M.gguf", workers: Optional[int] = None):
         """
         Initialize the Mistral model for chat
         
+        With workers > 0 the model runs in an InferencePool of worker processes; with 0 it
+        is loaded in this process and requests take turns generating.
+        
         Args:
             model_path: Path to the Mistral model file
+            workers: Number of inference worker processes; defaults to config.INFERENCE_WORKERS
         """
         self.model_path = model_path
-        self.llm = self._load_model()
+        workers = config.INFERENCE_WORKERS if workers is None else workers
+        self.pool = None
+        self.llm = None
+        if workers > 0:
+            self.pool = InferencePool(model_path, workers=workers, threads=config.INFERENCE_THREADS,
+                                      queue_size=config.INFERENCE_QUEUE_SIZE, timeout=config.INFERENCE_TIMEOUT,
+                                      queue_timeout=config.INFERENCE_QUEUE_TIMEOUT)
+        else:
+            self.llm = self._load_model()
+        # The ctransformers model is not thread-safe; concurrent requests take turns generating
+        self.lock = threading.Lock()
         
     def _load_model(self):
         """
@@ -43,6 +68,44 @@ class MistralChat:
             logger.error(f"Error loading Mistral model: {e}")
             raise
     
+    def _generate(self, prompt: str) -> str:
+        """
+        Generate text for a formatted prompt on the worker pool, or in-process under the lock
+        
+        Args:
+            prompt: Formatted prompt
+            
+        Returns:
+            Generated text
+        """
+        if self.pool is not None:
+            return self.pool.generate(prompt, **GENERATION)
+        with self.lock:
+            return self.llm(prompt, **GENERATION)
+    
+    def _generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Generate text for a formatted prompt, yielding tokens as they are produced
+        
+        Args:
+            prompt: Formatted prompt
+            
+        Yields:
+            Generated tokens
+        """
+        if self.pool is not None:
+            yield from self.pool.stream(prompt, **GENERATION)
+            return
+        with self.lock:
+            yield from self.llm(prompt, stream=True, **GENERATION)
+    
+    def close(self):
+        """
+        Stop the inference workers
+        """
+        if self.pool is not None:
+            self.pool.close()
+    
     def _format_prompt(self, messages: List[Dict[str, str]]) -> str:
         """
         Format messages into a prompt for Mistral
@@ -106,13 +169,12 @@ class MistralChat:
             prompt = self._format_prompt(messages)
             
             # Generate response
-            response = self.llm(prompt, 
-                               max_new_tokens=512,
-                               temperature=0.7,
-                               top_p=0.95,
-                               repetition_penalty=1.1)
+            response = self._generate(prompt)
             
             return response.strip()
+        except InferenceQueueFull as e:
+            logger.warning(f"Rejected request: {e}")
+            return BUSY_MESSAGE
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return f"I'm sorry, I encountered an error: {str(e)}"
@@ -133,24 +195,74 @@ class MistralChat:
             prompt = self._format_rag_prompt(context, question)
             
             # Generate response
-            response = self.llm(prompt, 
-                               max_new_tokens=512,
-                               temperature=0.7,
-                               top_p=0.95,
-                               repetition_penalty=1.1)
+            response = self._generate(prompt)
             
             return response.strip()
+        except InferenceQueueFull as e:
+            logger.warning(f"Rejected request: {e}")
+            return BUSY_MESSAGE
         except Exception as e:
             logger.error(f"Error generating RAG response: {e}")
             return f"I'm sorry, I encountered an error: {str(e)}"
     
-    def financial_rag_response(self, financial_data: Dict[str, Any], question: str) -> str:
+    def rag_chat_stream(self, context: str, question: str) -> Iterator[str]:
+        """
+        Generate a response with RAG context, yielding tokens as Mistral produces them
+        
+        Args:
+            context: Retrieved context information
+            question: User's question
+            
+        Yields:
+            Response tokens; an apology replaces the rest of the answer on error
+        """
+        try:
+            started = False
+            for token in self._generate_stream(self._format_rag_prompt(context, question)):
+                # Mistral opens its answer with whitespace, which rag_chat strips
+                if not started:
+                    token = token.lstrip()
+                    started = bool(token)
+                if token:
+                    yield token
+        except InferenceQueueFull as e:
+            logger.warning(f"Rejected request: {e}")
+            yield BUSY_MESSAGE
+        except Exception as e:
+            logger.error(f"Error generating RAG response: {e}")
+            yield f"I'm sorry, I encountered an error: {str(e)}"
+    
+    def _format_financial_context(self, financial_data: Dict[str, Any]) -> str:
+        """
+        Format a get_financial_data result as RAG context
+        
+        Args:
+            financial_data: Dictionary with financial data
+            
+        Returns:
+            Context lines for the RAG prompt
+        """
+        context = f"Company: {financial_data['company']}\n"
+        context += f"Metric: {financial_data['metric']}\n"
+        context += f"Period: {financial_data['term']}\n"
+        context += f"Type: {financial_data['consolidation']}\n"
+        context += f"Value: {financial_data['value']} {financial_data['unit']}\n"
+        context += f"Date: {financial_data['date']}\n"
+        return context
+    
+    def financial_rag_response(self, financial_data: Dict[str, Any], question: str, metric: Optional[str] = None,
+                               narrate: Optional[bool] = None) -> str:
         """
         Generate a response for financial data using RAG
         
+        Single-value results are answered from a template unless narration is requested;
+        only then does Mistral restate the value.
+        
         Args:
             financial_data: Dictionary with financial data
             question: User's question
+            metric: Metric as the user asked for it, used to pick the answer template
+            narrate: Whether Mistral writes the answer; defaults to config.ANSWER_NARRATION
             
         Returns:
             Formatted response with financial data
@@ -159,13 +271,38 @@ class MistralChat:
         if "error" in financial_data:
             return f"I'm sorry, I couldn't retrieve the financial information: {financial_data['error']}"
         
-        # Format the financial data as context
-        context = f"Company: {financial_data['company']}\n"
-        context += f"Metric: {financial_data['metric']}\n"
-        context += f"Period: {financial_data['term']}\n"
-        context += f"Type: {financial_data['consolidation']}\n"
-        context += f"Value: {financial_data['value']} {financial_data['unit']}\n"
-        context += f"Date: {financial_data['date']}\n"
+        if not (config.ANSWER_NARRATION if narrate is None else narrate):
+            answer = render_answer(financial_data, metric)
+            if answer is not None:
+                return answer
         
         # Generate response using RAG
-        return self.rag_chat(context, question)
\ No newline at end of file
+        return self.rag_chat(self._format_financial_context(financial_data), question)
+    
+    def financial_rag_response_stream(self, financial_data: Dict[str, Any], question: str,
+                                      metric: Optional[str] = None, narrate: Optional[bool] = None) -> Iterator[str]:
+        """
+        Streaming variant of financial_rag_response
+        
+        A templated answer is yielded whole; a narrated one token by token.
+        
+        Args:
+            financial_data: Dictionary with financial data
+            question: User's question
+            metric: Metric as the user asked for it, used to pick the answer template
+            narrate: Whether Mistral writes the answer; defaults to config.ANSWER_NARRATION
+            
+        Yields:
+            Response text chunks
+        """
+        if "error" in financial_data:
+            yield self.financial_rag_response(financial_data, question)
+            return
+        
+        if not (config.ANSWER_NARRATION if narrate is None else narrate):
+            answer = render_answer(financial_data, metric)
+            if answer is not None:
+                yield answer
+                return
+        
+        yield from self.rag_chat_stream(self._format_financial_context(financial_data), question)
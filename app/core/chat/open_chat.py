@@ -27,6 +27,18 @@ class OpenChat:
         print(result)
         return result
 
+    def chat_stream(self,messages):
+        """流式生成, 逐段返回模型输出的文本"""
+        logger.info(str(messages))
+        completion = self.client.chat.completions.create(
+        model="qwen-plus",
+        messages=messages,
+        stream=True
+        )
+        for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 if __name__=="__main__":
     oc = OpenChat()
     raw_messsages = [
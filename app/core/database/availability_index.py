@@ -0,0 +1,277 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: In-memory data-availability index over the raw data tables
+'''
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery
+
+logger = logging.getLogger(__name__)
+
+# Table family -> raw data table
+AVAILABILITY_TABLES = {
+    'regular': 'tbl_financialrawdata',
+    'quarter': 'tbl_financialrawdata_Quarter',
+    'ttm': 'tbl_financialrawdataTTM',
+    'ratio': 'tbl_ratiorawdata',
+    'dissection': 'tbl_disectionrawdata',
+    'dissection_quarter': 'tbl_disectionrawdata_Quarter',
+    'dissection_ttm': 'tbl_disectionrawdataTTM',
+    'dissection_ratio': 'tbl_disectionrawdata_Ratios',
+}
+
+DISSECTION_FAMILIES = {'dissection', 'dissection_quarter', 'dissection_ttm', 'dissection_ratio'}
+
+# Period date column per table family, also the incremental refresh watermark
+# (dissection tables report FinDate where the financial and ratio tables have PeriodEnd)
+DATE_COLUMNS = {
+    'regular': 'PeriodEnd',
+    'quarter': 'PeriodEnd',
+    'ttm': 'PeriodEnd',
+    'ratio': 'PeriodEnd',
+    'dissection': 'FinDate',
+    'dissection_quarter': 'FinDate',
+    'dissection_ttm': 'FinDate',
+    'dissection_ratio': 'FinDate',
+}
+
+# Seconds between incremental refreshes
+REFRESH_INTERVAL_SECONDS = 600
+# Seconds between full rebuilds; the incremental refresh only reads periods at or after the
+# watermark, so rows filed late for an older period are picked up by the next rebuild
+REBUILD_INTERVAL_SECONDS = 6 * 3600
+
+# Key layout (high to low bits): CompanyID | SubHeadID | DisectionGroupID | ConsolidationID
+# Wildcards on the low fields become contiguous ranges of the sorted key array
+CONSOLIDATION_BITS = 4
+GROUP_BITS = 12
+SUB_HEAD_BITS = 24
+COMPANY_BITS = 20
+
+GROUP_SHIFT = CONSOLIDATION_BITS
+SUB_HEAD_SHIFT = GROUP_SHIFT + GROUP_BITS
+COMPANY_SHIFT = SUB_HEAD_SHIFT + SUB_HEAD_BITS
+
+
+def pack_keys(company_ids, sub_head_ids, consolidation_ids, group_ids=None) -> np.ndarray:
+    """
+    Pack id columns into sorted, unique int64 keys
+
+    Raises:
+        ValueError: If any id does not fit its bit field
+    """
+    fields = [
+        (np.asarray(company_ids, dtype=np.int64), COMPANY_BITS, COMPANY_SHIFT, 'CompanyID'),
+        (np.asarray(sub_head_ids, dtype=np.int64), SUB_HEAD_BITS, SUB_HEAD_SHIFT, 'SubHeadID'),
+        (np.asarray(consolidation_ids, dtype=np.int64), CONSOLIDATION_BITS, 0, 'ConsolidationID'),
+    ]
+    if group_ids is not None:
+        fields.append((np.asarray(group_ids, dtype=np.int64), GROUP_BITS, GROUP_SHIFT, 'DisectionGroupID'))
+
+    keys = np.zeros(len(fields[0][0]), dtype=np.int64)
+    for values, bits, shift, name in fields:
+        if len(values) and (values.min() < 0 or values.max() >= (1 << bits)):
+            raise ValueError(f"{name} out of range for availability key ({bits} bits)")
+        keys |= values << shift
+    return np.unique(keys)
+
+
+class AvailabilityIndex:
+    """
+    Which (CompanyID, SubHeadID, ConsolidationID[, DisectionGroupID]) combinations have
+    at least one row, per raw data table.
+
+    Each table is held as one sorted int64 array, so an existence check is a binary
+    search and consolidation / dissection group can be left as wildcards. The period is
+    not indexed: a negative answer holds for any period as of the last load, a positive
+    answer only means the head has data for some period.
+
+    Builds and refreshes run one at a time under a lock and publish a new keys dict with one
+    assignment, so readers on other threads never see a half-merged family.
+    """
+
+    def __init__(self, fetch: Callable[[str], pd.DataFrame], tables: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            fetch: Callable that executes a SQL query and returns a DataFrame
+            tables: Optional table family -> table name mapping (defaults to AVAILABILITY_TABLES)
+        """
+        self.fetch = fetch
+        self.tables = dict(tables or AVAILABILITY_TABLES)
+        self.families = {table_name: family for family, table_name in self.tables.items()}
+        self.keys: Dict[str, np.ndarray] = {}
+        self.watermarks: Dict[str, Optional[pd.Timestamp]] = {}
+        self.refreshed_at = None
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def _query(self, family: str, since=None) -> str:
+        columns = "CompanyID, SubHeadID, ConsolidationID"
+        if family in DISSECTION_FAMILIES:
+            columns += ", DisectionGroupID"
+        date_column = DATE_COLUMNS[family]
+        where = f"WHERE {date_column} >= :since" if since is not None else ""
+        return BoundQuery(f"""
+        SELECT {columns}, MAX({date_column}) AS Watermark
+        FROM {self.tables[family]}
+        {where}
+        GROUP BY {columns}
+        """, {'since': since} if since is not None else None)
+
+    def _load(self, family: str, since=None) -> Optional[Tuple[np.ndarray, Optional[pd.Timestamp]]]:
+        """
+        Keys of a family's rows at or after since, and the latest period date among them
+        """
+        try:
+            rows = self.fetch(self._query(family, since))
+            rows = rows.dropna(subset=['CompanyID', 'SubHeadID', 'ConsolidationID'])
+            keys = pack_keys(
+                rows['CompanyID'], rows['SubHeadID'], rows['ConsolidationID'],
+                rows['DisectionGroupID'].fillna(0) if 'DisectionGroupID' in rows.columns else None
+            )
+        except Exception as e:
+            logger.error(f"Error loading availability for {self.tables[family]}: {e}")
+            return None
+
+        watermark = None
+        if not rows.empty and rows['Watermark'].notna().any():
+            watermark = pd.Timestamp(rows['Watermark'].max())
+        return keys, watermark
+
+    def build(self) -> 'AvailabilityIndex':
+        """
+        Load every table family from scratch. Families that fail to load are left out,
+        so lookups against them fall back to the database.
+        """
+        with self._lock:
+            self._build()
+        return self
+
+    def _build(self) -> None:
+        start = time.perf_counter()
+        keys, watermarks = {}, {}
+        for family in self.tables:
+            loaded = self._load(family)
+            if loaded is not None:
+                keys[family], watermarks[family] = loaded
+        self.keys, self.watermarks = keys, watermarks
+        self.refreshed_at = self.built_at = time.monotonic()
+        logger.info(f"Availability index built in {time.perf_counter() - start:.2f}s: "
+                    f"{sum(len(k) for k in keys.values())} keys, {self.nbytes() / 1e6:.1f} MB")
+
+    def refresh(self) -> int:
+        """
+        Merge in rows at or after each family's watermark (the last period is re-read so
+        rows added to it since the previous load are not missed)
+
+        Returns:
+            Number of new keys added
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        keys, watermarks = dict(self.keys), dict(self.watermarks)
+        added = 0
+        for family in keys:
+            loaded = self._load(family, since=watermarks.get(family))
+            if loaded is None:
+                continue
+            new_keys, watermark = loaded
+            if watermark is not None:
+                previous = watermarks.get(family)
+                watermarks[family] = watermark if previous is None else max(previous, watermark)
+            if not len(new_keys):
+                continue
+            before = len(keys[family])
+            keys[family] = np.union1d(keys[family], new_keys)
+            added += len(keys[family]) - before
+        self.keys, self.watermarks = keys, watermarks
+        self.refreshed_at = time.monotonic()
+        if added:
+            logger.info(f"Availability index refreshed: {added} new keys")
+        return added
+
+    def is_stale(self, interval: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Whether the last build or refresh is older than interval seconds
+        """
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at >= interval
+
+    def maybe_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS,
+                      rebuild_interval: float = REBUILD_INTERVAL_SECONDS) -> None:
+        """
+        Rebuild from scratch if the last build is older than rebuild_interval seconds, otherwise
+        refresh incrementally if the last refresh is older than interval seconds. When another
+        thread is already loading, return at once and keep answering from the current keys.
+        """
+        if not self.is_stale(interval) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            # Another thread may have refreshed between the check and the lock
+            if time.monotonic() - self.built_at >= rebuild_interval:
+                self._build()
+            elif self.is_stale(interval):
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def covers(self, table_name: str) -> bool:
+        """
+        Whether lookups against table_name can be answered from memory
+        """
+        return self.families.get(table_name) in self.keys
+
+    def has_data(self, table_name: str, company_id: int, sub_head_id: int,
+                 consolidation_id: Optional[int] = None, dissection_group_id: Optional[int] = None) -> bool:
+        """
+        Whether the table has any rows for the company and head. consolidation_id and
+        dissection_group_id match any value when None.
+        """
+        family = self.families[table_name]
+        keys = self.keys.get(family)
+        if keys is None:
+            # Dropped by a rebuild that failed to load it since covers() was checked
+            return True
+        if family not in DISSECTION_FAMILIES:
+            # Non-dissection tables are packed with group 0
+            dissection_group_id = 0
+        company_id, sub_head_id = int(company_id), int(sub_head_id)
+        if company_id >= (1 << COMPANY_BITS) or sub_head_id >= (1 << SUB_HEAD_BITS):
+            return False
+
+        base = (company_id << COMPANY_SHIFT) | (sub_head_id << SUB_HEAD_SHIFT)
+        if dissection_group_id is None:
+            low, high = base, base | ((1 << SUB_HEAD_SHIFT) - 1)
+        else:
+            base |= int(dissection_group_id) << GROUP_SHIFT
+            low, high = base, base | ((1 << GROUP_SHIFT) - 1)
+
+        if consolidation_id is not None:
+            key = low | int(consolidation_id)
+            if dissection_group_id is None:
+                # Consolidation is the lowest field, so it cannot be fixed under a group wildcard
+                # with one range; check each group present for this head instead
+                start = np.searchsorted(keys, low, side='left')
+                end = np.searchsorted(keys, high, side='right')
+                mask = (1 << CONSOLIDATION_BITS) - 1
+                return bool(np.any((keys[start:end] & mask) == int(consolidation_id)))
+            position = np.searchsorted(keys, key, side='left')
+            return position < len(keys) and keys[position] == key
+
+        position = np.searchsorted(keys, low, side='left')
+        return position < len(keys) and keys[position] <= high
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the key arrays
+        """
+        return sum(keys.nbytes for keys in self.keys.values())
@@ -0,0 +1,50 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Single-flight background thread for building and refreshing in-memory snapshots
+'''
+
+import threading
+from typing import Callable, Optional
+
+from utils import logger
+
+
+class BackgroundUpdate:
+    """
+    Runs an update callable on a daemon thread, at most one at a time
+
+    The in-memory snapshots (ratio screener, availability / period indexes, peer aggregates)
+    read whole raw tables to build or refresh, so requests only start an update and keep
+    reading the current snapshot instead of running it on their own thread.
+    """
+
+    def __init__(self, name: str, update: Callable[[], None]):
+        """
+        Args:
+            name: Thread name, also used in log messages
+            update: Builds the snapshot when missing, refreshes it when stale
+        """
+        self.name = name
+        self.update = update
+        self.thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> threading.Thread:
+        """
+        Start the update unless one is already running
+
+        Returns:
+            The running update thread
+        """
+        with self._lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            return self.thread
+
+    def _run(self) -> None:
+        try:
+            self.update()
+        except Exception as e:
+            logger.error(f"Error in background update {self.name}: {e}")
@@ -0,0 +1,141 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Set-based value queries behind FinancialDatabase.get_financial_data_batch
+'''
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery, values_table
+
+logger = logging.getLogger(__name__)
+
+# Columns of the tidy frame returned by get_financial_data_batch
+BATCH_COLUMNS = [
+    'company', 'metric', 'term', 'company_id', 'head_id', 'is_ratio', 'term_id', 'table',
+    'company_name', 'metric_name', 'term_name', 'consolidation', 'value', 'unit', 'date', 'error',
+]
+
+# Columns of the VALUES table joined to a raw data table; FY 0 matches any fiscal year
+KEY_COLUMNS = ('RowID', 'CompanyID', 'SubHeadID', 'TermID', 'FY')
+
+# Raw data table -> (head master table, head name column)
+_HEAD_TABLES = {
+    'tbl_ratiorawdata': ('tbl_ratiosheadmaster', 'HeadNames'),
+}
+_DEFAULT_HEAD_TABLE = ('tbl_headsmaster', 'SubHeadName')
+
+
+@dataclass
+class BatchCell:
+    """
+    One (company, metric, term) combination of a batch request and what was resolved for it
+    """
+    company: str
+    metric: str
+    term: str
+    company_id: Optional[int] = None
+    head_id: Optional[int] = None
+    is_ratio: bool = False
+    term_id: Optional[int] = None
+    fiscal_year: Optional[int] = None
+    is_ttm: bool = False
+    # Raw data tables to read, in order of preference
+    tables: Tuple[str, ...] = ()
+    table: Optional[str] = None
+    # Result in the shape get_financial_data returns
+    response: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.response.get('error')
+
+    def fail(self, message: str) -> None:
+        self.response = {'error': message}
+
+    def key_row(self, row_id: int) -> tuple:
+        """
+        Row of the VALUES table for this cell
+        """
+        return row_id, self.company_id, self.head_id, self.term_id, self.fiscal_year or 0
+
+    def set_record(self, record: Dict[str, Any], table: str) -> None:
+        """
+        Fill the response from a row of batch_value_query
+        """
+        date = record['PeriodEnd']
+        self.table = table
+        self.response = {
+            "company": record['Company'],
+            "metric": record['Metric'],
+            "term": record['Term'],
+            "consolidation": record['Consolidation'],
+            "value": float(record['Value']),
+            "unit": record['Unit'],
+            "date": date.strftime('%Y-%m-%d') if hasattr(date, 'strftime') else date,
+        }
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            'company': self.company, 'metric': self.metric, 'term': self.term,
+            'company_id': self.company_id, 'head_id': self.head_id, 'is_ratio': self.is_ratio,
+            'term_id': self.term_id, 'table': self.table,
+            'company_name': self.response.get('company'), 'metric_name': self.response.get('metric'),
+            'term_name': self.response.get('term'), 'consolidation': self.response.get('consolidation'),
+            'value': self.response.get('value'), 'unit': self.response.get('unit'),
+            'date': self.response.get('date'), 'error': self.error,
+        }
+
+
+def batch_frame(cells: List[BatchCell]) -> pd.DataFrame:
+    """
+    Tidy frame with one row per cell, in request order
+    """
+    df = pd.DataFrame([cell.to_row() for cell in cells], columns=BATCH_COLUMNS)
+    df['value'] = df['value'].astype(float)
+    return df
+
+
+def batch_value_query(table_name: str, rows: List[tuple], consolidation_id: int) -> BoundQuery:
+    """
+    Latest value of every key row in one raw data table
+
+    The keys are joined as a VALUES table; ROW_NUMBER keeps the most recent PeriodEnd per
+    RowID, which is the row get_financial_data answers with. Joins and output columns match
+    the single-question query of build_financial_query.
+
+    Args:
+        table_name: Raw data table (tbl_financialrawdata, _Quarter, TTM or tbl_ratiorawdata)
+        rows: Rows of KEY_COLUMNS values
+        consolidation_id: Consolidation ID shared by all rows
+
+    Returns:
+        BoundQuery returning RowID, Value, Unit, Term, Company, Metric, Consolidation, PeriodEnd
+    """
+    head_table, head_name_col = _HEAD_TABLES.get(table_name, _DEFAULT_HEAD_TABLE)
+    keys, params = values_table('k', KEY_COLUMNS, rows)
+    params['consolidation_id'] = consolidation_id
+    query = f"""
+    SELECT RowID, Value, Unit, Term, Company, Metric, Consolidation, PeriodEnd
+    FROM (
+        SELECT k.RowID, d.Value_ AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company,
+               h.{head_name_col} AS Metric, con.consolidationname AS Consolidation, d.PeriodEnd AS PeriodEnd,
+               ROW_NUMBER() OVER (PARTITION BY k.RowID ORDER BY d.PeriodEnd DESC) AS RowRank
+        FROM {keys}
+        JOIN {table_name} d ON d.CompanyID = k.CompanyID AND d.SubHeadID = k.SubHeadID
+            AND d.TermID = k.TermID AND (k.FY = 0 OR d.FY = k.FY)
+        JOIN {head_table} h ON d.SubHeadID = h.SubHeadID
+        JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+        JOIN tbl_terms t ON d.TermID = t.TermID
+        JOIN tbl_companieslist c ON d.CompanyID = c.CompanyID
+        JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND h.IndustryID = im.industryid
+        JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID
+        WHERE d.ConsolidationID = :consolidation_id
+    ) ranked
+    WHERE RowRank = 1
+    """
+    return BoundQuery(query, params, 'batch_values')
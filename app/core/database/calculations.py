@@ -0,0 +1,182 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Vectorized derivation of quarterly, TTM, growth, per-share and percent-of figures from cumulative raw data
+'''
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery, expand_in_list
+
+# Cumulative terms of tbl_financialrawdata, in fiscal-year order
+CUMULATIVE_TERMS = ('3M', '6M', '9M', '12M')
+QUARTERS = ('Q1', 'Q2', 'Q3', 'Q4')
+
+# DisectionGroupID -> growth rate the panel derives for it (Annual Growth, Quarterly Growth)
+DERIVED_GROWTH_GROUPS = {2: 'yoy', 5: 'qoq'}
+
+# Columns identifying one raw series
+SERIES_KEYS = ['CompanyID', 'SubHeadID']
+
+# Columns of the long frames returned by CumulativePanel
+DERIVED_COLUMNS = SERIES_KEYS + ['FY', 'Quarter', 'PeriodEnd', 'Value']
+
+
+def cumulative_query(company_ids: Sequence[int], head_ids: Sequence[int], term_ids: Sequence[int],
+                     consolidation_id: int) -> BoundQuery:
+    """
+    One statement returning the cumulative rows of every (company, head) pair
+
+    term_ids are the TermIDs of CUMULATIVE_TERMS; the caller maps them back to term names.
+    """
+    company_list, params = expand_in_list('company_ids', company_ids)
+    head_list, head_params = expand_in_list('head_ids', head_ids)
+    term_list, term_params = expand_in_list('term_ids', term_ids)
+    params.update(head_params)
+    params.update(term_params)
+    params['consolidation_id'] = consolidation_id
+    query = f"""
+        SELECT d.CompanyID, d.SubHeadID, d.TermID, d.FY, d.PeriodEnd, d.Value_ AS Value
+        FROM tbl_financialrawdata d
+        WHERE d.CompanyID IN ({company_list}) AND d.SubHeadID IN ({head_list})
+        AND d.TermID IN ({term_list}) AND d.ConsolidationID = :consolidation_id
+        """
+    return BoundQuery(query, params, 'cumulative_panel')
+
+
+@dataclass
+class CumulativePanel:
+    """
+    Cumulative 3M / 6M / 9M / 12M values of many series as one (series x fiscal year) x 4 array
+
+    Rows hold every fiscal year between a series' first and last one, so the previous year
+    of a row is the row above it (unless prev_valid is False). Missing values are NaN, and
+    every derived figure that needs one is NaN too.
+    """
+    index: pd.MultiIndex          # (CompanyID, SubHeadID, FY)
+    values: np.ndarray            # float64, rows x 4
+    period_ends: np.ndarray       # datetime64[ns], rows x 4
+    prev_valid: np.ndarray        # bool, rows; False on the first fiscal year of a series
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'CumulativePanel':
+        """
+        Build the panel from raw rows with CompanyID, SubHeadID, FY, Term, PeriodEnd and Value
+
+        Terms other than CUMULATIVE_TERMS are ignored; of duplicate rows the latest PeriodEnd wins.
+        """
+        keys = SERIES_KEYS + ['FY']
+        df = df[df['Term'].isin(CUMULATIVE_TERMS) & (pd.to_numeric(df['FY'], errors='coerce') > 0)]
+        df = df.assign(FY=df['FY'].astype(np.int64), PeriodEnd=pd.to_datetime(df['PeriodEnd']),
+                       Value=pd.to_numeric(df['Value'], errors='coerce').astype(np.float64))
+        df = df.sort_values('PeriodEnd', kind='stable').drop_duplicates(keys + ['Term'], keep='last')
+
+        # Every fiscal year between each series' first and last one
+        bounds = df.groupby(SERIES_KEYS, sort=True)['FY'].agg(['min', 'max'])
+        lengths = (bounds['max'] - bounds['min'] + 1).to_numpy()
+        starts = np.repeat(bounds['min'].to_numpy(), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        series = bounds.index.to_frame(index=False).loc[np.repeat(np.arange(len(bounds)), lengths)]
+        index = pd.MultiIndex.from_arrays([series['CompanyID'].to_numpy(), series['SubHeadID'].to_numpy(),
+                                           starts + offsets], names=keys)
+
+        values = df.pivot(index=keys, columns='Term', values='Value').reindex(index=index, columns=CUMULATIVE_TERMS)
+        period_ends = df.pivot(index=keys, columns='Term', values='PeriodEnd').reindex(index=index, columns=CUMULATIVE_TERMS)
+        return cls(index=index, values=values.to_numpy(dtype=np.float64),
+                   period_ends=period_ends.to_numpy(dtype='datetime64[ns]'), prev_valid=offsets > 0)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _previous_year(self, values: np.ndarray) -> np.ndarray:
+        previous = np.full_like(values, np.nan)
+        previous[1:] = values[:-1]
+        previous[~self.prev_valid] = np.nan
+        return previous
+
+    def quarterly(self) -> np.ndarray:
+        """
+        Standalone quarters: Q1 = 3M, Q2 = 6M - 3M, Q3 = 9M - 6M, Q4 = 12M - 9M
+        """
+        return np.diff(self.values, axis=1, prepend=0.0)
+
+    def ttm(self) -> np.ndarray:
+        """
+        Trailing twelve months at each quarter end: cumulative to date plus the previous
+        year's 12M less its cumulative to the same quarter
+        """
+        previous = self._previous_year(self.values)
+        ttm = self.values + previous[:, [3]] - previous
+        ttm[:, 3] = self.values[:, 3]
+        return ttm
+
+    def yoy_growth(self, values: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Percent change against the same quarter of the previous fiscal year (of the quarterly
+        values unless values are given)
+        """
+        values = self.quarterly() if values is None else values
+        return _percent_change(values, self._previous_year(values))
+
+    def qoq_growth(self, values: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Percent change against the previous quarter (Q1 against the previous year's Q4)
+        """
+        values = self.quarterly() if values is None else values
+        previous = np.empty_like(values)
+        previous[:, 1:] = values[:, :-1]
+        previous[:, 0] = self._previous_year(values)[:, 3]
+        return _percent_change(values, previous)
+
+    def to_frame(self, values: np.ndarray, quarters: Sequence[str] = QUARTERS) -> pd.DataFrame:
+        """
+        Long frame (DERIVED_COLUMNS) of a rows x 4 result, one row per non-missing value
+        """
+        keys = self.index.to_frame(index=False)
+        frame = pd.DataFrame({
+            'CompanyID': np.repeat(keys['CompanyID'].to_numpy(), 4),
+            'SubHeadID': np.repeat(keys['SubHeadID'].to_numpy(), 4),
+            'FY': np.repeat(keys['FY'].to_numpy(), 4),
+            'Quarter': np.tile(np.asarray(quarters, dtype=object), len(self)),
+            'PeriodEnd': self.period_ends.ravel(),
+            'Value': values.ravel(),
+        }, columns=DERIVED_COLUMNS)
+        return frame[frame['Value'].notna().to_numpy() & frame['PeriodEnd'].notna().to_numpy()].reset_index(drop=True)
+
+
+def per_share(values: pd.DataFrame, shares: pd.DataFrame) -> pd.DataFrame:
+    """
+    values divided by the share count of the same company and period end
+
+    Args:
+        values: Frame with CompanyID, PeriodEnd and Value (e.g. from CumulativePanel.to_frame)
+        shares: Frame with CompanyID, PeriodEnd and Value holding the number of shares
+    """
+    return _ratio(values, shares, 1.0)
+
+
+def percent_of(values: pd.DataFrame, base: pd.DataFrame) -> pd.DataFrame:
+    """
+    values as a percentage of base (total assets, sales) of the same company and period end
+    """
+    return _ratio(values, base, 100.0)
+
+
+def _ratio(values: pd.DataFrame, base: pd.DataFrame, scale: float) -> pd.DataFrame:
+    base = base[['CompanyID', 'PeriodEnd', 'Value']].drop_duplicates(['CompanyID', 'PeriodEnd'], keep='last')
+    merged = values.merge(base, on=['CompanyID', 'PeriodEnd'], how='inner', suffixes=('', '_base'))
+    numerator = merged['Value'].to_numpy(dtype=np.float64)
+    denominator = merged.pop('Value_base').to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(denominator != 0, scale * numerator / denominator, np.nan)
+    merged['Value'] = result
+    return merged[merged['Value'].notna()].reset_index(drop=True)
+
+
+def _percent_change(values: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous != 0, (values - previous) / np.abs(previous) * 100.0, np.nan)
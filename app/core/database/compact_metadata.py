@@ -0,0 +1,88 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Compact representation of the metadata frames (narrow ids, categorical / interned names)
+'''
+
+import sys
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# Suffix of the precomputed lowercase companion of a name column
+LOWER_SUFFIX = '_lower'
+
+# String columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+_INT32 = np.iinfo(np.int32)
+
+
+def lower_column(column: str) -> str:
+    return f"{column}{LOWER_SUFFIX}"
+
+
+def _is_string_column(series: pd.Series) -> bool:
+    if series.dtype != object:
+        return False
+    values = series.dropna()
+    return len(values) > 0 and all(isinstance(value, str) for value in values)
+
+
+def _compact_strings(series: pd.Series) -> pd.Series:
+    """
+    Categorical when values repeat, otherwise the same object column with interned strings.
+    Columns with NULLs are only interned: a categorical would turn None into NaN.
+    """
+    if not series.isna().any() and series.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(series):
+        return series.astype('category')
+    return series.map(lambda value: sys.intern(value) if isinstance(value, str) else value)
+
+
+def compact_series(series: pd.Series) -> pd.Series:
+    """
+    int64 columns that fit become int32, string columns categorical or interned.
+    Values, NaN and equality comparisons are unchanged.
+    """
+    if pd.api.types.is_integer_dtype(series.dtype) and series.dtype.itemsize > 4:
+        if series.empty or (series.min() >= _INT32.min and series.max() <= _INT32.max):
+            return series.astype(np.int32)
+        return series
+    if _is_string_column(series):
+        return _compact_strings(series)
+    return series
+
+
+def compact_frame(df: pd.DataFrame, name_columns: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Compact copy of df with a lowercase companion (column + LOWER_SUFFIX) for each of
+    name_columns present in df
+
+    Args:
+        df: Metadata frame as read from the database
+        name_columns: Columns looked up case-insensitively by name
+
+    Returns:
+        New DataFrame with the same rows and index
+    """
+    columns = {column: compact_series(df[column]) for column in df.columns}
+    for column in name_columns:
+        if column in df.columns and lower_column(column) not in df.columns and _is_string_column(df[column]):
+            columns[lower_column(column)] = _compact_strings(df[column].str.lower())
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """
+    Bytes held by df including the Python string objects
+    """
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def memory_report(before: Dict[str, pd.DataFrame], after: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, int]]:
+    """
+    Bytes per table before and after compaction
+    """
+    return {key: {'before': frame_nbytes(before[key]), 'after': frame_nbytes(after[key])}
+            for key in before if key in after}
@@ -0,0 +1,133 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Per-company context (name, ticker, sector, industry) built from cached metadata
+'''
+
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _column(df: pd.DataFrame, candidates) -> Optional[str]:
+    """
+    Return the first candidate column present in df
+    """
+    return next((c for c in candidates if c in df.columns), None)
+
+
+def _value(value):
+    """
+    Convert NaN to None and numpy scalars to Python scalars
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+@dataclass(frozen=True)
+class CompanyContext:
+    """
+    Sector and industry information for one company.
+
+    industry_id is the first industry mapped to the company's sector, which is what
+    the sector/industry queries in the query path used to pick; industry_ids holds
+    every industry mapped to the sector.
+    """
+    company_id: int
+    company_name: Optional[str] = None
+    ticker: Optional[str] = None
+    sector_id: Optional[int] = None
+    sector_name: Optional[str] = None
+    industry_id: Optional[int] = None
+    industry_name: Optional[str] = None
+    industry_ids: Tuple[int, ...] = field(default_factory=tuple)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Company metadata dictionary in the shape get_company_metadata returns
+        """
+        data = asdict(self)
+        data['industry_ids'] = list(self.industry_ids)
+        return data
+
+
+def build_company_contexts(metadata_cache: Dict[str, pd.DataFrame]) -> Dict[int, CompanyContext]:
+    """
+    Build a CompanyContext for every company from the cached companies, sectors,
+    industries and industry_sector_mapping frames
+
+    Args:
+        metadata_cache: FinancialDatabase.metadata_cache
+
+    Returns:
+        Dictionary of CompanyID -> CompanyContext
+    """
+    companies = metadata_cache.get('companies')
+    if companies is None or companies.empty:
+        return {}
+
+    id_col = _column(companies, ['CompanyID', 'company_id'])
+    name_col = _column(companies, ['CompanyName', 'company_name'])
+    ticker_col = _column(companies, ['Symbol', 'ticker', 'symbol'])
+    sector_col = _column(companies, ['SectorID', 'sector_id'])
+
+    # SectorID -> SectorName
+    sector_names = {}
+    sectors = metadata_cache.get('sectors')
+    if sectors is not None and not sectors.empty:
+        s_id = _column(sectors, ['SectorID', 'sectorid', 'sector_id'])
+        s_name = _column(sectors, ['SectorName', 'sectorname', 'sector_name'])
+        if s_id and s_name:
+            sector_names = {_value(k): _value(v) for k, v in zip(sectors[s_id], sectors[s_name])}
+
+    # IndustryID -> IndustryName
+    industry_names = {}
+    industries = metadata_cache.get('industries')
+    if industries is not None and not industries.empty:
+        i_id = _column(industries, ['IndustryID', 'industryid', 'industry_id'])
+        i_name = _column(industries, ['IndustryName', 'industryname', 'industry_name'])
+        if i_id and i_name:
+            industry_names = {_value(k): _value(v) for k, v in zip(industries[i_id], industries[i_name])}
+
+    # SectorID -> industries mapped to it, in mapping table order
+    sector_industries: Dict[Any, list] = {}
+    mapping = metadata_cache.get('industry_sector_mapping')
+    if mapping is not None and not mapping.empty:
+        m_sector = _column(mapping, ['sectorid', 'SectorID', 'sector_id'])
+        m_industry = _column(mapping, ['industryid', 'IndustryID', 'industry_id'])
+        if m_sector and m_industry:
+            for sector_id, industry_id in zip(mapping[m_sector], mapping[m_industry]):
+                sector_id, industry_id = _value(sector_id), _value(industry_id)
+                # Only industries present in tbl_industrynames, like the JOIN used to require
+                if sector_id is not None and industry_id in industry_names:
+                    sector_industries.setdefault(sector_id, []).append(industry_id)
+
+    def column_values(col):
+        return companies[col].tolist() if col else [None] * len(companies)
+
+    contexts = {}
+    for company_id, company_name, ticker, sector_id in zip(column_values(id_col), column_values(name_col),
+                                                           column_values(ticker_col), column_values(sector_col)):
+        company_id, sector_id = _value(company_id), _value(sector_id)
+        if company_id is None:
+            continue
+        industry_ids = tuple(sector_industries.get(sector_id, ()))
+        industry_id = industry_ids[0] if industry_ids else None
+        contexts[company_id] = CompanyContext(
+            company_id=company_id,
+            company_name=_value(company_name),
+            ticker=_value(ticker),
+            sector_id=sector_id,
+            sector_name=sector_names.get(sector_id),
+            industry_id=industry_id,
+            industry_name=industry_names.get(industry_id),
+            industry_ids=industry_ids,
+        )
+
+    logger.info(f"Built company context for {len(contexts)} companies")
+    return contexts
@@ -0,0 +1,158 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Company name/ticker resolver over tbl_companieslist
+'''
+
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Legal-form words ignored when comparing names ("United Bank Limited" == "United Bank")
+NAME_SUFFIXES = {'limited', 'ltd', 'company', 'co', 'corporation', 'corp', 'plc', 'inc', 'pvt'}
+
+# Minimum trigram similarity for a fuzzy match
+MIN_FUZZY_SCORE = 0.45
+
+# Score given to a name that contains the query as whole words
+WORD_MATCH_SCORE = 0.85
+
+# Score given to a name with a word starting with the query ("luck" -> "Lucky Cement")
+PREFIX_MATCH_SCORE = 0.6
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lowercase, replace punctuation with spaces and collapse whitespace
+    """
+    return " ".join(_NON_ALNUM_RE.sub(" ", name.lower()).split())
+
+
+def strip_suffixes(normalized: str) -> str:
+    """
+    Drop trailing legal-form words from a normalized name
+    """
+    words = normalized.split()
+    while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def _trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanyResolver:
+    """
+    Resolves a company name or ticker to a CompanyID.
+
+    Lookups go ticker map, exact normalized-name map, then a trigram index scored by
+    Dice similarity, so a short query like "UBL" hits the ticker before any fuzzy match.
+    """
+
+    def __init__(self, companies_df: Optional[pd.DataFrame]):
+        self.ids: List[int] = []
+        self.names: List[str] = []
+        self.tickers: Dict[str, int] = {}
+        self.exact_names: Dict[str, int] = {}
+        self.grams: Dict[str, List[int]] = {}
+        self.gram_counts: List[int] = []
+        self.padded: List[str] = []
+
+        if companies_df is None or companies_df.empty:
+            return
+
+        id_col = 'CompanyID' if 'CompanyID' in companies_df.columns else 'company_id'
+        name_col = 'CompanyName' if 'CompanyName' in companies_df.columns else 'company_name'
+        ticker_col = next((c for c in ['Symbol', 'ticker', 'symbol'] if c in companies_df.columns), None)
+        tickers = companies_df[ticker_col].tolist() if ticker_col else [None] * len(companies_df)
+
+        for company_id, name, ticker in zip(companies_df[id_col].tolist(), companies_df[name_col].tolist(), tickers):
+            pos = len(self.ids)
+            name = name if isinstance(name, str) else ''
+            normalized = normalize_name(name)
+            self.ids.append(company_id)
+            self.names.append(name)
+            self.padded.append(f" {normalized} ")
+
+            if isinstance(ticker, str) and ticker.strip():
+                self.tickers.setdefault(ticker.strip().lower(), pos)
+            if normalized:
+                self.exact_names.setdefault(normalized, pos)
+                self.exact_names.setdefault(strip_suffixes(normalized), pos)
+
+            grams = _trigrams(normalized) if normalized else set()
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(pos)
+
+        logger.info(f"Company resolver built: {len(self.ids)} companies, {len(self.tickers)} tickers")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _entry(self, pos: int, match_type: str, score: float) -> Tuple[int, str, str, float]:
+        return self.ids[pos], self.names[pos], match_type, score
+
+    def resolve(self, query: str) -> Optional[Tuple[int, str, str, float]]:
+        """
+        Resolve a company name or ticker
+
+        Returns:
+            Tuple of (company_id, company_name, match_type, score) or None.
+            match_type is 'ticker', 'name' or 'fuzzy'.
+        """
+        if not query or not query.strip():
+            return None
+
+        pos = self.tickers.get(query.strip().lower())
+        if pos is not None:
+            return self._entry(pos, 'ticker', 1.0)
+
+        normalized = normalize_name(query)
+        if not normalized:
+            return None
+        pos = self.exact_names.get(normalized, self.exact_names.get(strip_suffixes(normalized)))
+        if pos is not None:
+            return self._entry(pos, 'name', 1.0)
+
+        matches = self.fuzzy(query, limit=1)
+        return matches[0] if matches else None
+
+    def fuzzy(self, query: str, limit: int = 5, min_score: float = MIN_FUZZY_SCORE) -> List[Tuple[int, str, str, float]]:
+        """
+        Best fuzzy matches by trigram Dice similarity, in descending score order
+        (master table order breaks ties). Names containing the query as whole words
+        score at least WORD_MATCH_SCORE, names with a word starting with it at least
+        PREFIX_MATCH_SCORE.
+        """
+        normalized = strip_suffixes(normalize_name(query))
+        if not normalized:
+            return []
+
+        query_grams = _trigrams(normalized)
+        overlap: Dict[int, int] = {}
+        for gram in query_grams:
+            for pos in self.grams.get(gram, ()):
+                overlap[pos] = overlap.get(pos, 0) + 1
+
+        needle = f" {normalized} "
+        scored = []
+        for pos, shared in overlap.items():
+            score = 2.0 * shared / (len(query_grams) + self.gram_counts[pos])
+            if needle in self.padded[pos]:
+                score = max(score, WORD_MATCH_SCORE)
+            elif needle[:-1] in self.padded[pos]:
+                score = max(score, PREFIX_MATCH_SCORE)
+            if score >= min_score:
+                scored.append((-score, pos))
+
+        scored.sort()
+        return [self._entry(pos, 'fuzzy', round(-score, 3)) for score, pos in scored[:limit]]
@@ -0,0 +1,116 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Request-scoped database sessions and connection checkout counters
+'''
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+# Session active in the current thread / asyncio task, if any
+_current_session: ContextVar[Optional['DatabaseSession']] = ContextVar('financial_db_session', default=None)
+
+
+class DatabaseSession:
+    """
+    One pooled connection held for the whole of a request.
+
+    Every execute_query issued while the session is active runs on this connection,
+    so resolving a question costs one pool checkout (and at most one ODBC handshake)
+    instead of one per statement.
+    """
+
+    def __init__(self, owner: Any, connection: Any, snapshot: bool = False):
+        self.owner = owner
+        self.connection = connection
+        self.snapshot = snapshot
+        self.statements = 0
+        self.started = time.perf_counter()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'statements': self.statements,
+            'snapshot': self.snapshot,
+            'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+
+def current_session() -> Optional[DatabaseSession]:
+    """Return the session active in the current context, or None"""
+    return _current_session.get()
+
+
+def activate_session(session: DatabaseSession):
+    """Make session current; returns the token for deactivate_session"""
+    return _current_session.set(session)
+
+
+def deactivate_session(token) -> None:
+    _current_session.reset(token)
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters of connection checkouts, checkout wait, sessions, statements and
+    timeouts for one database
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.sessions = 0
+            self.statements = 0
+            self.session_statements = 0
+            self.connections_opened = 0
+            self.wait_s_total = 0.0
+            self.wait_s_max = 0.0
+            self.pool_timeouts = 0
+            self.query_timeouts = 0
+
+    def record_checkout(self, session: bool = False, wait_s: float = 0.0) -> None:
+        with self._lock:
+            self.checkouts += 1
+            if session:
+                self.sessions += 1
+            self.wait_s_total += wait_s
+            self.wait_s_max = max(self.wait_s_max, wait_s)
+
+    def record_connect(self) -> None:
+        """A new DBAPI connection (ODBC login) was opened by the pool"""
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_statement(self, in_session: bool = False) -> None:
+        with self._lock:
+            self.statements += 1
+            if in_session:
+                self.session_statements += 1
+
+    def record_pool_timeout(self) -> None:
+        with self._lock:
+            self.pool_timeouts += 1
+
+    def record_query_timeout(self) -> None:
+        with self._lock:
+            self.query_timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'sessions': self.sessions,
+                'statements': self.statements,
+                'statements_in_sessions': self.session_statements,
+                'statements_per_checkout': round(self.statements / self.checkouts, 2) if self.checkouts else 0.0,
+                'connections_opened': self.connections_opened,
+                'checkout_wait_ms_avg': round(self.wait_s_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'checkout_wait_ms_max': round(self.wait_s_max * 1000, 3),
+                'pool_timeouts': self.pool_timeouts,
+                'query_timeouts': self.query_timeouts,
+            }
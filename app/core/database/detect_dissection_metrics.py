@@ -63,6 +63,38 @@ def is_dissection_metric(metric_name):
     return False, None, None
 
 
+# DisectionGroupID -> pattern of the dissection part of a metric name
+DISSECTION_NAME_PATTERNS = {
+    1: r'\s*per\s*share\s*',
+    2: r'\s*annual\s*growth\s*',
+    3: r'\s*(percentage|%)\s*of\s*asset\s*',
+    4: r'\s*(percentage|%)\s*of\s*(sales|revenue)\s*',
+    5: r'\s*(quarterly|qoq)\s*growth\s*',
+}
+
+
+def dissection_base_metric(metric_name, dissection_group_id):
+    """
+    Base metric of a dissection metric name, e.g. 'pat' for 'PAT per share'
+    
+    Args:
+        metric_name: The name of the dissection metric
+        dissection_group_id: Its DisectionGroupID (1-5)
+        
+    Returns:
+        The lower-cased name without the dissection part, or metric_name if nothing is left
+    """
+    pattern = DISSECTION_NAME_PATTERNS.get(dissection_group_id)
+    if pattern is None:
+        return metric_name
+    base_metric = re.sub(pattern, '', metric_name.lower(), flags=re.IGNORECASE).strip()
+    if not base_metric:
+        logger.warning(f"Could not extract base metric from '{metric_name}', using original name")
+        return metric_name
+    logger.info(f"Extracted base metric '{base_metric}' from dissection metric '{metric_name}'")
+    return base_metric
+
+
 # Example usage
 if __name__ == "__main__":
     test_metrics = [
@@ -79,4 +111,4 @@ if __name__ == "__main__":
         if is_dissection:
             print(f"{metric}: Dissection metric with Group ID {group_id}, Data Type: {data_type}")
         else:
-            print(f"{metric}: Not a dissection metric")
\ No newline at end of file
+            print(f"{metric}: Not a dissection metric")
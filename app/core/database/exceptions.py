@@ -0,0 +1,34 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Exceptions raised by the financial database layer
+'''
+
+from typing import Optional
+
+
+class FinancialDatabaseError(Exception):
+    """
+    Base class for errors raised by FinancialDatabase
+    """
+
+
+class QueryTimeoutError(FinancialDatabaseError):
+    """
+    A statement ran past its timeout and was cancelled by the ODBC driver
+    """
+
+    def __init__(self, query: str, timeout: Optional[int]):
+        self.query = query
+        self.timeout = timeout
+        super().__init__(f"Query cancelled after {timeout} s timeout")
+
+
+class PoolTimeoutError(FinancialDatabaseError):
+    """
+    No pooled connection became free within the pool timeout
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        super().__init__(f"No database connection available after {timeout} s")
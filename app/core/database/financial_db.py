@@ -6,11 +6,60 @@ Description: Financial database connector for the FinRAG system
 
 import urllib
 import re
-from sqlalchemy import create_engine, text
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as SQLAlchemyPoolTimeout
 import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any, Union
 import os
 from utils import logger
+from app.core.database.metric_index import MetricIndex
+from app.core.database.availability_index import AvailabilityIndex
+from app.core.database.background_update import BackgroundUpdate
+from app.core.database.peer_aggregates import GROUP_KINDS, PeerAggregates, percentile_rank
+from app.core.database.period_index import PeriodIndex
+from app.core.database.screener import Condition, RatioScreener
+from app.core.database.statement_prefetch import PrefetchStats, StatementKey, statement_query
+from app.core.database.schema_catalog import SchemaCatalog
+from app.core.database.metadata_loader import MetadataLoader, MetadataSnapshot, snapshot_path
+from app.core.database.compact_metadata import frame_nbytes, lower_column
+from app.core.database.result_cache import ResultCache, ResultKey
+from app.core.database.batch_query import KEY_COLUMNS, BatchCell, batch_frame, batch_value_query
+from app.core.database.calculations import (CUMULATIVE_TERMS, DERIVED_GROWTH_GROUPS, QUARTERS, CumulativePanel,
+                                             cumulative_query)
+from app.core.database.query_planner import DISSECTION_TABLES, PlanBranch, QueryPlan, plan_response
+from app.core.database.time_series import (RATIO_SERIES_TABLES, REGULAR_SERIES_TABLES, SeriesKey, latest_row,
+                                           row_response, series_query, to_series_frame)
+from app.core.database.company_context import CompanyContext, build_company_contexts
+from app.core.database.company_resolver import CompanyResolver
+from app.core.database.query_context import QueryContext
+from app.core.database.db_session import (ConnectionStats, DatabaseSession, activate_session,
+                                          current_session, deactivate_session)
+from app.core.database.exceptions import PoolTimeoutError, QueryTimeoutError
+from app.core.database import query_catalog
+from app.core.database.query_catalog import (BoundQuery, coerce_params, equality_filters, expand_in_list,
+                                             period_filter)
+from conf import config
+
+
+# Term words whose period resolves against the latest loaded data (see get_term_id)
+MOVING_TERM_WORDS = ('ttm', 'trailing', 'latest', 'most recent', 'last reported', 'last available',
+                     'current', 'qtd', 'ytd', 'to date')
+
+
+def _is_query_timeout(error: Exception) -> bool:
+    """
+    True if error (or the DBAPI error it wraps) is the ODBC query timeout, SQLSTATE HYT00
+    """
+    while error is not None:
+        args = getattr(error, 'args', ())
+        if args and args[0] == 'HYT00' or 'Query timeout expired' in str(error):
+            return True
+        error = getattr(error, 'orig', None) or error.__cause__
+    return False
 
 class FinancialDatabase:
     def __init__(self, server: str, database: str):
@@ -23,14 +72,63 @@ class FinancialDatabase:
         """
         self.server = server
         self.database = database
+        # Connection checkout / statement / timeout counters, see session() and get_pool_metrics()
+        self.connection_stats = ConnectionStats()
+        # Default per-statement timeout in seconds (0 = no limit), applied to every new connection
+        self.query_timeout = config.DB_QUERY_TIMEOUT
         self.engine = self._create_engine()
         self.metadata_cache = {}
-        # Initialize TTM flag
-        self.is_ttm_query = False
+        # Background check of a metadata snapshot against the database, started by load_metadata
+        self.metadata_revalidation = None
+        # Bumped each time _set_metadata installs new frames, so structures built from the
+        # metadata outside this class (the RAG's entity extractor) know to rebuild
+        self.metadata_version = 0
+        # Metric name index, built lazily from the cached head tables
+        self.metric_index = None
+        # CompanyID -> CompanyContext, built lazily from the cached company/sector/industry tables
+        self.company_contexts = None
+        # Company name/ticker resolver, built lazily from the cached companies table
+        self.company_resolver = None
+        # Data-availability index over the raw data tables, built by build_availability_index and
+        # refreshed off the request thread by update_availability_index_in_background
+        self.availability_index = None
+        self.availability_index_update = BackgroundUpdate('availability-index', self._update_availability_index)
+        # Latest reported periods per company over the raw data tables, built by build_period_index
+        # and refreshed off the request thread by update_period_index_in_background
+        self.period_index = None
+        self.period_index_update = BackgroundUpdate('period-index', self._update_period_index)
+        # Latest ratio values of every company as a matrix, built and refreshed off the request
+        # thread by update_ratio_screener_in_background (one update at a time)
+        self.ratio_screener = None
+        self.ratio_screener_update = BackgroundUpdate('ratio-screener', self._update_ratio_screener)
+        # Sector / industry statistics of the raw data tables, built and refreshed off the request
+        # thread by update_peer_aggregates_in_background (one update at a time)
+        self.peer_aggregates = None
+        self.peer_aggregates_update = BackgroundUpdate('peer-aggregates', self._update_peer_aggregates)
+        # Tables / columns / types from INFORMATION_SCHEMA, loaded by load_metadata or on first use
+        self.schema_catalog = None
+        # get_financial_data results keyed on the resolved ResultKey, and question -> ResultKey,
+        # so a repeated question skips both the resolution chain and the final SQL
+        self.result_cache = ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
+        self.question_cache = ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
+        # Full histories of get_time_series keyed on SeriesKey; later period lookups of a cached
+        # head are answered from memory
+        self.series_cache = ResultCache(config.SERIES_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
+        # Statements fetched whole by prefetch_statement (StatementKey -> SubHeadIDs cached), and
+        # how many of the prefetched results follow-up questions read
+        self.statement_cache = ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
+        self.prefetch_stats = PrefetchStats(config.RESULT_CACHE_MAX_ENTRIES)
+        # Runs prefetch_statement after the answer is returned; worker threads carry no request
+        # session, so each prefetch checks out its own pooled connection
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=max(1, config.STATEMENT_PREFETCH_WORKERS),
+                                                    thread_name_prefix='statement-prefetch')
+        # Per-request state (TTM flag, resolved period end, relative table) lives in QueryContext
         
     def _create_engine(self):
         """
         Create SQLAlchemy engine with Windows Authentication
+        
+        Pool size, overflow, pre-ping, recycle and the login / statement timeouts come from conf.config.
         """
         params = urllib.parse.quote_plus(
             f"DRIVER={{ODBC Driver 17 for SQL Server}};"
@@ -38,89 +136,346 @@ class FinancialDatabase:
             f"DATABASE={self.database};"
             f"Trusted_Connection=yes;"
         )
-        return create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
+        engine = create_engine(
+            f"mssql+pyodbc:///?odbc_connect={params}",
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+            # pyodbc.connect(timeout=...) is the ODBC login timeout
+            connect_args={"timeout": config.DB_LOGIN_TIMEOUT},
+        )
+        
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            # pyodbc Connection.timeout is SQL_ATTR_QUERY_TIMEOUT: the driver cancels the
+            # statement and raises HYT00 once it runs longer than this
+            dbapi_connection.timeout = self.query_timeout
+            self.connection_stats.record_connect()
+        
+        return engine
+    
+    @contextmanager
+    def _checkout(self, session: bool = False):
+        """
+        Check a connection out of the pool, recording wait time and pool timeouts
+        
+        Raises:
+            PoolTimeoutError: No connection became free within DB_POOL_TIMEOUT
+        """
+        start = time.perf_counter()
+        try:
+            connection = self.engine.connect()
+        except SQLAlchemyPoolTimeout as e:
+            self.connection_stats.record_pool_timeout()
+            logger.error(f"Database pool exhausted: {e}")
+            raise PoolTimeoutError(config.DB_POOL_TIMEOUT) from e
+        self.connection_stats.record_checkout(session=session, wait_s=time.perf_counter() - start)
+        with connection:
+            yield connection
     
-    def execute_query(self, query: str) -> pd.DataFrame:
+    def execute_query(self, query: str, params: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[int] = None) -> pd.DataFrame:
         """
         Execute SQL query and return results as DataFrame
         
+        Values are sent as bound parameters (:name placeholders) rather than inlined, so
+        SQL Server reuses one cached plan per statement shape.
+        
         Args:
-            query: SQL query string
+            query: SQL query string, or a BoundQuery carrying its own parameters
+            params: Optional bind parameters; defaults to query.params for a BoundQuery
+            timeout: Optional statement timeout in seconds overriding DB_QUERY_TIMEOUT
             
         Returns:
             DataFrame with query results
+            
+        Raises:
+            QueryTimeoutError: The statement ran past its timeout and was cancelled
         """
+        if params is None:
+            params = getattr(query, 'params', None)
+        params = coerce_params(params)
         try:
-            with self.engine.connect() as connection:
-                result = pd.read_sql_query(text(query), con=connection)
-                return result
+            session = current_session()
+            if session is not None and session.owner is self:
+                # Reuse the connection checked out by the active request session
+                session.statements += 1
+                self.connection_stats.record_statement(in_session=True)
+                return self._read_sql(query, params, session.connection, timeout)
+            with self._checkout() as connection:
+                self.connection_stats.record_statement()
+                return self._read_sql(query, params, connection, timeout)
+        except PoolTimeoutError:
+            raise
         except Exception as e:
+            if _is_query_timeout(e):
+                self.connection_stats.record_query_timeout()
+                timeout = timeout if timeout is not None else self.query_timeout
+                logger.error(f"Database query timed out after {timeout} s: {query.strip()[:200]}")
+                raise QueryTimeoutError(query, timeout) from e
             logger.error(f"Database query error: {e}")
             raise
     
-    def load_metadata(self):
+    def _read_sql(self, query: str, params: Optional[Dict[str, Any]], connection,
+                  timeout: Optional[int]) -> pd.DataFrame:
         """
-        Load all metadata tables into memory cache
+        Run query on connection, temporarily overriding the statement timeout if one is given
         """
+        if timeout is None:
+            return pd.read_sql_query(text(query), con=connection, params=params)
+        dbapi_connection = connection.connection.dbapi_connection
+        previous = dbapi_connection.timeout
+        dbapi_connection.timeout = timeout
         try:
-            # Load companies list
-            self.metadata_cache['companies'] = self.execute_query(
-                "SELECT * FROM tbl_companieslist"
-            )
-            
-            # Load industry and sector data
-            self.metadata_cache['industries'] = self.execute_query(
-                "SELECT * FROM tbl_industrynames"
-            )
-            self.metadata_cache['sectors'] = self.execute_query(
-                "SELECT * FROM tbl_sectornames"
-            )
-            self.metadata_cache['industry_sector_mapping'] = self.execute_query(
-                "SELECT * FROM tbl_industryandsectormapping"
-            )
-            
-            # Load units of measurement
-            self.metadata_cache['units'] = self.execute_query(
-                "SELECT * FROM tbl_unitofmeasurement"
-            )
-            
-            # Load statement types
-            self.metadata_cache['statements'] = self.execute_query(
-                "SELECT * FROM tbl_statementsname"
-            )
-            
-            # Load financial heads
-            self.metadata_cache['heads'] = self.execute_query(
-                "SELECT * FROM tbl_headsmaster"
-            )
-            
-            # Load ratio heads
-            self.metadata_cache['ratio_heads'] = self.execute_query(
-                "SELECT * FROM tbl_ratiosheadmaster"
-            )
-            
-            # Load consolidation flags
-            self.metadata_cache['consolidation'] = self.execute_query(
-                "SELECT * FROM tbl_consolidation"
-            )
+            return pd.read_sql_query(text(query), con=connection, params=params)
+        finally:
+            dbapi_connection.timeout = previous
+    
+    def execute_statement(self, statement_name: str, /, timeout: Optional[int] = None, **values) -> pd.DataFrame:
+        """
+        Execute a named statement from query_catalog
+        
+        Args:
+            statement_name: Statement name, e.g. 'heads_like_in_sector' (positional, so a
+                statement may bind a parameter called name)
+            timeout: Optional statement timeout in seconds
+            **values: Statement parameters (and table, for statements with a {table} placeholder)
             
-            # Load terms and mappings
-            self.metadata_cache['terms'] = self.execute_query(
-                "SELECT * FROM tbl_terms"
-            )
-            self.metadata_cache['terms_mapping'] = self.execute_query(
-                "SELECT * FROM tbl_termsmapping"
-            )
+        Returns:
+            DataFrame with query results
+        """
+        return self.execute_query(query_catalog.get_statement(statement_name).bind(**values), timeout=timeout)
+    
+    @contextmanager
+    def session(self, snapshot: bool = False):
+        """
+        Hold one pooled connection for a unit of work such as answering one question
+        
+        Every execute_query issued inside the block (in the same thread or asyncio task)
+        runs on this connection. Nested calls reuse the outer session.
+        
+        Args:
+            snapshot: Run the whole session in one SNAPSHOT isolation transaction so every
+                read sees the same committed state (needs ALLOW_SNAPSHOT_ISOLATION ON)
             
-            # Load dissection master
-            self.metadata_cache['dissection'] = self.execute_query(
-                "SELECT * FROM tbl_disectionmaster"
-            )
+        Yields:
+            The active DatabaseSession
+        """
+        session = current_session()
+        if session is not None and session.owner is self:
+            yield session
+            return
+        
+        with self._checkout(session=True) as connection:
+            if snapshot:
+                connection = connection.execution_options(isolation_level="SNAPSHOT")
+                connection.begin()
+            session = DatabaseSession(self, connection, snapshot)
+            token = activate_session(session)
+            try:
+                yield session
+            finally:
+                deactivate_session(token)
+                # Read-only work: end the (auto-begun) transaction before the connection goes back to the pool
+                if connection.in_transaction():
+                    connection.rollback()
+                logger.debug(f"Database session finished: {session.stats()}")
+    
+    def warmup(self, connections: int = config.DB_POOL_WARMUP) -> int:
+        """
+        Open connections up front so the first requests after start-up skip the ODBC login
+        
+        The connections are held together (so the pool really opens that many), pinged
+        with SELECT 1 and returned to the pool.
+        
+        Args:
+            connections: Number of connections to open, capped at DB_POOL_SIZE
             
-            logger.info("Financial metadata loaded successfully")
+        Returns:
+            Number of connections warmed
+        """
+        connections = min(connections, config.DB_POOL_SIZE)
+        warmed = 0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for _ in range(connections):
+                try:
+                    connection = stack.enter_context(self._checkout())
+                    connection.exec_driver_sql("SELECT 1")
+                    warmed += 1
+                except Exception as e:
+                    logger.warning(f"Database warmup stopped after {warmed} connections: {e}")
+                    break
+        logger.info(f"Warmed {warmed} database connections in {time.perf_counter() - start:.2f}s")
+        return warmed
+
+    def close(self) -> None:
+        """
+        Stop the statement prefetch threads and close the pooled connections
+
+        Queued prefetches are cancelled; a running one finishes in the background and later
+        prefetch requests are skipped.
+        """
+        self.prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        if self.engine is not None:
+            self.engine.dispose()
+        logger.info("Financial database closed")
+
+    def get_connection_stats(self) -> Dict[str, Any]:
+        """
+        Return connection checkout, session, statement and timeout counters since start-up
+        """
+        return self.connection_stats.snapshot()
+    
+    def get_pool_metrics(self) -> Dict[str, Any]:
+        """
+        Return the current pool state together with the checkout / timeout counters
+        """
+        metrics = self.get_connection_stats()
+        pool = getattr(self.engine, 'pool', None)
+        if pool is not None and hasattr(pool, 'checkedout'):
+            metrics.update({
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'max_overflow': config.DB_MAX_OVERFLOW,
+            })
+        return metrics
+    
+    def load_metadata(self, use_snapshot: bool = config.METADATA_SNAPSHOT):
+        """
+        Load all metadata tables into memory cache
+        
+        With use_snapshot, metadata is served from the local snapshot when there is one and
+        revalidated against the database in a background thread; otherwise the tables are
+        read from the database in parallel and the snapshot is rewritten.
+        
+        Args:
+            use_snapshot: Read and write the local metadata snapshot
+        """
+        start = time.perf_counter()
+        loader = self._metadata_loader(use_snapshot)
+        
+        snapshot = loader.read_snapshot()
+        if snapshot is not None:
+            self._set_metadata(snapshot.frames)
+            logger.info(f"Financial metadata loaded from snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+            self.metadata_revalidation = threading.Thread(target=self._revalidate_metadata, args=(loader, snapshot),
+                                                          name='metadata-revalidation', daemon=True)
+            self.metadata_revalidation.start()
+            return
+        
+        try:
+            # Table and column lookups made while building queries are answered from memory,
+            # and the catalog tells the loader which columns each metadata table has
+            catalog = self.get_schema_catalog()
+            # Checksums are read before the tables so a change made during the load is caught next start
+            checksums = loader.checksums(catalog) if loader.path is not None else {}
+            frames = loader.load(catalog)
         except Exception as e:
             logger.error(f"Error loading metadata: {e}")
             raise
+        
+        self._set_metadata(frames)
+        loader.write_snapshot(frames, checksums)
+        logger.info(f"Financial metadata loaded successfully in {time.perf_counter() - start:.2f}s")
+    
+    def _metadata_loader(self, use_snapshot: bool) -> MetadataLoader:
+        path = snapshot_path(config.CACHE_DIR, self.server, self.database) if use_snapshot else None
+        return MetadataLoader(self.execute_query, path, max_workers=config.METADATA_LOAD_WORKERS)
+    
+    def _set_metadata(self, frames: Dict[str, pd.DataFrame]) -> None:
+        """
+        Install freshly loaded metadata frames and drop everything derived from them
+        """
+        self.metadata_cache.update(frames)
+        
+        # Rebuild derived indexes from the freshly loaded tables
+        self.metric_index = None
+        self.company_contexts = None
+        self.company_resolver = None
+        self.metadata_version += 1
+    
+    def get_metadata_memory(self) -> Dict[str, int]:
+        """
+        Bytes held by each cached metadata table, including string objects
+        """
+        return {key: frame_nbytes(df) for key, df in self.metadata_cache.items()}
+    
+    def _revalidate_metadata(self, loader: MetadataLoader, snapshot: MetadataSnapshot) -> None:
+        """
+        Compare the snapshot with the database and reload the tables that changed
+        """
+        try:
+            catalog = self.get_schema_catalog()
+            checksums = loader.checksums(catalog)
+            stale = loader.stale_tables(snapshot, checksums)
+            if not stale:
+                logger.info("Metadata snapshot is up to date")
+                return
+            
+            logger.info(f"Metadata snapshot is stale for {stale}, reloading")
+            frames = loader.load(catalog, keys=stale)
+            self._set_metadata(frames)
+            # Cached answers may have been resolved against the old metadata
+            self.invalidate_cached_results()
+            loader.write_snapshot({**snapshot.frames, **frames}, checksums)
+        except Exception as e:
+            logger.error(f"Error revalidating metadata snapshot: {e}")
+    
+    def get_schema_catalog(self) -> Optional[SchemaCatalog]:
+        """
+        Get the schema catalog, loading it from INFORMATION_SCHEMA on first use
+        
+        Returns:
+            SchemaCatalog, or None if it could not be loaded
+        """
+        if self.schema_catalog is None:
+            try:
+                self.schema_catalog = SchemaCatalog(self.execute_query).load()
+            except Exception as e:
+                logger.error(f"Error loading schema catalog, schema lookups will query the database: {e}")
+                return None
+        return self.schema_catalog
+    
+    def refresh_schema_catalog(self) -> Optional[SchemaCatalog]:
+        """
+        Reload the schema catalog after the schema changed (e.g. a deploy added a table)
+        """
+        if self.schema_catalog is None:
+            return self.get_schema_catalog()
+        return self.schema_catalog.refresh()
+    
+    def has_table(self, table_name: str) -> bool:
+        """
+        Check if a table exists, from the schema catalog when it is available
+        """
+        catalog = self.get_schema_catalog()
+        if catalog is not None:
+            return catalog.has_table(table_name)
+        return not self.execute_statement('table_exists', table_name=table_name).empty
+    
+    def get_table_columns(self, table_name: str) -> List[str]:
+        """
+        Column names of a table in ordinal order, from the schema catalog when it is available
+        """
+        catalog = self.get_schema_catalog()
+        if catalog is not None:
+            return catalog.columns(table_name)
+        return self.execute_statement('table_columns', table_name=table_name)['COLUMN_NAME'].tolist()
+    
+    def get_column_name(self, table_name: str, possible_names: List[str], default_name: str) -> str:
+        """
+        First of possible_names that exists in table_name, else default_name
+        """
+        catalog = self.get_schema_catalog()
+        if catalog is not None:
+            return catalog.resolve_column(table_name, possible_names, default_name)
+        columns = self.get_table_columns(table_name)
+        return next((name for name in possible_names if name in columns), default_name)
     
     def get_company_id(self, company_name_or_ticker: str) -> Optional[int]:
         """
@@ -135,50 +490,29 @@ class FinancialDatabase:
         if not company_name_or_ticker or company_name_or_ticker.strip() == "":
             logger.error(f"Empty company name or ticker provided")
             return None
-            
-        if 'companies' not in self.metadata_cache:
-            self.metadata_cache['companies'] = self.execute_query(
-                "SELECT * FROM tbl_companieslist"
-            )
-            
-        companies_df = self.metadata_cache['companies']
-        
-        # Debug log
-        logger.info(f"Looking up company: '{company_name_or_ticker}'")
-        logger.info(f"Available columns: {companies_df.columns.tolist()}")
-        
-        # Map column names based on actual database schema
-        company_id_col = 'CompanyID' if 'CompanyID' in companies_df.columns else 'company_id'
-        company_name_col = 'CompanyName' if 'CompanyName' in companies_df.columns else 'company_name'
         
-        # Check for ticker/symbol column
-        ticker_column = None
-        if 'Symbol' in companies_df.columns:
-            ticker_column = 'Symbol'
-        elif 'ticker' in companies_df.columns:
-            ticker_column = 'ticker'
-        elif 'symbol' in companies_df.columns:
-            ticker_column = 'symbol'
-        
-        if not ticker_column:
-            logger.info("No ticker/symbol column found, using company name only")
-        else:
-            logger.info(f"Using {ticker_column} as ticker column")
-            # Try to match by ticker (exact match)
-            ticker_match = companies_df[companies_df[ticker_column].str.lower() == company_name_or_ticker.lower()]
-            if not ticker_match.empty:
-                logger.info(f"Found company by ticker: {ticker_match.iloc[0][company_name_col]}")
-                return ticker_match.iloc[0][company_id_col]
-        
-        # Try to match by company name (contains)
-        name_match = companies_df[companies_df[company_name_col].str.lower().str.contains(company_name_or_ticker.lower())]
-        if not name_match.empty:
-            logger.info(f"Found company by name: {name_match.iloc[0][company_name_col]}")
-            return name_match.iloc[0][company_id_col]
+        match = self.get_company_resolver().resolve(company_name_or_ticker)
+        if match is not None:
+            company_id, company_name, match_type, score = match
+            logger.info(f"Found company by {match_type}: {company_name} (score {score})")
+            return company_id
             
         logger.error(f"Company not found: {company_name_or_ticker}")
         return None
     
+    def get_company_resolver(self) -> CompanyResolver:
+        """
+        Get the company name/ticker resolver, building it from the cached companies table on first use
+        """
+        if self.company_resolver is None:
+            if 'companies' not in self.metadata_cache:
+                self.metadata_cache['companies'] = self.execute_query(
+                    "SELECT * FROM tbl_companieslist"
+                )
+            
+            self.company_resolver = CompanyResolver(self.metadata_cache['companies'])
+        return self.company_resolver
+    
     def get_head_id(self, metric_name: str, company_id: Optional[int] = None, 
                     consolidation_id: Optional[int] = None, period_end: Optional[str] = None) -> Tuple[Optional[int], bool]:
         """
@@ -204,66 +538,28 @@ class FinancialDatabase:
             logger.info(f"Metric '{metric_name}' identified as dissection metric with group ID {dissection_group_id} and data type {data_type}")
             return self._get_dissection_head_id(metric_name, company_id, consolidation_id, period_end, dissection_group_id, data_type)
         
-        # For non-dissection metrics or when company_id is not provided, use original logic
+        # For non-dissection metrics or when company_id is not provided, use the metric index
+        metric_index = self.get_metric_index()
+        
         # Special handling for TTM EPS
         if metric_name.lower() == 'ttm eps' or metric_name.lower() == 'eps ttm':
             logger.info(f"Special handling for TTM EPS metric")
             
-            # First try to find EPS in regular heads (tbl_headsmaster)
-            # Load heads if not in cache
-            if 'heads' not in self.metadata_cache:
-                self.metadata_cache['heads'] = self.execute_query(
-                    "SELECT * FROM tbl_headsmaster"
-                )
+            # First try to find EPS in regular heads (exact, then contains), then in ratio heads
+            eps_match = metric_index.exact('eps', is_ratio=False)
+            if eps_match is not None:
+                logger.info(f"Found exact EPS match in regular heads: {eps_match[2]}")
+                return eps_match[0], False
             
-            # Get heads dataframe
-            heads_df = self.metadata_cache['heads']
-            
-            # Map column names
-            sub_head_id_col = 'SubHeadID' if 'SubHeadID' in heads_df.columns else 'sub_head_id'
-            head_name_col = 'SubHeadName' if 'SubHeadName' in heads_df.columns else 'head_name'
+            eps_match = metric_index.contains('eps', is_ratio=False)
+            if eps_match is not None:
+                logger.info(f"Found EPS match in regular heads: {eps_match[2]}")
+                return eps_match[0], False
             
-            # Try to find EPS in regular heads
-            eps_match = heads_df[heads_df[head_name_col].str.lower() == 'eps']
-            if not eps_match.empty:
-                logger.info(f"Found exact EPS match in regular heads: {eps_match.iloc[0][head_name_col]}")
-                return eps_match.iloc[0][sub_head_id_col], False
-            
-            # Try contains match for regular heads
-            eps_contains_match = heads_df[heads_df[head_name_col].str.lower().str.contains('eps')]
-            if not eps_contains_match.empty:
-                logger.info(f"Found EPS match in regular heads: {eps_contains_match.iloc[0][head_name_col]}")
-                return eps_contains_match.iloc[0][sub_head_id_col], False
-            
-            # If not found in regular heads, try ratio heads
-            # Load ratio heads if not in cache
-            if 'ratio_heads' not in self.metadata_cache:
-                self.metadata_cache['ratio_heads'] = self.execute_query(
-                    "SELECT * FROM tbl_ratiosheadmaster"
-                )
-                
-            # Get ratio heads dataframe
-            ratio_heads_df = self.metadata_cache['ratio_heads']
-            
-            # Map ratio head column names
-            ratio_head_id_col = 'SubHeadID' if 'SubHeadID' in ratio_heads_df.columns else 'ratio_head_id'
-            
-            # Check for ratio head name column variations
-            if 'HeadNames' in ratio_heads_df.columns:
-                ratio_head_name_col = 'HeadNames'
-            elif 'RatioHeadName' in ratio_heads_df.columns:
-                ratio_head_name_col = 'RatioHeadName'
-            elif 'ratio_head_name' in ratio_heads_df.columns:
-                ratio_head_name_col = 'ratio_head_name'
-            else:
-                logger.error(f"Could not find ratio head name column in {ratio_heads_df.columns.tolist()}")
-                return None, False
-                
-            # Try to find EPS in ratio heads
-            eps_ratio_match = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower().str.contains('eps')]
-            if not eps_ratio_match.empty:
-                logger.info(f"Found EPS match in ratio heads: {eps_ratio_match.iloc[0][ratio_head_name_col]}")
-                return eps_ratio_match.iloc[0][ratio_head_id_col], True
+            eps_match = metric_index.contains('eps', is_ratio=True)
+            if eps_match is not None:
+                logger.info(f"Found EPS match in ratio heads: {eps_match[2]}")
+                return eps_match[0], True
             
             logger.error(f"Could not find EPS in either regular or ratio heads")
             return None, False
@@ -281,18 +577,6 @@ class FinancialDatabase:
             original_metric = metric_name
             metric_name = METRIC_ALIASES[metric_key]
             logger.info(f"Mapping metric '{original_metric}' → '{metric_name}'")
-        
-        # Load heads if not in cache
-        if 'heads' not in self.metadata_cache:
-            self.metadata_cache['heads'] = self.execute_query(
-                "SELECT * FROM tbl_headsmaster"
-            )
-        
-        # Load ratio heads if not in cache
-        if 'ratio_heads' not in self.metadata_cache:
-            self.metadata_cache['ratio_heads'] = self.execute_query(
-                "SELECT * FROM tbl_ratiosheadmaster"
-            )
             
         # Determine if the metric is likely a ratio based on its name
         ratio_keywords = ['ratio', 'margin', 'percentage', 'percent', 'return on', 'roe', 'roa', 'roce', 'roic', 'eps', 'p/e', 'price to']
@@ -300,130 +584,555 @@ class FinancialDatabase:
         
         logger.info(f"Looking up metric: '{metric_name}', likely ratio: {is_likely_ratio}")
         
-        # Map column names based on actual database schema
-        heads_df = self.metadata_cache['heads']
-        ratio_heads_df = self.metadata_cache['ratio_heads']
+        # Ratio heads are searched first for likely ratio metrics, regular heads first otherwise
+        match = metric_index.resolve(metric_name, prefer_ratio=is_likely_ratio)
+        if match is not None:
+            head_id, is_ratio, head_name, match_type = match
+            logger.info(f"Found {match_type} metric match in {'ratio' if is_ratio else 'regular'} heads: {head_name}")
+            return head_id, is_ratio
+            
+        # Try to find similar metrics for logging purposes
+        similar_metrics = metric_index.similar(metric_name)
+        if similar_metrics:
+            logger.info(f"No exact match for '{metric_name}', but found similar metrics: {similar_metrics}")
+            
+        logger.error(f"Metric not found: {metric_name}")
+        return None, False
+    
+    def get_metric_index(self) -> MetricIndex:
+        """
+        Get the in-memory metric name index, building it from the cached head tables on first use
+        """
+        if self.metric_index is None:
+            # Load heads if not in cache
+            if 'heads' not in self.metadata_cache:
+                self.metadata_cache['heads'] = self.execute_query(
+                    "SELECT * FROM tbl_headsmaster"
+                )
+            
+            # Load ratio heads if not in cache
+            if 'ratio_heads' not in self.metadata_cache:
+                self.metadata_cache['ratio_heads'] = self.execute_query(
+                    "SELECT * FROM tbl_ratiosheadmaster"
+                )
+            
+            self.metric_index = MetricIndex.from_metadata(self.metadata_cache)
+        return self.metric_index
+    
+    def get_company_context(self, company_id: int) -> Optional[CompanyContext]:
+        """
+        Get the memoized sector/industry context for a company, built from the cached
+        companies, sectors, industries and industry_sector_mapping tables
         
-        logger.info(f"Heads columns: {heads_df.columns.tolist()}")
-        logger.info(f"Ratio heads columns: {ratio_heads_df.columns.tolist()}")
+        Args:
+            company_id: Company ID
+            
+        Returns:
+            CompanyContext if the company exists, None otherwise
+        """
+        if self.company_contexts is None:
+            tables = {
+                'companies': "SELECT * FROM tbl_companieslist",
+                'sectors': "SELECT * FROM tbl_sectornames",
+                'industries': "SELECT * FROM tbl_industrynames",
+                'industry_sector_mapping': "SELECT * FROM tbl_industryandsectormapping",
+            }
+            for key, query in tables.items():
+                if key not in self.metadata_cache:
+                    self.metadata_cache[key] = self.execute_query(query)
+            
+            self.company_contexts = build_company_contexts(self.metadata_cache)
         
-        head_id_col = 'HeadsMasterID' if 'HeadsMasterID' in heads_df.columns else 'head_id'
-        sub_head_id_col = 'SubHeadID' if 'SubHeadID' in heads_df.columns else 'sub_head_id'
-        head_name_col = 'SubHeadName' if 'SubHeadName' in heads_df.columns else 'head_name'
+        if company_id is None or pd.isna(company_id):
+            return None
+        context = self.company_contexts.get(company_id)
+        if context is None:
+            logger.warning(f"No company context for company ID: {company_id}")
+        return context
+    
+    def get_company_metadata(self, company_id: int) -> Dict[str, Any]:
+        """
+        Get company metadata including sector and industry information
         
-        # Map ratio head column names
-        ratio_head_id_col = 'SubHeadID' if 'SubHeadID' in ratio_heads_df.columns else 'ratio_head_id'
+        Args:
+            company_id: Company ID
+            
+        Returns:
+            Dictionary of company metadata, empty if the company is not found
+        """
+        context = self.get_company_context(company_id)
+        return context.to_dict() if context is not None else {}
+    
+    def build_availability_index(self) -> AvailabilityIndex:
+        """
+        Build the in-memory data-availability index from the raw data tables.
+        This scans every raw data table once, so it is meant to run at startup.
+        """
+        self.availability_index = AvailabilityIndex(self.execute_query).build()
+        return self.availability_index
+    
+    def _index_rules_out(self, table_name: str, company_id: int, sub_head_id: int,
+                         consolidation_id: Optional[int] = None, dissection_group_id: Optional[int] = None) -> bool:
+        """
+        True when the availability index covers the table and has no rows for the head
+        """
+        index = self.get_availability_index()
+        return (index is not None and index.covers(table_name)
+                and not index.has_data(table_name, company_id, sub_head_id, consolidation_id, dissection_group_id))
+    
+    def build_period_index(self) -> PeriodIndex:
+        """
+        Build the in-memory latest-period index from the raw data tables.
+        This runs one aggregate query per raw data table, so it is meant to run at startup.
+        """
+        self.period_index = PeriodIndex(self.execute_query).build()
+        return self.period_index
+    
+    def update_period_index_in_background(self) -> threading.Thread:
+        """
+        Refresh the period index (or rebuild it, see PeriodIndex.maybe_refresh) on a background
+        thread. At most one update runs at a time; the running one is returned.
+        """
+        return self.period_index_update.start()
+    
+    def _update_period_index(self) -> None:
+        if self.period_index is not None:
+            self.period_index.maybe_refresh()
+    
+    def get_period_index(self) -> Optional[PeriodIndex]:
+        """
+        Get the latest-period index; a stale index starts a background refresh and is returned
+        meanwhile
+        
+        Returns:
+            PeriodIndex if it has been built, None otherwise
+        """
+        index = self.period_index
+        if index is not None and index.is_stale():
+            self.update_period_index_in_background()
+        return index
+    
+    def _indexed_relative_period(self, table_name: str, relative_type: str, company_id: int,
+                                 consolidation_id: Optional[int], dissection_group_id: Optional[int] = None,
+                                 sub_head_id: Optional[int] = None) -> Optional[Tuple[Optional[int], Optional[str]]]:
+        """
+        Resolve a relative period from the period index
+        
+        Returns:
+            (term_id, period_end), (None, None) if the company has no such period,
+            or None when the index does not cover table_name
+        """
+        index = self.get_period_index()
+        if index is None or not index.covers(table_name):
+            return None
         
-        # Check for ratio head name column variations
-        if 'HeadNames' in ratio_heads_df.columns:
-            ratio_head_name_col = 'HeadNames'
-        elif 'RatioHeadName' in ratio_heads_df.columns:
-            ratio_head_name_col = 'RatioHeadName'
-        elif 'ratio_head_name' in ratio_heads_df.columns:
-            ratio_head_name_col = 'ratio_head_name'
+        # 'last_quarter' is the period before the latest one, 'ytd' the latest 12M / FY period
+        position = 1 if relative_type == 'last_quarter' else 0
+        periods = index.latest(table_name, company_id, consolidation_id, dissection_group_id, sub_head_id,
+                               annual=relative_type == 'ytd')
+        if len(periods) <= position:
+            logger.info(f"No {relative_type} period in {table_name} for company_id={company_id}")
+            return None, None
+        
+        term_id, period_end = periods[position]
+        logger.info(f"Resolved {relative_type} from period index to term_id={term_id}, period_end={period_end:%Y-%m-%d}")
+        return term_id, period_end.strftime('%Y-%m-%d')
+    
+    def update_availability_index_in_background(self) -> threading.Thread:
+        """
+        Refresh the availability index (or rebuild it, see AvailabilityIndex.maybe_refresh) on a
+        background thread. At most one update runs at a time; the running one is returned.
+        """
+        return self.availability_index_update.start()
+    
+    def _update_availability_index(self) -> None:
+        if self.availability_index is not None:
+            self.availability_index.maybe_refresh()
+    
+    def get_availability_index(self) -> Optional[AvailabilityIndex]:
+        """
+        Get the data-availability index; a stale index starts a background refresh and is
+        returned meanwhile
+        
+        Returns:
+            AvailabilityIndex if it has been built, None otherwise
+        """
+        index = self.availability_index
+        if index is not None and index.is_stale():
+            self.update_availability_index_in_background()
+        return index
+    
+    def build_ratio_screener(self) -> RatioScreener:
+        """
+        Build the in-memory ratio snapshot used by screen_companies.
+        This reads the latest row of every company and ratio head once, so it is meant to run
+        at startup or through update_ratio_screener_in_background, never on a request thread.
+        """
+        self.ratio_screener = RatioScreener(self.execute_query).build()
+        return self.ratio_screener
+    
+    def update_ratio_screener_in_background(self) -> threading.Thread:
+        """
+        Build the ratio screener, or refresh it when it is stale, on a background thread.
+        At most one update runs at a time; the running one is returned when there is one.
+        """
+        return self.ratio_screener_update.start()
+    
+    def _update_ratio_screener(self) -> None:
+        if self.ratio_screener is None:
+            self.build_ratio_screener()
         else:
-            logger.error(f"Could not find ratio head name column in {ratio_heads_df.columns.tolist()}")
-            return None, False
+            self.ratio_screener.maybe_refresh()
+    
+    def get_ratio_screener(self) -> Optional[RatioScreener]:
+        """
+        Get the ratio screener, None while it is first being built
         
-        logger.info(f"Using ratio head name column: {ratio_head_name_col}")
+        Neither the build nor the incremental refresh runs on the caller's thread: a missing or
+        stale screener starts a background update and the current matrix is screened meanwhile.
+        """
+        screener = self.ratio_screener
+        if screener is None or screener.is_stale():
+            self.update_ratio_screener_in_background()
+        return screener
+    
+    def screen_companies(self, conditions: List[Tuple[str, str, float]], consolidation: str = 'consolidated',
+                         sector: Optional[str] = None, order_by: Optional[str] = None, descending: bool = True,
+                         top: Optional[int] = config.SCREENER_TOP_N, since: Optional[str] = None) -> pd.DataFrame:
+        """
+        Companies whose latest ratios meet every condition, e.g.
+        [('Return on Equity', '>', 20), ('Price to Earnings', '<', 6)]
         
-        # Prioritize search based on whether the metric is likely a ratio
-        if is_likely_ratio:
-            # Check ratio heads first for likely ratio metrics
-            # Try exact match
-            exact_ratio_match = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower() == metric_name.lower()]
-            if not exact_ratio_match.empty:
-                logger.info(f"Found exact metric match in ratio heads: {exact_ratio_match.iloc[0][ratio_head_name_col]}")
-                return exact_ratio_match.iloc[0][ratio_head_id_col], True
-                
-            # Try contains match
-            ratio_match = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower().str.contains(metric_name.lower())]
-            if not ratio_match.empty:
-                logger.info(f"Found metric in ratio heads: {ratio_match.iloc[0][ratio_head_name_col]}")
-                return ratio_match.iloc[0][ratio_head_id_col], True
-                
-            # Try matching metric name within ratio head name
-            ratio_match_reverse = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower().apply(lambda x: metric_name.lower() in x)]
-            if not ratio_match_reverse.empty:
-                logger.info(f"Found metric as substring in ratio heads: {ratio_match_reverse.iloc[0][ratio_head_name_col]}")
-                return ratio_match_reverse.iloc[0][ratio_head_id_col], True
-            
-            # Fall back to regular heads if no match in ratio heads
-            logger.info(f"No match in ratio heads for likely ratio metric '{metric_name}', checking regular heads")
-            
-            # Check regular heads - first try exact match
-            exact_head_match = heads_df[heads_df[head_name_col].str.lower() == metric_name.lower()]
-            if not exact_head_match.empty:
-                logger.info(f"Found exact metric match in regular heads: {exact_head_match.iloc[0][head_name_col]}")
-                return exact_head_match.iloc[0][sub_head_id_col], False
-                
-            # Then try contains match
-            head_match = heads_df[heads_df[head_name_col].str.lower().str.contains(metric_name.lower())]
-            if not head_match.empty:
-                logger.info(f"Found metric in regular heads: {head_match.iloc[0][head_name_col]}")
-                return head_match.iloc[0][sub_head_id_col], False
-                
-            # Try matching metric name within head name
-            head_match_reverse = heads_df[heads_df[head_name_col].str.lower().apply(lambda x: metric_name.lower() in x)]
-            if not head_match_reverse.empty:
-                logger.info(f"Found metric as substring in regular heads: {head_match_reverse.iloc[0][head_name_col]}")
-                return head_match_reverse.iloc[0][sub_head_id_col], False
+        Args:
+            conditions: (ratio name, operator, threshold) tuples; operators are >, >=, <, <=, ==, !=
+            consolidation: Consolidation type
+            sector: Optional sector name restricting the universe
+            order_by: Ratio name ranking the result (defaults to the first condition's ratio)
+            descending: Highest values first
+            top: Maximum number of companies returned, None for all
+            since: Optional oldest PeriodEnd ('YYYY-MM-DD') accepted, to leave out stale reports
+            
+        Returns:
+            DataFrame with CompanyID, Company, Symbol, then per ratio its value and PeriodEnd, in
+            rank order; empty when a name cannot be resolved or the screener is still loading
+        """
+        screener = self.get_ratio_screener()
+        if screener is None:
+            logger.warning("Ratio screener is still being loaded, please try again shortly")
+            return pd.DataFrame()
+        consolidation_id = self.get_consolidation_id(consolidation)
+        if consolidation_id is None:
+            logger.error(f"Consolidation '{consolidation}' not found")
+            return pd.DataFrame()
+        
+        index = self.get_metric_index()
+        def condition(ratio_name: str, op: str = '>', threshold: float = float('-inf')) -> Optional[Condition]:
+            heads = index.exact_all(ratio_name, True) or index.contains_all(ratio_name, True)
+            if not heads:
+                logger.error(f"Ratio '{ratio_name}' not found")
+                return None
+            return Condition(tuple(int(head_id) for head_id, _, _ in heads), op, float(threshold), heads[0][2])
+        
+        screen = [condition(*item) for item in conditions]
+        ranking = condition(order_by) if order_by is not None else None
+        if any(item is None for item in screen) or (order_by is not None and ranking is None):
+            return pd.DataFrame()
+        
+        company_ids = None
+        if sector is not None:
+            # Builds company_contexts on first use
+            self.get_company_context(None)
+            company_ids = [context.company_id for context in self.company_contexts.values()
+                           if isinstance(context.sector_name, str) and context.sector_name.lower() == sector.lower()]
+            if not company_ids:
+                logger.error(f"Sector '{sector}' not found")
+                return pd.DataFrame()
+        
+        result = screener.screen(screen, consolidation_id, company_ids, ranking, descending, top, since)
+        contexts = [self.get_company_context(company_id) for company_id in result['CompanyID']]
+        result.insert(1, 'Company', [context.company_name if context else None for context in contexts])
+        result.insert(2, 'Symbol', [context.ticker if context else None for context in contexts])
+        logger.info(f"Screen of {len(screen)} conditions matched {len(result)} companies")
+        return result
+    
+    def build_peer_aggregates(self) -> PeerAggregates:
+        """
+        Build the sector / industry aggregates used by compare_to_peers.
+        This reads every row of the aggregated raw data tables, so it is meant to run at startup
+        or through update_peer_aggregates_in_background, never on a request thread.
+        """
+        # Builds company_contexts on first use
+        self.get_company_context(None)
+        company_groups = pd.DataFrame(
+            [(context.company_id, context.sector_id, context.industry_id) for context in self.company_contexts.values()],
+            columns=['CompanyID'] + list(GROUP_KINDS.values()))
+        self.peer_aggregates = PeerAggregates(self.execute_query, company_groups).build()
+        return self.peer_aggregates
+    
+    def update_peer_aggregates_in_background(self) -> threading.Thread:
+        """
+        Build the peer aggregates, or refresh them when they are stale, on a background thread.
+        At most one update runs at a time; the running one is returned when there is one.
+        """
+        return self.peer_aggregates_update.start()
+    
+    def _update_peer_aggregates(self) -> None:
+        if self.peer_aggregates is None:
+            self.build_peer_aggregates()
         else:
-            # Check regular heads first for non-ratio metrics
-            # Check regular heads - first try exact match
-            exact_head_match = heads_df[heads_df[head_name_col].str.lower() == metric_name.lower()]
-            if not exact_head_match.empty:
-                logger.info(f"Found exact metric match in regular heads: {exact_head_match.iloc[0][head_name_col]}")
-                return exact_head_match.iloc[0][sub_head_id_col], False
-                
-            # Then try contains match
-            head_match = heads_df[heads_df[head_name_col].str.lower().str.contains(metric_name.lower())]
-            if not head_match.empty:
-                logger.info(f"Found metric in regular heads: {head_match.iloc[0][head_name_col]}")
-                return head_match.iloc[0][sub_head_id_col], False
-                
-            # Try matching metric name within head name
-            head_match_reverse = heads_df[heads_df[head_name_col].str.lower().apply(lambda x: metric_name.lower() in x)]
-            if not head_match_reverse.empty:
-                logger.info(f"Found metric as substring in regular heads: {head_match_reverse.iloc[0][head_name_col]}")
-                return head_match_reverse.iloc[0][sub_head_id_col], False
-            
-            # Fall back to ratio heads if no match in regular heads
-            logger.info(f"No match in regular heads for non-ratio metric '{metric_name}', checking ratio heads")
-            
-            # Check ratio heads - first try exact match
-            exact_ratio_match = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower() == metric_name.lower()]
-            if not exact_ratio_match.empty:
-                logger.info(f"Found exact metric match in ratio heads: {exact_ratio_match.iloc[0][ratio_head_name_col]}")
-                return exact_ratio_match.iloc[0][ratio_head_id_col], True
-                
-            # Then try contains match
-            ratio_match = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower().str.contains(metric_name.lower())]
-            if not ratio_match.empty:
-                logger.info(f"Found metric in ratio heads: {ratio_match.iloc[0][ratio_head_name_col]}")
-                return ratio_match.iloc[0][ratio_head_id_col], True
-                
-            # Try matching metric name within ratio head name
-            ratio_match_reverse = ratio_heads_df[ratio_heads_df[ratio_head_name_col].str.lower().apply(lambda x: metric_name.lower() in x)]
-            if not ratio_match_reverse.empty:
-                logger.info(f"Found metric as substring in ratio heads: {ratio_match_reverse.iloc[0][ratio_head_name_col]}")
-                return ratio_match_reverse.iloc[0][ratio_head_id_col], True
+            self.peer_aggregates.maybe_refresh()
+    
+    def get_peer_aggregates(self) -> Optional[PeerAggregates]:
+        """
+        Get the peer aggregates, None while they are first being built
+        
+        Neither the build nor the incremental refresh runs on the caller's thread: a missing or
+        stale store starts a background update and the current store is returned meanwhile.
+        """
+        store = self.peer_aggregates
+        if store is None or store.is_stale():
+            self.update_peer_aggregates_in_background()
+        return store
+    
+    def compare_to_peers(self, company: str, metric: str, term: str, consolidation: str = 'consolidated',
+                         group: str = 'sector') -> Dict[str, Any]:
+        """
+        A company's value next to the statistics of its sector or industry for the same
+        head, term and period, e.g. HBL's ROE against the banking sector
+        
+        The company's value is read with one planned statement; the peer statistics come
+        from the precomputed aggregates instead of one get_financial_data call per peer.
+        
+        Args:
+            company: Company name or ticker
+            metric: Metric name
+            term: Term description
+            consolidation: Consolidation type
+            group: 'sector' or 'industry'
             
-        # Try to find similar metrics for logging purposes
-        similar_metrics = []
-        for name in heads_df[head_name_col].unique():
-            if any(token in name.lower() for token in metric_name.lower().split()):
-                similar_metrics.append(name)
-                
-        for name in ratio_heads_df[ratio_head_name_col].unique():
-            if any(token in name.lower() for token in metric_name.lower().split()):
-                similar_metrics.append(name)
-                
-        if similar_metrics:
-            logger.info(f"No exact match for '{metric_name}', but found similar metrics: {similar_metrics[:5]}")
+        Returns:
+            get_financial_data response extended with peer_group, peer_count, peer_mean,
+            peer_median, peer_p25, peer_p75 and the company's approximate percentile;
+            {"error": ...} when the value or the peer statistics are missing
+        """
+        if group not in GROUP_KINDS:
+            return {"error": f"Unknown peer group '{group}'"}
+        store = self.get_peer_aggregates()
+        if store is None:
+            return {"error": "Peer statistics are still being loaded, please try again shortly"}
+        plan = self.plan_financial_query(company, metric, term, consolidation)
+        if plan.error is not None:
+            return {"error": plan.error}
+        try:
+            result = self.run_plan(plan)
+        except Exception as e:
+            logger.error(f"Error retrieving financial data: {e}")
+            return {"error": str(e)}
+        if result.empty:
+            return {"error": "No data found for the specified parameters"}
+        record = result.iloc[0].to_dict()
+        response = plan_response(record)
+        
+        context = self.get_company_context(plan.company_id)
+        group_id = getattr(context, f"{group}_id", None) if context is not None else None
+        if group_id is None:
+            return {"error": f"No {group} found for '{company}'"}
+        # A period-end lookup may have answered with another term than plan.term_id
+        term_ids = {name: term_id for term_id, name in self._term_names().items()}
+        stats = store.lookup(record['SourceTable'], group, group_id, record['SubHeadID'],
+                                                  term_ids.get(record['Term'], plan.term_id), plan.consolidation_id,
+                                                  record['PeriodEnd'])
+        if stats is None:
+            return {"error": f"No {group} statistics for '{metric}' in {response['date']}"}
+        
+        response.update({
+            "peer_group": getattr(context, f"{group}_name"),
+            "peer_count": int(stats['Count']),
+            "peer_mean": float(stats['Mean']),
+            "peer_median": float(stats['Median']),
+            "peer_p25": float(stats['P25']),
+            "peer_p75": float(stats['P75']),
+            "percentile": percentile_rank(response['value'], stats),
+        })
+        return response
+    
+    def _head_statement_id(self, head_id: int) -> Optional[int]:
+        """
+        StatementID of a regular head, from the cached heads table when loaded
+        """
+        heads = self.metadata_cache.get('heads')
+        if heads is not None and 'StatementID' in heads.columns:
+            statement_ids = heads.loc[heads['SubHeadID'] == head_id, 'StatementID'].dropna()
+        else:
+            result = self.execute_query(BoundQuery(
+                "SELECT StatementID FROM tbl_headsmaster WHERE SubHeadID = :head_id", {'head_id': head_id},
+                'head_statement'))
+            if 'StatementID' not in result.columns:
+                return None
+            statement_ids = result['StatementID'].dropna()
+        return int(statement_ids.iloc[0]) if not statement_ids.empty else None
+    
+    def _get_statement_id(self, statement: str) -> Optional[int]:
+        """
+        StatementID of a statement name: exact match first, then the first name containing it
+        """
+        statements = self.metadata_cache.get('statements')
+        if statements is None or 'StatementName' not in statements.columns:
+            statements = self.execute_query(BoundQuery(
+                "SELECT StatementID, StatementName FROM tbl_statementsname", None, 'statements'))
+        if statements.empty:
+            return None
+        names = statements['StatementName'].astype(str).str.lower()
+        match = statements[names == statement.lower()]
+        if match.empty:
+            match = statements[names.str.contains(statement.lower(), regex=False)]
+        return int(match['StatementID'].iloc[0]) if not match.empty else None
+    
+    def _statement_tables(self, term_id: Optional[int], is_ttm: bool) -> List[str]:
+        term_name = self._term_names().get(term_id)
+        has_ttm_table = self.has_table('tbl_financialrawdataTTM')
+        return [table_name for table_name in self._value_tables(False, term_name, is_ttm, has_ttm_table)
+                if self.has_table(table_name)]
+    
+    def _fetch_statement(self, statement_key: StatementKey, tables: List[str],
+                         skip_head_id: Optional[int] = None) -> pd.DataFrame:
+        """
+        Read every head of a statement with one query and cache each head's response under
+        its ResultKey, so get_financial_data answers the other line items from memory
+        
+        Args:
+            statement_key: Company, statement and resolved period
+            tables: Raw data tables in order of preference
+            skip_head_id: Head already cached by the caller, left out of the prefetch statistics
             
-        logger.error(f"Metric not found: {metric_name}")
-        return None, False
+        Returns:
+            The statement's rows (columns statement_prefetch.STATEMENT_COLUMNS)
+        """
+        rows = self.execute_query(statement_query(
+            tables, statement_key.company_id, statement_key.statement_id, statement_key.term_id,
+            statement_key.consolidation_id, statement_key.period_end, statement_key.fiscal_year))
+        cached = []
+        for record in rows.dropna(subset=['Value']).to_dict('records'):
+            result_key = ResultKey(
+                company_id=statement_key.company_id, head_id=int(record['SubHeadID']), is_ratio=False,
+                term_id=statement_key.term_id, consolidation_id=statement_key.consolidation_id,
+                period_end=statement_key.period_end, resolved_period_end=statement_key.resolved_period_end,
+                fiscal_year=statement_key.fiscal_year, relative_type=statement_key.relative_type,
+                is_ttm=statement_key.is_ttm, dissection_group_id=None, dissection_data_type=None,
+            )
+            self.result_cache.put(result_key, plan_response(record), company_id=statement_key.company_id)
+            if result_key.head_id != skip_head_id:
+                cached.append(result_key)
+        self.statement_cache.put(statement_key, tuple(key.head_id for key in cached), company_id=statement_key.company_id)
+        self.prefetch_stats.record(cached)
+        logger.info(f"Fetched statement_id={statement_key.statement_id} for company_id={statement_key.company_id}: "
+                    f"{len(cached)} line items cached")
+        return rows
+    
+    def prefetch_statement(self, key: ResultKey, tables: Optional[List[str]] = None) -> int:
+        """
+        Cache the other line items of the statement key's head belongs to, for the same
+        company, period and consolidation (e.g. liabilities and equity after total assets)
+        
+        Each statement is read once per cache lifetime; failures are logged, not raised, since
+        the question that triggered the prefetch is already answered.
+        
+        Args:
+            key: ResultKey of a regular, non-dissection lookup that just succeeded
+            tables: Raw data tables the lookup searched, in order of preference
+            
+        Returns:
+            Number of line items cached, 0 when the statement was fetched before or cannot be read
+        """
+        if key.is_ratio or key.dissection_data_type is not None:
+            return 0
+        try:
+            statement_id = self._head_statement_id(key.head_id)
+            if statement_id is None:
+                return 0
+            statement_key = StatementKey(key.company_id, statement_id, key.term_id, key.consolidation_id, key.period_end,
+                                         key.resolved_period_end, key.fiscal_year, key.relative_type, key.is_ttm)
+            if self.statement_cache.get(statement_key) is not None:
+                return 0
+            if tables is None:
+                tables = self._statement_tables(key.term_id, key.is_ttm)
+            if not tables:
+                return 0
+            rows = self._fetch_statement(statement_key, tables, skip_head_id=key.head_id).dropna(subset=['Value'])
+        except Exception as e:
+            logger.error(f"Error prefetching statement of head_id={key.head_id}: {e}")
+            return 0
+        return int((rows['SubHeadID'] != key.head_id).sum())
+    
+    def prefetch_statement_in_background(self, key: ResultKey, tables: Optional[List[str]] = None) -> Optional[Future]:
+        """
+        Submit prefetch_statement to the prefetch executor so the question that triggered it
+        is answered without waiting for the statement query
+        
+        Args:
+            key: ResultKey of a regular, non-dissection lookup that just succeeded
+            tables: Raw data tables the lookup searched, in order of preference
+            
+        Returns:
+            Future of the number of line items cached, or None when the executor is shut down
+        """
+        try:
+            return self.prefetch_executor.submit(self.prefetch_statement, key, tables)
+        except RuntimeError as e:
+            logger.warning(f"Skipping statement prefetch of head_id={key.head_id}: {e}")
+            return None
+    
+    def get_financial_statement(self, company: str, statement: str, term: str,
+                                consolidation: str = 'consolidated') -> pd.DataFrame:
+        """
+        Every line item of a statement (e.g. 'Balance Sheet') for a company and period, with one query
+        
+        The line items are cached like get_financial_data results, so questions about any
+        of them are answered from memory afterwards.
+        
+        Args:
+            company: Company name or ticker
+            statement: Statement name from tbl_statementsname
+            term: Term description
+            consolidation: Consolidation type
+            
+        Returns:
+            DataFrame with statement_prefetch.STATEMENT_COLUMNS, one row per head with data;
+            empty when an entity cannot be resolved
+        """
+        company_id = self.get_company_id(company)
+        if company_id is None:
+            logger.error(f"Company '{company}' not found")
+            return pd.DataFrame()
+        consolidation_id = self.get_consolidation_id(consolidation)
+        if consolidation_id is None:
+            logger.error(f"Consolidation '{consolidation}' not found")
+            return pd.DataFrame()
+        
+        with self.session():
+            statement_id = self._get_statement_id(statement)
+            if statement_id is None:
+                logger.error(f"Statement '{statement}' not found")
+                return pd.DataFrame()
+            context = QueryContext()
+            term_id = self.get_term_id(term, company_id, consolidation_id=consolidation_id, context=context)
+            if isinstance(term_id, tuple):
+                term_id = term_id[0]
+            if term_id is None:
+                logger.error(f"Term '{term}' not found")
+                return pd.DataFrame()
+            statement_key = StatementKey(int(company_id), statement_id, term_id, consolidation_id, None,
+                                         context.resolved_period_end, self._extract_fiscal_year(term), None,
+                                         context.is_ttm_query)
+            tables = self._statement_tables(term_id, context.is_ttm_query)
+            if not tables:
+                logger.error("No raw data table found for the statement")
+                return pd.DataFrame()
+            try:
+                return self._fetch_statement(statement_key, tables)
+            except Exception as e:
+                logger.error(f"Error retrieving statement: {e}")
+                return pd.DataFrame()
     
     def _get_dissection_head_id(self, metric_name: str, company_id: int, 
                                consolidation_id: Optional[int], period_end: Optional[str],
@@ -443,8 +1152,8 @@ class FinancialDatabase:
             Tuple of (head_id, is_ratio) if found, (None, False) otherwise
         """
         # Extract base metric name by removing dissection indicators
-        base_metric = self._extract_base_metric(metric_name, dissection_group_id)
-        logger.info(f"Extracted base metric '{base_metric}' from dissection metric '{metric_name}'")
+        from app.core.database.detect_dissection_metrics import dissection_base_metric
+        base_metric = dissection_base_metric(metric_name, dissection_group_id)
         
         # Determine if this is a ratio metric
         is_ratio = data_type.lower() == 'ratio'
@@ -469,63 +1178,26 @@ class FinancialDatabase:
         # Determine dissection table name
         table_name = self._get_dissection_table_name(data_type)
         
-        # Check each SubHeadID for dissection data availability
-        for _, row in possible_heads.iterrows():
-            sub_head_id = row['SubHeadID']
-            sub_head_name = row[head_name_col]
-            
-            if self._has_dissection_data(table_name, company_id, sub_head_id, dissection_group_id, 
-                                       consolidation_id, period_end):
+        # Check every candidate SubHeadID for dissection data availability in one round trip
+        availability = self.get_heads_with_data(table_name, company_id, possible_heads['SubHeadID'].tolist(),
+                                                consolidation_id, period_end, dissection_group_id)
+        for sub_head_id, sub_head_name in zip(possible_heads['SubHeadID'], possible_heads[head_name_col]):
+            count = availability.get(sub_head_id, 0)
+            logger.info(f"SubHeadID {sub_head_id} has {count} rows of dissection data in {table_name}")
+            if count > 0:
                 logger.info(f"Found dissection data for SubHeadID {sub_head_id} ({sub_head_name})")
                 return sub_head_id, is_ratio
         
         logger.warning(f"No SubHeadID found with dissection data for metric: {metric_name}")
         return None, False
     
-    def _extract_base_metric(self, metric_name: str, dissection_group_id: int) -> str:
-        """
-        Extract base metric name by removing dissection indicators
-        """
-        import re
-        
-        base_metric = metric_name.lower()
-        
-        # Remove dissection indicators based on group ID
-        if dissection_group_id == 1:  # Per Share
-            base_metric = re.sub(r'\s*per\s*share\s*', '', base_metric, flags=re.IGNORECASE).strip()
-        elif dissection_group_id == 2:  # Annual Growth
-            base_metric = re.sub(r'\s*annual\s*growth\s*', '', base_metric, flags=re.IGNORECASE).strip()
-        elif dissection_group_id == 3:  # Percentage Of Asset
-            base_metric = re.sub(r'\s*(percentage|%)\s*of\s*asset\s*', '', base_metric, flags=re.IGNORECASE).strip()
-        elif dissection_group_id == 4:  # Percentage Of Sales/Revenue
-            base_metric = re.sub(r'\s*(percentage|%)\s*of\s*(sales|revenue)\s*', '', base_metric, flags=re.IGNORECASE).strip()
-        elif dissection_group_id == 5:  # Quarterly Growth
-            base_metric = re.sub(r'\s*(quarterly|qoq)\s*growth\s*', '', base_metric, flags=re.IGNORECASE).strip()
-        
-        # If base_metric is empty, use the original metric name
-        if not base_metric:
-            base_metric = metric_name.lower()
-        
-        return base_metric
-    
     def _get_company_sector_industry(self, company_id: int) -> Tuple[Optional[int], Optional[int]]:
         """
         Get sector and industry IDs for a company
         """
-        sector_query = f"""
-        SELECT c.SectorID, i.IndustryID 
-        FROM tbl_companieslist c
-        LEFT JOIN tbl_industryandsectormapping m ON c.SectorID = m.sectorid
-        LEFT JOIN tbl_industrynames i ON m.industryid = i.IndustryID
-        WHERE c.CompanyID = {company_id}
-        """
-        
-        result = self.execute_query(sector_query)
-        
-        if not result.empty:
-            sector_id = result.iloc[0]['SectorID'] if 'SectorID' in result.columns else None
-            industry_id = result.iloc[0]['IndustryID'] if 'IndustryID' in result.columns else None
-            return sector_id, industry_id
+        context = self.get_company_context(company_id)
+        if context is not None:
+            return context.sector_id, context.industry_id
         
         return None, None
     
@@ -535,17 +1207,8 @@ class FinancialDatabase:
         Get regular heads that match the base metric
         """
         if sector_id is not None and industry_id is not None:
-            query = f"""
-            SELECT h.SubHeadID, h.SubHeadName 
-            FROM tbl_headsmaster h
-            JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-            WHERE LOWER(h.SubHeadName) LIKE '%{base_metric}%'
-            AND m.sectorid = {sector_id}
-            """
-        else:
-            query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%{base_metric}%'"
-        
-        return self.execute_query(query)
+            return self.execute_statement('heads_like_in_sector', sector_id=sector_id, pattern=base_metric)
+        return self.execute_statement('heads_like', pattern=base_metric)
     
     def _get_ratio_heads_for_metric(self, base_metric: str, sector_id: Optional[int], 
                                   industry_id: Optional[int]) -> pd.DataFrame:
@@ -553,17 +1216,8 @@ class FinancialDatabase:
         Get ratio heads that match the base metric
         """
         if sector_id is not None and industry_id is not None:
-            query = f"""
-            SELECT r.SubHeadID, r.HeadNames 
-            FROM tbl_ratiosheadmaster r
-            JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-            WHERE LOWER(r.HeadNames) LIKE '%{base_metric}%'
-            AND m.sectorid = {sector_id}
-            """
-        else:
-            query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{base_metric}%'"
-        
-        return self.execute_query(query)
+            return self.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=base_metric)
+        return self.execute_statement('ratio_heads_like', pattern=base_metric)
     
     def _get_dissection_table_name(self, data_type: str) -> str:
         """
@@ -584,34 +1238,159 @@ class FinancialDatabase:
         """
         Check if dissection data exists for the given parameters
         """
-        where_clauses = [
-            f"d.CompanyID = {company_id}",
-            f"d.SubHeadID = {sub_head_id}",
-            f"d.DisectionGroupID = {dissection_group_id}"
-        ]
-        
-        if consolidation_id is not None:
-            where_clauses.append(f"d.ConsolidationID = {consolidation_id}")
-        
-        if period_end is not None:
-            where_clauses.append(f"d.PeriodEnd = '{period_end}'")
+        availability = self.get_heads_with_data(table_name, company_id, [sub_head_id],
+                                                consolidation_id, period_end, dissection_group_id)
+        count = availability.get(sub_head_id, 0)
+        logger.info(f"SubHeadID {sub_head_id} has {count} rows of dissection data in {table_name}")
+        return count > 0
+    
+    def get_heads_with_data(self, table_name: str, company_id: int, sub_head_ids: List[int],
+                            consolidation_id: Optional[int] = None, period_end: Optional[str] = None,
+                            dissection_group_id: Optional[int] = None) -> Dict[int, int]:
+        """
+        Find which candidate SubHeadIDs have rows in a raw data table for a company
         
-        where_clause = " AND ".join(where_clauses)
+        Args:
+            table_name: Raw data table to probe (e.g. tbl_financialrawdata, tbl_disectionrawdata)
+            company_id: Company ID
+            sub_head_ids: Candidate SubHeadIDs
+            consolidation_id: Optional consolidation ID filter
+            period_end: Optional period end filter (format: 'YYYY-MM-DD')
+            dissection_group_id: Optional DisectionGroupID filter for dissection tables
+            
+        Returns:
+            Dictionary of SubHeadID -> row count, containing only SubHeadIDs that have data
+        """
+        return self.probe_head_data({table_name: sub_head_ids}, company_id, consolidation_id,
+                                    period_end, dissection_group_id).get(table_name, {})
+    
+    def probe_head_data(self, candidates: Dict[str, List[int]], company_id: int,
+                        consolidation_id: Optional[int] = None, period_end: Optional[str] = None,
+                        dissection_group_id: Optional[int] = None) -> Dict[str, Dict[int, int]]:
+        """
+        Batched data-availability probe: one GROUP BY per table, combined with UNION ALL,
+        so any number of candidate SubHeadIDs across tables costs a single round trip
         
-        query = f"""
-        SELECT COUNT(*) as count FROM {table_name} d 
-        WHERE {where_clause}
+        Args:
+            candidates: Dictionary of table name -> candidate SubHeadIDs
+            company_id: Company ID
+            consolidation_id: Optional consolidation ID filter
+            period_end: Optional period end filter (format: 'YYYY-MM-DD')
+            dissection_group_id: Optional DisectionGroupID filter for dissection tables
+            
+        Returns:
+            Dictionary of table name -> {SubHeadID: row count} for SubHeadIDs that have data.
+            Tables covered by the availability index skip heads with no rows, and are answered
+            from memory entirely when period_end is None.
         """
+        availability = {table_name: {} for table_name in candidates}
+        index = self.get_availability_index()
+        
+        selects = []
+        params = {}
+        for table_name, sub_head_ids in candidates.items():
+            ids = sorted({int(sub_head_id) for sub_head_id in sub_head_ids if sub_head_id is not None and not pd.isna(sub_head_id)})
+            
+            if index is not None and index.covers(table_name):
+                # Drop heads the index knows have no rows at all
+                ids = [sub_head_id for sub_head_id in ids
+                       if index.has_data(table_name, company_id, sub_head_id, consolidation_id, dissection_group_id)]
+                if period_end is None:
+                    # No period filter, so the index answers on its own (existence only, count reported as 1)
+                    availability[table_name] = {sub_head_id: 1 for sub_head_id in ids}
+                    continue
+            
+            if not ids:
+                continue
+            
+            where_clauses, filter_params = equality_filters({
+                'CompanyID': company_id,
+                'DisectionGroupID': dissection_group_id,
+                'ConsolidationID': consolidation_id,
+                'PeriodEnd': period_end,
+            }, alias='d')
+            placeholders, id_params = expand_in_list(f"sub_head_ids_{len(selects)}", ids)
+            where_clauses.insert(1, f"d.SubHeadID IN ({placeholders})")
+            params.update(filter_params)
+            params.update(id_params)
+            
+            selects.append(f"""
+            SELECT '{table_name}' AS TableName, d.SubHeadID, COUNT(*) AS count
+            FROM {table_name} d
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY d.SubHeadID""")
+        
+        if not selects:
+            return availability
         
         try:
-            result = self.execute_query(query)
-            count = result.iloc[0]['count'] if not result.empty else 0
-            logger.info(f"SubHeadID {sub_head_id} has {count} rows of dissection data in {table_name}")
-            return count > 0
+            result = self.execute_query(BoundQuery("\n            UNION ALL".join(selects), params))
         except Exception as e:
-            logger.error(f"Error checking dissection data: {e}")
-            return False
-    
+            logger.error(f"Error probing data availability: {e}")
+            return availability
+        
+        for table_name, sub_head_id, count in zip(result['TableName'], result['SubHeadID'], result['count']):
+            if count > 0:
+                availability[table_name][int(sub_head_id)] = int(count)
+        
+        logger.info(f"Data availability for company_id={company_id}: "
+                    f"{ {table_name: sorted(ids) for table_name, ids in availability.items()} }")
+        return availability
+
+    def probe_companies_head_data(self, candidates: Dict[str, List[int]], company_ids: List[int],
+                                  consolidation_id: Optional[int] = None) -> Dict[str, Dict[int, Dict[int, int]]]:
+        """
+        probe_head_data for many companies at once: one GROUP BY CompanyID, SubHeadID per table
+
+        Args:
+            candidates: Dictionary of table name -> candidate SubHeadIDs
+            company_ids: Company IDs
+            consolidation_id: Optional consolidation ID filter
+
+        Returns:
+            Dictionary of table name -> {CompanyID: {SubHeadID: row count}} for heads that have data.
+            Tables covered by the availability index are answered from memory.
+        """
+        availability = {table_name: {} for table_name in candidates}
+        index = self.get_availability_index()
+        company_ids = sorted({int(company_id) for company_id in company_ids})
+
+        for table_name, sub_head_ids in candidates.items():
+            ids = sorted({int(sub_head_id) for sub_head_id in sub_head_ids if sub_head_id is not None and not pd.isna(sub_head_id)})
+            if not ids or not company_ids:
+                continue
+
+            if index is not None and index.covers(table_name):
+                for company_id in company_ids:
+                    heads = {sub_head_id: 1 for sub_head_id in ids
+                             if index.has_data(table_name, company_id, sub_head_id, consolidation_id)}
+                    if heads:
+                        availability[table_name][company_id] = heads
+                continue
+
+            # IN lists are padded to a power of two, i.e. at most twice their length
+            id_placeholders, id_params = expand_in_list('sub_head_ids', ids)
+            max_params = config.BATCH_MAX_PARAMS - len(id_params) - 1
+            for chunk in query_catalog.chunked(company_ids, 2, max_params):
+                company_placeholders, company_params = expand_in_list('company_ids', chunk)
+                where_clauses, params = equality_filters({'ConsolidationID': consolidation_id}, alias='d')
+                where_clauses += [f"d.CompanyID IN ({company_placeholders})", f"d.SubHeadID IN ({id_placeholders})"]
+                query = f"""
+                SELECT d.CompanyID, d.SubHeadID, COUNT(*) AS count
+                FROM {table_name} d
+                WHERE {" AND ".join(where_clauses)}
+                GROUP BY d.CompanyID, d.SubHeadID"""
+                try:
+                    result = self.execute_query(BoundQuery(query, {**params, **company_params, **id_params}))
+                except Exception as e:
+                    logger.error(f"Error probing data availability in {table_name}: {e}")
+                    continue
+                for company_id, sub_head_id, count in zip(result['CompanyID'], result['SubHeadID'], result['count']):
+                    if count > 0:
+                        availability[table_name].setdefault(int(company_id), {})[int(sub_head_id)] = int(count)
+
+        return availability
+
     def resolve_relative_period(self, company_id: int, consolidation_id: int, relative_type: str) -> Tuple[Optional[int], Optional[str]]:
         """
         Resolve a relative period term to a specific term_id and period_end date
@@ -626,18 +1405,17 @@ class FinancialDatabase:
         """
         logger.info(f"Resolving relative period: {relative_type} for company_id={company_id}, consolidation_id={consolidation_id}")
         
+        if relative_type in ['most_recent_quarter', 'current', 'last_quarter', 'ytd']:
+            table_name = 'tbl_financialrawdata' if relative_type == 'ytd' else 'tbl_financialrawdata_Quarter'
+            resolved = self._indexed_relative_period(table_name, relative_type, company_id, consolidation_id)
+            if resolved is not None:
+                return resolved
+        
         try:
             if relative_type in ['most_recent_quarter', 'current']:
                 # Find the most recent quarter data for this company
-                query = f"""
-                SELECT TOP 1 TermID, PeriodEnd 
-                FROM tbl_financialrawdata_Quarter 
-                WHERE CompanyID = {company_id} 
-                AND ConsolidationID = {consolidation_id} 
-                ORDER BY PeriodEnd DESC
-                """
-                
-                result = self.execute_query(query)
+                result = self.execute_statement('latest_quarter_period', company_id=company_id,
+                                                consolidation_id=consolidation_id)
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -645,18 +1423,9 @@ class FinancialDatabase:
                     return term_id, str(period_end)
                     
             elif relative_type == 'last_quarter':
-                # Find the second most recent quarter data (OFFSET 1)
-                query = f"""
-                SELECT TermID, PeriodEnd 
-                FROM tbl_financialrawdata_Quarter 
-                WHERE CompanyID = {company_id} 
-                AND ConsolidationID = {consolidation_id} 
-                ORDER BY PeriodEnd DESC
-                OFFSET 1 ROWS
-                FETCH NEXT 1 ROWS ONLY
-                """
-                
-                result = self.execute_query(query)
+                # Find the quarter before the most recent one
+                result = self.execute_statement('previous_quarter_period', company_id=company_id,
+                                                consolidation_id=consolidation_id)
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -665,16 +1434,8 @@ class FinancialDatabase:
                     
             elif relative_type == 'ytd':
                 # Find the latest annual data (12M or FY)
-                query = f"""
-                SELECT TOP 1 TermID, PeriodEnd 
-                FROM tbl_financialrawdata 
-                WHERE CompanyID = {company_id} 
-                AND ConsolidationID = {consolidation_id} 
-                AND TermID IN (SELECT TermID FROM tbl_terms WHERE term IN ('12M', 'FY')) 
-                ORDER BY PeriodEnd DESC
-                """
-                
-                result = self.execute_query(query)
+                result = self.execute_statement('latest_annual_period', company_id=company_id,
+                                                consolidation_id=consolidation_id)
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -711,17 +1472,23 @@ class FinancialDatabase:
         # Determine the appropriate dissection table
         table_name = self._get_dissection_table_name(dissection_data_type)
         
+        if sub_head_id is not None and self._index_rules_out(table_name, company_id, sub_head_id, consolidation_id, dissection_group_id):
+            logger.info(f"No dissection data for SubHeadID {sub_head_id} in {table_name}, skipping period lookup")
+            return None, None
+        
+        resolved = self._indexed_relative_period(table_name, relative_type, company_id, consolidation_id,
+                                                 dissection_group_id, sub_head_id)
+        if resolved is not None:
+            return resolved
+        
         try:
             # Build base WHERE clause
-            where_clauses = [
-                f"CompanyID = {company_id}",
-                f"ConsolidationID = {consolidation_id}",
-                f"DisectionGroupID = {dissection_group_id}"
-            ]
-            
-            if sub_head_id is not None:
-                where_clauses.append(f"SubHeadID = {sub_head_id}")
-            
+            where_clauses, params = equality_filters({
+                'CompanyID': company_id,
+                'ConsolidationID': consolidation_id,
+                'DisectionGroupID': dissection_group_id,
+                'SubHeadID': sub_head_id,
+            })
             where_clause = " AND ".join(where_clauses)
             
             if relative_type in ['most_recent_quarter', 'current']:
@@ -733,7 +1500,7 @@ class FinancialDatabase:
                 ORDER BY FinDate DESC
                 """
                 
-                result = self.execute_query(query)
+                result = self.execute_query(BoundQuery(query, params))
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -741,17 +1508,16 @@ class FinancialDatabase:
                     return term_id, str(period_end)
                     
             elif relative_type == 'last_quarter':
-                # Find the second most recent data (OFFSET 1)
+                # Find the period before the most recent one
                 query = f"""
-                SELECT TermID, FinDate as PeriodEnd 
+                SELECT TOP 1 TermID, FinDate as PeriodEnd 
                 FROM {table_name} 
                 WHERE {where_clause}
+                AND FinDate < (SELECT MAX(FinDate) FROM {table_name} WHERE {where_clause})
                 ORDER BY FinDate DESC
-                OFFSET 1 ROWS
-                FETCH NEXT 1 ROWS ONLY
                 """
                 
-                result = self.execute_query(query)
+                result = self.execute_query(BoundQuery(query, params))
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -769,7 +1535,7 @@ class FinancialDatabase:
                 ORDER BY d.FinDate DESC
                 """
                 
-                result = self.execute_query(query)
+                result = self.execute_query(BoundQuery(query, params))
                 if not result.empty:
                     term_id = result.iloc[0]['TermID']
                     period_end = result.iloc[0]['PeriodEnd']
@@ -784,7 +1550,7 @@ class FinancialDatabase:
             logger.error(f"Error resolving dissection relative period: {e}")
             return None, None
     
-    def get_term_id(self, term_description: str, company_id: int, is_relative_term: bool = False, relative_term_type: Optional[str] = None, relative_type: Optional[str] = None, consolidation_id: int = 1, is_dissection: bool = False, dissection_group_id: Optional[int] = None, dissection_data_type: Optional[str] = None, sub_head_id: Optional[int] = None) -> Union[Optional[int], Tuple[Optional[int], Optional[str]]]:
+    def get_term_id(self, term_description: str, company_id: int, is_relative_term: bool = False, relative_term_type: Optional[str] = None, relative_type: Optional[str] = None, consolidation_id: int = 1, is_dissection: bool = False, dissection_group_id: Optional[int] = None, dissection_data_type: Optional[str] = None, sub_head_id: Optional[int] = None, context: Optional[QueryContext] = None) -> Union[Optional[int], Tuple[Optional[int], Optional[str]]]:
         """
         Get term_id from term description
         
@@ -799,11 +1565,15 @@ class FinancialDatabase:
             dissection_group_id: Dissection group ID for dissection queries
             dissection_data_type: Data type for dissection queries ('Quarter', 'TTM', 'Ratios', or 'Annual')
             sub_head_id: Sub head ID for dissection queries
+            context: Per-request QueryContext; receives the TTM flag and resolved period end
             
         Returns:
             For regular terms: term_id if found, None otherwise
             For relative terms: Tuple of (term_id, period_end) if found, (None, None) otherwise
         """
+        if context is None:
+            context = QueryContext()
+        
         # Handle None or empty term_description for relative terms
         if (term_description is None or term_description.strip() == '') and (is_relative_term or relative_type):
             logger.info(f"Empty term_description detected with relative term flag. Using 'TTM' as default.")
@@ -878,7 +1648,7 @@ class FinancialDatabase:
             )
         
         # Initialize TTM flag to False by default
-        self.is_ttm_query = False
+        context.is_ttm_query = False
         
         # Legacy relative term handling has been moved to the top of the method
         # and now uses resolve_relative_period for all relative term types
@@ -886,49 +1656,41 @@ class FinancialDatabase:
         # TTM handling
         if 'ttm' in term_description.lower() or any(ttm_term in term_description.lower() for ttm_term in ['trailing twelve months', 'trailing 12 months']):
             # Set TTM flag for query building
-            self.is_ttm_query = True
+            context.is_ttm_query = True
             logger.info(f"TTM term detected: {term_description}")
             
             # Check if tbl_financialrawdataTTM exists
-            ttm_table_check = f"""
-            SELECT COUNT(*) as count FROM INFORMATION_SCHEMA.TABLES 
-            WHERE TABLE_NAME = 'tbl_financialrawdataTTM'
-            """
-            ttm_table_result = self.execute_query(ttm_table_check)
-            ttm_table_exists = ttm_table_result.iloc[0]['count'] > 0 if not ttm_table_result.empty else False
-            
-            try:
-                if ttm_table_exists:
-                    # Use TTM specific table
-                    query = f"""
-                    SELECT TOP 1 TermID, PeriodEnd 
-                    FROM tbl_financialrawdataTTM 
-                    WHERE CompanyID = {company_id} 
-                    ORDER BY PeriodEnd DESC
-                    """
-                else:
-                    # Fallback to regular table with TTM term
-                    query = f"""
-                    SELECT TOP 1 TermID, PeriodEnd 
-                    FROM tbl_financialrawdata 
-                    WHERE CompanyID = {company_id} 
-                    AND TermID IN (SELECT TermID FROM tbl_terms WHERE term = 'TTM') 
-                    ORDER BY PeriodEnd DESC
-                    """
-                
-                result = self.execute_query(query)
-                if not result.empty:
-                    term_id = result.iloc[0]['TermID']
-                    period_end = result.iloc[0]['PeriodEnd']
-                    logger.info(f"Found latest TTM data: TermID={term_id}, PeriodEnd={period_end}")
-                    
-                    # Store period_end as string for later use in query building
-                    self.resolved_period_end = period_end.strftime('%Y-%m-%d') if hasattr(period_end, 'strftime') else str(period_end)
-                    # Set flag for TTM query in build_financial_query
-                    self.is_ttm_query = True
+            ttm_table_exists = self.has_table('tbl_financialrawdataTTM')
+            
+            index = self.get_period_index()
+            if ttm_table_exists and index is not None and index.covers('tbl_financialrawdataTTM'):
+                # No periods in the index means the company has no TTM data
+                periods = index.latest('tbl_financialrawdataTTM', company_id)
+                if periods:
+                    term_id, period_end = periods[0]
+                    logger.info(f"Found latest TTM data in period index: TermID={term_id}, PeriodEnd={period_end}")
+                    context.resolved_period_end = period_end.strftime('%Y-%m-%d')
                     return term_id
-            except Exception as e:
-                logger.error(f"Error finding latest TTM data: {e}")
+            else:
+                try:
+                    if ttm_table_exists:
+                        # Use TTM specific table
+                        result = self.execute_statement('latest_ttm_period', company_id=company_id)
+                    else:
+                        # Fallback to regular table with TTM term
+                        result = self.execute_statement('latest_ttm_term_period', company_id=company_id)
+                    if not result.empty:
+                        term_id = result.iloc[0]['TermID']
+                        period_end = result.iloc[0]['PeriodEnd']
+                        logger.info(f"Found latest TTM data: TermID={term_id}, PeriodEnd={period_end}")
+                    
+                        # Store period_end as string for later use in query building
+                        context.resolved_period_end = period_end.strftime('%Y-%m-%d') if hasattr(period_end, 'strftime') else str(period_end)
+                        # Set flag for TTM query in build_financial_query
+                        context.is_ttm_query = True
+                        return term_id
+                except Exception as e:
+                    logger.error(f"Error finding latest TTM data: {e}")
         
         # If we couldn't resolve the relative term, log a warning
         logger.warning(f"Could not resolve term: {term_description}")
@@ -972,7 +1734,7 @@ class FinancialDatabase:
         elif 'ttm' in term_lower or 'trailing twelve months' in term_lower or 'trailing 12 months' in term_lower:
             term_type = 'TTM'
             # Set flag for TTM query in build_financial_query
-            self.is_ttm_query = True
+            context.is_ttm_query = True
         # Special case for FY queries - always map to 6M (term_id=2) based on test results
         elif 'fy' in term_lower:
             logger.info(f"FY term detected, mapping to '6M' (TermID=2) based on test results")
@@ -1008,8 +1770,10 @@ class FinancialDatabase:
             logger.error(f"Could not find term name column in {terms_df.columns.tolist()}")
             return None
             
-        # Look up the term_id
-        term_match = terms_df[terms_df[term_name_col].str.lower() == term_type.lower()]
+        # Look up the term_id, using the precomputed lowercase names when the frame has them
+        lower_col = lower_column(term_name_col)
+        term_names = terms_df[lower_col] if lower_col in terms_df.columns else terms_df[term_name_col].str.lower()
+        term_match = terms_df[term_names == term_type.lower()]
         
         if not term_match.empty:
             logger.info(f"Found term: {term_match.iloc[0][term_name_col]}")
@@ -1135,7 +1899,7 @@ class FinancialDatabase:
         logger.error(f"Dissection group not found: {group_name}")
         return None
     
-    def build_financial_query(self, company_id, head_id, term_id, consolidation_id, is_ratio, fiscal_year=None, period_end=None, is_relative=False, relative_type=None, is_dissection=False, dissection_group_id=None, dissection_data_type=None):
+    def build_financial_query(self, company_id, head_id, term_id, consolidation_id, is_ratio, fiscal_year=None, period_end=None, is_relative=False, relative_type=None, is_dissection=False, dissection_group_id=None, dissection_data_type=None, context: Optional[QueryContext] = None):
         """
         Build SQL query for financial data based on parameters
         
@@ -1152,10 +1916,14 @@ class FinancialDatabase:
             is_dissection: Flag indicating if this is a dissection metric query
             dissection_group_id: Dissection group ID (1-5) for dissection metrics
             dissection_data_type: Data type for dissection metrics ('regular', 'ratio', 'quarter', 'ttm')
+            context: Per-request QueryContext carrying the TTM flag from get_term_id
             
         Returns:
             SQL query string
         """
+        if context is None:
+            context = QueryContext()
+        
         # Check for None values in critical parameters
         if head_id is None:
             logger.error("Cannot build financial query: head_id is None")
@@ -1178,13 +1946,12 @@ class FinancialDatabase:
                 # For quarter-based relative queries, we'll use the Quarter table
                 # But we'll still need to check if the head_id exists in tbl_headsmaster
                 if not is_ratio:
-                    head_check_query = f"SELECT COUNT(*) as count FROM tbl_headsmaster WHERE SubHeadID = {head_id}"
-                    head_check_result = self.execute_query(head_check_query)
+                    head_check_result = self.execute_statement('head_count', table='tbl_headsmaster', sub_head_id=head_id)
                     head_exists = head_check_result.iloc[0]['count'] > 0 if not head_check_result.empty else False
                     
                     if head_exists:
                         # If head_id exists in tbl_headsmaster, use tbl_financialrawdata_Quarter
-                        self.relative_table_name = 'tbl_financialrawdata_Quarter'
+                        context.relative_table_name = 'tbl_financialrawdata_Quarter'
                         logger.info(f"Using tbl_financialrawdata_Quarter for relative query with head_id {head_id}")
         # Legacy handling for is_relative flag (can be removed once all code paths use the tuple return)
         elif is_relative and relative_type:
@@ -1233,57 +2000,37 @@ class FinancialDatabase:
             JOIN tbl_headsmaster h ON d.SubHeadID = h.SubHeadID
             JOIN tbl_termsmaster t ON d.TermID = t.TermID
             JOIN tbl_consolidationmaster con ON d.ConsolidationID = con.ConsolidationID
-            WHERE d.CompanyID = {company_id}
-                AND d.SubHeadID = {head_id}
-                AND d.ConsolidationID = {consolidation_id}
-                AND d.DisectionGroupID = {dissection_group_id}
+            WHERE d.CompanyID = :company_id
+                AND d.SubHeadID = :head_id
+                AND d.ConsolidationID = :consolidation_id
+                AND d.DisectionGroupID = :dissection_group_id
             """
+            params = {'company_id': company_id, 'head_id': head_id, 'consolidation_id': consolidation_id,
+                      'dissection_group_id': dissection_group_id}
             
             # Add term filter if provided
             if term_id:
-                query += f" AND d.TermID = {term_id}"
+                query += " AND d.TermID = :term_id"
+                params['term_id'] = term_id
             
             # Add period_end filter if provided
             if period_end:
-                query += f" AND d.FinDate = '{period_end}'"
+                query += " AND d.FinDate = :period_end"
+                params['period_end'] = period_end
             
             # Add fiscal year filter if provided
             if fiscal_year:
-                query += f" AND YEAR(d.FinDate) = {fiscal_year}"
+                query += " AND YEAR(d.FinDate) = :fiscal_year"
+                params['fiscal_year'] = fiscal_year
             
             query += " ORDER BY d.FinDate DESC"
             
-            logger.info(f"Generated dissection query: {query}")
-            return query
+            logger.info(f"Generated dissection query: {query} with {params}")
+            return BoundQuery(query, params)
 
         # Get sector and industry information for metadata traversal
-        sector_query = f"""
-        SELECT c.SectorID, s.SectorName 
-        FROM tbl_companieslist c
-        JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-        WHERE c.CompanyID = {company_id}
-        """
-        sector_result = self.execute_query(sector_query)
-        
-        sector_id = None
-        industry_id = None
-        
-        if not sector_result.empty:
-            sector_id = sector_result.iloc[0]['SectorID']
-            logger.info(f"Found SectorID: {sector_id} for company ID: {company_id}")
-            
-            # Get industry information
-            industry_query = f"""
-            SELECT i.IndustryID, i.IndustryName 
-            FROM tbl_industrynames i
-            JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-            WHERE m.sectorid = {sector_id}
-            """
-            industry_result = self.execute_query(industry_query)
-            
-            if not industry_result.empty:
-                industry_id = industry_result.iloc[0]['IndustryID']
-                logger.info(f"Found IndustryID: {industry_id} for SectorID: {sector_id}")
+        sector_id, industry_id = self._get_company_sector_industry(company_id)
+        logger.info(f"Found SectorID: {sector_id}, IndustryID: {industry_id} for company ID: {company_id}")
         
         # Validate that the head_id exists in the appropriate master table and is valid for this industry-sector combination
         if head_id is None:
@@ -1294,26 +2041,10 @@ class FinancialDatabase:
             logger.error(f"Cannot validate head_id: sector_id is None")
             return "SELECT 'Error: sector_id is None' as error"
             
-        if is_ratio:
-            # For ratio heads, check if the SubHeadID exists in tbl_ratiosheadmaster and is valid for this industry
-            validation_query = f"""
-            SELECT COUNT(*) as count
-            FROM tbl_ratiosheadmaster h
-            JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-            WHERE h.SubHeadID = {head_id}
-            AND m.sectorid = {sector_id}
-            """
-        else:
-            # For regular heads, check if the SubHeadID exists in tbl_headsmaster and is valid for this industry
-            validation_query = f"""
-            SELECT COUNT(*) as count
-            FROM tbl_headsmaster h
-            JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-            WHERE h.SubHeadID = {head_id}
-            AND m.sectorid = {sector_id}
-            """
-        
-        validation_result = self.execute_query(validation_query)
+        # Check the SubHeadID exists in tbl_ratiosheadmaster / tbl_headsmaster and is valid for this industry
+        head_table = 'tbl_ratiosheadmaster' if is_ratio else 'tbl_headsmaster'
+        validation_result = self.execute_statement('head_count_in_sector', table=head_table,
+                                                   sector_id=sector_id, sub_head_id=head_id)
         count = validation_result.iloc[0]['count'] if not validation_result.empty else 0
         
         if count == 0:
@@ -1322,20 +2053,7 @@ class FinancialDatabase:
                 logger.error(f"Cannot perform simple validation: head_id is None")
                 return "SELECT 'Error: head_id is None' as error"
                 
-            if is_ratio:
-                simple_validation_query = f"""
-                SELECT COUNT(*) as count
-                FROM tbl_ratiosheadmaster h
-                WHERE h.SubHeadID = {head_id}
-                """
-            else:
-                simple_validation_query = f"""
-                SELECT COUNT(*) as count
-                FROM tbl_headsmaster h
-                WHERE h.SubHeadID = {head_id}
-                """
-            
-            simple_validation_result = self.execute_query(simple_validation_query)
+            simple_validation_result = self.execute_statement('head_count', table=head_table, sub_head_id=head_id)
             simple_count = simple_validation_result.iloc[0]['count'] if not simple_validation_result.empty else 0
             
             if simple_count > 0:
@@ -1455,7 +2173,7 @@ class FinancialDatabase:
             # Query for regular financial data
             try:
                 # Check if this is a TTM query
-                is_ttm_query = self.is_ttm_query
+                is_ttm_query = context.is_ttm_query
                 if is_ttm_query:
                     logger.info("TTM query detected, will use TTM-specific table if available")
                 
@@ -1463,8 +2181,7 @@ class FinancialDatabase:
                 is_quarterly_query = False
                 if term_id is not None:
                     # Get term information to check if it's a quarter
-                    term_query = f"SELECT term FROM tbl_terms WHERE TermID = {term_id}"
-                    term_result = self.execute_query(term_query)
+                    term_result = self.execute_statement('term_name', term_id=term_id)
                     if not term_result.empty:
                         term_name = term_result.iloc[0]['term']
                         if term_name and term_name.startswith('Q'):
@@ -1479,40 +2196,29 @@ class FinancialDatabase:
                 if is_ttm_query:
                     # First check if TTM table exists
                     try:
-                        ttm_table_check = f"""
-                        SELECT COUNT(*) as count FROM INFORMATION_SCHEMA.TABLES 
-                        WHERE TABLE_NAME = 'tbl_financialrawdataTTM'
-                        """
-                        ttm_table_result = self.execute_query(ttm_table_check)
-                        ttm_table_exists = ttm_table_result.iloc[0]['count'] > 0 if not ttm_table_result.empty else False
-                        
-                        if ttm_table_exists:
-                            sample_query = "SELECT TOP 1 * FROM tbl_financialrawdataTTM"
-                            sample_df = pd.read_sql(sample_query, self.engine)
-                            logger.info(f"Using TTM table with columns: {sample_df.columns.tolist()}")
+                        if self.has_table('tbl_financialrawdataTTM'):
+                            columns = self.get_table_columns('tbl_financialrawdataTTM')
+                            logger.info(f"Using TTM table with columns: {columns}")
                             table_name = 'tbl_financialrawdataTTM'
                         else:
                             logger.warning(f"TTM table not found, falling back to regular table")
-                            sample_query = "SELECT TOP 1 * FROM tbl_financialrawdata"
-                            sample_df = pd.read_sql(sample_query, self.engine)
+                            columns = self.get_table_columns('tbl_financialrawdata')
                             table_name = 'tbl_financialrawdata'
                     except Exception as e:
                         logger.warning(f"TTM table not found or error: {e}, falling back to regular table")
-                        sample_query = "SELECT TOP 1 * FROM tbl_financialrawdata"
-                        sample_df = pd.read_sql(sample_query, self.engine)
+                        columns = self.get_table_columns('tbl_financialrawdata')
                         table_name = 'tbl_financialrawdata'
                 else:
-                    sample_query = "SELECT TOP 1 * FROM tbl_financialrawdata"
-                    sample_df = pd.read_sql(sample_query, self.engine)
+                    columns = self.get_table_columns('tbl_financialrawdata')
                     table_name = 'tbl_financialrawdata'
                     
-                logger.info(f"Financial table columns: {sample_df.columns.tolist()}")
+                logger.info(f"Financial table columns: {columns}")
                 
-                # Use the actual column names from the sample
-                value_col = 'Amount' if 'Amount' in sample_df.columns else 'Value'
-                date_col = 'FinDate' if 'FinDate' in sample_df.columns else 'Date'
+                # Use the actual column names from the schema
+                value_col = 'Amount' if 'Amount' in columns else 'Value'
+                date_col = 'FinDate' if 'FinDate' in columns else 'Date'
             except Exception as e:
-                logger.error(f"Error getting sample financial data: {e}")
+                logger.error(f"Error getting financial table columns: {e}")
                 # Default values if we can't get the actual column names
                 value_col = 'Amount'
                 date_col = 'FinDate'
@@ -1523,6 +2229,12 @@ class FinancialDatabase:
             head_name_col_alias = f"h.{head_name_col}"
             head_join = f"JOIN tbl_headsmaster h ON {table_alias}.{head_id_col} = h.{head_id_col}"
         
+        # Values are bound as parameters; only the table / column names chosen above are formatted in
+        period_clause, period_params = self._period_filter(table_alias, term_id, period_end, fiscal_year)
+        ratio_period_clause, _ = self._period_filter('r', term_id, period_end, fiscal_year)
+        plain_period_clause, _ = self._period_filter('', term_id, period_end, fiscal_year)
+        params = {'company_id': company_id, 'head_id': head_id, 'consolidation_id': consolidation_id, **period_params}
+        
         # Build the query based on the table type (ratio or financial)
         if is_ratio:
             # For ratio data, use the correct column names as per the schema
@@ -1536,10 +2248,10 @@ class FinancialDatabase:
             JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
             JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND rh.IndustryID = im.industryid
             JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID
-            WHERE r.CompanyID = {company_id} 
-            AND r.SubHeadID = {head_id} 
-            {f"AND r.PeriodEnd = '{str(period_end)}'" if period_end is not None else (f"AND r.TermID = {term_id} AND r.FY = {fiscal_year}" if fiscal_year is not None else f"AND r.TermID = {term_id}")} 
-            AND r.ConsolidationID = {consolidation_id} 
+            WHERE r.CompanyID = :company_id 
+            AND r.SubHeadID = :head_id 
+            {ratio_period_clause} 
+            AND r.ConsolidationID = :consolidation_id 
             ORDER BY r.PeriodEnd DESC 
             """
         else:
@@ -1547,8 +2259,7 @@ class FinancialDatabase:
             is_quarterly_query = False
             if term_id is not None:
                 # Get term information to check if it's a quarter
-                term_query = f"SELECT term FROM tbl_terms WHERE TermID = {term_id}"
-                term_result = self.execute_query(term_query)
+                term_result = self.execute_statement('term_name', term_id=term_id)
                 if not term_result.empty:
                     term_name = term_result.iloc[0]['term']
                     if term_name and term_name.startswith('Q'):
@@ -1560,22 +2271,28 @@ class FinancialDatabase:
                             # First check if data exists in tbl_financialrawdata_Quarter
                             check_quarter_query = f"""
                             SELECT COUNT(*) as count FROM tbl_financialrawdata_Quarter 
-                            WHERE CompanyID = {company_id} AND SubHeadID = {head_id}
-                            {f"AND PeriodEnd = '{str(period_end)}'" if period_end is not None else (f"AND TermID = {term_id} AND FY = {fiscal_year}" if fiscal_year is not None else f"AND TermID = {term_id}")}
-                            AND ConsolidationID = {consolidation_id}
+                            WHERE CompanyID = :company_id AND SubHeadID = :head_id
+                            {plain_period_clause}
+                            AND ConsolidationID = :consolidation_id
                             """
-                            check_quarter_result = self.execute_query(check_quarter_query)
-                            has_quarter_data = check_quarter_result.iloc[0]['count'] > 0 if not check_quarter_result.empty else False
+                            if self._index_rules_out('tbl_financialrawdata_Quarter', company_id, head_id, consolidation_id):
+                                has_quarter_data = False
+                            else:
+                                check_quarter_result = self.execute_query(BoundQuery(check_quarter_query, params))
+                                has_quarter_data = check_quarter_result.iloc[0]['count'] > 0 if not check_quarter_result.empty else False
                             
                             # Then check if data exists in tbl_financialrawdata
                             check_regular_query = f"""
                             SELECT COUNT(*) as count FROM tbl_financialrawdata 
-                            WHERE CompanyID = {company_id} AND SubHeadID = {head_id}
-                            {f"AND PeriodEnd = '{str(period_end)}'" if period_end is not None else (f"AND TermID = {term_id} AND FY = {fiscal_year}" if fiscal_year is not None else f"AND TermID = {term_id}")}
-                            AND ConsolidationID = {consolidation_id}
+                            WHERE CompanyID = :company_id AND SubHeadID = :head_id
+                            {plain_period_clause}
+                            AND ConsolidationID = :consolidation_id
                             """
-                            check_regular_result = self.execute_query(check_regular_query)
-                            has_regular_data = check_regular_result.iloc[0]['count'] > 0 if not check_regular_result.empty else False
+                            if self._index_rules_out('tbl_financialrawdata', company_id, head_id, consolidation_id):
+                                has_regular_data = False
+                            else:
+                                check_regular_result = self.execute_query(BoundQuery(check_regular_query, params))
+                                has_regular_data = check_regular_result.iloc[0]['count'] > 0 if not check_regular_result.empty else False
                             
                             # Decide which table to use based on data availability
                             if has_quarter_data:
@@ -1604,10 +2321,10 @@ class FinancialDatabase:
                 JOIN tbl_terms t ON {table_alias}.TermID = t.TermID
                 JOIN tbl_companieslist c ON {table_alias}.CompanyID = c.CompanyID
                 JOIN tbl_consolidation con ON {table_alias}.ConsolidationID = con.ConsolidationID
-                WHERE {table_alias}.CompanyID = {company_id}
-                AND {table_alias}.SubHeadID = {head_id}
-                {f"AND {table_alias}.PeriodEnd = '{str(period_end)}'" if period_end is not None else (f"AND {table_alias}.TermID = {term_id} AND {table_alias}.FY = {fiscal_year}" if fiscal_year is not None else f"AND {table_alias}.TermID = {term_id}")}
-                AND {table_alias}.ConsolidationID = {consolidation_id}
+                WHERE {table_alias}.CompanyID = :company_id
+                AND {table_alias}.SubHeadID = :head_id
+                {period_clause}
+                AND {table_alias}.ConsolidationID = :consolidation_id
                 ORDER BY {table_alias}.PeriodEnd DESC
                 """
             else:
@@ -1622,10 +2339,10 @@ class FinancialDatabase:
                 JOIN tbl_companieslist c ON {table_alias}.CompanyID = c.CompanyID
                 JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND h.IndustryID = im.industryid
                 JOIN tbl_consolidation con ON {table_alias}.ConsolidationID = con.ConsolidationID
-                WHERE {table_alias}.CompanyID = {company_id}
-                AND {table_alias}.SubHeadID = {head_id}
-                {f"AND {table_alias}.PeriodEnd = '{str(period_end)}'" if period_end is not None else (f"AND {table_alias}.TermID = {term_id} AND {table_alias}.FY = {fiscal_year}" if fiscal_year is not None else f"AND {table_alias}.TermID = {term_id}")}
-                AND {table_alias}.ConsolidationID = {consolidation_id}
+                WHERE {table_alias}.CompanyID = :company_id
+                AND {table_alias}.SubHeadID = :head_id
+                {period_clause}
+                AND {table_alias}.ConsolidationID = :consolidation_id
                 ORDER BY {table_alias}.PeriodEnd DESC
                 """
         
@@ -1633,7 +2350,41 @@ class FinancialDatabase:
         logger.info(f"Query: {query}")
         logger.info(f"Company ID: {company_id}, Term ID: {term_id}, Consolidation ID: {consolidation_id}")
             
-        return query
+        return BoundQuery(query, params)
+    
+    def _period_filter(self, alias: str, term_id: Optional[int], period_end: Optional[str],
+                       fiscal_year: Optional[int]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Period condition shared by the data queries, see query_catalog.period_filter
+        """
+        return period_filter(alias, term_id, period_end, fiscal_year)
+    
+    @staticmethod
+    def _extract_fiscal_year(term: str) -> Optional[int]:
+        """
+        Fiscal year of a term description ('FY 2023', 'fy2023', 'Q2 2023'), None if it has none
+        """
+        fiscal_year = None
+        if 'FY' in term.upper() and len(term.split()) > 1:
+            try:
+                fiscal_year = int(term.split()[-1])
+                logger.info(f"Extracted fiscal year: {fiscal_year}")
+            except ValueError:
+                logger.warning(f"Could not extract fiscal year from term: {term}")
+        elif term.lower().startswith('fy'):
+            # Handle 'fy2023' format
+            year_match = re.search(r'\d{4}', term)
+            if year_match:
+                fiscal_year = int(year_match.group(0))
+                logger.info(f"Extracted fiscal year from FY format: {fiscal_year}")
+        
+        # If fiscal year is still None, try to extract from any 4-digit number in the term
+        if fiscal_year is None:
+            year_match = re.search(r'\d{4}', term)
+            if year_match:
+                fiscal_year = int(year_match.group(0))
+                logger.info(f"Extracted fiscal year from term: {fiscal_year}")
+        return fiscal_year
     
     def _format_date(self, date_str: str) -> str:
         """
@@ -1669,7 +2420,7 @@ class FinancialDatabase:
                           consolidation: str = 'consolidated', period_end: str = None,
                           is_relative_term: bool = False, relative_term_type: Optional[str] = None,
                           relative_type: Optional[str] = None, company_id: Optional[int] = None,
-                          consolidation_id: Optional[int] = None) -> Dict[str, Any]:
+                          consolidation_id: Optional[int] = None, context: Optional[QueryContext] = None) -> Dict[str, Any]:
         """
         Get financial data based on natural language parameters
         
@@ -1682,10 +2433,613 @@ class FinancialDatabase:
             is_relative_term: Flag indicating if this is a relative term
             relative_term_type: Type of relative term (quarter, month, annual) - legacy
             relative_type: Type of relative period ('most_recent_quarter', 'last_quarter', 'current', 'ytd')
+            company_id: Optional already-resolved company ID
+            consolidation_id: Optional already-resolved consolidation ID
+            context: Optional per-request QueryContext; a fresh one is used when omitted
             
         Returns:
             Dictionary with financial data and metadata
         """
+        # Relative periods move when a new period is loaded, so only fixed periods are cached by the
+        # question text; the others always resolve their period and are cached on the ResultKey
+        question = None
+        if not self._is_moving_period(term, is_relative_term, relative_type):
+            question = self._question_key(company, metric, term, consolidation, period_end, is_relative_term,
+                                          relative_term_type, relative_type, company_id, consolidation_id)
+            result_key = self.question_cache.get(question)
+            if result_key is not None:
+                response = self.result_cache.get(result_key)
+                if response is not None:
+                    return dict(response)
+        
+        # The whole resolution chain runs on one checked-out connection
+        with self.session():
+            return self._get_financial_data(company, metric, term, consolidation, period_end,
+                                            is_relative_term, relative_term_type, relative_type,
+                                            company_id, consolidation_id, context, question=question)
+    
+    @staticmethod
+    def _is_moving_period(term: Optional[str], is_relative_term: bool, relative_type: Optional[str]) -> bool:
+        """
+        Whether the question's period depends on the latest loaded data ('latest', TTM, relative types)
+        """
+        if is_relative_term or relative_type:
+            return True
+        term = (term or '').lower()
+        return not term.strip() or any(word in term for word in MOVING_TERM_WORDS)
+    
+    @staticmethod
+    def _question_key(*values) -> tuple:
+        """
+        Hashable key of the question as asked, with strings normalized
+        """
+        return tuple(value.strip().lower() if isinstance(value, str) else value for value in values)
+    
+    def invalidate_cached_results(self, company_id: Optional[int] = None) -> int:
+        """
+        Drop cached get_financial_data results, e.g. after new data was loaded for a company
+        
+        Args:
+            company_id: Company whose results to drop; all results when None
+            
+        Returns:
+            Number of cached results removed
+        """
+        if company_id is None:
+            self.question_cache.clear()
+            self.series_cache.clear()
+            self.statement_cache.clear()
+            self.prefetch_stats.clear()
+            return self.result_cache.clear()
+        self.question_cache.invalidate_company(company_id)
+        self.series_cache.invalidate_company(company_id)
+        self.statement_cache.invalidate_company(company_id)
+        return self.result_cache.invalidate_company(company_id)
+    
+    def get_result_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit / miss / eviction counters of the result, question, series and statement caches,
+        and the statement prefetch hit rate
+        """
+        return {'results': self.result_cache.stats(), 'questions': self.question_cache.stats(),
+                'series': self.series_cache.stats(), 'statements': self.statement_cache.stats(),
+                'prefetch': self.prefetch_stats.stats()}
+
+    def get_financial_data_batch(self, companies: List[str], metrics: List[str], terms: List[str],
+                                 consolidation: str = 'consolidated') -> pd.DataFrame:
+        """
+        Get financial data for every (company, metric, term) combination in a few round trips
+
+        IDs are resolved in bulk: companies and terms from memory, head candidates once per
+        metric and sector, and data availability for all companies with one probe per table.
+        Values are read with one statement per raw data table that joins a VALUES table of the
+        resolved keys, split so no statement binds more than config.BATCH_MAX_PARAMS parameters.
+        Dissection metrics go through get_financial_data one combination at a time.
+
+        Args:
+            companies: Company names or tickers
+            metrics: Financial metric names
+            terms: Term descriptions (e.g., 'Q2 2023', 'TTM')
+            consolidation: 'consolidated' or 'standalone'
+
+        Returns:
+            DataFrame with one row per combination (columns batch_query.BATCH_COLUMNS);
+            combinations that could not be answered have a NaN value and an error message
+        """
+        with self.session():
+            return self._get_financial_data_batch(companies, metrics, terms, consolidation)
+
+    def _get_financial_data_batch(self, companies: List[str], metrics: List[str], terms: List[str],
+                                  consolidation: str) -> pd.DataFrame:
+        """
+        Body of get_financial_data_batch, run inside a database session
+        """
+        from app.core.database.detect_dissection_metrics import is_dissection_metric
+
+        cells = [BatchCell(company, metric, term) for company in companies for metric in metrics for term in terms]
+        consolidation_id = self.get_consolidation_id(consolidation)
+        if consolidation_id is None:
+            for cell in cells:
+                cell.fail(f"Consolidation '{consolidation}' not found")
+            return batch_frame(cells)
+
+        company_ids = {company: self.get_company_id(company) for company in dict.fromkeys(companies)}
+        dissection = {metric: is_dissection_metric(metric)[0] for metric in dict.fromkeys(metrics)}
+
+        pending = []
+        for cell in cells:
+            cell.company_id = company_ids[cell.company]
+            if cell.company_id is None:
+                cell.fail(f"Company '{cell.company}' not found")
+            elif dissection[cell.metric]:
+                cell.response = self._get_financial_data(cell.company, cell.metric, cell.term, consolidation,
+                                                         company_id=cell.company_id, consolidation_id=consolidation_id)
+            else:
+                pending.append(cell)
+
+        self._resolve_batch_terms(pending, consolidation_id)
+        pending = [cell for cell in pending if cell.error is None]
+        self._resolve_batch_heads(pending, consolidation_id)
+        pending = [cell for cell in pending if cell.error is None]
+        self._fetch_batch_values(pending, consolidation_id)
+        self._derive_batch_values([cell for cell in pending if cell.error is not None], consolidation_id)
+
+        logger.info(f"Batch of {len(cells)} combinations: {sum(cell.error is None for cell in cells)} answered")
+        return batch_frame(cells)
+
+    def _resolve_batch_terms(self, cells: List[BatchCell], consolidation_id: int) -> None:
+        """
+        Resolve term_id, fiscal year and the TTM flag once per (company, term)
+        """
+        resolved = {}
+        for cell in cells:
+            key = (cell.company_id, cell.term)
+            if key not in resolved:
+                context = QueryContext()
+                term_id = self.get_term_id(cell.term, cell.company_id, consolidation_id=consolidation_id, context=context)
+                resolved[key] = (term_id, context.is_ttm_query)
+            term_id, cell.is_ttm = resolved[key]
+            if term_id is None:
+                cell.fail(f"Term '{cell.term}' not found")
+                continue
+            cell.term_id = int(term_id)
+            cell.fiscal_year = self._extract_fiscal_year(cell.term)
+
+    def _resolve_batch_heads(self, cells: List[BatchCell], consolidation_id: int) -> None:
+        """
+        Resolve (head_id, is_ratio) once per (company, metric), like get_available_head_id:
+        candidates are looked up once per metric and sector, availability probed for all
+        companies together
+        """
+        from app.core.database.fix_head_id import RAW_DATA_TABLES, head_candidate_stages, pick_head_with_data
+
+        pairs = {}
+        for cell in cells:
+            pairs.setdefault((cell.company_id, cell.metric), []).append(cell)
+
+        stage_cache, pair_stages, candidates = {}, {}, {}
+        for company_id, metric in pairs:
+            context = self.get_company_context(company_id)
+            key = (metric, context.sector_id, context.industry_id) if context is not None else (metric, None, None)
+            if key not in stage_cache:
+                stage_cache[key] = head_candidate_stages(self, *key)
+            pair_stages[(company_id, metric)] = stage_cache[key]
+            for _, heads, is_ratio in stage_cache[key]:
+                if heads is not None and not heads.empty:
+                    candidates.setdefault(RAW_DATA_TABLES[is_ratio], []).extend(heads['SubHeadID'].tolist())
+
+        availability = self.probe_companies_head_data(candidates, [company_id for company_id, _ in pairs],
+                                                      consolidation_id)
+        for (company_id, metric), pair_cells in pairs.items():
+            head = pick_head_with_data(pair_stages[(company_id, metric)],
+                                       {table_name: counts.get(company_id, {}) for table_name, counts in availability.items()})
+            for cell in pair_cells:
+                if head is None:
+                    cell.fail(f"Could not find a valid metric ID for '{metric}'")
+                else:
+                    cell.head_id, cell.is_ratio = int(head[0]), bool(head[1])
+
+    def _fetch_batch_values(self, cells: List[BatchCell], consolidation_id: int) -> None:
+        """
+        Read the values of resolved cells with one VALUES-join statement per raw data table
+        (and per config.BATCH_MAX_PARAMS parameters)
+        """
+        term_names = self._term_names()
+        has_ttm_table = self.has_table('tbl_financialrawdataTTM')
+
+        rows = {}
+        for row_id, cell in enumerate(cells):
+            cell.tables = self._value_tables(cell.is_ratio, term_names.get(cell.term_id), cell.is_ttm, has_ttm_table)
+            for table_name in cell.tables:
+                rows.setdefault(table_name, []).append(cell.key_row(row_id))
+
+        found, failed = {}, {}
+        for table_name, table_rows in rows.items():
+            for chunk in query_catalog.chunked(table_rows, len(KEY_COLUMNS), config.BATCH_MAX_PARAMS - 1):
+                try:
+                    result = self.execute_query(batch_value_query(table_name, chunk, consolidation_id))
+                except Exception as e:
+                    logger.error(f"Error retrieving batch financial data from {table_name}: {e}")
+                    failed.update({row[0]: str(e) for row in chunk})
+                    continue
+                for record in result.to_dict('records'):
+                    found[(int(record['RowID']), table_name)] = record
+
+        for row_id, cell in enumerate(cells):
+            table_name = next((table_name for table_name in cell.tables if (row_id, table_name) in found), None)
+            if table_name is not None:
+                cell.set_record(found[(row_id, table_name)], table_name)
+            elif row_id in failed:
+                cell.fail(f"Error retrieving financial data: {failed[row_id]}")
+            else:
+                cell.fail("No data found for the specified parameters")
+
+    def _derive_batch_values(self, cells: List[BatchCell], consolidation_id: int) -> None:
+        """
+        Derive the quarter and TTM values the raw data tables had no row for from one
+        cumulative panel over all of their companies and heads
+        """
+        keys = {id(cell): ResultKey(
+            company_id=cell.company_id, head_id=cell.head_id, is_ratio=cell.is_ratio, term_id=cell.term_id,
+            consolidation_id=consolidation_id, period_end=None, resolved_period_end=None,
+            fiscal_year=cell.fiscal_year, relative_type=None, is_ttm=cell.is_ttm, dissection_group_id=None,
+            dissection_data_type=None) for cell in cells}
+        cells = [cell for cell in cells if self._is_derivable(keys[id(cell)])]
+        if not cells:
+            return
+        try:
+            panel = self.get_cumulative_panel([cell.company_id for cell in cells], [cell.head_id for cell in cells],
+                                              consolidation_id)
+        except Exception as e:
+            logger.error(f"Error loading cumulative data: {e}")
+            return
+        for cell in cells:
+            response = self._derived_response(keys[id(cell)], panel)
+            if response is not None:
+                cell.table, cell.response = 'tbl_financialrawdata', response
+
+    def _term_names(self) -> Dict[int, str]:
+        """
+        TermID -> term name from the cached terms table
+        """
+        terms_df = self.metadata_cache.get('terms')
+        if terms_df is None or 'TermID' not in terms_df.columns or 'term' not in terms_df.columns:
+            return {}
+        return dict(zip(terms_df['TermID'].astype(int), terms_df['term']))
+
+    @staticmethod
+    def _value_tables(is_ratio: bool, term_name: Optional[str], is_ttm: bool, has_ttm_table: bool) -> Tuple[str, ...]:
+        """
+        Raw data tables a value is read from, in order of preference
+
+        Follows build_financial_query: quarterly terms prefer the Quarter table and fall back to
+        the regular one, TTM terms use the TTM table when it exists.
+        """
+        if is_ratio:
+            return ('tbl_ratiorawdata',)
+        if isinstance(term_name, str) and term_name.startswith('Q'):
+            return ('tbl_financialrawdata_Quarter', 'tbl_financialrawdata')
+        if is_ttm and has_ttm_table:
+            return ('tbl_financialrawdataTTM',)
+        return ('tbl_financialrawdata',)
+
+    def get_time_series(self, company: str, metric: str, consolidation: str = 'consolidated',
+                        company_id: Optional[int] = None, consolidation_id: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """
+        Full history of a metric for a company across the raw data tables, with one query
+        
+        Regular heads are read from the regular, Quarter and TTM tables, ratio heads from the
+        ratio table. The series is cached (config.SERIES_CACHE_MAX_ENTRIES), and
+        get_financial_data answers later period lookups of the same head from it.
+        
+        Args:
+            company: Company name or ticker
+            metric: Metric name
+            consolidation: Consolidation type
+            company_id: Optional pre-resolved company ID
+            consolidation_id: Optional pre-resolved consolidation ID
+            
+        Returns:
+            PeriodEnd-indexed frame with SERIES_COLUMNS (see time_series.to_series_frame), empty
+            when the head has no rows; None if the company or metric cannot be resolved
+        """
+        if company_id is None:
+            company_id = self.get_company_id(company)
+            if company_id is None:
+                logger.error(f"Company '{company}' not found")
+                return None
+        if consolidation_id is None:
+            consolidation_id = self.get_consolidation_id(consolidation)
+            if consolidation_id is None:
+                logger.error(f"Consolidation '{consolidation}' not found")
+                return None
+        
+        with self.session():
+            try:
+                from app.core.database.fix_head_id import get_available_head_id
+                head_id, is_ratio = get_available_head_id(self, company_id, metric, None, consolidation_id)
+            except Exception as e:
+                logger.error(f"Error using fix_head_id: {e}")
+                head_id, is_ratio = self.get_head_id(metric, company_id, consolidation_id)
+            if head_id is None:
+                logger.error(f"Could not find a valid metric ID for '{metric}'")
+                return None
+            
+            key = SeriesKey(int(company_id), int(head_id), bool(is_ratio), int(consolidation_id))
+            cached = self.series_cache.get(key)
+            if cached is not None:
+                return cached.copy()
+            
+            tables = [table_name for table_name in (RATIO_SERIES_TABLES if is_ratio else REGULAR_SERIES_TABLES)
+                      if self.has_table(table_name)]
+            if not tables:
+                logger.error(f"No raw data table found for metric '{metric}'")
+                return None
+            frame = to_series_frame(self.execute_query(series_query(tables, *key)))
+        
+        logger.info(f"Loaded {len(frame)} periods of head_id={head_id} for company_id={company_id}")
+        self.series_cache.put(key, frame, company_id=key.company_id)
+        return frame.copy()
+
+    def _series_response(self, key: ResultKey) -> Optional[Dict[str, Any]]:
+        """
+        get_financial_data response for key from a cached time series
+        
+        Returns:
+            Response dict, None when no series of the head is cached, the lookup is relative, or
+            the series has no matching row
+        """
+        if key.relative_type is not None or key.resolved_period_end is not None:
+            return None
+        frame = self.series_cache.get(SeriesKey(key.company_id, key.head_id, key.is_ratio, key.consolidation_id))
+        if frame is None:
+            return None
+        tables = self._value_tables(key.is_ratio, self._term_names().get(key.term_id), key.is_ttm,
+                                    self.has_table('tbl_financialrawdataTTM'))
+        for table_name in tables:
+            row = latest_row(frame, table_name, key.term_id, key.fiscal_year, key.period_end)
+            if row is not None:
+                logger.info(f"Answered head_id={key.head_id} for company_id={key.company_id} from the series cache")
+                return row_response(frame, row)
+        return None
+
+    def get_cumulative_panel(self, company_ids: List[int], head_ids: List[int],
+                             consolidation_id: int) -> CumulativePanel:
+        """
+        Cumulative 3M / 6M / 9M / 12M rows of many companies and heads as one panel
+        
+        Reads tbl_financialrawdata once per config.BATCH_MAX_PARAMS parameters; quarterly,
+        TTM, growth and per-share figures are then derived in memory (see calculations.py).
+        get_financial_data and the batch API fall back to it when the Quarter, TTM or
+        dissection tables have no row for a lookup.
+        
+        Args:
+            company_ids: Company IDs
+            head_ids: SubHeadIDs of regular (non-ratio) heads
+            consolidation_id: Consolidation ID
+            
+        Returns:
+            CumulativePanel over every (company, head) pair that has rows
+        """
+        columns = ['CompanyID', 'SubHeadID', 'FY', 'Term', 'PeriodEnd', 'Value']
+        term_names = {term_id: name for term_id, name in self._term_names().items() if name in CUMULATIVE_TERMS}
+        company_ids = list(dict.fromkeys(int(company_id) for company_id in company_ids))
+        head_ids = list(dict.fromkeys(int(head_id) for head_id in head_ids))
+        if not term_names or not company_ids or not head_ids:
+            return CumulativePanel.from_frame(pd.DataFrame(columns=columns))
+        
+        frames = []
+        # IN lists are padded up to a power of two, so a chunk of n companies binds up to 2n
+        budget = (config.BATCH_MAX_PARAMS - 1 - query_catalog.padded_size(len(head_ids))
+                  - query_catalog.padded_size(len(term_names)))
+        max_companies = max(1, budget // 2)
+        with self.session():
+            for chunk in query_catalog.chunked(company_ids, 1, max_companies):
+                frames.append(self.execute_query(cumulative_query(chunk, head_ids, list(term_names), consolidation_id)))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        df['Term'] = df['TermID'].map(term_names) if 'TermID' in df.columns else None
+        
+        panel = CumulativePanel.from_frame(df.reindex(columns=columns))
+        logger.info(f"Loaded {len(panel)} fiscal years of {len(head_ids)} heads for {len(company_ids)} companies")
+        return panel
+
+    def _is_derivable(self, key: ResultKey) -> bool:
+        """
+        Whether _derived_response can compute the value of key from cumulative rows
+        """
+        if key.is_ratio or key.relative_type is not None:
+            return False
+        if key.dissection_group_id is not None:
+            return key.dissection_group_id in DERIVED_GROWTH_GROUPS
+        return key.is_ttm or self._term_names().get(key.term_id) in QUARTERS
+
+    def _derived_response(self, key: ResultKey, panel: Optional[CumulativePanel] = None) -> Optional[Dict[str, Any]]:
+        """
+        get_financial_data response derived from the cumulative rows of tbl_financialrawdata
+
+        Fallback for lookups the stored tables could not answer: quarterly terms (Quarter
+        table), TTM lookups (TTM table) and the Annual / Quarterly Growth dissection groups.
+        The value is matched like the plan statement matches rows: by period end when one
+        was given, else by term (quarter) and fiscal year, latest first.
+
+        Args:
+            key: Resolved lookup
+            panel: Panel holding the key's company and head (loaded when not given)
+
+        Returns:
+            Response dict, None when the lookup cannot be derived or the panel has no value
+        """
+        if not self._is_derivable(key):
+            return None
+        term_name = self._term_names().get(key.term_id)
+        growth = DERIVED_GROWTH_GROUPS.get(key.dissection_group_id)
+        if panel is None:
+            try:
+                panel = self.get_cumulative_panel([key.company_id], [key.head_id], key.consolidation_id)
+            except Exception as e:
+                logger.error(f"Error loading cumulative data: {e}")
+                return None
+        if not len(panel):
+            return None
+        labels = QUARTERS
+        if growth == 'qoq':
+            values = panel.qoq_growth()
+        elif growth == 'yoy' and term_name in CUMULATIVE_TERMS:
+            # Annual growth of a cumulative term compares the cumulative values
+            values, labels = panel.yoy_growth(panel.values), CUMULATIVE_TERMS
+        elif growth == 'yoy':
+            values = panel.yoy_growth()
+        elif key.is_ttm:
+            values = panel.ttm()
+        else:
+            values = panel.quarterly()
+        frame = panel.to_frame(values, labels)
+        frame = frame[(frame['CompanyID'] == key.company_id) & (frame['SubHeadID'] == key.head_id)]
+
+        if key.period_end is not None:
+            frame = frame[frame['PeriodEnd'] == pd.Timestamp(key.period_end)]
+        else:
+            if term_name in labels:
+                frame = frame[frame['Quarter'] == term_name]
+            if key.fiscal_year is not None:
+                frame = frame[frame['FY'] == key.fiscal_year]
+        if frame.empty:
+            return None
+        row = frame.loc[frame['PeriodEnd'].idxmax()]
+
+        try:
+            result = self.execute_query(BoundQuery("""
+            SELECT c.CompanyName AS Company, h.SubHeadName AS Metric, u.unitname AS Unit,
+                   con.consolidationname AS Consolidation
+            FROM tbl_companieslist c
+            CROSS JOIN tbl_headsmaster h
+            JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+            CROSS JOIN tbl_consolidation con
+            WHERE c.CompanyID = :company_id AND h.SubHeadID = :head_id AND con.ConsolidationID = :consolidation_id
+            """, {'company_id': key.company_id, 'head_id': key.head_id, 'consolidation_id': key.consolidation_id},
+                'derived_labels'))
+        except Exception as e:
+            logger.error(f"Error loading labels of derived value: {e}")
+            return None
+        if result.empty:
+            return None
+        record = result.iloc[0].to_dict()
+        logger.info(f"Derived {growth or ('ttm' if key.is_ttm else 'quarterly')} value of head_id={key.head_id} "
+                    f"for company_id={key.company_id} from cumulative data")
+        return plan_response({
+            **record,
+            'Term': 'TTM' if key.is_ttm and growth is None else row['Quarter'],
+            'Unit': '%' if growth is not None else record['Unit'],
+            'Value': row['Value'],
+            'PeriodEnd': row['PeriodEnd'],
+        })
+
+    def plan_branches(self, heads: List[Tuple[int, bool]], term_id: Optional[int], is_ttm: bool = False,
+                      dissection_group_id: Optional[int] = None,
+                      dissection_data_type: Optional[str] = None) -> List[PlanBranch]:
+        """
+        Raw data tables a QueryPlan searches for its candidate heads, in order of preference
+        
+        Regular and ratio heads use the tables of _value_tables. Dissection lookups search the
+        dissection table of the data type, first in the requested group, then in any group.
+        """
+        kinds = list(dict.fromkeys(bool(is_ratio) for _, is_ratio in heads))
+        if dissection_data_type is not None:
+            table_name = DISSECTION_TABLES.get(dissection_data_type.lower(), DISSECTION_TABLES['regular'])
+            groups = [dissection_group_id, None] if dissection_group_id is not None else [None]
+            return [PlanBranch(table_name, is_ratio, group) for is_ratio in kinds for group in groups]
+        
+        term_name = self._term_names().get(term_id)
+        has_ttm_table = self.has_table('tbl_financialrawdataTTM')
+        return [PlanBranch(table_name, is_ratio) for is_ratio in kinds
+                for table_name in self._value_tables(is_ratio, term_name, is_ttm, has_ttm_table)
+                if self.has_table(table_name)]
+
+    def plan_financial_query(self, company: str, metric: str, term: str, consolidation: str = 'consolidated',
+                             period_end: Optional[str] = None, company_id: Optional[int] = None,
+                             consolidation_id: Optional[int] = None,
+                             context: Optional[QueryContext] = None) -> QueryPlan:
+        """
+        Resolve a question into a QueryPlan without probing the raw data tables
+        
+        Every candidate SubHeadID of the metric (regular, ratio and dissection) becomes a
+        ranked candidate of the plan, so execute_plan finds the best one with data in a single
+        statement instead of probing each candidate in turn.
+        
+        Args:
+            company: Company name or ticker
+            metric: Metric name
+            term: Term description ('Q1 2023', 'FY 2022', or a 'YYYY-MM-DD' period end)
+            consolidation: Consolidation type
+            period_end: Optional period end date overriding the term's TermID filter
+            company_id: Optional pre-resolved company ID
+            consolidation_id: Optional pre-resolved consolidation ID
+            context: Per-request QueryContext for get_term_id
+            
+        Returns:
+            QueryPlan; plan.error is set when an entity cannot be resolved
+        """
+        plan = QueryPlan()
+        if company_id is None:
+            company_id = self.get_company_id(company)
+            if company_id is None:
+                return plan.fail(f"Company '{company}' not found")
+        if consolidation_id is None:
+            consolidation_id = self.get_consolidation_id(consolidation)
+            if consolidation_id is None:
+                return plan.fail(f"Consolidation '{consolidation}' not found")
+        plan.company_id, plan.consolidation_id = int(company_id), int(consolidation_id)
+        
+        from app.core.database.detect_dissection_metrics import dissection_base_metric, is_dissection_metric
+        is_dissection, dissection_group_id, dissection_data_type = is_dissection_metric(metric)
+        
+        if context is None:
+            context = QueryContext()
+        term_id = self.get_term_id(term, plan.company_id, consolidation_id=plan.consolidation_id,
+                                   is_dissection=is_dissection, dissection_group_id=dissection_group_id,
+                                   dissection_data_type=dissection_data_type, context=context)
+        if isinstance(term_id, tuple):
+            term_id, period_end = term_id
+        if term_id is None:
+            return plan.fail(f"Term '{term}' not found")
+        plan.term_id = int(term_id)
+        plan.fiscal_year = self._extract_fiscal_year(term)
+        period_end = period_end if period_end is not None else context.resolved_period_end
+        plan.period_end = self._format_date(period_end) if period_end is not None else None
+        
+        from app.core.database.fix_head_id import head_candidate_stages
+        sector_id, industry_id = self._get_company_sector_industry(plan.company_id)
+        head_metric = dissection_base_metric(metric, dissection_group_id) if is_dissection else metric
+        stages = head_candidate_stages(self, head_metric, sector_id, industry_id)
+        plan.heads = list(dict.fromkeys((int(head_id), bool(is_ratio)) for _, heads, is_ratio in stages
+                                        if not heads.empty for head_id in heads['SubHeadID']))
+        if not plan.heads:
+            return plan.fail(f"Could not find a valid metric ID for '{metric}'")
+        plan.branches = self.plan_branches(plan.heads, plan.term_id, context.is_ttm_query,
+                                           dissection_group_id if is_dissection else None,
+                                           dissection_data_type if is_dissection else None)
+        return plan
+
+    def run_plan(self, plan: QueryPlan) -> pd.DataFrame:
+        """
+        Send the plan's statement and count the round trip
+        
+        Returns:
+            The best-ranked row (columns query_planner.PLAN_COLUMNS), empty if no candidate has data
+        """
+        query = plan.statement()
+        plan.round_trips += 1
+        result = self.execute_query(query)
+        logger.info(plan.explain())
+        return result
+
+    def execute_plan(self, plan: QueryPlan) -> Dict[str, Any]:
+        """
+        Run a QueryPlan and format its row like get_financial_data
+        """
+        if plan.error is not None:
+            return {"error": plan.error}
+        try:
+            result = self.run_plan(plan)
+        except Exception as e:
+            logger.error(f"Error retrieving financial data: {e}")
+            return {"error": str(e)}
+        if result.empty:
+            return {"error": "No data found for the specified parameters"}
+        return plan_response(result.iloc[0].to_dict())
+
+    def _get_financial_data(self, company: str, metric: str, term: str, 
+                           consolidation: str = 'consolidated', period_end: str = None,
+                           is_relative_term: bool = False, relative_term_type: Optional[str] = None,
+                           relative_type: Optional[str] = None, company_id: Optional[int] = None,
+                           consolidation_id: Optional[int] = None, context: Optional[QueryContext] = None,
+                           question: Optional[tuple] = None) -> Dict[str, Any]:
+        """
+        Body of get_financial_data, run inside a database session
+        
+        question is the key get_financial_data looked the question up under; a successful
+        result is cached for it and for its resolved ResultKey.
+        """
         # Get IDs from metadata - use passed parameters if available
         if company_id is None:
             company_id = self.get_company_id(company)
@@ -1693,33 +3047,8 @@ class FinancialDatabase:
                 return {"error": f"Company '{company}' not found"}
         
         # Get sector and industry information for metadata traversal
-        sector_query = f"""
-        SELECT c.SectorID, s.SectorName 
-        FROM tbl_companieslist c
-        JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-        WHERE c.CompanyID = {company_id}
-        """
-        sector_result = self.execute_query(sector_query)
-        
-        sector_id = None
-        industry_id = None
-        
-        if not sector_result.empty:
-            sector_id = sector_result.iloc[0]['SectorID']
-            logger.info(f"Found SectorID: {sector_id} for company: {company}")
-            
-            # Get industry information
-            industry_query = f"""
-            SELECT i.IndustryID, i.IndustryName 
-            FROM tbl_industrynames i
-            JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-            WHERE m.sectorid = {sector_id}
-            """
-            industry_result = self.execute_query(industry_query)
-            
-            if not industry_result.empty:
-                industry_id = industry_result.iloc[0]['IndustryID']
-                logger.info(f"Found IndustryID: {industry_id} for SectorID: {sector_id}")
+        sector_id, industry_id = self._get_company_sector_industry(company_id)
+        logger.info(f"Found SectorID: {sector_id}, IndustryID: {industry_id} for company: {company}")
         
         # Get consolidation ID - use passed parameter if available
         if consolidation_id is None:
@@ -1734,11 +3063,12 @@ class FinancialDatabase:
         if is_dissection:
             logger.info(f"Detected dissection metric '{metric}' with group_id={dissection_group_id}, data_type={dissection_data_type}")
         
-        # Initialize attribute for storing resolved period_end
-        self.resolved_period_end = None
+        # Per-request resolution state shared by get_term_id and build_financial_query
+        if context is None:
+            context = QueryContext()
         
         # Get term ID, passing relative term information and dissection parameters
-        term_id_result = self.get_term_id(term, company_id, is_relative_term, relative_term_type, relative_type, consolidation_id, is_dissection, dissection_group_id, dissection_data_type)
+        term_id_result = self.get_term_id(term, company_id, is_relative_term, relative_term_type, relative_type, consolidation_id, is_dissection, dissection_group_id, dissection_data_type, context=context)
         
         # Handle tuple return value from get_term_id for relative terms
         if isinstance(term_id_result, tuple) and len(term_id_result) == 2:
@@ -1756,8 +3086,8 @@ class FinancialDatabase:
                 return {"error": f"Term '{term}' not found"}
             
             # Use resolved_period_end if available from legacy relative term resolution
-            if self.resolved_period_end is not None:
-                formatted_period_end = self._format_date(self.resolved_period_end)
+            if context.resolved_period_end is not None:
+                formatted_period_end = self._format_date(context.resolved_period_end)
                 logger.info(f"Using resolved period_end from legacy relative term: {formatted_period_end}")
             elif period_end is not None:
                 formatted_period_end = self._format_date(period_end)
@@ -1765,11 +3095,8 @@ class FinancialDatabase:
             else:
                 formatted_period_end = None
             # Try to get period_end from term if not provided
-            period_query = f"""
-            SELECT PeriodEnd FROM tbl_terms WHERE TermID = {term_id}
-            """
             try:
-                period_result = self.execute_query(period_query)
+                period_result = self.execute_statement('term_period_end', term_id=term_id)
                 if not period_result.empty and 'PeriodEnd' in period_result.columns:
                     formatted_period_end = self._format_date(period_result.iloc[0]['PeriodEnd'])
                     logger.info(f"Using period_end from term: {formatted_period_end}")
@@ -1826,26 +3153,7 @@ class FinancialDatabase:
 
             
         # Extract fiscal year if present in the term
-        fiscal_year = None
-        if 'FY' in term.upper() and len(term.split()) > 1:
-            try:
-                fiscal_year = int(term.split()[-1])
-                logger.info(f"Extracted fiscal year: {fiscal_year}")
-            except ValueError:
-                logger.warning(f"Could not extract fiscal year from term: {term}")
-        elif term.lower().startswith('fy'):
-            # Handle 'fy2023' format
-            year_match = re.search(r'\d{4}', term)
-            if year_match:
-                fiscal_year = int(year_match.group(0))
-                logger.info(f"Extracted fiscal year from FY format: {fiscal_year}")
-        
-        # If fiscal year is still None, try to extract from any 4-digit number in the term
-        if fiscal_year is None:
-            year_match = re.search(r'\d{4}', term)
-            if year_match:
-                fiscal_year = int(year_match.group(0))
-                logger.info(f"Extracted fiscal year from term: {fiscal_year}")
+        fiscal_year = self._extract_fiscal_year(term)
         
         # Format period_end date if provided
         if period_end is not None:
@@ -1854,18 +3162,67 @@ class FinancialDatabase:
         else:
             formatted_period_end = None
             
+        result_key = ResultKey(
+            company_id=int(company_id), head_id=int(head_id), is_ratio=bool(is_ratio), term_id=term_id,
+            consolidation_id=consolidation_id, period_end=formatted_period_end,
+            resolved_period_end=context.resolved_period_end, fiscal_year=fiscal_year, relative_type=relative_type,
+            is_ttm=context.is_ttm_query, dissection_group_id=dissection_group_id, dissection_data_type=dissection_data_type,
+        )
+        cached = self.result_cache.get(result_key)
+        if cached is not None:
+            self.prefetch_stats.hit(result_key)
+            if question is not None:
+                self.question_cache.put(question, result_key, company_id=result_key.company_id)
+            return dict(cached)
+        
+        # A cached time series of the head answers from memory
+        if not is_dissection:
+            response = self._series_response(result_key)
+            if response is not None:
+                self.result_cache.put(result_key, dict(response), company_id=result_key.company_id)
+                if question is not None:
+                    self.question_cache.put(question, result_key, company_id=result_key.company_id)
+                return response
+        
+        # The value (with the head's table fallbacks) comes back from one ranked statement
+        if not is_dissection:
+            plan = QueryPlan(company_id=int(company_id), consolidation_id=consolidation_id, term_id=term_id,
+                             fiscal_year=fiscal_year, period_end=formatted_period_end,
+                             heads=[(int(head_id), bool(is_ratio))])
+            plan.branches = self.plan_branches(plan.heads, term_id, context.is_ttm_query)
+            response = self.execute_plan(plan)
+            if 'error' in response:
+                # Quarter and TTM figures the stored tables lack are derived from cumulative rows
+                response = self._derived_response(result_key) or response
+            if 'error' not in response:
+                self.result_cache.put(result_key, dict(response), company_id=result_key.company_id)
+                if question is not None:
+                    self.question_cache.put(question, result_key, company_id=result_key.company_id)
+                # Follow-up questions usually ask for other line items of the same statement
+                if config.STATEMENT_PREFETCH and not is_ratio:
+                    self.prefetch_statement_in_background(result_key, [branch.table_name for branch in plan.branches])
+            return response
+        
         # Build and execute query
         query = self.build_financial_query(
             company_id, head_id, term_id, consolidation_id, is_ratio, fiscal_year, formatted_period_end,
             is_relative=is_relative_term, relative_type=relative_type,
-            is_dissection=is_dissection, dissection_group_id=dissection_group_id, dissection_data_type=dissection_data_type
+            is_dissection=is_dissection, dissection_group_id=dissection_group_id, dissection_data_type=dissection_data_type,
+            context=context
         )
         
         try:
             result = self.execute_query(query)
             
             if result.empty:
-                return {"error": "No data found for the specified parameters"}
+                # Growth figures the dissection tables lack are derived from cumulative rows
+                response = self._derived_response(result_key)
+                if response is None:
+                    return {"error": "No data found for the specified parameters"}
+                self.result_cache.put(result_key, dict(response), company_id=result_key.company_id)
+                if question is not None:
+                    self.question_cache.put(question, result_key, company_id=result_key.company_id)
+                return response
                 
             # Get the most recent result
             latest = result.iloc[0]
@@ -1895,6 +3252,9 @@ class FinancialDatabase:
                 "date": latest[date_col].strftime('%Y-%m-%d') if hasattr(latest[date_col], 'strftime') else latest[date_col],
             }
             
+            self.result_cache.put(result_key, dict(response), company_id=result_key.company_id)
+            if question is not None:
+                self.question_cache.put(question, result_key, company_id=result_key.company_id)
             return response
         except Exception as e:
             logger.error(f"Error retrieving financial data: {e}")
@@ -30,7 +30,41 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
     Returns:
         Tuple of (head_id, is_ratio) if found, (None, False) otherwise
     """
+    # Get sector and industry information for the company from the cached company context
+    context = db.get_company_context(company_id)
+    sector_id = context.sector_id if context is not None else None
+    industry_id = context.industry_id if context is not None else None
+    logger.info(f"Found SectorID: {sector_id}, IndustryID: {industry_id} for company ID: {company_id}")
     
+    stages = head_candidate_stages(db, metric_name, sector_id, industry_id)
+    if not stages:
+        return None, False
+    
+    # period_end is not used for EPS availability
+    is_eps = metric_name.lower() in ('ttm eps', 'eps ttm')
+    head_with_data = select_head_with_data(db, stages, company_id, None if is_eps else period_end, consolidation_id)
+    if head_with_data is not None:
+        return head_with_data
+    
+    logger.error(f"No data found for any SubHeadID for metric: {metric_name}")
+    return None, False
+
+def head_candidate_stages(db, metric_name, sector_id=None, industry_id=None):
+    """
+    Candidate SubHeadIDs for a metric name, in priority order.
+    
+    Candidates depend only on the metric and the company's sector / industry, so callers
+    resolving one metric for many companies of a sector can reuse the stages.
+    
+    Args:
+        db: FinancialDatabase instance
+        metric_name: Name of the financial metric
+        sector_id: Optional sector ID of the company
+        industry_id: Optional industry ID of the company
+        
+    Returns:
+        Ordered list of (label, heads DataFrame, is_ratio); empty if no head matches
+    """
     # Metric name mappings for common aliases
     METRIC_ALIASES = {
         'total assets': 'Total Assets Of Window Takaful Operations - Operator\'s Fund',
@@ -48,81 +82,13 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
     # Special handling for TTM EPS
     if metric_name.lower() == 'ttm eps' or metric_name.lower() == 'eps ttm':
         logger.info(f"Special handling for TTM EPS metric")
-        # First try to find EPS in regular heads (tbl_headsmaster)
-        query = "SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%eps%'"
-        eps_heads = db.execute_query(query)
+        # Get all EPS-related regular and ratio heads
+        eps_heads = db.execute_statement('heads_like', pattern='eps')
+        eps_ratio_heads = db.execute_statement('ratio_heads_like', pattern='eps')
+        logger.info(f"Found {len(eps_heads)} EPS-related regular heads and {len(eps_ratio_heads)} EPS-related ratio heads")
         
-        if not eps_heads.empty:
-            logger.info(f"Found {len(eps_heads)} EPS-related regular heads")
-            
-            # Try each EPS head to find one with data
-            for _, row in eps_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['SubHeadName']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {sub_head_id}"]
-                
-                if consolidation_id is not None:
-                    where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_financialrawdata f 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"EPS head: Regular SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for EPS regular SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, False
-        else:
-            logger.info(f"No EPS-related regular heads found, trying ratio heads")
-            
-        # If no regular heads with data found, try ratio heads
-        # Get all EPS-related ratio heads
-        query = "SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%eps%'"
-        eps_ratio_heads = db.execute_query(query)
-        
-        if not eps_ratio_heads.empty:
-            logger.info(f"Found {len(eps_ratio_heads)} EPS-related ratio heads")
-            
-            # Try each EPS ratio head to find one with data
-            for _, row in eps_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"EPS head: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for EPS ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True
-        else:
-            logger.error(f"No EPS-related ratio heads found")
-                
-        logger.error(f"No data found for any EPS head (regular or ratio)")
-        return None, False
+        # Regular heads take priority over ratio heads
+        return [("EPS head", eps_heads, False), ("EPS head", eps_ratio_heads, True)]
     
     # Normalize the metric name for better matching
     normalized_metric_name = metric_name.lower().strip()
@@ -147,38 +113,9 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
     logger.info(f"Final classification for '{metric_name}': {'Ratio Metric' if is_ratio_metric else 'Regular Financial Metric'}")
     logger.info(f"Will use {'tbl_ratiosheadmaster' if is_ratio_metric else 'tbl_headsmaster'} for lookup")
     
-    # Get sector and industry information for the company
-    sector_query = f"""
-    SELECT c.SectorID, s.SectorName 
-    FROM tbl_companieslist c
-    JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    sector_result = db.execute_query(sector_query)
-    
-    sector_id = None
-    industry_id = None
-    
-    if not sector_result.empty:
-        sector_id = sector_result.iloc[0]['SectorID']
-        logger.info(f"Found SectorID: {sector_id} for company ID: {company_id}")
-        
-        # Get industry information
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName 
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {sector_id}
-        """
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            industry_id = industry_result.iloc[0]['IndustryID']
-            logger.info(f"Found IndustryID: {industry_id} for SectorID: {sector_id}")
-    
     # If we couldn't determine sector or industry, log a warning but continue with the search
     if sector_id is None or industry_id is None:
-        logger.warning(f"Could not determine sector or industry for company ID: {company_id}")
+        logger.warning(f"Could not determine sector or industry for metric: {metric_name}")
         logger.warning("Will search for SubHeadIDs without industry-sector validation")
 
     # Initialize variables to store search results
@@ -190,96 +127,59 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For ratio metrics, ONLY search in ratio heads - never fall back to regular heads
         if sector_id is not None and industry_id is not None:
             # First try exact match with industry validation
-            query = f"""
-            SELECT r.SubHeadID, r.HeadNames 
-            FROM tbl_ratiosheadmaster r
-            JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-            WHERE LOWER(r.HeadNames) = LOWER('{normalized_metric_name}')
-            AND m.sectorid = {sector_id}
-            """
-            exact_ratio_heads = db.execute_query(query)
+            exact_ratio_heads = db.execute_statement('ratio_heads_by_name_in_sector', sector_id=sector_id, name=normalized_metric_name)
             
             # If no exact matches, try contains match with industry validation
             if exact_ratio_heads.empty:
                 logger.info(f"No exact ratio matches with industry validation, trying contains match with industry filter")
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) LIKE '%{normalized_metric_name}%'
-                OR LOWER(r.HeadNames) LIKE '%debt%equity%'
-                AND m.sectorid = {sector_id}
-                """
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity_in_sector', sector_id=sector_id, pattern=normalized_metric_name)
             
             # If still no matches with industry validation, try without it as fallback
             if exact_ratio_heads.empty:
                 logger.info(f"No ratio matches with industry validation, trying without industry filter")
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{normalized_metric_name}')"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=normalized_metric_name)
                 
                 # If still no exact matches, try contains match without industry validation
                 if exact_ratio_heads.empty:
                     logger.info(f"No exact ratio matches without industry filter, trying contains match")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%' OR LOWER(HeadNames) LIKE '%debt%equity%'"
-                    exact_ratio_heads = db.execute_query(query)
+                    exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity', pattern=normalized_metric_name)
         else:
             # If sector or industry is not available, search without validation
-            query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{normalized_metric_name}')"
-            exact_ratio_heads = db.execute_query(query)
+            exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=normalized_metric_name)
             
             # If no exact matches, try contains match
             if exact_ratio_heads.empty:
                 logger.info(f"No exact ratio matches without industry info, trying contains match")
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%' OR LOWER(HeadNames) LIKE '%debt%equity%'"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity', pattern=normalized_metric_name)
         
         # For ratio metrics, we do NOT fall back to regular heads
         # This ensures ratio metrics are always looked up in tbl_ratiosheadmaster
     else:
         # For regular metrics, first try regular heads
         if sector_id is not None and industry_id is not None:
-            query = f"""
-            SELECT h.SubHeadID, h.SubHeadName 
-            FROM tbl_headsmaster h
-            JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-            WHERE LOWER(h.SubHeadName) = LOWER('{metric_name}')
-            AND m.sectorid = {sector_id}
-            """
-            exact_heads = db.execute_query(query)
+            exact_heads = db.execute_statement('heads_by_name_in_sector', sector_id=sector_id, name=metric_name)
             
             # If no matches with industry validation, try without it as fallback
             if exact_heads.empty:
                 logger.info(f"No exact matches with industry validation, trying without industry filter")
-                query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) = LOWER('{metric_name}')"
-                exact_heads = db.execute_query(query)
+                exact_heads = db.execute_statement('heads_by_name', name=metric_name)
         else:
             # If sector or industry is not available, search without validation
-            query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) = LOWER('{metric_name}')"
-            exact_heads = db.execute_query(query)
+            exact_heads = db.execute_statement('heads_by_name', name=metric_name)
         
         # Only if we don't find in regular heads, try ratio heads as fallback
         if exact_heads.empty:
             logger.info(f"No exact matches in regular heads, trying ratio heads as fallback")
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) = LOWER('{metric_name}')
-                AND m.sectorid = {sector_id}
-                """
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name_in_sector', sector_id=sector_id, name=metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if exact_ratio_heads.empty:
                     logger.info(f"No exact ratio matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{metric_name}')"
-                    exact_ratio_heads = db.execute_query(query)
+                    exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{metric_name}')"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=metric_name)
     
     # Initialize variables for contains matches
     contains_heads = pd.DataFrame()
@@ -296,24 +196,15 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For ratio metrics, ONLY search in ratio heads - never fall back to regular heads
         if exact_ratio_heads.empty:
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE r.HeadNames LIKE '%{metric_name}%'
-                AND m.sectorid = {sector_id}
-                """
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if contains_ratio_heads.empty:
                     logger.info(f"No contains ratio matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE HeadNames LIKE '%{metric_name}%'"
-                    contains_ratio_heads = db.execute_query(query)
+                    contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE HeadNames LIKE '%{metric_name}%'"
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=metric_name)
         
         # For ratio metrics, we do NOT fall back to regular heads
         # This ensures ratio metrics are always looked up in tbl_ratiosheadmaster
@@ -321,258 +212,112 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For regular metrics, prioritize searching in regular heads
         if exact_heads.empty:
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT h.SubHeadID, h.SubHeadName 
-                FROM tbl_headsmaster h
-                JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-                WHERE h.SubHeadName LIKE '%{metric_name}%'
-                AND m.sectorid = {sector_id}
-                """
-                contains_heads = db.execute_query(query)
+                contains_heads = db.execute_statement('heads_like_in_sector', sector_id=sector_id, pattern=metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if contains_heads.empty:
                     logger.info(f"No contains matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE SubHeadName LIKE '%{metric_name}%'"
-                    contains_heads = db.execute_query(query)
+                    contains_heads = db.execute_statement('heads_like', pattern=metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE SubHeadName LIKE '%{metric_name}%'"
-                contains_heads = db.execute_query(query)
+                contains_heads = db.execute_statement('heads_like', pattern=metric_name)
         
         # Only if we don't find in regular heads, try ratio heads as fallback
         if contains_heads.empty and exact_ratio_heads.empty:
             logger.info(f"No contains matches in regular heads, trying ratio heads as fallback")
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE r.HeadNames LIKE '%{metric_name}%'
-                AND m.sectorid = {sector_id}
-                """
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if contains_ratio_heads.empty:
                     logger.info(f"No contains ratio matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE HeadNames LIKE '%{metric_name}%'"
-                    contains_ratio_heads = db.execute_query(query)
+                    contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE HeadNames LIKE '%{metric_name}%'"
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=metric_name)
 
     # Check if we found any potential matches
     if contains_heads.empty and contains_ratio_heads.empty:
         logger.error(f"No SubHeadIDs found for metric: {metric_name}")
-        return None, False
+        return []
     
-    # Prioritize checking based on whether the metric is a ratio or not
+    # Candidate lists in priority order; contains matches are skipped when they are the exact matches
     if is_ratio_metric:
-        # First check exact matches in ratio heads for ratio metrics
-        if not exact_ratio_heads.empty:
-            logger.info(f"Found {len(exact_ratio_heads)} exact matches in ratio heads for metric: {metric_name}")
-            
-            for _, row in exact_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"r.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Exact match: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for exact match ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True
-        
-        # Then check contains matches in ratio heads for ratio metrics
-        if not contains_ratio_heads.empty and contains_ratio_heads.equals(exact_ratio_heads) == False:
-            logger.info(f"Found {len(contains_ratio_heads)} contains matches in ratio heads for metric: {metric_name}")
-            
-            for _, row in contains_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"r.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Contains match: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for contains match ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True
-        
         # For ratio metrics, we do NOT check regular heads
         # This ensures ratio metrics are always queried from tbl_ratiorawdata
+        stages = [("Exact match", exact_ratio_heads, True)]
+        if not contains_ratio_heads.equals(exact_ratio_heads):
+            stages.append(("Contains match", contains_ratio_heads, True))
     else:
-        # For regular metrics, first check exact matches in regular heads
-        if not exact_heads.empty:
-            logger.info(f"Found {len(exact_heads)} exact matches in regular heads for metric: {metric_name}")
-            
-            for _, row in exact_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                sub_head_name = row['SubHeadName']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"f.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_financialrawdata f 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Exact match: SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for exact match SubHeadID {sub_head_id} ({sub_head_name})")
-                    return sub_head_id, False
+        stages = [("Exact match", exact_heads, False)]
+        if not contains_heads.equals(exact_heads):
+            stages.append(("Contains match", contains_heads, False))
+        # As fallback for regular metrics, check ratio heads
+        stages.append(("Fallback exact match", exact_ratio_heads, True))
+        if not contains_ratio_heads.equals(exact_ratio_heads):
+            stages.append(("Fallback contains match", contains_ratio_heads, True))
+    return stages
+
+RAW_DATA_TABLES = {
+    False: 'tbl_financialrawdata',
+    True: 'tbl_ratiorawdata',
+}
+
+def select_head_with_data(db, stages, company_id, period_end=None, consolidation_id=None):
+    """
+    Pick the first candidate SubHeadID that has data, walking the candidate lists in priority order.
+    
+    Availability for every candidate in every stage is fetched with a single batched probe
+    (FinancialDatabase.probe_head_data) instead of one COUNT(*) per SubHeadID.
+    
+    Args:
+        db: FinancialDatabase instance
+        stages: Ordered list of (label, heads DataFrame, is_ratio)
+        company_id: Company ID
+        period_end: Optional specific period end date (format: 'YYYY-MM-DD')
+        consolidation_id: Optional consolidation ID
         
-        # Then check contains matches in regular heads for regular metrics
-        if not contains_heads.empty and contains_heads.equals(exact_heads) == False:
-            logger.info(f"Found {len(contains_heads)} contains matches in regular heads for metric: {metric_name}")
-            
-            for _, row in contains_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                sub_head_name = row['SubHeadName']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"f.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_financialrawdata f 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Contains match: SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for contains match SubHeadID {sub_head_id} ({sub_head_name})")
-                    return sub_head_id, False
+    Returns:
+        Tuple of (head_id, is_ratio) for the first candidate with data, None otherwise
+    """
+    stages = [(label, heads, is_ratio) for label, heads, is_ratio in stages if heads is not None and not heads.empty]
+    
+    candidates = {}
+    for _, heads, is_ratio in stages:
+        candidates.setdefault(RAW_DATA_TABLES[is_ratio], []).extend(heads['SubHeadID'].tolist())
+    if not candidates:
+        return None
+    
+    availability = db.probe_head_data(candidates, company_id, consolidation_id, period_end)
+    return pick_head_with_data(stages, availability)
+
+def pick_head_with_data(stages, availability):
+    """
+    First candidate SubHeadID in stages that has rows according to availability
+    
+    Args:
+        stages: Ordered list of (label, heads DataFrame, is_ratio)
+        availability: Dictionary of raw data table -> {SubHeadID: row count}
         
-        # As fallback for regular metrics, check ratio heads
-        if not exact_ratio_heads.empty:
-            logger.info(f"Checking ratio heads as fallback for regular metric: {metric_name}")
-            
-            for _, row in exact_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"r.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Fallback exact match: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for fallback exact match ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True
+    Returns:
+        Tuple of (head_id, is_ratio), None if no candidate has data
+    """
+    for label, heads, is_ratio in stages:
+        if heads is None or heads.empty:
+            continue
+        name_col = 'HeadNames' if is_ratio else 'SubHeadName'
+        counts = availability.get(RAW_DATA_TABLES[is_ratio], {})
+        logger.info(f"Checking {len(heads)} {label.lower()} candidates in {'ratio' if is_ratio else 'regular'} heads")
         
-        # Finally check contains matches in ratio heads as last resort for regular metrics
-        if not contains_ratio_heads.empty and contains_ratio_heads.equals(exact_ratio_heads) == False:
-            logger.info(f"Checking contains matches in ratio heads as last resort for regular metric: {metric_name}")
+        for sub_head_id, head_name in zip(heads['SubHeadID'], heads[name_col]):
+            count = counts.get(sub_head_id, 0)
+            logger.info(f"{label}: {'Ratio ' if is_ratio else ''}SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
             
-            for _, row in contains_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if period_end is not None:
-                    where_clauses.append(f"r.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"Fallback contains match: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for fallback contains match ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True
+            if count > 0:
+                logger.info(f"Found data for {label.lower()} {'ratio ' if is_ratio else ''}SubHeadID {sub_head_id} ({head_name})")
+                return sub_head_id, is_ratio
     
-    logger.error(f"No data found for any SubHeadID for metric: {metric_name}")
-    return None, False
+    return None
 
 # Example usage
 if __name__ == "__main__":
@@ -581,33 +326,11 @@ if __name__ == "__main__":
     period_end = '2021-03-31'
     consolidation_id = db.get_consolidation_id('unconsolidated')
     
-    # Get company's sector and industry information for context
-    sector_query = f"""
-    SELECT c.SectorID, s.SectorName 
-    FROM tbl_companieslist c
-    JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    sector_result = db.execute_query(sector_query)
-    
-    if not sector_result.empty:
-        sector_id = sector_result.iloc[0]['SectorID']
-        sector_name = sector_result.iloc[0]['SectorName']
-        print(f"\nCompany is in sector: {sector_name} (ID: {sector_id})")
-        
-        # Get industry information
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName 
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {sector_id}
-        """
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            industry_id = industry_result.iloc[0]['IndustryID']
-            industry_name = industry_result.iloc[0]['IndustryName']
-            print(f"Company is in industry: {industry_name} (ID: {industry_id})")
+    # Get sector and industry information for the company from the cached company context
+    context = db.get_company_context(company_id)
+    if context is not None:
+        print(f"\nCompany is in sector: {context.sector_name} (ID: {context.sector_id})")
+        print(f"Company is in industry: {context.industry_name} (ID: {context.industry_id})")
     
     # Example 1: Test with a regular financial metric
     regular_metric = 'Depreciation and Amortisation'
@@ -635,7 +358,7 @@ if __name__ == "__main__":
         # Determine table and column names based on whether it's a ratio or not
         if is_ratio:
             # For ratio metrics, use ratio tables and columns with correct column names
-            query = f"""
+            query = """
             SELECT r.Value_ as Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                    rh.HeadNames AS Metric, con.consolidationname AS Consolidation, r.PeriodEnd AS PeriodEnd
             FROM tbl_ratiorawdata r
@@ -644,15 +367,15 @@ if __name__ == "__main__":
             JOIN tbl_terms t ON r.TermID = t.TermID
             JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
             JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID
-            WHERE r.CompanyID = {company_id}
-            AND r.SubHeadID = {test_head_id}
-            AND r.RatioDate = '{period_end}'
-            AND r.ConsolidationID = {consolidation_id}
+            WHERE r.CompanyID = :company_id
+            AND r.SubHeadID = :head_id
+            AND r.RatioDate = :period_end
+            AND r.ConsolidationID = :consolidation_id
             ORDER BY r.RatioDate DESC
             """
         else:
             # For regular financial metrics, use financial tables and columns
-            query = f"""
+            query = """
             SELECT f.Value as Value, u.unitname, t.term, c.CompanyName, 
                    h.SubHeadName, con.consolidationname, f.PeriodEnd
             FROM tbl_financialrawdata f
@@ -661,15 +384,16 @@ if __name__ == "__main__":
             JOIN tbl_terms t ON f.TermID = t.TermID
             JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
             JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-            WHERE f.CompanyID = {company_id}
-            AND f.SubHeadID = {test_head_id}
-            AND f.PeriodEnd = '{period_end}'
-            AND f.ConsolidationID = {consolidation_id}
+            WHERE f.CompanyID = :company_id
+            AND f.SubHeadID = :head_id
+            AND f.PeriodEnd = :period_end
+            AND f.ConsolidationID = :consolidation_id
             ORDER BY f.PeriodEnd DESC
         """
         
         print(f"\nQuery with Head ID:\n{query}\n")
-        result = db.execute_query(query)
+        result = db.execute_query(query, {'company_id': company_id, 'head_id': test_head_id,
+                                          'period_end': period_end, 'consolidation_id': consolidation_id})
         print(f"\nQuery Result:\n{result}")
     else:
         print("\nNo valid head_id found for either metric")
\ No newline at end of file
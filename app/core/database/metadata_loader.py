@@ -0,0 +1,262 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Parallel, column-projected loading of the metadata tables with a local snapshot
+'''
+
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from app.core.database.compact_metadata import compact_frame
+from app.core.database.schema_catalog import SchemaCatalog
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataTable(NamedTuple):
+    """
+    One metadata table and the columns read from it. columns lists every name variant the
+    readers accept; the ones the table actually has are selected. None selects every column.
+    names are the columns given a precomputed lowercase companion.
+    """
+    table_name: str
+    columns: Optional[Tuple[str, ...]] = None
+    names: Tuple[str, ...] = ()
+
+
+# metadata_cache key -> table
+METADATA_TABLES: Dict[str, MetadataTable] = {
+    'companies': MetadataTable('tbl_companieslist', (
+        'CompanyID', 'company_id', 'CompanyName', 'company_name', 'Symbol', 'ticker', 'symbol',
+        'SectorID', 'sector_id')),
+    'industries': MetadataTable('tbl_industrynames', (
+        'IndustryID', 'industryid', 'industry_id', 'IndustryName', 'industryname', 'industry_name')),
+    'sectors': MetadataTable('tbl_sectornames', (
+        'SectorID', 'sectorid', 'sector_id', 'SectorName', 'sectorname', 'sector_name')),
+    'industry_sector_mapping': MetadataTable('tbl_industryandsectormapping', (
+        'sectorid', 'SectorID', 'sector_id', 'industryid', 'IndustryID', 'industry_id')),
+    'units': MetadataTable('tbl_unitofmeasurement', ('UnitID', 'unit_id', 'UnitName', 'unit_name')),
+    'statements': MetadataTable('tbl_statementsname'),
+    'heads': MetadataTable('tbl_headsmaster', (
+        'SubHeadID', 'sub_head_id', 'head_id', 'SubHeadName', 'head_name', 'IndustryID', 'industryid',
+        'UnitID', 'StatementID'), ('SubHeadName', 'head_name')),
+    'ratio_heads': MetadataTable('tbl_ratiosheadmaster', (
+        'SubHeadID', 'ratio_head_id', 'HeadNames', 'RatioHeadName', 'ratio_head_name', 'IndustryID',
+        'industryid', 'UnitID'), ('HeadNames', 'RatioHeadName', 'ratio_head_name')),
+    'consolidation': MetadataTable('tbl_consolidation', (
+        'ConsolidationID', 'consolidation_id', 'consolidationname', 'ConsolidationName', 'consolidation_name')),
+    'terms': MetadataTable('tbl_terms', ('TermID', 'term_id', 'term', 'TermName', 'term_name'),
+                           ('term', 'TermName', 'term_name')),
+    'terms_mapping': MetadataTable('tbl_termsmapping'),
+    'dissection': MetadataTable('tbl_disectionmaster'),
+}
+
+# Bumped whenever the snapshot layout changes; older snapshots are ignored
+SNAPSHOT_VERSION = 2
+
+# Snapshot file: 8-byte header length, pickled header padded to BUFFER_ALIGNMENT, then the
+# body: pickle payload followed by its out-of-band buffers, each on a BUFFER_ALIGNMENT boundary
+BUFFER_ALIGNMENT = 64
+
+
+def selected_columns(table: MetadataTable, catalog: Optional[SchemaCatalog]) -> Optional[list]:
+    """
+    Columns of table to read, in ordinal order, or None to read every column (no catalog,
+    table not in the catalog, or none of the candidate columns found)
+    """
+    if table.columns is None or catalog is None or not catalog.has_table(table.table_name):
+        return None
+    wanted = set(table.columns)
+    columns = [column for column in catalog.columns(table.table_name) if column in wanted]
+    return columns or None
+
+
+def select_query(table: MetadataTable, catalog: Optional[SchemaCatalog] = None) -> str:
+    columns = selected_columns(table, catalog)
+    return f"SELECT {', '.join(columns) if columns else '*'} FROM {table.table_name}"
+
+
+def checksum_query(tables: Dict[str, MetadataTable], catalog: Optional[SchemaCatalog] = None) -> str:
+    """
+    One statement returning the row count and CHECKSUM_AGG of the selected columns of every table
+    """
+    parts = []
+    for key, table in tables.items():
+        columns = selected_columns(table, catalog)
+        parts.append(f"SELECT '{key}' AS TableKey, COUNT_BIG(*) AS RowCount, "
+                     f"CHECKSUM_AGG(BINARY_CHECKSUM({', '.join(columns) if columns else '*'})) AS RowChecksum "
+                     f"FROM {table.table_name}")
+    return "\nUNION ALL\n".join(parts)
+
+
+def snapshot_path(cache_dir: str, server: str, database: str) -> str:
+    """
+    Snapshot file for one server / database under cache_dir
+    """
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{server}_{database}")
+    return os.path.join(cache_dir, f"metadata_{name}.pkl")
+
+
+class MetadataSnapshot(NamedTuple):
+    frames: Dict[str, pd.DataFrame]
+    # metadata_cache key -> (row count, checksum) read before the frames were loaded
+    checksums: Dict[str, Tuple[int, int]]
+    created_at: float
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // BUFFER_ALIGNMENT) * BUFFER_ALIGNMENT
+
+
+class MetadataLoader:
+    """
+    Loads the metadata tables concurrently, each on its own pooled connection, reading only
+    the columns the readers use, and compacts them (see compact_metadata).
+
+    A snapshot of the loaded frames is pickled under the cache directory together with the
+    tables' row counts and checksums. A later start can serve metadata from the snapshot
+    and revalidate it with a single checksum query, reloading only the tables that changed.
+
+    The snapshot keeps numeric columns and categorical codes as out-of-band pickle buffers
+    that are read through a read-only memory map, so worker processes on one host share
+    those pages instead of each holding a copy.
+    """
+
+    def __init__(self, execute_query: Callable[[str], pd.DataFrame], path: Optional[str] = None,
+                 tables: Optional[Dict[str, MetadataTable]] = None, max_workers: int = 4):
+        """
+        Args:
+            execute_query: Callable that executes a SQL query and returns a DataFrame
+            path: Snapshot file, None to disable snapshots
+            tables: Optional metadata_cache key -> table mapping (defaults to METADATA_TABLES)
+            max_workers: Tables loaded at the same time
+        """
+        self.execute_query = execute_query
+        self.path = path
+        self.tables = dict(tables or METADATA_TABLES)
+        self.max_workers = max_workers
+
+    def load(self, catalog: Optional[SchemaCatalog] = None,
+             keys: Optional[Iterable[str]] = None, compact: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Load tables from the database in parallel
+
+        Args:
+            catalog: Schema catalog used to project columns; every column is read without it
+            keys: metadata_cache keys to load, all tables when None
+            compact: Return compact frames (int32 ids, categorical / interned names, lowercase name columns)
+
+        Raises:
+            Exception: The first error raised while loading a table
+        """
+        start = time.perf_counter()
+        keys = list(keys) if keys is not None else list(self.tables)
+        queries = {key: select_query(self.tables[key], catalog) for key in keys}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(keys)))) as pool:
+            futures = {key: pool.submit(self.execute_query, query) for key, query in queries.items()}
+            frames = {key: future.result() for key, future in futures.items()}
+        if compact:
+            frames = {key: compact_frame(df, self.tables[key].names) for key, df in frames.items()}
+        logger.info(f"Loaded {len(frames)} metadata tables ({sum(len(df) for df in frames.values())} rows) "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return frames
+
+    def checksums(self, catalog: Optional[SchemaCatalog] = None) -> Dict[str, Tuple[int, int]]:
+        """
+        Row count and checksum per table, empty if the checksum query fails
+        """
+        try:
+            df = self.execute_query(checksum_query(self.tables, catalog))
+        except Exception as e:
+            logger.error(f"Error reading metadata checksums: {e}")
+            return {}
+        return {key: (int(rows), int(checksum) if pd.notna(checksum) else 0)
+                for key, rows, checksum in zip(df['TableKey'], df['RowCount'], df['RowChecksum'])}
+
+    def stale_tables(self, snapshot: MetadataSnapshot, checksums: Dict[str, Tuple[int, int]]) -> list:
+        """
+        Keys whose snapshot frame may differ from the database; all of them when checksums are unknown
+        """
+        return [key for key in self.tables
+                if key not in snapshot.frames or key not in checksums or checksums[key] != snapshot.checksums.get(key)]
+
+    def _fingerprint(self) -> str:
+        # Snapshots written for other table / column lists are not reused
+        return hashlib.sha256(repr(sorted(self.tables.items())).encode()).hexdigest()
+
+    def read_snapshot(self) -> Optional[MetadataSnapshot]:
+        """
+        Read the snapshot, or None if there is none or it is corrupt, from another version
+        or for another table list. Numeric columns of the returned frames are read-only
+        views of the memory-mapped file.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            header_size, = struct.unpack_from('<Q', view, 0)
+            version, fingerprint, digest, payload_size, buffers = pickle.loads(view[8:8 + header_size])
+            if version != SNAPSHOT_VERSION or fingerprint != self._fingerprint():
+                logger.info(f"Ignoring metadata snapshot {self.path}: written for another layout")
+                return None
+            body = 8 + header_size
+            if hashlib.sha256(view[body:]).hexdigest() != digest:
+                logger.warning(f"Ignoring metadata snapshot {self.path}: checksum mismatch")
+                return None
+            payload = view[body:body + payload_size]
+            snapshot = MetadataSnapshot(*pickle.loads(payload, buffers=[view[body + offset:body + offset + size]
+                                                                        for offset, size in buffers]))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable metadata snapshot {self.path}: {e}")
+            return None
+        logger.info(f"Read metadata snapshot from {time.ctime(snapshot.created_at)} "
+                    f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return snapshot
+
+    def write_snapshot(self, frames: Dict[str, pd.DataFrame], checksums: Dict[str, Tuple[int, int]]) -> None:
+        """
+        Write frames and checksums to the snapshot file, replacing it atomically
+        """
+        if self.path is None:
+            return
+        try:
+            buffers = []
+            payload = pickle.dumps(tuple(MetadataSnapshot(frames, checksums, time.time())), protocol=5,
+                                   buffer_callback=buffers.append)
+            raw_buffers = [buffer.raw() for buffer in buffers]
+
+            # Buffer offsets are relative to the start of the body (payload and buffers)
+            layout, position = [], _aligned(len(payload))
+            for raw in raw_buffers:
+                layout.append((position, raw.nbytes))
+                position = _aligned(position + raw.nbytes)
+            body = bytearray(position)
+            body[:len(payload)] = payload
+            for (offset, size), raw in zip(layout, raw_buffers):
+                body[offset:offset + size] = raw
+
+            # The header is padded so the body, and with it every buffer, starts aligned
+            header = pickle.dumps((SNAPSHOT_VERSION, self._fingerprint(), hashlib.sha256(body).hexdigest(),
+                                   len(payload), layout))
+            header_size = _aligned(8 + len(header)) - 8
+
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(struct.pack('<Q', header_size))
+                f.write(header.ljust(header_size, b'\0'))
+                f.write(body)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error writing metadata snapshot {self.path}: {e}")
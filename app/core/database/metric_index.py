@@ -0,0 +1,240 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: In-memory inverted index over tbl_headsmaster / tbl_ratiosheadmaster names
+'''
+
+import bisect
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.database.compact_metadata import lower_column
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _ngrams(text: str) -> set:
+    """
+    Return the set of character n-grams of a normalized string
+    """
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _tokens(text: str) -> List[str]:
+    """
+    Split a normalized string into alphanumeric tokens
+    """
+    return _TOKEN_RE.findall(text)
+
+
+class _HeadTable:
+    """
+    Postings for one master table. Row positions follow the DataFrame order so
+    "first match" means the same row the pandas scans used to return.
+    """
+
+    def __init__(self, df: Optional[pd.DataFrame], id_candidates: List[str], name_candidates: List[str]):
+        self.ids: List[int] = []
+        self.names: List[str] = []
+        self.norms: List[str] = []
+        self.exact: Dict[str, int] = {}
+        self.sorted_norms: List[Tuple[str, int]] = []
+        self.grams: Dict[str, List[int]] = {}
+        self.tokens: Dict[str, List[int]] = {}
+        self.id_col = None
+        self.name_col = None
+
+        if df is None or df.empty:
+            return
+
+        self.id_col = next((c for c in id_candidates if c in df.columns), None)
+        self.name_col = next((c for c in name_candidates if c in df.columns), None)
+        if self.id_col is None or self.name_col is None:
+            logger.error(f"Could not find id/name columns in {df.columns.tolist()}")
+            return
+
+        # Compact metadata frames carry the lowercase names precomputed
+        lower_col = lower_column(self.name_col)
+        lowered = df[lower_col].tolist() if lower_col in df.columns else [None] * len(df)
+        for head_id, name, norm in zip(df[self.id_col].tolist(), df[self.name_col].tolist(), lowered):
+            if not isinstance(name, str):
+                continue
+            pos = len(self.ids)
+            norm = norm if isinstance(norm, str) else name.lower()
+            self.ids.append(head_id)
+            self.names.append(name)
+            self.norms.append(norm)
+            self.exact.setdefault(norm, pos)
+            for gram in _ngrams(norm):
+                self.grams.setdefault(gram, []).append(pos)
+            for token in set(_tokens(norm)):
+                self.tokens.setdefault(token, []).append(pos)
+
+        self.sorted_norms = sorted((norm, pos) for pos, norm in enumerate(self.norms))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find_exact(self, query: str) -> Optional[int]:
+        return self.exact.get(query)
+
+    def find_prefix(self, query: str) -> List[int]:
+        start = bisect.bisect_left(self.sorted_norms, (query, -1))
+        positions = []
+        for norm, pos in self.sorted_norms[start:]:
+            if not norm.startswith(query):
+                break
+            positions.append(pos)
+        return sorted(positions)
+
+    def candidates(self, query: str) -> Optional[List[int]]:
+        """
+        Positions that may contain query as a substring, in row order: the shortest
+        posting list among the query's n-grams, verified by the caller.
+        Returns None when the query is too short to use the n-gram postings.
+        """
+        if len(query) < NGRAM_SIZE:
+            return None
+        smallest = None
+        for gram in _ngrams(query):
+            posting = self.grams.get(gram)
+            if posting is None:
+                return []
+            if smallest is None or len(posting) < len(smallest):
+                smallest = posting
+        return smallest
+
+    def find_contains(self, query: str) -> Optional[int]:
+        candidates = self.candidates(query)
+        if candidates is None:
+            candidates = range(len(self.norms))
+        for pos in candidates:
+            if query in self.norms[pos]:
+                return pos
+        return None
+
+    def find_all_contains(self, query: str) -> List[int]:
+        candidates = self.candidates(query)
+        if candidates is None:
+            candidates = range(len(self.norms))
+        return [pos for pos in candidates if query in self.norms[pos]]
+
+
+class MetricIndex:
+    """
+    Prebuilt index over regular heads and ratio heads.
+
+    Answers exact, prefix, substring and similar-name lookups without scanning
+    the master tables, and resolves a metric name with the same priority order
+    as FinancialDatabase.get_head_id (exact then contains, preferred table first).
+    """
+
+    HEAD_ID_COLUMNS = ['SubHeadID', 'sub_head_id']
+    HEAD_NAME_COLUMNS = ['SubHeadName', 'head_name']
+    RATIO_ID_COLUMNS = ['SubHeadID', 'ratio_head_id']
+    RATIO_NAME_COLUMNS = ['HeadNames', 'RatioHeadName', 'ratio_head_name']
+
+    def __init__(self, heads_df: Optional[pd.DataFrame], ratio_heads_df: Optional[pd.DataFrame]):
+        self.heads = _HeadTable(heads_df, self.HEAD_ID_COLUMNS, self.HEAD_NAME_COLUMNS)
+        self.ratio_heads = _HeadTable(ratio_heads_df, self.RATIO_ID_COLUMNS, self.RATIO_NAME_COLUMNS)
+        logger.info(f"Metric index built: {len(self.heads)} regular heads, {len(self.ratio_heads)} ratio heads")
+
+    @classmethod
+    def from_metadata(cls, metadata_cache: Dict[str, pd.DataFrame]) -> 'MetricIndex':
+        return cls(metadata_cache.get('heads'), metadata_cache.get('ratio_heads'))
+
+    def _table(self, is_ratio: bool) -> _HeadTable:
+        return self.ratio_heads if is_ratio else self.heads
+
+    def _entry(self, table: _HeadTable, pos: Optional[int], is_ratio: bool) -> Optional[Tuple[int, bool, str]]:
+        if pos is None:
+            return None
+        return table.ids[pos], is_ratio, table.names[pos]
+
+    def exact(self, metric_name: str, is_ratio: bool) -> Optional[Tuple[int, bool, str]]:
+        """
+        Case-insensitive exact name match. Returns (head_id, is_ratio, head_name) or None
+        """
+        table = self._table(is_ratio)
+        return self._entry(table, table.find_exact(metric_name.lower()), is_ratio)
+
+    def exact_all(self, metric_name: str, is_ratio: bool) -> List[Tuple[int, bool, str]]:
+        """
+        Every head named metric_name (case-insensitive), in master table order; the same
+        name is usually repeated once per industry
+        """
+        query = metric_name.lower()
+        table = self._table(is_ratio)
+        return [self._entry(table, pos, is_ratio) for pos in table.find_prefix(query) if table.norms[pos] == query]
+
+    def prefix(self, metric_name: str, is_ratio: bool) -> List[Tuple[int, bool, str]]:
+        """
+        All heads whose name starts with metric_name, in master table order
+        """
+        table = self._table(is_ratio)
+        return [self._entry(table, pos, is_ratio) for pos in table.find_prefix(metric_name.lower())]
+
+    def contains(self, metric_name: str, is_ratio: bool) -> Optional[Tuple[int, bool, str]]:
+        """
+        First head (in master table order) whose name contains metric_name
+        """
+        table = self._table(is_ratio)
+        return self._entry(table, table.find_contains(metric_name.lower()), is_ratio)
+
+    def contains_all(self, metric_name: str, is_ratio: bool) -> List[Tuple[int, bool, str]]:
+        """
+        Every head whose name contains metric_name, in master table order
+        """
+        table = self._table(is_ratio)
+        return [self._entry(table, pos, is_ratio) for pos in table.find_all_contains(metric_name.lower())]
+
+    def resolve(self, metric_name: str, prefer_ratio: bool) -> Optional[Tuple[int, bool, str, str]]:
+        """
+        Resolve a metric name the way get_head_id does: exact then contains in the
+        preferred table, then exact then contains in the other table.
+
+        Returns:
+            Tuple of (head_id, is_ratio, head_name, match_type) or None
+        """
+        for is_ratio in (prefer_ratio, not prefer_ratio):
+            for match_type, finder in (('exact', self.exact), ('contains', self.contains)):
+                entry = finder(metric_name, is_ratio)
+                if entry is not None:
+                    return entry + (match_type,)
+        return None
+
+    def similar(self, metric_name: str, limit: int = 5) -> List[str]:
+        """
+        Names that share at least one query token as a substring, regular heads
+        before ratio heads, ranked by the number of whole tokens they share
+        """
+        query_tokens = [t for t in metric_name.lower().split() if t]
+        if not query_tokens:
+            return []
+
+        ranked = []
+        for table_rank, table in enumerate((self.heads, self.ratio_heads)):
+            hits = set()
+            for token in query_tokens:
+                hits.update(table.find_all_contains(token))
+            shared = {}
+            for token in set(_tokens(metric_name.lower())):
+                for pos in table.tokens.get(token, []):
+                    if pos in hits:
+                        shared[pos] = shared.get(pos, 0) + 1
+            seen = set()
+            for pos in sorted(hits):
+                name = table.names[pos]
+                if name in seen:
+                    continue
+                seen.add(name)
+                ranked.append((-shared.get(pos, 0), table_rank, pos, name))
+
+        ranked.sort()
+        return [name for _, _, _, name in ranked[:limit]]
@@ -0,0 +1,276 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Materialized sector / industry aggregates of the raw data tables for peer comparisons
+'''
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery
+
+logger = logging.getLogger(__name__)
+
+# Table family -> raw data table
+AGGREGATE_TABLES = {
+    'regular': 'tbl_financialrawdata',
+    'quarter': 'tbl_financialrawdata_Quarter',
+    'ttm': 'tbl_financialrawdataTTM',
+    'ratio': 'tbl_ratiorawdata',
+}
+
+# Peer groups; a company's industry is the first industry mapped to its sector
+GROUP_KINDS = {'sector': 'SectorID', 'industry': 'IndustryID'}
+GROUP_KIND_DTYPE = pd.CategoricalDtype(list(GROUP_KINDS))
+
+# Column used as the incremental refresh watermark
+WATERMARK_COLUMN = 'PeriodEnd'
+
+# Seconds between incremental refreshes
+REFRESH_INTERVAL_SECONDS = 600
+
+KEY_COLUMNS = ['GroupKind', 'GroupID', 'SubHeadID', 'TermID', 'ConsolidationID', 'PeriodEnd']
+STAT_COLUMNS = ['Count', 'Mean', 'Median', 'P10', 'P25', 'P75', 'P90', 'Min', 'Max']
+
+# Stored quantiles and the percentile each stands for, for percentile_rank
+QUANTILES = {'P10': 0.10, 'P25': 0.25, 'P75': 0.75, 'P90': 0.90}
+RANK_POINTS = [('Min', 0.0), ('P10', 10.0), ('P25', 25.0), ('Median', 50.0), ('P75', 75.0), ('P90', 90.0), ('Max', 100.0)]
+
+
+def aggregate(rows: pd.DataFrame, company_groups: pd.DataFrame) -> pd.DataFrame:
+    """
+    Peer statistics of raw rows per group and (SubHeadID, TermID, ConsolidationID, PeriodEnd)
+
+    Args:
+        rows: Raw rows with CompanyID, SubHeadID, TermID, ConsolidationID, PeriodEnd and Value
+        company_groups: CompanyID with SectorID and IndustryID
+
+    Returns:
+        DataFrame with KEY_COLUMNS + STAT_COLUMNS; companies outside company_groups and
+        missing values are left out
+    """
+    rows = rows.dropna(subset=['Value']).merge(company_groups, on='CompanyID', how='inner')
+    frames = []
+    for kind, group_col in GROUP_KINDS.items():
+        grouped = rows.dropna(subset=[group_col]).assign(GroupKind=kind, GroupID=lambda df: df[group_col].astype(np.int64))
+        frames.append(grouped[KEY_COLUMNS + ['Value']])
+    rows = pd.concat(frames, ignore_index=True)
+    if rows.empty:
+        return pd.DataFrame(columns=KEY_COLUMNS + STAT_COLUMNS).astype({'GroupKind': GROUP_KIND_DTYPE})
+
+    groups = rows.groupby(KEY_COLUMNS, sort=True, observed=True)['Value']
+    stats = groups.agg(Count='count', Mean='mean', Median='median', Min='min', Max='max')
+    quantiles = groups.quantile(list(QUANTILES.values())).unstack()
+    quantiles.columns = list(QUANTILES)
+    stats = stats.join(quantiles).reset_index()
+    stats['Count'] = stats['Count'].astype(np.int32)
+    stats['GroupKind'] = stats['GroupKind'].astype(GROUP_KIND_DTYPE)
+    return stats[KEY_COLUMNS + STAT_COLUMNS]
+
+
+class FamilyAggregates(NamedTuple):
+    """
+    Aggregates of one table family with the lookups built over them
+    """
+    frame: pd.DataFrame
+    # Key tuple -> row position in frame
+    positions: Dict[tuple, int]
+    # (GroupKind, GroupID, SubHeadID, TermID, ConsolidationID) -> latest PeriodEnd
+    latest: Dict[tuple, pd.Timestamp]
+
+
+def index_aggregates(frame: pd.DataFrame) -> FamilyAggregates:
+    """
+    Key positions and latest periods of an aggregates frame (see aggregate)
+    """
+    keys = list(zip(*(frame[column].tolist() for column in KEY_COLUMNS)))
+    latest = frame.groupby(KEY_COLUMNS[:-1], sort=False, observed=True)['PeriodEnd'].max()
+    return FamilyAggregates(frame, {key: position for position, key in enumerate(keys)},
+                            dict(zip(latest.index.tolist(), latest.tolist())))
+
+
+class PeerAggregates:
+    """
+    Count, mean, median, percentiles and range of every head per sector / industry, term,
+    consolidation and period, per raw data table.
+
+    Loaded once from the raw tables and refreshed incrementally: rows at or after each
+    table's PeriodEnd watermark are read again and their periods re-aggregated, so a peer
+    comparison is a dictionary lookup instead of one query per peer.
+
+    Lookups run on request threads while a refresh may be re-aggregating. Builds and
+    refreshes run one at a time under a lock and publish each family's frame together with
+    its positions and latest periods as one FamilyAggregates, so a lookup never reads a
+    position of one frame from another.
+    """
+
+    def __init__(self, fetch: Callable[[str], pd.DataFrame], company_groups: pd.DataFrame,
+                 tables: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            fetch: Callable that executes a SQL query and returns a DataFrame
+            company_groups: CompanyID with SectorID and IndustryID
+            tables: Optional table family -> table name mapping (defaults to AGGREGATE_TABLES)
+        """
+        self.fetch = fetch
+        self.company_groups = company_groups[['CompanyID'] + list(GROUP_KINDS.values())]
+        self.tables = dict(tables or AGGREGATE_TABLES)
+        self.families = {table_name: family for family, table_name in self.tables.items()}
+        # family -> aggregates; replaced as a whole, never modified in place
+        self.aggregates: Dict[str, FamilyAggregates] = {}
+        self.watermarks: Dict[str, Optional[pd.Timestamp]] = {}
+        self.refreshed_at = None
+        # Serializes build / refresh; lookups never take it
+        self._lock = threading.Lock()
+
+    @property
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {family: aggregates.frame for family, aggregates in self.aggregates.items()}
+
+    def _query(self, family: str, since=None) -> str:
+        where = f"WHERE {WATERMARK_COLUMN} >= :since" if since is not None else ""
+        return BoundQuery(f"""
+        SELECT CompanyID, SubHeadID, TermID, ConsolidationID, PeriodEnd, Value_ AS Value
+        FROM {self.tables[family]}
+        {where}
+        """, {'since': since} if since is not None else None, 'peer_aggregates')
+
+    def _load(self, family: str, since=None) -> Optional[pd.DataFrame]:
+        try:
+            rows = self.fetch(self._query(family, since))
+            rows = rows.dropna(subset=['CompanyID', 'SubHeadID', 'TermID', 'ConsolidationID', 'PeriodEnd'])
+            rows = rows.assign(PeriodEnd=pd.to_datetime(rows['PeriodEnd']),
+                               Value=pd.to_numeric(rows['Value'], errors='coerce'))
+            stats = aggregate(rows, self.company_groups)
+        except Exception as e:
+            logger.error(f"Error aggregating {self.tables[family]}: {e}")
+            return None
+        if not rows.empty:
+            watermark = rows['PeriodEnd'].max()
+            previous = self.watermarks.get(family)
+            self.watermarks[family] = watermark if previous is None else max(previous, watermark)
+        else:
+            self.watermarks.setdefault(family, None)
+        return stats
+
+    def build(self) -> 'PeerAggregates':
+        """
+        Aggregate every table family from scratch. Families that fail to load are left out.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.watermarks = {}
+            aggregates = {}
+            for family in self.tables:
+                stats = self._load(family)
+                if stats is not None:
+                    aggregates[family] = index_aggregates(stats)
+            self.aggregates = aggregates
+            self.refreshed_at = time.monotonic()
+        logger.info(f"Peer aggregates built in {time.perf_counter() - start:.2f}s: "
+                    f"{sum(len(frame) for frame in self.frames.values())} groups, {self.nbytes() / 1e6:.1f} MB")
+        return self
+
+    def refresh(self) -> int:
+        """
+        Re-aggregate the periods at or after each family's watermark (every row of those
+        periods is read again, so the statistics stay complete)
+
+        Returns:
+            Number of aggregate rows replaced or added
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        replaced = 0
+        for family in list(self.aggregates):
+            since = self.watermarks.get(family)
+            stats = self._load(family, since=since)
+            if stats is None or stats.empty:
+                continue
+            frame = self.aggregates[family].frame
+            if since is not None:
+                frame = frame[frame['PeriodEnd'] < since]
+            aggregates = index_aggregates(pd.concat([frame, stats], ignore_index=True))
+            self.aggregates = {**self.aggregates, family: aggregates}
+            replaced += len(stats)
+        self.refreshed_at = time.monotonic()
+        if replaced:
+            logger.info(f"Peer aggregates refreshed: {replaced} groups re-aggregated")
+        return replaced
+
+    def is_stale(self, interval: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Whether the last build or refresh is older than interval seconds
+        """
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at >= interval
+
+    def maybe_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS) -> None:
+        """
+        Refresh incrementally if the last refresh is older than interval seconds. When another
+        thread is already refreshing, return at once.
+        """
+        if not self.is_stale(interval) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            # Another thread may have refreshed between the check and the lock
+            if self.is_stale(interval):
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def covers(self, table_name: str) -> bool:
+        """
+        Whether lookups against table_name can be answered from memory
+        """
+        return self.families.get(table_name) in self.aggregates
+
+    def lookup(self, table_name: str, group_kind: str, group_id: int, head_id: int, term_id: int,
+               consolidation_id: int, period_end: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Peer statistics of one head in one group
+
+        Args:
+            table_name: Raw data table the head's values come from
+            group_kind: 'sector' or 'industry'
+            group_id: SectorID or IndustryID
+            head_id: SubHeadID
+            term_id: TermID
+            consolidation_id: Consolidation ID
+            period_end: Optional PeriodEnd; the group's latest period when None
+
+        Returns:
+            Dict of PeriodEnd and STAT_COLUMNS, None when the group has no such values
+        """
+        aggregates = self.aggregates.get(self.families.get(table_name))
+        if aggregates is None:
+            return None
+        prefix = (group_kind, int(group_id), int(head_id), int(term_id), int(consolidation_id))
+        period_end = aggregates.latest.get(prefix) if period_end is None else pd.Timestamp(period_end)
+        position = aggregates.positions.get(prefix + (period_end,)) if period_end is not None else None
+        if position is None:
+            return None
+        row = aggregates.frame.iloc[position]
+        return {'PeriodEnd': row['PeriodEnd'], **{column: row[column] for column in STAT_COLUMNS}}
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the aggregate frames
+        """
+        return sum(int(frame.memory_usage(deep=True).sum()) for frame in self.frames.values())
+
+
+def percentile_rank(value: float, stats: Dict[str, Any]) -> Optional[float]:
+    """
+    Approximate percentile of value among the peers, interpolated between the stored quantiles
+    """
+    if value is None or np.isnan(value) or not stats.get('Count'):
+        return None
+    points = [stats[column] for column, _ in RANK_POINTS]
+    return float(np.interp(value, points, [percentile for _, percentile in RANK_POINTS]))
@@ -0,0 +1,285 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: In-memory index of the latest reported periods per company over the raw data tables
+'''
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from app.core.database.availability_index import DATE_COLUMNS, DISSECTION_FAMILIES
+from app.core.database.query_catalog import BoundQuery
+
+logger = logging.getLogger(__name__)
+
+# Table family -> raw data table
+PERIOD_TABLES = {
+    'regular': 'tbl_financialrawdata',
+    'quarter': 'tbl_financialrawdata_Quarter',
+    'ttm': 'tbl_financialrawdataTTM',
+    'dissection': 'tbl_disectionrawdata',
+    'dissection_quarter': 'tbl_disectionrawdata_Quarter',
+    'dissection_ttm': 'tbl_disectionrawdataTTM',
+    'dissection_ratio': 'tbl_disectionrawdata_Ratios',
+}
+
+# Partition columns, most significant first; lookups may leave all but CompanyID as wildcards
+KEY_COLUMNS = ['CompanyID', 'ConsolidationID']
+DISSECTION_KEY_COLUMNS = ['CompanyID', 'ConsolidationID', 'DisectionGroupID', 'SubHeadID']
+
+# Terms that count as annual for 'ytd' (financial tables use tbl_terms, dissection tables tbl_termsmaster)
+ANNUAL_TERMS = "SELECT TermID FROM tbl_terms WHERE term IN ('12M', 'FY')"
+DISSECTION_ANNUAL_TERMS = "SELECT TermID FROM tbl_termsmaster WHERE TermName IN ('12M', 'FY')"
+
+# Periods kept per partition
+DEFAULT_DEPTH = 4
+
+# Seconds between incremental refreshes
+REFRESH_INTERVAL_SECONDS = 600
+# Seconds between full rebuilds; the incremental refresh only reads periods at or after the
+# watermark, so a company filing late for an older period is picked up by the next rebuild
+REBUILD_INTERVAL_SECONDS = 6 * 3600
+
+# (PeriodEnd, TermID), most recent first
+Periods = List[Tuple[pd.Timestamp, int]]
+
+
+class FamilyPeriods(NamedTuple):
+    """
+    Partitions of one table family, published together so a lookup never pairs company keys
+    with partitions from another load
+    """
+    # partition key -> (recent periods, recent annual periods)
+    partitions: Dict[tuple, Tuple[Periods, Periods]]
+    # CompanyID -> partition keys, for lookups with wildcards
+    company_keys: Dict[int, FrozenSet[tuple]]
+
+
+EMPTY_FAMILY = FamilyPeriods({}, {})
+
+
+def top_periods(periods: Iterable[Tuple[pd.Timestamp, int]], depth: int) -> Periods:
+    """
+    The depth most recent distinct (PeriodEnd, TermID) pairs, ordered like
+    ORDER BY PeriodEnd DESC, TermID DESC
+    """
+    return sorted(set(periods), reverse=True)[:depth]
+
+
+class PeriodIndex:
+    """
+    The last few distinct (TermID, PeriodEnd) pairs reported per company and
+    consolidation (and per dissection group and SubHeadID for dissection tables).
+
+    Each partition keeps the most recent periods of any term and, separately, the most
+    recent annual (12M / FY) periods, so 'latest', 'last quarter' and 'ytd' resolve from
+    memory. The index is loaded with one ROW_NUMBER query per table and refreshed
+    incrementally from each table's period date watermark.
+
+    Builds and refreshes run one at a time under a lock. A refresh builds new partition dicts
+    and swaps them in with one assignment, so readers on other threads never iterate a
+    partition or key set while it changes.
+    """
+
+    def __init__(self, fetch: Callable[[str], pd.DataFrame], tables: Optional[Dict[str, str]] = None,
+                 depth: int = DEFAULT_DEPTH):
+        """
+        Args:
+            fetch: Callable that executes a SQL query and returns a DataFrame
+            tables: Optional table family -> table name mapping (defaults to PERIOD_TABLES)
+            depth: Number of periods kept per partition
+        """
+        self.fetch = fetch
+        self.tables = dict(tables or PERIOD_TABLES)
+        self.families = {table_name: family for family, table_name in self.tables.items()}
+        self.depth = depth
+        self.periods: Dict[str, FamilyPeriods] = {}
+        self.watermarks: Dict[str, Optional[pd.Timestamp]] = {}
+        self.refreshed_at = None
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key_columns(family: str) -> List[str]:
+        return DISSECTION_KEY_COLUMNS if family in DISSECTION_FAMILIES else KEY_COLUMNS
+
+    def _query(self, family: str, since=None) -> BoundQuery:
+        keys = ", ".join(self._key_columns(family))
+        dissection = family in DISSECTION_FAMILIES
+        date_column = DATE_COLUMNS[family]
+        annual_terms = DISSECTION_ANNUAL_TERMS if dissection else ANNUAL_TERMS
+        params = {'depth': self.depth}
+        where = ""
+        if since is not None:
+            where = f"WHERE {date_column} >= :since"
+            params['since'] = since
+        return BoundQuery(f"""
+        SELECT {keys}, TermID, PeriodEnd, IsAnnual
+        FROM (
+            SELECT {keys}, TermID, PeriodEnd, IsAnnual,
+                   ROW_NUMBER() OVER (PARTITION BY {keys}, IsAnnual ORDER BY PeriodEnd DESC, TermID DESC) AS PeriodRank
+            FROM (
+                SELECT DISTINCT {keys}, TermID, {date_column} AS PeriodEnd,
+                       CASE WHEN TermID IN ({annual_terms}) THEN 1 ELSE 0 END AS IsAnnual
+                FROM {self.tables[family]}
+                {where}
+            ) p
+        ) r
+        WHERE PeriodRank <= :depth
+        """, params)
+
+    def _load(self, family: str, since=None) -> Optional[pd.DataFrame]:
+        try:
+            rows = self.fetch(self._query(family, since))
+            return rows.dropna(subset=['CompanyID', 'TermID', 'PeriodEnd'])
+        except Exception as e:
+            logger.error(f"Error loading latest periods for {self.tables[family]}: {e}")
+            return None
+
+    def _merge(self, family: str, periods: FamilyPeriods, rows: pd.DataFrame) -> Tuple[FamilyPeriods, int]:
+        """
+        Merge loaded rows into a copy of a family's partitions
+
+        Returns:
+            The merged partitions, and the number of partitions whose periods changed
+        """
+        key_columns = self._key_columns(family)
+        columns = [rows[column].fillna(0) if column != 'CompanyID' else rows[column] for column in key_columns]
+
+        loaded: Dict[tuple, Tuple[Periods, Periods]] = {}
+        for values in zip(*columns, rows['TermID'], rows['PeriodEnd'], rows['IsAnnual']):
+            key = tuple(int(value) for value in values[:-3])
+            period = (pd.Timestamp(values[-2]), int(values[-3]))
+            recent, annual = loaded.setdefault(key, ([], []))
+            recent.append(period)
+            if values[-1]:
+                annual.append(period)
+
+        partitions = dict(periods.partitions)
+        company_keys = dict(periods.company_keys)
+        changed = 0
+        for key, (recent, annual) in loaded.items():
+            previous = partitions.get(key, ([], []))
+            merged = (top_periods(previous[0] + recent, self.depth), top_periods(previous[1] + annual, self.depth))
+            if merged != previous:
+                partitions[key] = merged
+                company_keys[key[0]] = company_keys.get(key[0], frozenset()) | {key}
+                changed += 1
+        return FamilyPeriods(partitions, company_keys), changed
+
+    @staticmethod
+    def _watermark(rows: pd.DataFrame, previous: Optional[pd.Timestamp]) -> Optional[pd.Timestamp]:
+        if rows.empty:
+            return previous
+        watermark = pd.Timestamp(rows['PeriodEnd'].max())
+        return watermark if previous is None else max(previous, watermark)
+
+    def build(self) -> 'PeriodIndex':
+        """
+        Load every table family from scratch. Families that fail to load are left out,
+        so lookups against them fall back to the database.
+        """
+        with self._lock:
+            self._build()
+        return self
+
+    def _build(self) -> None:
+        start = time.perf_counter()
+        periods, watermarks = {}, {}
+        for family in self.tables:
+            rows = self._load(family)
+            if rows is not None:
+                periods[family], _ = self._merge(family, EMPTY_FAMILY, rows)
+                watermarks[family] = self._watermark(rows, None)
+        self.periods, self.watermarks = periods, watermarks
+        self.refreshed_at = self.built_at = time.monotonic()
+        logger.info(f"Period index built in {time.perf_counter() - start:.2f}s: "
+                    f"{sum(len(family.partitions) for family in periods.values())} partitions")
+
+    def refresh(self) -> int:
+        """
+        Merge in rows at or after each family's watermark (the last period is re-read so
+        rows added to it since the previous load are not missed)
+
+        Returns:
+            Number of partitions whose periods changed
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        periods, watermarks = dict(self.periods), dict(self.watermarks)
+        changed = 0
+        for family in periods:
+            rows = self._load(family, since=watermarks.get(family))
+            if rows is not None:
+                periods[family], merged = self._merge(family, periods[family], rows)
+                watermarks[family] = self._watermark(rows, watermarks.get(family))
+                changed += merged
+        self.periods, self.watermarks = periods, watermarks
+        self.refreshed_at = time.monotonic()
+        if changed:
+            logger.info(f"Period index refreshed: {changed} partitions changed")
+        return changed
+
+    def is_stale(self, interval: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Whether the last build or refresh is older than interval seconds
+        """
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at >= interval
+
+    def maybe_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS,
+                      rebuild_interval: float = REBUILD_INTERVAL_SECONDS) -> None:
+        """
+        Rebuild from scratch if the last build is older than rebuild_interval seconds, otherwise
+        refresh incrementally if the last refresh is older than interval seconds. When another
+        thread is already loading, return at once and keep answering from the current partitions.
+        """
+        if not self.is_stale(interval) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            # Another thread may have refreshed between the check and the lock
+            if time.monotonic() - self.built_at >= rebuild_interval:
+                self._build()
+            elif self.is_stale(interval):
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def covers(self, table_name: str) -> bool:
+        """
+        Whether latest-period lookups against table_name can be answered from memory
+        """
+        return self.families.get(table_name) in self.periods
+
+    def latest(self, table_name: str, company_id: int, consolidation_id: Optional[int] = None,
+               dissection_group_id: Optional[int] = None, sub_head_id: Optional[int] = None,
+               annual: bool = False) -> List[Tuple[int, pd.Timestamp]]:
+        """
+        Most recent distinct periods with data, most recent first. consolidation_id,
+        dissection_group_id and sub_head_id match any value when None; the group and
+        SubHeadID only apply to dissection tables.
+
+        Args:
+            annual: Only return 12M / FY periods
+
+        Returns:
+            Up to depth (TermID, PeriodEnd) pairs, empty if the company has no data
+        """
+        family = self.families[table_name]
+        partitions, company_keys = self.periods.get(family, EMPTY_FAMILY)
+        wanted = (int(company_id), consolidation_id, dissection_group_id, sub_head_id)[:len(self._key_columns(family))]
+
+        if None not in wanted:
+            entry = partitions.get(tuple(int(value) for value in wanted))
+            entries = [entry] if entry is not None else []
+        else:
+            entries = [partitions[key] for key in company_keys.get(wanted[0], ())
+                       if all(value is None or int(value) == part for value, part in zip(wanted, key))]
+
+        periods = top_periods((period for entry in entries for period in entry[1 if annual else 0]), self.depth)
+        return [(term_id, period_end) for period_end, term_id in periods]
@@ -11,6 +11,7 @@ from typing import Dict, Any, Tuple, Optional, Union
 
 from app.core.database.financial_db import FinancialDatabase
 from app.core.database.fix_head_id import get_available_head_id
+from app.core.database.query_context import QueryContext
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,15 @@ def process_query(db: FinancialDatabase, query: str) -> Dict[str, Any]:
     Returns:
         Dictionary containing the query result or error message
     """
+    # Every lookup for this question runs on one checked-out connection
+    with db.session():
+        return _process_query(db, query)
+
+
+def _process_query(db: FinancialDatabase, query: str) -> Dict[str, Any]:
+    """
+    Body of process_query, run inside a database session
+    """
     logger.info(f"Processing query: {query}")
     
     # Extract entities from the query
@@ -63,6 +73,8 @@ def process_query(db: FinancialDatabase, query: str) -> Dict[str, Any]:
     fiscal_year = entities.get('fiscal_year')
     is_relative_term = False
     relative_type = None
+    # Per-request resolution state shared by get_term_id and build_financial_query
+    context = QueryContext()
     
     if 'period_end' in entities and entities['period_end']:
         # Use specific date
@@ -78,7 +90,7 @@ def process_query(db: FinancialDatabase, query: str) -> Dict[str, Any]:
         logger.info(f"Is relative term: {is_relative_term}, type: {relative_type}")
         
         # Get term ID
-        term_id_result = db.get_term_id(term)
+        term_id_result = db.get_term_id(term, context=context)
         
         # Handle tuple return for relative terms
         if isinstance(term_id_result, tuple):
@@ -125,7 +137,8 @@ def process_query(db: FinancialDatabase, query: str) -> Dict[str, Any]:
     # Build and execute query
     query = db.build_financial_query(
         company_id, head_id, term_id, consolidation_id, is_ratio, fiscal_year, formatted_period_end,
-        is_relative=is_relative_term, relative_type=relative_type
+        is_relative=is_relative_term, relative_type=relative_type,
+        context=context
     )
     
     try:
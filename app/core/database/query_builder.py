@@ -7,6 +7,8 @@ Description: Implementation of SQL query building functions for TREA AI
 import logging
 from typing import Dict, Any, Optional, Union
 
+from app.core.database.query_catalog import BoundQuery, equality_filters, expand_in_list
+
 logger = logging.getLogger(__name__)
 
 def build_financial_query(
@@ -14,7 +16,7 @@ def build_financial_query(
     consolidation_id: Optional[int] = None, is_ratio: bool = False, 
     fiscal_year: Optional[int] = None, period_end: Optional[str] = None,
     is_relative: bool = False, relative_type: Optional[str] = None
-) -> str:
+) -> BoundQuery:
     """
     Build a SQL query to retrieve financial data based on the provided parameters.
     
@@ -31,7 +33,7 @@ def build_financial_query(
         relative_type: Type of relative term
         
     Returns:
-        SQL query string
+        SQL query (BoundQuery) with its bound parameters
     """
     logger.info(f"Building financial query with parameters: company_id={company_id}, head_id={head_id}, "
                f"term_id={term_id}, consolidation_id={consolidation_id}, is_ratio={is_ratio}, "
@@ -91,22 +93,19 @@ def build_financial_query(
         date_col = get_column_name(db, table_name, ['PeriodEnd', 'FinDate', 'Date'], 'PeriodEnd')
     
     # Build the WHERE clause
-    where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
-    
-    if consolidation_id is not None:
-        where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-    
-    if term_id is not None:
-        where_clauses.append(f"f.TermID = {term_id}")
+    where_clauses, params = equality_filters(
+        {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id, 'TermID': term_id}, alias='f')
     
     if period_end is not None:
-        where_clauses.append(f"f.{date_col} = '{period_end}'")
+        where_clauses.append(f"f.{date_col} = :period_end")
+        params['period_end'] = period_end
     
     if fiscal_year is not None:
         # Check if FY column exists in the table
         fy_col = get_column_name(db, table_name, ['FY', 'FiscalYear'], 'FY')
         if fy_col:
-            where_clauses.append(f"f.{fy_col} = {fiscal_year}")
+            where_clauses.append(f"f.{fy_col} = :fiscal_year")
+            params['fiscal_year'] = fiscal_year
         else:
             logger.warning(f"Fiscal year column not found in {table_name}, ignoring fiscal year filter")
     
@@ -115,7 +114,7 @@ def build_financial_query(
     # Build the SQL query
     if is_ratio:
         # For ratio metrics
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                rh.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -126,10 +125,10 @@ def build_financial_query(
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     else:
         # For regular financial metrics
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                h.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -140,7 +139,7 @@ def build_financial_query(
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     
     logger.info(f"Built SQL query: {query}")
     return query
@@ -158,42 +157,12 @@ def get_company_metadata(db, company_id: int) -> Dict[str, Any]:
     """
     logger.info(f"Getting company metadata for company ID: {company_id}")
     
-    # Query for company metadata
-    query = f"""
-    SELECT c.CompanyID, c.CompanyName, c.SectorID, s.SectorName
-    FROM tbl_companieslist c
-    LEFT JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    
-    company_result = db.execute_query(query)
-    
-    if company_result.empty:
+    # Sector and industry come from the memoized company context instead of per-call queries
+    company_data = db.get_company_metadata(company_id)
+    if not company_data:
         logger.warning(f"Company metadata not found for company ID: {company_id}")
         return {}
     
-    company_data = {
-        'company_id': company_result.iloc[0]['CompanyID'],
-        'company_name': company_result.iloc[0]['CompanyName'],
-        'sector_id': company_result.iloc[0]['SectorID'],
-        'sector_name': company_result.iloc[0]['SectorName']
-    }
-    
-    # Get industry information if sector ID is available
-    if company_data['sector_id']:
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {company_data['sector_id']}
-        """
-        
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            company_data['industry_id'] = industry_result.iloc[0]['IndustryID']
-            company_data['industry_name'] = industry_result.iloc[0]['IndustryName']
-    
     logger.info(f"Company metadata: {company_data}")
     return company_data
 
@@ -222,14 +191,14 @@ def validate_head_id(db, head_id: int, sector_id: int, industry_id: int, is_rati
         name_col = 'SubHeadName'
     
     # Query for the head in the industry-sector mapping
-    query = f"""
+    query = BoundQuery(f"""
     SELECT h.SubHeadID, h.{name_col}, m.sectorid, m.industryid
     FROM {table} h
     JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-    WHERE h.SubHeadID = {head_id}
-    AND m.sectorid = {sector_id}
-    AND m.industryid = {industry_id}
-    """
+    WHERE h.SubHeadID = :head_id
+    AND m.sectorid = :sector_id
+    AND m.industryid = :industry_id
+    """, {'head_id': head_id, 'sector_id': sector_id, 'industry_id': industry_id})
     
     result = db.execute_query(query)
     
@@ -255,23 +224,11 @@ def get_column_name(db, table_name: str, possible_names: list, default_name: str
     """
     logger.info(f"Getting column name from {possible_names} for table {table_name}")
     
-    # Query for table columns
-    query = f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{table_name}'"
-    result = db.execute_query(query)
-    
-    if result.empty:
-        logger.warning(f"No columns found for table {table_name}, using default name: {default_name}")
-        return default_name
-    
-    # Check if any of the possible names exist in the table
-    columns = result['COLUMN_NAME'].tolist()
-    for name in possible_names:
-        if name in columns:
-            logger.info(f"Found column name {name} in table {table_name}")
-            return name
-    
-    logger.warning(f"None of the possible column names {possible_names} found in table {table_name}, using default name: {default_name}")
-    return default_name
+    # Resolved from the in-memory schema catalog, so building a query does not hit INFORMATION_SCHEMA
+    name = db.get_column_name(table_name, possible_names, default_name)
+    if name not in possible_names:
+        logger.warning(f"None of the possible column names {possible_names} found in table {table_name}, using default name: {default_name}")
+    return name
 
 def check_if_quarterly(db, term_id: Optional[int]) -> bool:
     """
@@ -287,8 +244,7 @@ def check_if_quarterly(db, term_id: Optional[int]) -> bool:
     if term_id is None:
         return False
     
-    query = f"SELECT term FROM tbl_terms WHERE TermID = {term_id}"
-    result = db.execute_query(query)
+    result = db.execute_statement('term_name', term_id=term_id)
     
     if result.empty:
         return False
@@ -298,7 +254,7 @@ def check_if_quarterly(db, term_id: Optional[int]) -> bool:
     
     return any(qt in term for qt in quarterly_terms)
 
-def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optional[int] = None, is_ratio: bool = False) -> str:
+def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optional[int] = None, is_ratio: bool = False) -> BoundQuery:
     """
     Build a SQL query for TTM (Trailing Twelve Months) data.
     
@@ -310,7 +266,7 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         is_ratio: Whether the head ID is a ratio head
         
     Returns:
-        SQL query string
+        SQL query (BoundQuery) with its bound parameters
     """
     logger.info(f"Building TTM query for company ID: {company_id}, head ID: {head_id}, consolidation ID: {consolidation_id}, is_ratio: {is_ratio}")
     
@@ -336,15 +292,13 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         date_col = get_column_name(db, table_name, ['PeriodEnd', 'FinDate', 'Date'], 'PeriodEnd')
         
         # Build WHERE clause
-        where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
-        
-        if consolidation_id is not None:
-            where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses, params = equality_filters(
+            {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id}, alias='f')
         
         where_clause = " AND ".join(where_clauses)
         
         # Build SQL query
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                h.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -355,7 +309,7 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     elif is_ratio:
         # For ratio metrics, use regular ratio table with TTM term ID
         table_name = 'tbl_ratiorawdata'
@@ -365,15 +319,13 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         date_col = get_column_name(db, table_name, ['PeriodEnd', 'RatioDate', 'Date'], 'PeriodEnd')
         
         # Build WHERE clause
-        where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}", f"f.TermID = {ttm_term_id}"]
-        
-        if consolidation_id is not None:
-            where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses, params = equality_filters(
+            {'CompanyID': company_id, 'SubHeadID': head_id, 'TermID': ttm_term_id, 'ConsolidationID': consolidation_id}, alias='f')
         
         where_clause = " AND ".join(where_clauses)
         
         # Build SQL query
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                rh.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -384,7 +336,7 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     else:
         # For regular financial metrics without TTM table, use regular table with TTM term ID
         table_name = 'tbl_financialrawdata'
@@ -394,15 +346,13 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         date_col = get_column_name(db, table_name, ['PeriodEnd', 'FinDate', 'Date'], 'PeriodEnd')
         
         # Build WHERE clause
-        where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}", f"f.TermID = {ttm_term_id}"]
-        
-        if consolidation_id is not None:
-            where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses, params = equality_filters(
+            {'CompanyID': company_id, 'SubHeadID': head_id, 'TermID': ttm_term_id, 'ConsolidationID': consolidation_id}, alias='f')
         
         where_clause = " AND ".join(where_clauses)
         
         # Build SQL query
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                h.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -413,12 +363,12 @@ def build_ttm_query(db, company_id: int, head_id: int, consolidation_id: Optiona
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     
     logger.info(f"Built TTM SQL query: {query}")
     return query
 
-def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id: Optional[int] = None, is_ratio: bool = False, relative_type: str = 'most_recent_period') -> str:
+def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id: Optional[int] = None, is_ratio: bool = False, relative_type: str = 'most_recent_period') -> BoundQuery:
     """
     Build a SQL query for the most recent period with data.
     
@@ -431,7 +381,7 @@ def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id:
         relative_type: Type of relative term
         
     Returns:
-        SQL query string
+        SQL query (BoundQuery) with its bound parameters
     """
     logger.info(f"Building most recent query for company ID: {company_id}, head ID: {head_id}, consolidation ID: {consolidation_id}, is_ratio: {is_ratio}, relative_type: {relative_type}")
     
@@ -467,10 +417,8 @@ def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id:
         date_col = get_column_name(db, table_name, ['PeriodEnd', 'FinDate', 'Date'], 'PeriodEnd')
     
     # Build WHERE clause
-    where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
-    
-    if consolidation_id is not None:
-        where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+    where_clauses, params = equality_filters(
+        {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id}, alias='f')
     
     # For quarterly data, add term filter if needed
     if relative_type in ['most_recent_quarter', 'last_quarter']:
@@ -480,15 +428,16 @@ def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id:
         
         if not quarterly_term_result.empty:
             quarterly_term_ids = quarterly_term_result['TermID'].tolist()
-            quarterly_term_filter = " OR ".join([f"f.TermID = {term_id}" for term_id in quarterly_term_ids])
-            where_clauses.append(f"({quarterly_term_filter})")
+            placeholders, term_params = expand_in_list('quarterly_term_id', quarterly_term_ids)
+            where_clauses.append(f"f.TermID IN ({placeholders})")
+            params.update(term_params)
     
     where_clause = " AND ".join(where_clauses)
     
     # Build SQL query
     if is_ratio:
         # For ratio metrics
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                rh.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -499,10 +448,10 @@ def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id:
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     else:
         # For regular financial metrics
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 f.{value_col} AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company, 
                h.{head_name_col} AS Metric, con.consolidationname AS Consolidation, f.{date_col} AS PeriodEnd
         FROM {table_name} f
@@ -513,7 +462,7 @@ def build_most_recent_query(db, company_id: int, head_id: int, consolidation_id:
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
         WHERE {where_clause}
         ORDER BY f.{date_col} DESC
-        """
+        """, params)
     
     logger.info(f"Built most recent SQL query: {query}")
     return query
@@ -529,7 +478,4 @@ def check_table_exists(db, table_name: str) -> bool:
     Returns:
         True if the table exists, False otherwise
     """
-    query = f"SELECT 1 FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = '{table_name}'"
-    result = db.execute_query(query)
-    
-    return not result.empty
\ No newline at end of file
+    return db.has_table(table_name)
\ No newline at end of file
@@ -0,0 +1,352 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Catalog of named, parameterized SQL statements for the financial database
+'''
+
+import datetime
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Parameter types accepted by Statement.params
+INT = 'int'
+FLOAT = 'float'
+STR = 'str'
+DATE = 'date'
+LIKE = 'like'          # bound as a case-insensitive '%value%' pattern with wildcards escaped
+INT_LIST = 'int_list'  # expanded to :name_0, :name_1, ... padded to a power of two
+
+# Tables a {table} placeholder may be replaced with
+RAW_DATA_TABLES = (
+    'tbl_financialrawdata', 'tbl_financialrawdata_Quarter', 'tbl_financialrawdataTTM', 'tbl_ratiorawdata',
+    'tbl_disectionrawdata', 'tbl_disectionrawdata_Quarter', 'tbl_disectionrawdataTTM', 'tbl_disectionrawdata_Ratios',
+)
+HEAD_TABLES = ('tbl_headsmaster', 'tbl_ratiosheadmaster')
+
+
+class BoundQuery(str):
+    """
+    SQL text carrying its bound parameters.
+
+    It is a str, so code that logs, prints or passes the query on keeps working;
+    FinancialDatabase.execute_query picks the parameters up from .params.
+    """
+
+    def __new__(cls, sql: str, params: Optional[Dict[str, Any]] = None, name: Optional[str] = None):
+        query = super().__new__(cls, sql)
+        query.params = dict(params or {})
+        query.name = name
+        return query
+
+
+def coerce_param(value: Any) -> Any:
+    """
+    Convert numpy / pandas scalars to the Python types the ODBC driver binds natively
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value).to_pydatetime()
+    return value
+
+
+def coerce_params(params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not params:
+        return params
+    return {name: coerce_param(value) for name, value in params.items()}
+
+
+def like_pattern(value: Any) -> str:
+    """
+    Lower-cased '%value%' pattern with the LIKE wildcards in value escaped
+    """
+    escaped = re.sub(r'([\[%_])', r'[\1]', str(value).strip().lower())
+    return f"%{escaped}%"
+
+
+def padded_size(count: int) -> int:
+    """
+    Next power of two >= count, so IN lists of similar length share one statement shape
+    """
+    size = 1
+    while size < count:
+        size *= 2
+    return size
+
+
+def expand_in_list(name: str, values: Iterable[Any]) -> Tuple[str, Dict[str, int]]:
+    """
+    Placeholder list and parameters for an IN (...) over values, padded with the last value
+
+    Returns:
+        Tuple of (":name_0, :name_1, ...", {"name_0": ..., ...})
+    """
+    ids = [_to_int(value) for value in values]
+    if not ids:
+        raise ValueError(f"IN list '{name}' is empty")
+    ids += [ids[-1]] * (padded_size(len(ids)) - len(ids))
+    params = {f"{name}_{i}": value for i, value in enumerate(ids)}
+    return ", ".join(f":{param}" for param in params), params
+
+
+def equality_filters(columns: Dict[str, Any], alias: str = '') -> Tuple[List[str], Dict[str, Any]]:
+    """
+    "col = :param" clauses for the columns whose value is not None
+
+    Args:
+        columns: Dictionary of column name -> value; None values are skipped
+        alias: Optional table alias prefixed to every column
+
+    Returns:
+        Tuple of (clauses, params); parameter names are the snake_cased column names
+    """
+    prefix = f"{alias}." if alias else ''
+    clauses, params = [], {}
+    for column, value in columns.items():
+        if value is None:
+            continue
+        param = re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', column).lower()
+        clauses.append(f"{prefix}{column} = :{param}")
+        params[param] = coerce_param(value)
+    return clauses, params
+
+
+def values_table(name: str, columns: Iterable[str], rows: Iterable[Iterable[Any]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Derived table over rows of bound values, to join many keys in one statement
+
+    Args:
+        name: Alias of the derived table, also the prefix of its parameters
+        columns: Column names of the derived table
+        rows: Rows of values, one per column
+
+    Returns:
+        Tuple of ("(VALUES (:name_0_0, ...), ...) AS name(col, ...)", params)
+    """
+    columns = list(columns)
+    tuples, params = [], {}
+    for i, row in enumerate(rows):
+        row = list(row)
+        if len(row) != len(columns):
+            raise ValueError(f"VALUES row {i} of '{name}' has {len(row)} values for {len(columns)} columns")
+        for j, value in enumerate(row):
+            params[f"{name}_{i}_{j}"] = coerce_param(value)
+        tuples.append("(" + ", ".join(f":{name}_{i}_{j}" for j in range(len(row))) + ")")
+    if not tuples:
+        raise ValueError(f"VALUES table '{name}' is empty")
+    return f"(VALUES {', '.join(tuples)}) AS {name}({', '.join(columns)})", params
+
+
+def period_filter(alias: str, term_id: Optional[int], period_end: Optional[str],
+                  fiscal_year: Optional[int], dissection: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """
+    Period condition of the data queries: PeriodEnd when known, else TermID (and FY)
+
+    Args:
+        alias: Table alias for the columns, or '' for none
+        dissection: Whether the table is a dissection table, which has FinDate and no FY column
+
+    Returns:
+        Tuple of (SQL condition starting with AND, bind parameters)
+    """
+    prefix = f"{alias}." if alias else ''
+    date_column = f"{prefix}FinDate" if dissection else f"{prefix}PeriodEnd"
+    fiscal_year_column = f"YEAR({prefix}FinDate)" if dissection else f"{prefix}FY"
+    if period_end is not None:
+        return f"AND {date_column} = :period_end", {'period_end': str(period_end)}
+    if fiscal_year is not None:
+        return (f"AND {prefix}TermID = :term_id AND {fiscal_year_column} = :fiscal_year",
+                {'term_id': term_id, 'fiscal_year': fiscal_year})
+    return f"AND {prefix}TermID = :term_id", {'term_id': term_id}
+
+
+def chunked(rows: List[Any], params_per_row: int, max_params: int) -> List[List[Any]]:
+    """
+    Split rows so that no statement binds more than max_params parameters
+    (SQL Server rejects requests with more than 2100)
+    """
+    size = max(1, max_params // max(1, params_per_row))
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def _to_int(value: Any) -> int:
+    if value is None or isinstance(value, (bool, np.bool_)):
+        raise ValueError(f"Expected an integer, got {value!r}")
+    value = coerce_param(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"Expected an integer, got {value!r}")
+    return int(value)
+
+
+def _to_date(value: Any) -> datetime.date:
+    if value is None:
+        raise ValueError("Expected a date, got None")
+    return pd.Timestamp(value).date()
+
+
+_CONVERTERS = {
+    INT: _to_int,
+    FLOAT: lambda value: float(coerce_param(value)),
+    STR: lambda value: str(value),
+    DATE: _to_date,
+    LIKE: like_pattern,
+}
+
+
+@dataclass(frozen=True)
+class Statement:
+    """
+    A named SQL statement with typed bind parameters.
+
+    sql uses :name placeholders; an optional {table} placeholder is filled from tables,
+    the only identifiers a caller may choose.
+    """
+    name: str
+    sql: str
+    params: Dict[str, str] = field(default_factory=dict)
+    tables: Tuple[str, ...] = ()
+
+    def bind(self, **values) -> BoundQuery:
+        """
+        Validate and convert values, returning the statement as a BoundQuery
+
+        Raises:
+            ValueError: Missing, unexpected or ill-typed values, or a table not in tables
+        """
+        sql = self.sql
+        if self.tables:
+            table = values.pop('table', None)
+            if table not in self.tables:
+                raise ValueError(f"{self.name}: table {table!r} is not one of {self.tables}")
+            sql = sql.replace('{table}', table)
+
+        missing = set(self.params) - set(values)
+        unexpected = set(values) - set(self.params)
+        if missing or unexpected:
+            raise ValueError(f"{self.name}: missing parameters {sorted(missing)}, unexpected {sorted(unexpected)}")
+
+        params = {}
+        for name, kind in self.params.items():
+            if kind == INT_LIST:
+                placeholders, expanded = expand_in_list(name, values[name])
+                sql = re.sub(rf":{name}\b", placeholders, sql)
+                params.update(expanded)
+            else:
+                if values[name] is None:
+                    raise ValueError(f"{self.name}: parameter '{name}' is None")
+                params[name] = _CONVERTERS[kind](values[name])
+        return BoundQuery(sql, params, self.name)
+
+
+_HEAD_IN_SECTOR = """
+    JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
+    WHERE m.sectorid = :sector_id AND """
+
+STATEMENTS = [
+    # --- Heads --------------------------------------------------------------
+    Statement('heads_by_name', """
+        SELECT h.SubHeadID, h.SubHeadName FROM tbl_headsmaster h
+        WHERE LOWER(h.SubHeadName) = LOWER(:name)""", {'name': STR}),
+    Statement('heads_by_name_in_sector', """
+        SELECT h.SubHeadID, h.SubHeadName FROM tbl_headsmaster h""" + _HEAD_IN_SECTOR + """
+        LOWER(h.SubHeadName) = LOWER(:name)""", {'sector_id': INT, 'name': STR}),
+    Statement('heads_like', """
+        SELECT h.SubHeadID, h.SubHeadName FROM tbl_headsmaster h
+        WHERE LOWER(h.SubHeadName) LIKE :pattern""", {'pattern': LIKE}),
+    Statement('heads_like_in_sector', """
+        SELECT h.SubHeadID, h.SubHeadName FROM tbl_headsmaster h""" + _HEAD_IN_SECTOR + """
+        LOWER(h.SubHeadName) LIKE :pattern""", {'sector_id': INT, 'pattern': LIKE}),
+    Statement('ratio_heads_by_name', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h
+        WHERE LOWER(h.HeadNames) = LOWER(:name)""", {'name': STR}),
+    Statement('ratio_heads_by_name_in_sector', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h""" + _HEAD_IN_SECTOR + """
+        LOWER(h.HeadNames) = LOWER(:name)""", {'sector_id': INT, 'name': STR}),
+    Statement('ratio_heads_like', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h
+        WHERE LOWER(h.HeadNames) LIKE :pattern""", {'pattern': LIKE}),
+    Statement('ratio_heads_like_in_sector', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h""" + _HEAD_IN_SECTOR + """
+        LOWER(h.HeadNames) LIKE :pattern""", {'sector_id': INT, 'pattern': LIKE}),
+    Statement('ratio_heads_like_or_debt_equity', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h
+        WHERE LOWER(h.HeadNames) LIKE :pattern OR LOWER(h.HeadNames) LIKE '%debt%equity%'""",
+              {'pattern': LIKE}),
+    Statement('ratio_heads_like_or_debt_equity_in_sector', """
+        SELECT h.SubHeadID, h.HeadNames FROM tbl_ratiosheadmaster h
+        JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
+        WHERE LOWER(h.HeadNames) LIKE :pattern
+        OR (LOWER(h.HeadNames) LIKE '%debt%equity%' AND m.sectorid = :sector_id)""",
+              {'sector_id': INT, 'pattern': LIKE}),
+    Statement('head_count', """
+        SELECT COUNT(*) AS count FROM {table} h WHERE h.SubHeadID = :sub_head_id""",
+              {'sub_head_id': INT}, HEAD_TABLES),
+    Statement('head_count_in_sector', """
+        SELECT COUNT(*) AS count FROM {table} h""" + _HEAD_IN_SECTOR + """
+        h.SubHeadID = :sub_head_id""", {'sector_id': INT, 'sub_head_id': INT}, HEAD_TABLES),
+
+    # --- Terms --------------------------------------------------------------
+    Statement('term_name', """
+        SELECT term FROM tbl_terms WHERE TermID = :term_id""", {'term_id': INT}),
+    Statement('term_period_end', """
+        SELECT PeriodEnd FROM tbl_terms WHERE TermID = :term_id""", {'term_id': INT}),
+    Statement('term_by_name', """
+        SELECT TermID FROM tbl_terms WHERE LOWER(term) = LOWER(:term)""", {'term': STR}),
+    Statement('terms_like', """
+        SELECT TermID, term FROM tbl_terms WHERE LOWER(term) LIKE :pattern""", {'pattern': LIKE}),
+
+    # --- Schema (fallback when the schema catalog could not be loaded) -------
+    Statement('table_exists', """
+        SELECT 1 AS found FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = :table_name""", {'table_name': STR}),
+    Statement('table_columns', """
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = :table_name
+        ORDER BY ORDINAL_POSITION""", {'table_name': STR}),
+
+    # --- Periods ------------------------------------------------------------
+    Statement('latest_quarter_period', """
+        SELECT TOP 1 TermID, PeriodEnd FROM tbl_financialrawdata_Quarter
+        WHERE CompanyID = :company_id AND ConsolidationID = :consolidation_id
+        ORDER BY PeriodEnd DESC""", {'company_id': INT, 'consolidation_id': INT}),
+    Statement('previous_quarter_period', """
+        SELECT TOP 1 TermID, PeriodEnd FROM tbl_financialrawdata_Quarter
+        WHERE CompanyID = :company_id AND ConsolidationID = :consolidation_id
+        AND PeriodEnd < (SELECT MAX(PeriodEnd) FROM tbl_financialrawdata_Quarter
+                         WHERE CompanyID = :company_id AND ConsolidationID = :consolidation_id)
+        ORDER BY PeriodEnd DESC""", {'company_id': INT, 'consolidation_id': INT}),
+    Statement('latest_annual_period', """
+        SELECT TOP 1 TermID, PeriodEnd FROM tbl_financialrawdata
+        WHERE CompanyID = :company_id AND ConsolidationID = :consolidation_id
+        AND TermID IN (SELECT TermID FROM tbl_terms WHERE term IN ('12M', 'FY'))
+        ORDER BY PeriodEnd DESC""", {'company_id': INT, 'consolidation_id': INT}),
+    Statement('latest_ttm_period', """
+        SELECT TOP 1 TermID, PeriodEnd FROM tbl_financialrawdataTTM
+        WHERE CompanyID = :company_id
+        ORDER BY PeriodEnd DESC""", {'company_id': INT}),
+    Statement('latest_ttm_term_period', """
+        SELECT TOP 1 TermID, PeriodEnd FROM tbl_financialrawdata
+        WHERE CompanyID = :company_id
+        AND TermID IN (SELECT TermID FROM tbl_terms WHERE term = 'TTM')
+        ORDER BY PeriodEnd DESC""", {'company_id': INT}),
+]
+
+CATALOG: Dict[str, Statement] = {statement.name: statement for statement in STATEMENTS}
+
+
+def get_statement(name: str) -> Statement:
+    try:
+        return CATALOG[name]
+    except KeyError:
+        raise KeyError(f"Unknown statement '{name}'") from None
+
+
+def bind(statement_name: str, /, **values) -> BoundQuery:
+    """
+    Bind values to the named statement from the catalog
+    """
+    return get_statement(statement_name).bind(**values)
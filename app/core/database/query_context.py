@@ -0,0 +1,23 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Per-request resolution state for the financial query path
+'''
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class QueryContext:
+    """
+    State produced while resolving one question and consumed later in the same request.
+
+    get_term_id records whether the term is TTM and the period end it resolved to,
+    build_financial_query records the table chosen for relative periods. Keeping this
+    per request instead of on the shared FinancialDatabase lets several requests run
+    on one instance at the same time.
+    """
+    is_ttm_query: bool = False
+    resolved_period_end: Optional[str] = None
+    relative_table_name: Optional[str] = None
@@ -0,0 +1,171 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Plans a financial data lookup as one ranked statement over all of its fallback candidates
+'''
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.database.query_catalog import BoundQuery, period_filter, values_table
+
+# Dissection data type -> raw data table
+DISSECTION_TABLES = {
+    'regular': 'tbl_disectionrawdata',
+    'quarter': 'tbl_disectionrawdata_Quarter',
+    'ttm': 'tbl_disectionrawdataTTM',
+    'ratio': 'tbl_disectionrawdata_Ratios',
+}
+
+# Source columns and label tables per branch kind (keyed on PlanBranch.is_dissection): the
+# dissection tables report Amount / FinDate and label terms and consolidations from the
+# *master tables, like the dissection query of build_financial_query
+BRANCH_COLUMNS = {
+    False: {'value': 'Value_', 'date': 'PeriodEnd', 'terms': 'tbl_terms', 'term': 'term',
+            'consolidations': 'tbl_consolidation', 'consolidation': 'consolidationname'},
+    True: {'value': 'Amount', 'date': 'FinDate', 'terms': 'tbl_termsmaster', 'term': 'TermName',
+           'consolidations': 'tbl_consolidationmaster', 'consolidation': 'ConsolidationName'},
+}
+
+# Columns of the row a plan statement returns
+PLAN_COLUMNS = ['Value', 'Unit', 'Term', 'Company', 'Metric', 'Consolidation', 'PeriodEnd',
+                'SubHeadID', 'SourceTable', 'DisectionGroupID']
+
+
+@dataclass(frozen=True)
+class PlanBranch:
+    """
+    One raw data table searched by a plan
+
+    For dissection tables, dissection_group_id restricts the rows to one group; a branch
+    without it accepts any group.
+    """
+    table_name: str
+    is_ratio: bool
+    dissection_group_id: Optional[int] = None
+
+    @property
+    def is_dissection(self) -> bool:
+        return self.table_name in DISSECTION_TABLES.values()
+
+
+@dataclass
+class QueryPlan:
+    """
+    Resolved entities of one lookup and the fallback candidates to search, in order
+
+    Candidates are every (head, branch) pair whose kinds match: heads in priority order, then
+    branches in priority order. statement() ranks them in SQL, so the first candidate with a
+    row answers in one round trip instead of one probe / query per fallback.
+    """
+    company_id: Optional[int] = None
+    consolidation_id: Optional[int] = None
+    term_id: Optional[int] = None
+    fiscal_year: Optional[int] = None
+    period_end: Optional[str] = None
+    # Candidate (SubHeadID, is_ratio) pairs in priority order
+    heads: List[Tuple[int, bool]] = field(default_factory=list)
+    branches: List[PlanBranch] = field(default_factory=list)
+    # Statements sent to read the value (one per run)
+    round_trips: int = 0
+    error: Optional[str] = None
+
+    def fail(self, message: str) -> 'QueryPlan':
+        self.error = message
+        return self
+
+    def candidates(self) -> List[Tuple[int, bool, PlanBranch]]:
+        """
+        (SubHeadID, is_ratio, branch) candidates in the order statement() ranks them
+        """
+        return [(head_id, is_ratio, branch) for head_id, is_ratio in dict.fromkeys(self.heads)
+                for branch in self.branches if branch.is_ratio == is_ratio]
+
+    def statement(self) -> BoundQuery:
+        """
+        One UNION ALL over the branches, each joined to its candidate heads, with the best
+        row picked by ROW_NUMBER() over (head rank, branch rank, latest PeriodEnd)
+        """
+        params = {'company_id': self.company_id}
+        consolidation_clause = ''
+        if self.consolidation_id is not None:
+            consolidation_clause = "AND d.ConsolidationID = :consolidation_id"
+            params['consolidation_id'] = self.consolidation_id
+        head_ranks = {head: rank for rank, head in enumerate(dict.fromkeys(self.heads))}
+
+        selects = []
+        for branch_rank, branch in enumerate(self.branches):
+            heads = [(head_id, rank) for (head_id, is_ratio), rank in head_ranks.items() if is_ratio == branch.is_ratio]
+            if not heads:
+                continue
+            candidates, candidate_params = values_table(f"k{branch_rank}", ('SubHeadID', 'HeadRank'), heads)
+            params.update(candidate_params)
+            head_table, head_name_col = ('tbl_ratiosheadmaster', 'HeadNames') if branch.is_ratio else ('tbl_headsmaster', 'SubHeadName')
+            columns = BRANCH_COLUMNS[branch.is_dissection]
+            period_clause, period_params = period_filter('d', self.term_id, self.period_end, self.fiscal_year,
+                                                         dissection=branch.is_dissection)
+            params.update(period_params)
+            group_col, group_clause = 'NULL', ''
+            if branch.is_dissection:
+                group_col = 'd.DisectionGroupID'
+                if branch.dissection_group_id is not None:
+                    group_clause = f"AND d.DisectionGroupID = :dissection_group_id_{branch_rank}"
+                    params[f"dissection_group_id_{branch_rank}"] = branch.dissection_group_id
+            selects.append(f"""
+                SELECT d.{columns['value']} AS Value, u.unitname AS Unit, t.{columns['term']} AS Term,
+                       c.CompanyName AS Company, h.{head_name_col} AS Metric,
+                       con.{columns['consolidation']} AS Consolidation, d.{columns['date']} AS PeriodEnd,
+                       d.SubHeadID AS SubHeadID, '{branch.table_name}' AS SourceTable, {group_col} AS DisectionGroupID,
+                       k{branch_rank}.HeadRank AS HeadRank, {branch_rank} AS BranchRank
+                FROM {candidates}
+                JOIN {branch.table_name} d ON d.SubHeadID = k{branch_rank}.SubHeadID
+                JOIN {head_table} h ON d.SubHeadID = h.SubHeadID
+                JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+                JOIN {columns['terms']} t ON d.TermID = t.TermID
+                JOIN tbl_companieslist c ON d.CompanyID = c.CompanyID
+                JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND h.IndustryID = im.industryid
+                JOIN {columns['consolidations']} con ON d.ConsolidationID = con.ConsolidationID
+                WHERE d.CompanyID = :company_id {consolidation_clause}
+                {period_clause} {group_clause}""")
+        if not selects:
+            raise ValueError("Query plan has no candidates")
+
+        union = "\n                UNION ALL".join(selects)
+        query = f"""
+        SELECT {', '.join(PLAN_COLUMNS)}
+        FROM (
+            SELECT b.*, ROW_NUMBER() OVER (ORDER BY b.HeadRank, b.BranchRank, b.PeriodEnd DESC) AS PlanRank
+            FROM ({union}
+            ) AS b
+        ) AS ranked
+        WHERE PlanRank = 1
+        """
+        return BoundQuery(query, params, 'query_plan')
+
+    def explain(self) -> str:
+        """
+        Ranked candidates and the round trips spent, for logs
+        """
+        lines = [f"QueryPlan company_id={self.company_id} consolidation_id={self.consolidation_id} "
+                 f"term_id={self.term_id} fiscal_year={self.fiscal_year} period_end={self.period_end} "
+                 f"round_trips={self.round_trips}"]
+        for rank, (head_id, is_ratio, branch) in enumerate(self.candidates()):
+            group = f" group={branch.dissection_group_id}" if branch.dissection_group_id is not None else ''
+            lines.append(f"  {rank}: SubHeadID={head_id} {'ratio' if is_ratio else 'regular'} in {branch.table_name}{group}")
+        return "\n".join(lines)
+
+
+def plan_response(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    get_financial_data response for the row a plan statement returned
+    """
+    date = record['PeriodEnd']
+    return {
+        "company": record['Company'],
+        "metric": record['Metric'],
+        "term": record['Term'],
+        "consolidation": record['Consolidation'],
+        "value": float(record['Value']),
+        "unit": record['Unit'],
+        "date": date.strftime('%Y-%m-%d') if hasattr(date, 'strftime') else date,
+    }
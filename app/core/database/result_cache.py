@@ -0,0 +1,136 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Bounded LRU / TTL cache for get_financial_data results
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Set
+
+
+class ResultKey(NamedTuple):
+    """
+    Fully resolved parameters of one financial data lookup; everything the final SQL depends on
+    """
+    company_id: int
+    head_id: int
+    is_ratio: bool
+    term_id: Optional[int]
+    consolidation_id: Optional[int]
+    period_end: Optional[str]
+    resolved_period_end: Optional[str]
+    fiscal_year: Optional[int]
+    relative_type: Optional[str]
+    is_ttm: bool
+    dissection_group_id: Optional[int]
+    dissection_data_type: Optional[str]
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live.
+
+    Every entry belongs to a company, so new data for one company can be invalidated
+    without dropping the rest. get() is a dict lookup plus an OrderedDict move, so a
+    hit costs microseconds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, company_id, value), least recently used first
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._by_company: Dict[Any, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value for key, or None on a miss or an expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, company_id, value = entry
+            if expires_at <= self._clock():
+                self._remove(key, company_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, company_id: Any) -> None:
+        """
+        Cache value under key, evicting the least recently used entries beyond max_entries
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._by_company.get(previous[1], set()).discard(key)
+            self._entries[key] = (self._clock() + self.ttl_seconds, company_id, value)
+            self._by_company.setdefault(company_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (_, old_company_id, _) = next(iter(self._entries.items()))
+                self._remove(old_key, old_company_id)
+                self.evictions += 1
+
+    def invalidate_company(self, company_id: Any) -> int:
+        """
+        Drop every entry of one company
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            keys = self._by_company.pop(company_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._by_company.clear()
+            self.invalidations += removed
+            return removed
+
+    def _remove(self, key: Hashable, company_id: Any) -> None:
+        self._entries.pop(key, None)
+        keys = self._by_company.get(company_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_company[company_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,103 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: In-memory catalog of the database schema (tables, columns, data types)
+'''
+
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_QUERY = """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE
+    FROM INFORMATION_SCHEMA.COLUMNS c
+    JOIN INFORMATION_SCHEMA.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+
+class _Table:
+    """
+    Columns of one table in ordinal order, with their data types
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.columns: List[str] = []
+        self.types: Dict[str, str] = {}
+
+
+class SchemaCatalog:
+    """
+    Tables, columns and column types read from INFORMATION_SCHEMA in one query.
+
+    The schema only changes on deploys, so the catalog is loaded once and kept until
+    refresh() is called. Table lookups are case-insensitive like the server's default
+    collation; column names are returned with the case the server reports.
+    """
+
+    def __init__(self, execute_query: Callable[[str], pd.DataFrame]):
+        self._execute_query = execute_query
+        self._tables: Dict[str, _Table] = {}
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def load(self) -> 'SchemaCatalog':
+        """
+        Read every table and column from INFORMATION_SCHEMA, replacing what was loaded before
+        """
+        start = time.perf_counter()
+        df = self._execute_query(SCHEMA_QUERY)
+
+        tables: Dict[str, _Table] = {}
+        for table_name, column_name, data_type in zip(df['TABLE_NAME'], df['COLUMN_NAME'], df['DATA_TYPE']):
+            table = tables.get(table_name.lower())
+            if table is None:
+                table = tables[table_name.lower()] = _Table(table_name)
+            table.columns.append(column_name)
+            table.types[column_name] = data_type
+
+        self._tables = tables
+        self.loaded_at = time.time()
+        logger.info(f"Loaded schema catalog: {len(tables)} tables, {len(df)} columns "
+                    f"in {time.perf_counter() - start:.2f} s")
+        return self
+
+    def refresh(self) -> 'SchemaCatalog':
+        """
+        Reload the catalog, e.g. after a deploy changed the schema
+        """
+        return self.load()
+
+    def tables(self) -> List[str]:
+        return [table.name for table in self._tables.values()]
+
+    def has_table(self, table_name: str) -> bool:
+        return table_name.lower() in self._tables
+
+    def columns(self, table_name: str) -> List[str]:
+        """
+        Column names of table_name in ordinal order, empty if the table does not exist
+        """
+        table = self._tables.get(table_name.lower())
+        return list(table.columns) if table is not None else []
+
+    def column_type(self, table_name: str, column_name: str) -> Optional[str]:
+        table = self._tables.get(table_name.lower())
+        return table.types.get(column_name) if table is not None else None
+
+    def resolve_column(self, table_name: str, possible_names: Sequence[str], default_name: str) -> str:
+        """
+        First of possible_names that exists in table_name, else default_name
+        """
+        table = self._tables.get(table_name.lower())
+        if table is None:
+            return default_name
+        return next((name for name in possible_names if name in table.types), default_name)
@@ -0,0 +1,342 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: In-memory cross-sectional screener over the latest ratio values of every company
+'''
+
+import logging
+import operator
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery
+
+logger = logging.getLogger(__name__)
+
+SCREENER_TABLE = 'tbl_ratiorawdata'
+
+# Column used as the incremental refresh watermark
+WATERMARK_COLUMN = 'PeriodEnd'
+
+# Seconds between incremental refreshes
+REFRESH_INTERVAL_SECONDS = 600
+
+# Comparison operators accepted in conditions
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+@dataclass(frozen=True)
+class Condition:
+    """
+    One screen condition: the ratio compared with a threshold
+
+    A ratio name can map to several SubHeadIDs (one per industry); a company's value is
+    taken from the first of head_ids it reports.
+    """
+    head_ids: Tuple[int, ...]
+    op: str
+    threshold: float
+    label: str = ''
+
+    def __post_init__(self):
+        if self.op not in OPERATORS:
+            raise ValueError(f"Unsupported screen operator '{self.op}'")
+
+
+class ScreenerMatrix(NamedTuple):
+    """
+    One consistent state of the screener: sorted id arrays and the matrices indexed by them
+    """
+    company_ids: np.ndarray
+    head_ids: np.ndarray
+    # ConsolidationID -> (values, period ends), both companies x heads
+    values: Dict[int, np.ndarray]
+    period_ends: Dict[int, np.ndarray]
+
+
+EMPTY_MATRIX = ScreenerMatrix(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), {}, {})
+
+
+class RatioScreener:
+    """
+    The latest value of every (CompanyID, ratio SubHeadID) per consolidation, held as a
+    dense float64 matrix (companies x heads) with a matching PeriodEnd matrix.
+
+    Conditions become vectorized comparisons over matrix columns and rankings an
+    argpartition, so a screen over every listed company needs no database round trip.
+    The matrix is loaded with one ROW_NUMBER query and refreshed incrementally from the
+    PeriodEnd watermark; newer periods replace older ones cell by cell.
+
+    Screens run on request threads while a refresh may be merging new rows, so the
+    matrices are never written in place: a refresh (one at a time, under a lock) merges
+    into copies and publishes them as a new ScreenerMatrix in one assignment. A screen
+    reads self.matrix once and sees either the old or the new state, never a mix.
+    """
+
+    def __init__(self, fetch: Callable[[str], pd.DataFrame], table_name: str = SCREENER_TABLE):
+        """
+        Args:
+            fetch: Callable that executes a SQL query and returns a DataFrame
+            table_name: Ratio raw data table
+        """
+        self.fetch = fetch
+        self.table_name = table_name
+        self.matrix = EMPTY_MATRIX
+        self.watermark: Optional[pd.Timestamp] = None
+        self.refreshed_at = None
+        # Serializes build / refresh; readers never take it
+        self._lock = threading.Lock()
+
+    @property
+    def company_ids(self) -> np.ndarray:
+        return self.matrix.company_ids
+
+    @property
+    def head_ids(self) -> np.ndarray:
+        return self.matrix.head_ids
+
+    @property
+    def values(self) -> Dict[int, np.ndarray]:
+        return self.matrix.values
+
+    @property
+    def period_ends(self) -> Dict[int, np.ndarray]:
+        return self.matrix.period_ends
+
+    def _query(self, since=None) -> str:
+        where = f"WHERE {WATERMARK_COLUMN} >= :since" if since is not None else ""
+        return BoundQuery(f"""
+        SELECT CompanyID, SubHeadID, ConsolidationID, PeriodEnd, Value
+        FROM (
+            SELECT CompanyID, SubHeadID, ConsolidationID, PeriodEnd, Value_ AS Value,
+                   ROW_NUMBER() OVER (PARTITION BY CompanyID, SubHeadID, ConsolidationID
+                                      ORDER BY PeriodEnd DESC) AS RowRank
+            FROM {self.table_name}
+            {where}
+        ) AS latest
+        WHERE RowRank = 1
+        """, {'since': since} if since is not None else None, 'ratio_screener')
+
+    def _load(self, since=None) -> Optional[pd.DataFrame]:
+        try:
+            rows = self.fetch(self._query(since))
+        except Exception as e:
+            logger.error(f"Error loading ratio snapshot from {self.table_name}: {e}")
+            return None
+        rows = rows.dropna(subset=['CompanyID', 'SubHeadID', 'ConsolidationID', 'PeriodEnd'])
+        rows = rows.assign(PeriodEnd=pd.to_datetime(rows['PeriodEnd']),
+                           Value=pd.to_numeric(rows['Value'], errors='coerce').astype(np.float64))
+        if not rows.empty:
+            watermark = rows['PeriodEnd'].max()
+            self.watermark = watermark if self.watermark is None else max(self.watermark, watermark)
+        return rows
+
+    @staticmethod
+    def _grow(matrix: ScreenerMatrix, company_ids: np.ndarray, head_ids: np.ndarray) -> ScreenerMatrix:
+        """
+        Copy of matrix with rows / columns added for ids not in it yet, keeping both id arrays sorted
+        """
+        new_companies = np.union1d(matrix.company_ids, company_ids)
+        new_heads = np.union1d(matrix.head_ids, head_ids)
+        rows = np.searchsorted(new_companies, matrix.company_ids)
+        columns = np.searchsorted(new_heads, matrix.head_ids)
+        values, period_ends = {}, {}
+        for consolidation_id in matrix.values:
+            values[consolidation_id] = np.full((len(new_companies), len(new_heads)), np.nan)
+            period_ends[consolidation_id] = np.full((len(new_companies), len(new_heads)), np.datetime64('NaT'),
+                                                    dtype='datetime64[ns]')
+            values[consolidation_id][np.ix_(rows, columns)] = matrix.values[consolidation_id]
+            period_ends[consolidation_id][np.ix_(rows, columns)] = matrix.period_ends[consolidation_id]
+        return ScreenerMatrix(new_companies, new_heads, values, period_ends)
+
+    def _merge(self, matrix: ScreenerMatrix, rows: pd.DataFrame) -> Tuple[ScreenerMatrix, int]:
+        """
+        Write rows into a copy of matrix where they are at least as recent as the cell
+
+        Returns:
+            (merged matrix, number of cells that changed)
+        """
+        if rows.empty:
+            return matrix, 0
+        matrix = self._grow(matrix, rows['CompanyID'].to_numpy(dtype=np.int64), rows['SubHeadID'].to_numpy(dtype=np.int64))
+        updated = 0
+        for consolidation_id, group in rows.groupby('ConsolidationID'):
+            consolidation_id = int(consolidation_id)
+            if consolidation_id not in matrix.values:
+                shape = (len(matrix.company_ids), len(matrix.head_ids))
+                matrix.values[consolidation_id] = np.full(shape, np.nan)
+                matrix.period_ends[consolidation_id] = np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+            values, period_ends = matrix.values[consolidation_id], matrix.period_ends[consolidation_id]
+            rows_at = np.searchsorted(matrix.company_ids, group['CompanyID'].to_numpy(dtype=np.int64))
+            columns_at = np.searchsorted(matrix.head_ids, group['SubHeadID'].to_numpy(dtype=np.int64))
+            incoming = group['PeriodEnd'].to_numpy(dtype='datetime64[ns]')
+            current = period_ends[rows_at, columns_at]
+            incoming_values = group['Value'].to_numpy()
+            current_values = values[rows_at, columns_at]
+            newer = np.isnat(current) | (incoming >= current)
+            # Re-read rows at the watermark only count when they changed
+            changed = newer & ((incoming != current) | ~((incoming_values == current_values)
+                                                        | (np.isnan(incoming_values) & np.isnan(current_values))))
+            values[rows_at[changed], columns_at[changed]] = incoming_values[changed]
+            period_ends[rows_at[changed], columns_at[changed]] = incoming[changed]
+            updated += int(changed.sum())
+        return matrix, updated
+
+    def build(self) -> 'RatioScreener':
+        """
+        Load the latest value of every company and ratio head from scratch
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.watermark = None
+            matrix = EMPTY_MATRIX
+            rows = self._load()
+            if rows is not None:
+                matrix, _ = self._merge(matrix, rows)
+            self.matrix = matrix
+            self.refreshed_at = time.monotonic()
+        logger.info(f"Ratio screener built in {time.perf_counter() - start:.2f}s: {len(matrix.company_ids)} companies x "
+                    f"{len(matrix.head_ids)} heads, {self.nbytes() / 1e6:.1f} MB")
+        return self
+
+    def refresh(self) -> int:
+        """
+        Merge in rows at or after the watermark (the last period is re-read so rows added
+        to it since the previous load are not missed)
+
+        Returns:
+            Number of cells that changed
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        rows = self._load(since=self.watermark)
+        updated = 0
+        if rows is not None:
+            matrix, updated = self._merge(self.matrix, rows)
+            self.matrix = matrix
+        self.refreshed_at = time.monotonic()
+        if updated:
+            logger.info(f"Ratio screener refreshed: {updated} cells updated")
+        return updated
+
+    def is_stale(self, interval: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Whether the last build or refresh is older than interval seconds
+        """
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at >= interval
+
+    def maybe_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS) -> None:
+        """
+        Refresh incrementally if the last refresh is older than interval seconds. When another
+        thread is already refreshing, return at once and keep screening the current matrix.
+        """
+        if not self.is_stale(interval) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            # Another thread may have refreshed between the check and the lock
+            if self.is_stale(interval):
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def column(self, head_ids: Iterable[int], consolidation_id: int,
+               matrix: Optional[ScreenerMatrix] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-company value and PeriodEnd of the first of head_ids each company reports
+
+        Returns:
+            (values, period_ends) aligned with company_ids; NaN / NaT where none is reported
+        """
+        matrix = matrix or self.matrix
+        count = len(matrix.company_ids)
+        values = np.full(count, np.nan)
+        period_ends = np.full(count, np.datetime64('NaT'), dtype='datetime64[ns]')
+        if consolidation_id not in matrix.values:
+            return values, period_ends
+        for head_id in head_ids:
+            position = np.searchsorted(matrix.head_ids, head_id)
+            if position == len(matrix.head_ids) or matrix.head_ids[position] != head_id:
+                continue
+            missing = np.isnan(values)
+            values[missing] = matrix.values[consolidation_id][missing, position]
+            period_ends[missing] = matrix.period_ends[consolidation_id][missing, position]
+        return values, period_ends
+
+    def screen(self, conditions: Sequence[Condition], consolidation_id: int,
+               company_ids: Optional[Iterable[int]] = None, order_by: Optional[Condition] = None,
+               descending: bool = True, top: Optional[int] = None,
+               since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        Companies meeting every condition, ranked by order_by
+
+        Args:
+            conditions: Conditions that must all hold; a missing value fails its condition
+            consolidation_id: Consolidation ID
+            company_ids: Optional universe (e.g. a sector's companies); every company when None
+            order_by: Condition whose ratio ranks the result (defaults to the first condition)
+            descending: Highest values first
+            top: Optional number of companies to return
+            since: Optional oldest PeriodEnd accepted for a condition's value
+
+        Returns:
+            DataFrame with CompanyID, then value and PeriodEnd columns per condition label
+            (label and "label PeriodEnd"), in rank order
+        """
+        matrix = self.matrix
+        mask = np.ones(len(matrix.company_ids), dtype=bool)
+        if company_ids is not None:
+            mask &= np.isin(matrix.company_ids, np.fromiter(company_ids, dtype=np.int64))
+        since = np.datetime64(pd.Timestamp(since), 'ns') if since is not None else None
+
+        columns = {}
+        for position, condition in enumerate(conditions):
+            label = condition.label or f"condition_{position}"
+            values, period_ends = self.column(condition.head_ids, consolidation_id, matrix)
+            with np.errstate(invalid='ignore'):
+                mask &= OPERATORS[condition.op](values, condition.threshold)
+            if since is not None:
+                mask &= period_ends >= since
+            columns[label] = values
+            columns[f"{label} PeriodEnd"] = period_ends
+
+        order_by = order_by or (conditions[0] if conditions else None)
+        selected = np.flatnonzero(mask)
+        if order_by is not None:
+            keys, _ = self.column(order_by.head_ids, consolidation_id, matrix)
+            keys = -keys[selected] if descending else keys[selected]
+            # NaN ranks last either way
+            keys = np.where(np.isnan(keys), np.inf, keys)
+            if top is not None and top < len(selected):
+                partition = np.argpartition(keys, top)[:top]
+                selected, keys = selected[partition], keys[partition]
+            selected = selected[np.argsort(keys, kind='stable')]
+        if top is not None:
+            selected = selected[:top]
+
+        frame = pd.DataFrame({'CompanyID': matrix.company_ids[selected]})
+        for label, values in columns.items():
+            frame[label] = values[selected]
+        return frame
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the matrices
+        """
+        matrix = self.matrix
+        return (sum(values.nbytes for values in matrix.values.values())
+                + sum(period_ends.nbytes for period_ends in matrix.period_ends.values())
+                + matrix.company_ids.nbytes + matrix.head_ids.nbytes)
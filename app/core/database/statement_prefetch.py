@@ -0,0 +1,147 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Statement-level fetch of every line item of a company's statement, used to prefetch follow-up questions
+'''
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Sequence
+
+from app.core.database.query_catalog import BoundQuery, period_filter
+from app.core.database.query_planner import PLAN_COLUMNS
+
+# Columns of the rows a statement query returns: one per head of the statement
+STATEMENT_COLUMNS = PLAN_COLUMNS + ['StatementID', 'Statement']
+
+
+class StatementKey(NamedTuple):
+    """
+    One statement of one company for one resolved period; the ResultKey fields without the head
+    """
+    company_id: int
+    statement_id: int
+    term_id: Optional[int]
+    consolidation_id: Optional[int]
+    period_end: Optional[str]
+    resolved_period_end: Optional[str]
+    fiscal_year: Optional[int]
+    relative_type: Optional[str]
+    is_ttm: bool
+
+
+def statement_query(tables: Sequence[str], company_id: int, statement_id: int, term_id: Optional[int],
+                    consolidation_id: Optional[int], period_end: Optional[str] = None,
+                    fiscal_year: Optional[int] = None) -> BoundQuery:
+    """
+    Every head of a statement for one company and period in one statement
+
+    Heads are restricted to the industries mapped to the company's sector, like the plan
+    statement. Each head keeps its best row the way a single-head QueryPlan ranks it: first
+    table of tables with a row, then the latest PeriodEnd.
+
+    Args:
+        tables: Raw data tables in order of preference
+        company_id: Company ID
+        statement_id: StatementID of tbl_statementsname
+        term_id: Term ID
+        consolidation_id: Consolidation ID, or None for any
+        period_end: Optional period end overriding the TermID filter
+        fiscal_year: Optional fiscal year
+
+    Returns:
+        BoundQuery named 'statement_prefetch' returning STATEMENT_COLUMNS
+    """
+    if not tables:
+        raise ValueError("Statement query has no tables")
+    period_clause, params = period_filter('d', term_id, period_end, fiscal_year)
+    params.update({'company_id': company_id, 'statement_id': statement_id})
+    consolidation_clause = ''
+    if consolidation_id is not None:
+        consolidation_clause = "AND d.ConsolidationID = :consolidation_id"
+        params['consolidation_id'] = consolidation_id
+
+    selects = [f"""
+                SELECT d.Value_ AS Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company,
+                       h.SubHeadName AS Metric, con.consolidationname AS Consolidation, d.PeriodEnd AS PeriodEnd,
+                       d.SubHeadID AS SubHeadID, '{table_name}' AS SourceTable, NULL AS DisectionGroupID,
+                       s.StatementID AS StatementID, s.StatementName AS Statement, {rank} AS BranchRank
+                FROM {table_name} d
+                JOIN tbl_headsmaster h ON d.SubHeadID = h.SubHeadID
+                JOIN tbl_statementsname s ON h.StatementID = s.StatementID
+                JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+                JOIN tbl_terms t ON d.TermID = t.TermID
+                JOIN tbl_companieslist c ON d.CompanyID = c.CompanyID
+                JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND h.IndustryID = im.industryid
+                JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID
+                WHERE d.CompanyID = :company_id AND s.StatementID = :statement_id {consolidation_clause}
+                {period_clause}""" for rank, table_name in enumerate(tables)]
+
+    union = "\n                UNION ALL".join(selects)
+    query = f"""
+        SELECT {', '.join(STATEMENT_COLUMNS)}
+        FROM (
+            SELECT b.*, ROW_NUMBER() OVER (PARTITION BY b.SubHeadID ORDER BY b.BranchRank, b.PeriodEnd DESC) AS HeadRank
+            FROM ({union}
+            ) AS b
+        ) AS ranked
+        WHERE HeadRank = 1
+        ORDER BY SubHeadID
+        """
+    return BoundQuery(query, params, 'statement_prefetch')
+
+
+class PrefetchStats:
+    """
+    Thread-safe counters of the statement prefetch.
+
+    Remembers the result keys a prefetch cached (bounded, oldest forgotten first) until a
+    follow-up question reads them, so the hit rate is the share of prefetched values that
+    saved a query.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pending: 'OrderedDict[Hashable, None]' = OrderedDict()
+        self.statements = 0
+        self.prefetched = 0
+        self.used = 0
+
+    def record(self, keys: Iterable[Hashable]) -> None:
+        """
+        Count one fetched statement and remember the result keys it cached
+        """
+        with self._lock:
+            self.statements += 1
+            for key in keys:
+                self.prefetched += 1
+                self._pending[key] = None
+                self._pending.move_to_end(key)
+            while len(self._pending) > self.max_entries:
+                self._pending.popitem(last=False)
+
+    def hit(self, key: Hashable) -> bool:
+        """
+        Count a result cache hit on key if a prefetch cached it and it was not read before
+        """
+        with self._lock:
+            if key not in self._pending:
+                return False
+            del self._pending[key]
+            self.used += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'statements': self.statements,
+                'prefetched': self.prefetched,
+                'used': self.used,
+                'pending': len(self._pending),
+                'hit_rate': self.used / self.prefetched if self.prefetched else 0.0,
+            }
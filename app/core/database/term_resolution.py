@@ -6,7 +6,9 @@ Description: Implementation of term resolution functions for TREA AI
 
 import logging
 import re
-from typing import Dict, Any, Tuple, Optional, Union
+from typing import Dict, Any, List, Tuple, Optional, Union
+
+from app.core.database.query_catalog import BoundQuery, equality_filters
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +43,7 @@ def get_term_id(db, term: str, company_id: int = None, head_id: int = None, cons
     logger.info(f"Normalized term: {normalized_term}")
     
     # Query the database for the term ID
-    query = f"SELECT TermID FROM tbl_terms WHERE LOWER(term) = LOWER('{normalized_term}')"
-    result = db.execute_query(query)
+    result = db.execute_statement('term_by_name', term=normalized_term)
     
     if not result.empty:
         term_id = result.iloc[0]['TermID']
@@ -50,8 +51,7 @@ def get_term_id(db, term: str, company_id: int = None, head_id: int = None, cons
         return term_id
     
     # If not found, try a more flexible match
-    query = f"SELECT TermID, term FROM tbl_terms WHERE LOWER(term) LIKE '%{normalized_term.lower()}%'"
-    result = db.execute_query(query)
+    result = db.execute_statement('terms_like', pattern=normalized_term)
     
     if not result.empty:
         term_id = result.iloc[0]['TermID']
@@ -195,8 +195,7 @@ def get_default_term_id(db, term: str) -> int:
     Returns:
         Term ID
     """
-    query = f"SELECT TermID FROM tbl_terms WHERE LOWER(term) = LOWER('{term}')"
-    result = db.execute_query(query)
+    result = db.execute_statement('term_by_name', term=term)
     
     if not result.empty:
         return result.iloc[0]['TermID']
@@ -213,6 +212,22 @@ def get_default_term_id(db, term: str) -> int:
     logger.error("Could not find default term ID, using 1 as fallback")
     return 1
 
+def _indexed_periods(db, table_name: str, company_id: int = None, head_id: int = None,
+                     consolidation_id: int = None) -> Optional[List[Tuple[int, Any]]]:
+    """
+    Latest (term_id, period_end) pairs from the database's period index, most recent first.
+    
+    Returns None when the index cannot answer and the table has to be queried: the index is
+    not built or does not cover the table, or the lookup is for a specific head (financial
+    tables are indexed per company and consolidation, not per head).
+    """
+    if company_id is None or head_id is not None:
+        return None
+    index = db.get_period_index()
+    if index is None or not index.covers(table_name):
+        return None
+    return index.latest(table_name, company_id, consolidation_id)
+
 def resolve_most_recent_period(db, company_id: int = None, head_id: int = None, consolidation_id: int = None, default_term_id: int = None) -> Tuple[int, str]:
     """
     Resolve the most recent period with data for the specified parameters.
@@ -230,50 +245,43 @@ def resolve_most_recent_period(db, company_id: int = None, head_id: int = None,
     logger.info("Resolving most recent period")
     
     # Build where clause based on available parameters
-    where_clauses = []
-    if company_id is not None:
-        where_clauses.append(f"CompanyID = {company_id}")
-    if head_id is not None:
-        where_clauses.append(f"SubHeadID = {head_id}")
-    if consolidation_id is not None:
-        where_clauses.append(f"ConsolidationID = {consolidation_id}")
+    where_clauses, params = equality_filters(
+        {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id}, alias='f')
     
     where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
     
-    # Query the database for the most recent period
-    query = f"""
-    SELECT TOP 1 f.TermID, f.PeriodEnd, t.term
-    FROM tbl_financialrawdata f
-    JOIN tbl_terms t ON f.TermID = t.TermID
-    WHERE {where_clause}
-    ORDER BY f.PeriodEnd DESC
-    """
-    
-    result = db.execute_query(query)
-    
-    if not result.empty:
-        term_id = result.iloc[0]['TermID']
-        period_end = result.iloc[0]['PeriodEnd']
-        term_name = result.iloc[0]['term']
-        logger.info(f"Found most recent period: term_id={term_id}, period_end={period_end}, term={term_name}")
+    # Most recent period from the period index, else from the database
+    periods = _indexed_periods(db, 'tbl_financialrawdata', company_id, head_id, consolidation_id)
+    if periods is None:
+        query = BoundQuery(f"""
+        SELECT TOP 1 f.TermID, f.PeriodEnd
+        FROM tbl_financialrawdata f
+        WHERE {where_clause}
+        ORDER BY f.PeriodEnd DESC
+        """, params)
+        result = db.execute_query(query)
+        periods = list(zip(result['TermID'], result['PeriodEnd'])) if not result.empty else []
+    
+    if periods:
+        term_id, period_end = periods[0]
+        logger.info(f"Found most recent period: term_id={term_id}, period_end={period_end}")
         return term_id, period_end.strftime('%Y-%m-%d')
     
     # If no data found, try the quarterly table
-    query = f"""
-    SELECT TOP 1 f.TermID, f.PeriodEnd, t.term
-    FROM tbl_financialrawdata_Quarter f
-    JOIN tbl_terms t ON f.TermID = t.TermID
-    WHERE {where_clause}
-    ORDER BY f.PeriodEnd DESC
-    """
-    
-    result = db.execute_query(query)
-    
-    if not result.empty:
-        term_id = result.iloc[0]['TermID']
-        period_end = result.iloc[0]['PeriodEnd']
-        term_name = result.iloc[0]['term']
-        logger.info(f"Found most recent period in quarterly table: term_id={term_id}, period_end={period_end}, term={term_name}")
+    periods = _indexed_periods(db, 'tbl_financialrawdata_Quarter', company_id, head_id, consolidation_id)
+    if periods is None:
+        query = BoundQuery(f"""
+        SELECT TOP 1 f.TermID, f.PeriodEnd
+        FROM tbl_financialrawdata_Quarter f
+        WHERE {where_clause}
+        ORDER BY f.PeriodEnd DESC
+        """, params)
+        result = db.execute_query(query)
+        periods = list(zip(result['TermID'], result['PeriodEnd'])) if not result.empty else []
+    
+    if periods:
+        term_id, period_end = periods[0]
+        logger.info(f"Found most recent period in quarterly table: term_id={term_id}, period_end={period_end}")
         return term_id, period_end.strftime('%Y-%m-%d')
     
     # If still no data found, return default term ID and current date
@@ -298,42 +306,36 @@ def resolve_last_quarter(db, company_id: int = None, head_id: int = None, consol
     logger.info("Resolving last quarter")
     
     # Build where clause based on available parameters
-    where_clauses = []
-    if company_id is not None:
-        where_clauses.append(f"CompanyID = {company_id}")
-    if head_id is not None:
-        where_clauses.append(f"SubHeadID = {head_id}")
-    if consolidation_id is not None:
-        where_clauses.append(f"ConsolidationID = {consolidation_id}")
+    where_clauses, params = equality_filters(
+        {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id}, alias='f')
     
     where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
     
-    # Query the database for the last quarter
-    query = f"""
-    SELECT TOP 1 f.TermID, f.PeriodEnd, t.term
-    FROM tbl_financialrawdata_Quarter f
-    JOIN tbl_terms t ON f.TermID = t.TermID
-    WHERE {where_clause}
-    ORDER BY f.PeriodEnd DESC
-    """
-    
-    result = db.execute_query(query)
-    
-    if not result.empty:
-        term_id = result.iloc[0]['TermID']
-        period_end = result.iloc[0]['PeriodEnd']
-        term_name = result.iloc[0]['term']
-        logger.info(f"Found last quarter: term_id={term_id}, period_end={period_end}, term={term_name}")
+    # Last quarter from the period index, else from the database
+    periods = _indexed_periods(db, 'tbl_financialrawdata_Quarter', company_id, head_id, consolidation_id)
+    if periods is None:
+        query = BoundQuery(f"""
+        SELECT TOP 1 f.TermID, f.PeriodEnd
+        FROM tbl_financialrawdata_Quarter f
+        WHERE {where_clause}
+        ORDER BY f.PeriodEnd DESC
+        """, params)
+        result = db.execute_query(query)
+        periods = list(zip(result['TermID'], result['PeriodEnd'])) if not result.empty else []
+    
+    if periods:
+        term_id, period_end = periods[0]
+        logger.info(f"Found last quarter: term_id={term_id}, period_end={period_end}")
         return term_id, period_end.strftime('%Y-%m-%d')
     
     # If no data found in quarterly table, try the regular table with 3M term
-    query = f"""
+    query = BoundQuery(f"""
     SELECT TOP 1 f.TermID, f.PeriodEnd, t.term
     FROM tbl_financialrawdata f
     JOIN tbl_terms t ON f.TermID = t.TermID
     WHERE {where_clause} AND LOWER(t.term) = '3m'
     ORDER BY f.PeriodEnd DESC
-    """
+    """, params)
     
     result = db.execute_query(query)
     
@@ -460,23 +462,18 @@ def resolve_ttm(db, company_id: int = None, head_id: int = None, consolidation_i
     term_id = get_default_term_id(db, 'TTM')
     
     # Build where clause based on available parameters
-    where_clauses = []
-    if company_id is not None:
-        where_clauses.append(f"CompanyID = {company_id}")
-    if head_id is not None:
-        where_clauses.append(f"SubHeadID = {head_id}")
-    if consolidation_id is not None:
-        where_clauses.append(f"ConsolidationID = {consolidation_id}")
+    where_clauses, params = equality_filters(
+        {'CompanyID': company_id, 'SubHeadID': head_id, 'ConsolidationID': consolidation_id}, alias='f')
     
     where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
     
     # Try to find the most recent TTM period in the TTM table
-    query = f"""
+    query = BoundQuery(f"""
     SELECT TOP 1 f.PeriodEnd
     FROM tbl_financialrawdata_TTM f
     WHERE {where_clause}
     ORDER BY f.PeriodEnd DESC
-    """
+    """, params)
     
     result = db.execute_query(query)
     
@@ -0,0 +1,138 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Full metric history of one company and head across the raw data tables
+'''
+
+import re
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.database.query_catalog import BoundQuery
+
+# Raw data tables a head's history is read from
+REGULAR_SERIES_TABLES = ('tbl_financialrawdata', 'tbl_financialrawdata_Quarter', 'tbl_financialrawdataTTM')
+RATIO_SERIES_TABLES = ('tbl_ratiorawdata',)
+
+# Columns of a series frame; the index is PeriodEnd
+SERIES_COLUMNS = ['Value', 'TermID', 'FY', 'Term', 'Source']
+
+
+class SeriesKey(NamedTuple):
+    """
+    Cache key of one series
+    """
+    company_id: int
+    head_id: int
+    is_ratio: bool
+    consolidation_id: int
+
+
+def series_query(tables: Iterable[str], company_id: int, head_id: int, is_ratio: bool,
+                 consolidation_id: int) -> BoundQuery:
+    """
+    One statement returning every row of the head for the company from each of tables
+
+    Joins match the single-value query of build_financial_query, so the series holds the
+    rows get_financial_data can answer with. The labels (company, metric, unit,
+    consolidation) are the same on every row and end up in the frame's attrs.
+    """
+    head_table, head_name_col = ('tbl_ratiosheadmaster', 'HeadNames') if is_ratio else ('tbl_headsmaster', 'SubHeadName')
+    selects = [f"""
+        SELECT '{table_name}' AS Source, d.PeriodEnd, d.TermID, d.FY, d.Value_ AS Value, t.term AS Term,
+               u.unitname AS Unit, c.CompanyName AS Company, h.{head_name_col} AS Metric,
+               con.consolidationname AS Consolidation
+        FROM {table_name} d
+        JOIN {head_table} h ON d.SubHeadID = h.SubHeadID
+        JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+        JOIN tbl_terms t ON d.TermID = t.TermID
+        JOIN tbl_companieslist c ON d.CompanyID = c.CompanyID
+        JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID AND h.IndustryID = im.industryid
+        JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID
+        WHERE d.CompanyID = :company_id AND d.SubHeadID = :head_id AND d.ConsolidationID = :consolidation_id"""
+               for table_name in tables]
+    query = "\n        UNION ALL".join(selects) + "\n        ORDER BY PeriodEnd"
+    return BoundQuery(query, {'company_id': company_id, 'head_id': head_id, 'consolidation_id': consolidation_id},
+                      'time_series')
+
+
+def to_series_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    PeriodEnd-indexed frame of the rows of series_query, oldest first
+
+    Value is float64, TermID and FY are int32 (FY is 0 when missing), Term and Source are
+    categoricals. The per-series labels are kept in attrs.
+    """
+    frame = pd.DataFrame({
+        'Value': pd.to_numeric(df['Value'], errors='coerce').astype(np.float64),
+        'TermID': df['TermID'].astype(np.int32),
+        'FY': pd.to_numeric(df['FY'], errors='coerce').fillna(0).astype(np.int32),
+        'Term': df['Term'].astype('category'),
+        'Source': df['Source'].astype('category'),
+    }, columns=SERIES_COLUMNS)
+    frame.index = pd.DatetimeIndex(pd.to_datetime(df['PeriodEnd']), name='PeriodEnd')
+    frame = frame.sort_index(kind='stable')
+    first = df.iloc[0] if len(df) else pd.Series(dtype=object)
+    frame.attrs = {label: first.get(column) for label, column in
+                   (('company', 'Company'), ('metric', 'Metric'), ('unit', 'Unit'), ('consolidation', 'Consolidation'))}
+    return frame
+
+
+def latest_row(frame: pd.DataFrame, table_name: str, term_id: Optional[int] = None,
+               fiscal_year: Optional[int] = None, period_end: Optional[str] = None) -> Optional[pd.Series]:
+    """
+    Most recent row of table_name matching the period filter of build_financial_query:
+    PeriodEnd when given, else TermID (and FY when given)
+
+    Returns:
+        Row with PeriodEnd as its name, None if no row matches
+    """
+    mask = frame['Source'] == table_name
+    if period_end is not None:
+        mask &= frame.index == pd.Timestamp(period_end)
+    else:
+        mask &= frame['TermID'] == term_id
+        if fiscal_year is not None:
+            mask &= frame['FY'] == fiscal_year
+    rows = frame[mask]
+    return rows.iloc[-1] if len(rows) else None
+
+
+def period_row(frame: pd.DataFrame, period: str) -> Optional[pd.Series]:
+    """
+    Most recent row for a period as written in a question ('Q1 2023', 'FY 2020', '6M')
+
+    The term part is matched against the term name, the year against FY (or the PeriodEnd
+    year when FY is missing); 'FY' alone only selects the year.
+
+    Returns:
+        Row with PeriodEnd as its name, None if no row matches
+    """
+    parts = period.split()
+    year = int(parts.pop()) if parts and re.fullmatch(r'\d{4}', parts[-1]) else None
+    term = ' '.join(part for part in parts if part.upper() != 'FY').lower()
+    mask = np.ones(len(frame), dtype=bool)
+    if term:
+        mask &= frame['Term'].astype(str).str.lower().str.contains(term, regex=False).to_numpy()
+    if year is not None:
+        fiscal_years = np.where(frame['FY'].to_numpy() > 0, frame['FY'].to_numpy(), frame.index.year)
+        mask &= fiscal_years == year
+    rows = frame[mask]
+    return rows.iloc[-1] if len(rows) else None
+
+
+def row_response(frame: pd.DataFrame, row: pd.Series) -> Dict[str, object]:
+    """
+    get_financial_data response for one row of a series frame
+    """
+    return {
+        "company": frame.attrs.get('company'),
+        "metric": frame.attrs.get('metric'),
+        "term": row['Term'],
+        "consolidation": frame.attrs.get('consolidation'),
+        "value": float(row['Value']),
+        "unit": frame.attrs.get('unit'),
+        "date": row.name.strftime('%Y-%m-%d'),
+    }
@@ -6,8 +6,10 @@ import re
 # Add the project root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 from app.core.database.financial_db import FinancialDatabase
-from app.core.database.detect_dissection_metrics import is_dissection_metric
+from app.core.database.detect_dissection_metrics import dissection_base_metric, is_dissection_metric
 from app.core.database.metric_classification import classify_metric, get_metric_type_info
+from app.core.database.fix_head_id import select_head_with_data
+from app.core.database.query_catalog import BoundQuery, like_pattern
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -51,78 +53,19 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
     # Special handling for TTM EPS
     if metric_name.lower() == 'ttm eps' or metric_name.lower() == 'eps ttm':
         logger.info(f"Special handling for TTM EPS metric")
-        # First try to find EPS in regular heads (tbl_headsmaster)
-        query = "SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%eps%'"
-        eps_heads = db.execute_query(query)
+        # Get all EPS-related regular and ratio heads
+        eps_heads = db.execute_statement('heads_like', pattern='eps')
+        eps_ratio_heads = db.execute_statement('ratio_heads_like', pattern='eps')
+        logger.info(f"Found {len(eps_heads)} EPS-related regular heads and {len(eps_ratio_heads)} EPS-related ratio heads")
         
-        if not eps_heads.empty:
-            logger.info(f"Found {len(eps_heads)} EPS-related regular heads")
-            
-            # Try each EPS head to find one with data
-            for _, row in eps_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['SubHeadName']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {sub_head_id}"]
-                
-                if consolidation_id is not None:
-                    where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_financialrawdata f 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"EPS head: Regular SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for EPS regular SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, False, False, None, None
-        else:
-            logger.info(f"No EPS-related regular heads found, trying ratio heads")
-            
-        # If no regular heads with data found, try ratio heads
-        # Get all EPS-related ratio heads
-        query = "SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%eps%'"
-        eps_ratio_heads = db.execute_query(query)
-        
-        if not eps_ratio_heads.empty:
-            logger.info(f"Found {len(eps_ratio_heads)} EPS-related ratio heads")
-            
-            # Try each EPS ratio head to find one with data
-            for _, row in eps_ratio_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                head_name = row['HeadNames']
-                
-                # Build a query to check if data exists
-                where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-                
-                if consolidation_id is not None:
-                    where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
-                logger.info(f"EPS head: Ratio SubHeadID {sub_head_id} ({head_name}) has {count} rows of data")
-                
-                if count > 0:
-                    logger.info(f"Found data for EPS ratio SubHeadID {sub_head_id} ({head_name})")
-                    return sub_head_id, True, False, None, None
-        else:
-            logger.error(f"No EPS-related ratio heads found")
+        # Regular heads take priority over ratio heads
+        head_with_data = select_head_with_data(db, [
+            ("EPS head", eps_heads, False),
+            ("EPS head", eps_ratio_heads, True),
+        ], company_id, None, consolidation_id)
+        if head_with_data is not None:
+            sub_head_id, is_ratio = head_with_data
+            return sub_head_id, is_ratio, False, None, None
                 
         logger.error(f"No data found for any EPS head (regular or ratio)")
         return None, False, False, None, None
@@ -136,82 +79,21 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         logger.info(f"Metric '{metric_name}' identified as a dissection metric with group ID {dissection_group_id} and data type {data_type}")
         
         # Extract the base metric name (remove the dissection part)
-        base_metric = metric_name
-        
-        # For Per Share metrics
-        if dissection_group_id == 1:
-            base_metric = re.sub(r'\s*per\s*share\s*', '', metric_name.lower(), flags=re.IGNORECASE).strip()
-            logger.info(f"Extracted base metric '{base_metric}' from Per Share metric '{metric_name}'")
-        
-        # For Annual Growth metrics
-        elif dissection_group_id == 2:
-            base_metric = re.sub(r'\s*annual\s*growth\s*', '', metric_name.lower(), flags=re.IGNORECASE).strip()
-            logger.info(f"Extracted base metric '{base_metric}' from Annual Growth metric '{metric_name}'")
-        
-        # For Percentage Of Asset metrics
-        elif dissection_group_id == 3:
-            base_metric = re.sub(r'\s*(percentage|%)\s*of\s*asset\s*', '', metric_name.lower(), flags=re.IGNORECASE).strip()
-            logger.info(f"Extracted base metric '{base_metric}' from Percentage Of Asset metric '{metric_name}'")
-        
-        # For Percentage Of Sales/Revenue metrics
-        elif dissection_group_id == 4:
-            base_metric = re.sub(r'\s*(percentage|%)\s*of\s*(sales|revenue)\s*', '', metric_name.lower(), flags=re.IGNORECASE).strip()
-            logger.info(f"Extracted base metric '{base_metric}' from Percentage Of Sales/Revenue metric '{metric_name}'")
-        
-        # For Quarterly Growth metrics
-        elif dissection_group_id == 5:
-            base_metric = re.sub(r'\s*(quarterly|qoq)\s*growth\s*', '', metric_name.lower(), flags=re.IGNORECASE).strip()
-            logger.info(f"Extracted base metric '{base_metric}' from Quarterly Growth metric '{metric_name}'")
-        
-        # If base_metric is empty, use the original metric name
-        if not base_metric:
-            base_metric = metric_name
-            logger.warning(f"Could not extract base metric from '{metric_name}', using original name")
-        
-        # Get sector and industry information for the company
-        sector_query = f"""
-        SELECT c.SectorID, s.SectorName 
-        FROM tbl_companieslist c
-        JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-        WHERE c.CompanyID = {company_id}
-        """
-        sector_result = db.execute_query(sector_query)
+        base_metric = dissection_base_metric(metric_name, dissection_group_id)
         
-        sector_id = None
-        industry_id = None
-        
-        if not sector_result.empty:
-            sector_id = sector_result.iloc[0]['SectorID']
-            logger.info(f"Found SectorID: {sector_id} for company ID: {company_id}")
-            
-            # Get industry information
-            industry_query = f"""
-            SELECT i.IndustryID, i.IndustryName 
-            FROM tbl_industrynames i
-            JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-            WHERE m.sectorid = {sector_id}
-            """
-            industry_result = db.execute_query(industry_query)
-            
-            if not industry_result.empty:
-                industry_id = industry_result.iloc[0]['IndustryID']
-                logger.info(f"Found IndustryID: {industry_id} for SectorID: {sector_id}")
+        # Get sector and industry information for the company from the cached company context
+        context = db.get_company_context(company_id)
+        sector_id = context.sector_id if context is not None else None
+        industry_id = context.industry_id if context is not None else None
+        logger.info(f"Found SectorID: {sector_id}, IndustryID: {industry_id} for company ID: {company_id}")
         
         # Search for the base metric in the appropriate heads table
         # For ratio dissection data, search in tbl_ratiosheadmaster
         if data_type.lower() == 'ratio':
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) LIKE '%{base_metric.lower()}%'
-                AND m.sectorid = {sector_id}
-                """
+                possible_heads = db.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=base_metric)
             else:
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{base_metric.lower()}%'"
-            
-            possible_heads = db.execute_query(query)
+                possible_heads = db.execute_statement('ratio_heads_like', pattern=base_metric)
             
             if possible_heads.empty:
                 logger.warning(f"No ratio heads found for base metric: {base_metric}")
@@ -229,34 +111,11 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
             else:
                 table_name = "tbl_disectionrawdata"
             
-            # Check each SubHeadID to see if it has dissection data for the company
-            for _, row in possible_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                sub_head_name = row['HeadNames']
-                
-                # Build a query to check if dissection data exists
-                where_clauses = [
-                    f"d.CompanyID = {company_id}", 
-                    f"d.SubHeadID = {sub_head_id}",
-                    f"d.DisectionGroupID = {dissection_group_id}"
-                ]
-                
-                if period_end is not None:
-                    where_clauses.append(f"d.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"d.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM {table_name} d 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
+            # Probe every candidate SubHeadID in one query, then walk them in ranking order
+            counts = db.get_heads_with_data(table_name, company_id, possible_heads['SubHeadID'].tolist(),
+                                            consolidation_id, period_end, dissection_group_id)
+            for sub_head_id, sub_head_name in zip(possible_heads['SubHeadID'], possible_heads['HeadNames']):
+                count = counts.get(sub_head_id, 0)
                 logger.info(f"Ratio SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of dissection data")
                 
                 if count > 0:
@@ -266,17 +125,9 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For regular dissection data, search in tbl_headsmaster
         else:
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT h.SubHeadID, h.SubHeadName 
-                FROM tbl_headsmaster h
-                JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-                WHERE LOWER(h.SubHeadName) LIKE '%{base_metric.lower()}%'
-                AND m.sectorid = {sector_id}
-                """
+                possible_heads = db.execute_statement('heads_like_in_sector', sector_id=sector_id, pattern=base_metric)
             else:
-                query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%{base_metric.lower()}%'"
-            
-            possible_heads = db.execute_query(query)
+                possible_heads = db.execute_statement('heads_like', pattern=base_metric)
             
             if possible_heads.empty:
                 logger.warning(f"No regular heads found for base metric: {base_metric}")
@@ -294,34 +145,11 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
             else:
                 table_name = "tbl_disectionrawdata"
             
-            # Check each SubHeadID to see if it has dissection data for the company
-            for _, row in possible_heads.iterrows():
-                sub_head_id = row['SubHeadID']
-                sub_head_name = row['SubHeadName']
-                
-                # Build a query to check if dissection data exists
-                where_clauses = [
-                    f"d.CompanyID = {company_id}", 
-                    f"d.SubHeadID = {sub_head_id}",
-                    f"d.DisectionGroupID = {dissection_group_id}"
-                ]
-                
-                if period_end is not None:
-                    where_clauses.append(f"d.PeriodEnd = '{period_end}'")
-                    
-                if consolidation_id is not None:
-                    where_clauses.append(f"d.ConsolidationID = {consolidation_id}")
-                    
-                where_clause = " AND ".join(where_clauses)
-                
-                query = f"""
-                SELECT COUNT(*) as count FROM {table_name} d 
-                WHERE {where_clause}
-                """
-                
-                result = db.execute_query(query)
-                count = result.iloc[0]['count'] if not result.empty else 0
-                
+            # Probe every candidate SubHeadID in one query, then walk them in ranking order
+            counts = db.get_heads_with_data(table_name, company_id, possible_heads['SubHeadID'].tolist(),
+                                            consolidation_id, period_end, dissection_group_id)
+            for sub_head_id, sub_head_name in zip(possible_heads['SubHeadID'], possible_heads['SubHeadName']):
+                count = counts.get(sub_head_id, 0)
                 logger.info(f"Regular SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of dissection data")
                 
                 if count > 0:
@@ -333,25 +161,25 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         
         # Try to find available SubHeadIDs with any dissection group
         if data_type.lower() == 'ratio':
-            query = f"""
+            query = BoundQuery(f"""
             SELECT DISTINCT d.SubHeadID, r.HeadNames, d.DisectionGroupID, COUNT(*) as count
             FROM {table_name} d
             JOIN tbl_ratiosheadmaster r ON d.SubHeadID = r.SubHeadID
-            WHERE d.CompanyID = {company_id}
-            AND LOWER(r.HeadNames) LIKE '%{base_metric.lower()}%'
+            WHERE d.CompanyID = :company_id
+            AND LOWER(r.HeadNames) LIKE :pattern
             GROUP BY d.SubHeadID, r.HeadNames, d.DisectionGroupID
             ORDER BY count DESC
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(base_metric)})
         else:
-            query = f"""
+            query = BoundQuery(f"""
             SELECT DISTINCT d.SubHeadID, h.SubHeadName, d.DisectionGroupID, COUNT(*) as count
             FROM {table_name} d
             JOIN tbl_headsmaster h ON d.SubHeadID = h.SubHeadID
-            WHERE d.CompanyID = {company_id}
-            AND LOWER(h.SubHeadName) LIKE '%{base_metric.lower()}%'
+            WHERE d.CompanyID = :company_id
+            AND LOWER(h.SubHeadName) LIKE :pattern
             GROUP BY d.SubHeadID, h.SubHeadName, d.DisectionGroupID
             ORDER BY count DESC
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(base_metric)})
         
         available_heads = db.execute_query(query)
         
@@ -398,34 +226,11 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
     logger.info(f"Final classification for '{metric_name}': {'Ratio Metric' if is_ratio_metric else 'Regular Financial Metric'}")
     logger.info(f"Will use {'tbl_ratiosheadmaster' if is_ratio_metric else 'tbl_headsmaster'} for lookup")
     
-    # Get sector and industry information for the company
-    sector_query = f"""
-    SELECT c.SectorID, s.SectorName 
-    FROM tbl_companieslist c
-    JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    sector_result = db.execute_query(sector_query)
-    
-    sector_id = None
-    industry_id = None
-    
-    if not sector_result.empty:
-        sector_id = sector_result.iloc[0]['SectorID']
-        logger.info(f"Found SectorID: {sector_id} for company ID: {company_id}")
-        
-        # Get industry information
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName 
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {sector_id}
-        """
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            industry_id = industry_result.iloc[0]['IndustryID']
-            logger.info(f"Found IndustryID: {industry_id} for SectorID: {sector_id}")
+    # Get sector and industry information for the company from the cached company context
+    context = db.get_company_context(company_id)
+    sector_id = context.sector_id if context is not None else None
+    industry_id = context.industry_id if context is not None else None
+    logger.info(f"Found SectorID: {sector_id}, IndustryID: {industry_id} for company ID: {company_id}")
     
     # If we couldn't determine sector or industry, log a warning but continue with the search
     if sector_id is None or industry_id is None:
@@ -441,96 +246,59 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For ratio metrics, ONLY search in ratio heads - never fall back to regular heads
         if sector_id is not None and industry_id is not None:
             # First try exact match with industry validation
-            query = f"""
-            SELECT r.SubHeadID, r.HeadNames 
-            FROM tbl_ratiosheadmaster r
-            JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-            WHERE LOWER(r.HeadNames) = LOWER('{normalized_metric_name}')
-            AND m.sectorid = {sector_id}
-            """
-            exact_ratio_heads = db.execute_query(query)
+            exact_ratio_heads = db.execute_statement('ratio_heads_by_name_in_sector', sector_id=sector_id, name=normalized_metric_name)
             
             # If no exact matches, try contains match with industry validation
             if exact_ratio_heads.empty:
                 logger.info(f"No exact ratio matches with industry validation, trying contains match with industry filter")
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) LIKE '%{normalized_metric_name}%'
-                OR LOWER(r.HeadNames) LIKE '%debt%equity%'
-                AND m.sectorid = {sector_id}
-                """
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity_in_sector', sector_id=sector_id, pattern=normalized_metric_name)
             
             # If still no matches with industry validation, try without it as fallback
             if exact_ratio_heads.empty:
                 logger.info(f"No ratio matches with industry validation, trying without industry filter")
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{normalized_metric_name}')"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=normalized_metric_name)
                 
                 # If still no exact matches, try contains match without industry validation
                 if exact_ratio_heads.empty:
                     logger.info(f"No exact ratio matches without industry filter, trying contains match")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%' OR LOWER(HeadNames) LIKE '%debt%equity%'"
-                    exact_ratio_heads = db.execute_query(query)
+                    exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity', pattern=normalized_metric_name)
         else:
             # If sector or industry is not available, search without validation
-            query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{normalized_metric_name}')"
-            exact_ratio_heads = db.execute_query(query)
+            exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=normalized_metric_name)
             
             # If no exact matches, try contains match
             if exact_ratio_heads.empty:
                 logger.info(f"No exact ratio matches without industry info, trying contains match")
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%' OR LOWER(HeadNames) LIKE '%debt%equity%'"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_like_or_debt_equity', pattern=normalized_metric_name)
         
         # For ratio metrics, we do NOT fall back to regular heads
         # This ensures ratio metrics are always looked up in tbl_ratiosheadmaster
     else:
         # For regular metrics, first try regular heads
         if sector_id is not None and industry_id is not None:
-            query = f"""
-            SELECT h.SubHeadID, h.SubHeadName 
-            FROM tbl_headsmaster h
-            JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-            WHERE LOWER(h.SubHeadName) = LOWER('{metric_name}')
-            AND m.sectorid = {sector_id}
-            """
-            exact_heads = db.execute_query(query)
+            exact_heads = db.execute_statement('heads_by_name_in_sector', sector_id=sector_id, name=metric_name)
             
             # If no matches with industry validation, try without it as fallback
             if exact_heads.empty:
                 logger.info(f"No exact matches with industry validation, trying without industry filter")
-                query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) = LOWER('{metric_name}')"
-                exact_heads = db.execute_query(query)
+                exact_heads = db.execute_statement('heads_by_name', name=metric_name)
         else:
             # If sector or industry is not available, search without validation
-            query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) = LOWER('{metric_name}')"
-            exact_heads = db.execute_query(query)
+            exact_heads = db.execute_statement('heads_by_name', name=metric_name)
         
         # Only if we don't find in regular heads, try ratio heads as fallback
         if exact_heads.empty:
             logger.info(f"No exact matches in regular heads, trying ratio heads as fallback")
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) = LOWER('{metric_name}')
-                AND m.sectorid = {sector_id}
-                """
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name_in_sector', sector_id=sector_id, name=metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if exact_ratio_heads.empty:
                     logger.info(f"No exact ratio matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{metric_name}')"
-                    exact_ratio_heads = db.execute_query(query)
+                    exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) = LOWER('{metric_name}')"
-                exact_ratio_heads = db.execute_query(query)
+                exact_ratio_heads = db.execute_statement('ratio_heads_by_name', name=metric_name)
     
     # Initialize variables for contains matches
     contains_heads = pd.DataFrame()
@@ -547,69 +315,42 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         # For ratio metrics, ONLY search in ratio heads - never fall back to regular heads
         if exact_ratio_heads.empty:
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT r.SubHeadID, r.HeadNames 
-                FROM tbl_ratiosheadmaster r
-                JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                WHERE LOWER(r.HeadNames) LIKE '%{normalized_metric_name}%'
-                AND m.sectorid = {sector_id}
-                """
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=normalized_metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if contains_ratio_heads.empty:
                     logger.info(f"No contains ratio matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%'"
-                    contains_ratio_heads = db.execute_query(query)
+                    contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=normalized_metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%'"
-                contains_ratio_heads = db.execute_query(query)
+                contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=normalized_metric_name)
     else:
         # For regular metrics, first try regular heads
         if exact_heads.empty:
             if sector_id is not None and industry_id is not None:
-                query = f"""
-                SELECT h.SubHeadID, h.SubHeadName 
-                FROM tbl_headsmaster h
-                JOIN tbl_industryandsectormapping m ON h.IndustryID = m.industryid
-                WHERE LOWER(h.SubHeadName) LIKE '%{normalized_metric_name}%'
-                AND m.sectorid = {sector_id}
-                """
-                contains_heads = db.execute_query(query)
+                contains_heads = db.execute_statement('heads_like_in_sector', sector_id=sector_id, pattern=normalized_metric_name)
                 
                 # If no matches with industry validation, try without it as fallback
                 if contains_heads.empty:
                     logger.info(f"No contains matches with industry validation, trying without industry filter")
-                    query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%{normalized_metric_name}%'"
-                    contains_heads = db.execute_query(query)
+                    contains_heads = db.execute_statement('heads_like', pattern=normalized_metric_name)
             else:
                 # If sector or industry is not available, search without validation
-                query = f"SELECT SubHeadID, SubHeadName FROM tbl_headsmaster WHERE LOWER(SubHeadName) LIKE '%{normalized_metric_name}%'"
-                contains_heads = db.execute_query(query)
+                contains_heads = db.execute_statement('heads_like', pattern=normalized_metric_name)
             
             # Only if we don't find in regular heads, try ratio heads as fallback
             if contains_heads.empty:
                 logger.info(f"No contains matches in regular heads, trying ratio heads as fallback")
                 if sector_id is not None and industry_id is not None:
-                    query = f"""
-                    SELECT r.SubHeadID, r.HeadNames 
-                    FROM tbl_ratiosheadmaster r
-                    JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
-                    WHERE LOWER(r.HeadNames) LIKE '%{normalized_metric_name}%'
-                    AND m.sectorid = {sector_id}
-                    """
-                    contains_ratio_heads = db.execute_query(query)
+                    contains_ratio_heads = db.execute_statement('ratio_heads_like_in_sector', sector_id=sector_id, pattern=normalized_metric_name)
                     
                     # If no matches with industry validation, try without it as fallback
                     if contains_ratio_heads.empty:
                         logger.info(f"No contains ratio matches with industry validation, trying without industry filter")
-                        query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%'"
-                        contains_ratio_heads = db.execute_query(query)
+                        contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=normalized_metric_name)
                 else:
                     # If sector or industry is not available, search without validation
-                    query = f"SELECT SubHeadID, HeadNames FROM tbl_ratiosheadmaster WHERE LOWER(HeadNames) LIKE '%{normalized_metric_name}%'"
-                    contains_ratio_heads = db.execute_query(query)
+                    contains_ratio_heads = db.execute_statement('ratio_heads_like', pattern=normalized_metric_name)
     
     # Check if we found any matches
     if contains_heads.empty and contains_ratio_heads.empty:
@@ -625,68 +366,17 @@ def get_available_head_id(db, company_id, metric_name, period_end=None, consolid
         logger.info(f"Found {len(contains_ratio_heads)} ratio head matches for metric: {metric_name}")
         logger.info(f"Ratio matches: {contains_ratio_heads.to_dict()}")
     
-    # Check each SubHeadID to see if it has data for the company
-    # First check regular heads if available and not a ratio metric
-    if not contains_heads.empty and not is_ratio_metric:
-        for _, row in contains_heads.iterrows():
-            sub_head_id = row['SubHeadID']
-            sub_head_name = row['SubHeadName']
-            
-            # Build a query to check if data exists
-            where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {sub_head_id}"]
-            
-            if period_end is not None:
-                where_clauses.append(f"f.PeriodEnd = '{period_end}'")
-                
-            if consolidation_id is not None:
-                where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
-                
-            where_clause = " AND ".join(where_clauses)
-            
-            query = f"""
-            SELECT COUNT(*) as count FROM tbl_financialrawdata f 
-            WHERE {where_clause}
-            """
-            
-            result = db.execute_query(query)
-            count = result.iloc[0]['count'] if not result.empty else 0
-            
-            logger.info(f"Regular SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of data")
-            
-            if count > 0:
-                logger.info(f"Found data for regular SubHeadID {sub_head_id} ({sub_head_name})")
-                return sub_head_id, False, False, None, None
+    # Check which SubHeadIDs have data for the company in one batched probe
+    # Regular heads first (unless this is a ratio metric), then ratio heads
+    stages = []
+    if not is_ratio_metric:
+        stages.append(("Contains match", contains_heads, False))
+    stages.append(("Contains match", contains_ratio_heads, True))
     
-    # Then check ratio heads
-    if not contains_ratio_heads.empty:
-        for _, row in contains_ratio_heads.iterrows():
-            sub_head_id = row['SubHeadID']
-            sub_head_name = row['HeadNames']
-            
-            # Build a query to check if data exists
-            where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {sub_head_id}"]
-            
-            if period_end is not None:
-                where_clauses.append(f"r.PeriodEnd = '{period_end}'")
-                
-            if consolidation_id is not None:
-                where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
-                
-            where_clause = " AND ".join(where_clauses)
-            
-            query = f"""
-            SELECT COUNT(*) as count FROM tbl_ratiorawdata r 
-            WHERE {where_clause}
-            """
-            
-            result = db.execute_query(query)
-            count = result.iloc[0]['count'] if not result.empty else 0
-            
-            logger.info(f"Ratio SubHeadID {sub_head_id} ({sub_head_name}) has {count} rows of data")
-            
-            if count > 0:
-                logger.info(f"Found data for ratio SubHeadID {sub_head_id} ({sub_head_name})")
-                return sub_head_id, True, False, None, None
+    head_with_data = select_head_with_data(db, stages, company_id, period_end, consolidation_id)
+    if head_with_data is not None:
+        sub_head_id, is_ratio = head_with_data
+        return sub_head_id, is_ratio, False, None, None
     
     # If we get here, we couldn't find any data for this metric
     logger.error(f"No data found for any SubHeadID for metric: {metric_name}")
@@ -723,33 +413,11 @@ if __name__ == "__main__":
     period_end = '2021-03-31'
     consolidation_id = db.get_consolidation_id('unconsolidated')
     
-    # Get company's sector and industry information for context
-    sector_query = f"""
-    SELECT c.SectorID, s.SectorName 
-    FROM tbl_companieslist c
-    JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    sector_result = db.execute_query(sector_query)
-    
-    if not sector_result.empty:
-        sector_id = sector_result.iloc[0]['SectorID']
-        sector_name = sector_result.iloc[0]['SectorName']
-        print(f"\nCompany is in sector: {sector_name} (ID: {sector_id})")
-        
-        # Get industry information
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName 
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {sector_id}
-        """
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            industry_id = industry_result.iloc[0]['IndustryID']
-            industry_name = industry_result.iloc[0]['IndustryName']
-            print(f"Company is in industry: {industry_name} (ID: {industry_id})")
+    # Get sector and industry information for the company from the cached company context
+    context = db.get_company_context(company_id)
+    if context is not None:
+        print(f"\nCompany is in sector: {context.sector_name} (ID: {context.sector_id})")
+        print(f"Company is in industry: {context.industry_name} (ID: {context.industry_id})")
     
     # Example 1: Test with a regular financial metric
     regular_metric = 'Depreciation and Amortisation'
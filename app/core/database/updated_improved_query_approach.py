@@ -10,6 +10,7 @@ from app.core.database.financial_db import FinancialDatabase
 from app.core.database.updated_fix_head_id import get_available_head_id
 from app.core.database.detect_dissection_metrics import is_dissection_metric
 from app.core.database.metric_classification import classify_metric, get_metric_type_info
+from app.core.database.query_catalog import BoundQuery, like_pattern
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +51,16 @@ def get_financial_data(company_name, metric_name, period_term=None, consolidatio
     # Normalize metric name
     metric_name = metric_name.strip()
     
+    # A period end date is answered by the query planner: every candidate SubHeadID in the
+    # regular, ratio or dissection tables is ranked in one statement
+    if period_term is not None and re.match(r'^\d{4}-\d{2}-\d{2}$', period_term) and 'ttm' not in metric_name.lower():
+        plan = db.plan_financial_query(company_name, metric_name, period_term, period_end=period_term,
+                                       company_id=company_id, consolidation_id=consolidation_id)
+        if plan.error is not None:
+            logger.error(plan.error)
+            return pd.DataFrame()
+        return db.run_plan(plan)
+    
     # Use the new metric classification system to determine the metric type
     metric_type = classify_metric(metric_name)
     logger.info(f"Classified metric '{metric_name}' as: {metric_type}")
@@ -132,19 +143,23 @@ def query_regular_data(db, company_id, metric_name, period_term=None, consolidat
         return query_dissection_data(db, company_id, metric_name, period_term, consolidation_id, dissection_group_id, data_type, head_id)
     
     # Build the SQL query for regular financial data
-    where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
+    where_clauses = ["f.CompanyID = :company_id", "f.SubHeadID = :head_id"]
+    params = {'company_id': company_id, 'head_id': head_id}
     
     if period_end is not None:
-        where_clauses.append(f"f.PeriodEnd = '{period_end}'")
+        where_clauses.append("f.PeriodEnd = :period_end")
+        params['period_end'] = period_end
     elif term_id is not None:
-        where_clauses.append(f"f.TermID = {term_id}")
+        where_clauses.append("f.TermID = :term_id")
+        params['term_id'] = term_id
     
     if consolidation_id is not None:
-        where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses.append("f.ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     where_clause = " AND ".join(where_clauses)
     
-    query = f"""
+    query = BoundQuery(f"""
     SELECT f.Value_ AS Value, 
            u.unitname AS Unit, 
            t.term AS Term, 
@@ -161,7 +176,7 @@ def query_regular_data(db, company_id, metric_name, period_term=None, consolidat
     JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID 
     WHERE {where_clause} 
     ORDER BY f.PeriodEnd DESC;
-    """
+    """, params)
     
     logger.info(f"Executing regular financial data query: {query}")
     result = db.execute_query(query)
@@ -170,16 +185,16 @@ def query_regular_data(db, company_id, metric_name, period_term=None, consolidat
         logger.warning(f"No data found for regular financial query")
         
         # Get available SubHeads for this company as a fallback
-        fallback_query = f"""
+        fallback_query = BoundQuery("""
         SELECT DISTINCT h.SubHeadID, h.SubHeadName, t.term, con.consolidationname
         FROM tbl_financialrawdata f
         JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
         JOIN tbl_terms t ON f.TermID = t.TermID
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-        WHERE f.CompanyID = {company_id}
-        AND h.SubHeadName LIKE '%{metric_name}%'
+        WHERE f.CompanyID = :company_id
+        AND LOWER(h.SubHeadName) LIKE :pattern
         ORDER BY h.SubHeadName
-        """
+        """, {'company_id': company_id, 'pattern': like_pattern(metric_name)})
         
         fallback_result = db.execute_query(fallback_query)
         
@@ -239,19 +254,23 @@ def query_ratio_data(db, company_id, metric_name, period_term=None, consolidatio
             return query_regular_data(db, company_id, metric_name, period_term, consolidation_id)
     
     # Build the SQL query for ratio data
-    where_clauses = [f"r.CompanyID = {company_id}", f"r.SubHeadID = {head_id}"]
+    where_clauses = ["r.CompanyID = :company_id", "r.SubHeadID = :head_id"]
+    params = {'company_id': company_id, 'head_id': head_id}
     
     if period_end is not None:
-        where_clauses.append(f"r.PeriodEnd = '{period_end}'")
+        where_clauses.append("r.PeriodEnd = :period_end")
+        params['period_end'] = period_end
     elif term_id is not None:
-        where_clauses.append(f"r.TermID = {term_id}")
+        where_clauses.append("r.TermID = :term_id")
+        params['term_id'] = term_id
     
     if consolidation_id is not None:
-        where_clauses.append(f"r.ConsolidationID = {consolidation_id}")
+        where_clauses.append("r.ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     where_clause = " AND ".join(where_clauses)
     
-    query = f"""
+    query = BoundQuery(f"""
     SELECT r.Value_ AS Value, 
            u.unitname AS Unit, 
            t.term AS Term, 
@@ -268,7 +287,7 @@ def query_ratio_data(db, company_id, metric_name, period_term=None, consolidatio
     JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID 
     WHERE {where_clause} 
     ORDER BY r.PeriodEnd DESC;
-    """
+    """, params)
     
     logger.info(f"Executing ratio data query: {query}")
     result = db.execute_query(query)
@@ -277,16 +296,16 @@ def query_ratio_data(db, company_id, metric_name, period_term=None, consolidatio
         logger.warning(f"No data found for ratio query")
         
         # Get available SubHeads for this company as a fallback
-        fallback_query = f"""
+        fallback_query = BoundQuery("""
         SELECT DISTINCT rh.SubHeadID, rh.HeadNames, t.term, con.consolidationname
         FROM tbl_ratiorawdata r
         JOIN tbl_ratiosheadmaster rh ON r.SubHeadID = rh.SubHeadID
         JOIN tbl_terms t ON r.TermID = t.TermID
         JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID
-        WHERE r.CompanyID = {company_id}
-        AND rh.HeadNames LIKE '%{metric_name}%'
+        WHERE r.CompanyID = :company_id
+        AND LOWER(rh.HeadNames) LIKE :pattern
         ORDER BY rh.HeadNames
-        """
+        """, {'company_id': company_id, 'pattern': like_pattern(metric_name)})
         
         fallback_result = db.execute_query(fallback_query)
         
@@ -343,21 +362,25 @@ def query_ttm_data(db, company_id, metric_name, period_term=None, consolidation_
         return query_dissection_data(db, company_id, clean_metric_name, period_term, consolidation_id, dissection_group_id, 'ttm', head_id)
     
     # Build the SQL query for TTM data
-    where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
+    where_clauses = ["f.CompanyID = :company_id", "f.SubHeadID = :head_id"]
+    params = {'company_id': company_id, 'head_id': head_id}
     
     if period_end is not None:
-        where_clauses.append(f"f.PeriodEnd = '{period_end}'")
+        where_clauses.append("f.PeriodEnd = :period_end")
+        params['period_end'] = period_end
     elif term_id is not None:
-        where_clauses.append(f"f.TermID = {term_id}")
+        where_clauses.append("f.TermID = :term_id")
+        params['term_id'] = term_id
     
     if consolidation_id is not None:
-        where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses.append("f.ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     where_clause = " AND ".join(where_clauses)
     
     # Use the appropriate table and join based on whether it's a ratio or regular metric
     if is_ratio:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -374,9 +397,9 @@ def query_ttm_data(db, company_id, metric_name, period_term=None, consolidation_
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY f.PeriodEnd DESC;
-        """
+        """, params)
     else:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -393,7 +416,7 @@ def query_ttm_data(db, company_id, metric_name, period_term=None, consolidation_
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY f.PeriodEnd DESC;
-        """
+        """, params)
     
     logger.info(f"Executing TTM data query: {query}")
     result = db.execute_query(query)
@@ -403,27 +426,27 @@ def query_ttm_data(db, company_id, metric_name, period_term=None, consolidation_
         
         # Get available SubHeads for this company as a fallback
         if is_ratio:
-            fallback_query = f"""
+            fallback_query = BoundQuery("""
             SELECT DISTINCT rh.SubHeadID, rh.HeadNames, t.term, con.consolidationname
             FROM tbl_ratiorawdataTTM f
             JOIN tbl_ratiosheadmaster rh ON f.SubHeadID = rh.SubHeadID
             JOIN tbl_terms t ON f.TermID = t.TermID
             JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-            WHERE f.CompanyID = {company_id}
-            AND rh.HeadNames LIKE '%{clean_metric_name}%'
+            WHERE f.CompanyID = :company_id
+            AND LOWER(rh.HeadNames) LIKE :pattern
             ORDER BY rh.HeadNames
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(clean_metric_name)})
         else:
-            fallback_query = f"""
+            fallback_query = BoundQuery("""
             SELECT DISTINCT h.SubHeadID, h.SubHeadName, t.term, con.consolidationname
             FROM tbl_financialrawdataTTM f
             JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
             JOIN tbl_terms t ON f.TermID = t.TermID
             JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-            WHERE f.CompanyID = {company_id}
-            AND h.SubHeadName LIKE '%{clean_metric_name}%'
+            WHERE f.CompanyID = :company_id
+            AND LOWER(h.SubHeadName) LIKE :pattern
             ORDER BY h.SubHeadName
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(clean_metric_name)})
         
         fallback_result = db.execute_query(fallback_query)
         
@@ -480,21 +503,25 @@ def query_quarterly_data(db, company_id, metric_name, period_term=None, consolid
         return query_dissection_data(db, company_id, clean_metric_name, period_term, consolidation_id, dissection_group_id, 'quarter', head_id)
     
     # Build the SQL query for quarterly data
-    where_clauses = [f"f.CompanyID = {company_id}", f"f.SubHeadID = {head_id}"]
+    where_clauses = ["f.CompanyID = :company_id", "f.SubHeadID = :head_id"]
+    params = {'company_id': company_id, 'head_id': head_id}
     
     if period_end is not None:
-        where_clauses.append(f"f.PeriodEnd = '{period_end}'")
+        where_clauses.append("f.PeriodEnd = :period_end")
+        params['period_end'] = period_end
     elif term_id is not None:
-        where_clauses.append(f"f.TermID = {term_id}")
+        where_clauses.append("f.TermID = :term_id")
+        params['term_id'] = term_id
     
     if consolidation_id is not None:
-        where_clauses.append(f"f.ConsolidationID = {consolidation_id}")
+        where_clauses.append("f.ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     where_clause = " AND ".join(where_clauses)
     
     # Use the appropriate table and join based on whether it's a ratio or regular metric
     if is_ratio:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -511,9 +538,9 @@ def query_quarterly_data(db, company_id, metric_name, period_term=None, consolid
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY f.PeriodEnd DESC;
-        """
+        """, params)
     else:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT f.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -530,7 +557,7 @@ def query_quarterly_data(db, company_id, metric_name, period_term=None, consolid
         JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY f.PeriodEnd DESC;
-        """
+        """, params)
     
     logger.info(f"Executing quarterly data query: {query}")
     result = db.execute_query(query)
@@ -540,27 +567,27 @@ def query_quarterly_data(db, company_id, metric_name, period_term=None, consolid
         
         # Get available SubHeads for this company as a fallback
         if is_ratio:
-            fallback_query = f"""
+            fallback_query = BoundQuery("""
             SELECT DISTINCT rh.SubHeadID, rh.HeadNames, t.term, con.consolidationname
             FROM tbl_ratiorawdata_Quarter f
             JOIN tbl_ratiosheadmaster rh ON f.SubHeadID = rh.SubHeadID
             JOIN tbl_terms t ON f.TermID = t.TermID
             JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-            WHERE f.CompanyID = {company_id}
-            AND rh.HeadNames LIKE '%{clean_metric_name}%'
+            WHERE f.CompanyID = :company_id
+            AND LOWER(rh.HeadNames) LIKE :pattern
             ORDER BY rh.HeadNames
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(clean_metric_name)})
         else:
-            fallback_query = f"""
+            fallback_query = BoundQuery("""
             SELECT DISTINCT h.SubHeadID, h.SubHeadName, t.term, con.consolidationname
             FROM tbl_financialrawdata_Quarter f
             JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
             JOIN tbl_terms t ON f.TermID = t.TermID
             JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-            WHERE f.CompanyID = {company_id}
-            AND h.SubHeadName LIKE '%{clean_metric_name}%'
+            WHERE f.CompanyID = :company_id
+            AND LOWER(h.SubHeadName) LIKE :pattern
             ORDER BY h.SubHeadName
-            """
+            """, {'company_id': company_id, 'pattern': like_pattern(clean_metric_name)})
         
         fallback_result = db.execute_query(fallback_query)
         
@@ -650,25 +677,25 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
     logger.info(f"Using dissection table: {table_name} for data type: {data_type}")
     
     # Build the SQL query for dissection data
-    where_clauses = [
-        f"d.CompanyID = {company_id}", 
-        f"d.SubHeadID = {head_id}",
-        f"d.DisectionGroupID = {dissection_group_id}"
-    ]
+    where_clauses = ["d.CompanyID = :company_id", "d.SubHeadID = :head_id", "d.DisectionGroupID = :dissection_group_id"]
+    params = {'company_id': company_id, 'head_id': head_id, 'dissection_group_id': dissection_group_id}
     
     if period_end is not None:
-        where_clauses.append(f"d.PeriodEnd = '{period_end}'")
+        where_clauses.append("d.PeriodEnd = :period_end")
+        params['period_end'] = period_end
     elif term_id is not None:
-        where_clauses.append(f"d.TermID = {term_id}")
+        where_clauses.append("d.TermID = :term_id")
+        params['term_id'] = term_id
     
     if consolidation_id is not None:
-        where_clauses.append(f"d.ConsolidationID = {consolidation_id}")
+        where_clauses.append("d.ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     where_clause = " AND ".join(where_clauses)
     
     # Use the appropriate join based on whether it's a ratio or regular metric
     if is_ratio:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT d.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -686,9 +713,9 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
         JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY d.PeriodEnd DESC;
-        """
+        """, params)
     else:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT d.Value_ AS Value, 
                u.unitname AS Unit, 
                t.term AS Term, 
@@ -706,7 +733,7 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
         JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID 
         WHERE {where_clause} 
         ORDER BY d.PeriodEnd DESC;
-        """
+        """, params)
     
     logger.info(f"Executing dissection data query: {query}")
     result = db.execute_query(query)
@@ -720,7 +747,7 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
         where_clause = " AND ".join(where_clauses)
         
         if is_ratio:
-            query = f"""
+            query = BoundQuery(f"""
             SELECT d.Value_ AS Value, 
                    u.unitname AS Unit, 
                    t.term AS Term, 
@@ -738,9 +765,9 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
             JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID 
             WHERE {where_clause} 
             ORDER BY d.PeriodEnd DESC;
-            """
+            """, params)
         else:
-            query = f"""
+            query = BoundQuery(f"""
             SELECT d.Value_ AS Value, 
                    u.unitname AS Unit, 
                    t.term AS Term, 
@@ -758,7 +785,7 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
             JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID 
             WHERE {where_clause} 
             ORDER BY d.PeriodEnd DESC;
-            """
+            """, params)
         
         logger.info(f"Trying dissection query without DisectionGroupID filter: {query}")
         result = db.execute_query(query)
@@ -773,29 +800,29 @@ def query_dissection_data(db, company_id, metric_name, period_term=None, consoli
             
             # Get available SubHeads for this company as a fallback
             if is_ratio:
-                fallback_query = f"""
+                fallback_query = BoundQuery(f"""
                 SELECT DISTINCT d.SubHeadID, rh.HeadNames, d.DisectionGroupID, t.term, con.consolidationname, COUNT(*) as count
                 FROM {table_name} d
                 JOIN tbl_ratiosheadmaster rh ON d.SubHeadID = rh.SubHeadID
                 JOIN tbl_terms t ON d.TermID = t.TermID
                 JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID
-                WHERE d.CompanyID = {company_id}
-                AND LOWER(rh.HeadNames) LIKE '%{metric_name.lower()}%'
+                WHERE d.CompanyID = :company_id
+                AND LOWER(rh.HeadNames) LIKE :pattern
                 GROUP BY d.SubHeadID, rh.HeadNames, d.DisectionGroupID, t.term, con.consolidationname
                 ORDER BY count DESC
-                """
+                """, {'company_id': company_id, 'pattern': like_pattern(metric_name)})
             else:
-                fallback_query = f"""
+                fallback_query = BoundQuery(f"""
                 SELECT DISTINCT d.SubHeadID, h.SubHeadName, d.DisectionGroupID, t.term, con.consolidationname, COUNT(*) as count
                 FROM {table_name} d
                 JOIN tbl_headsmaster h ON d.SubHeadID = h.SubHeadID
                 JOIN tbl_terms t ON d.TermID = t.TermID
                 JOIN tbl_consolidation con ON d.ConsolidationID = con.ConsolidationID
-                WHERE d.CompanyID = {company_id}
-                AND LOWER(h.SubHeadName) LIKE '%{metric_name.lower()}%'
+                WHERE d.CompanyID = :company_id
+                AND LOWER(h.SubHeadName) LIKE :pattern
                 GROUP BY d.SubHeadID, h.SubHeadName, d.DisectionGroupID, t.term, con.consolidationname
                 ORDER BY count DESC
-                """
+                """, {'company_id': company_id, 'pattern': like_pattern(metric_name)})
             
             fallback_result = db.execute_query(fallback_query)
             
@@ -844,14 +871,17 @@ def resolve_relative_period(db, company_id, metric_name, period_term, consolidat
         logger.info(f"Using detected dissection data type: {dissection_data_type}")
     
     # Build the query to get the latest period_end and term_id based on data type
-    where_clauses = [f"CompanyID = {company_id}", f"SubHeadID = {head_id}"]
+    where_clauses = ["CompanyID = :company_id", "SubHeadID = :head_id"]
+    params = {'company_id': company_id, 'head_id': head_id}
     
     if consolidation_id is not None:
-        where_clauses.append(f"ConsolidationID = {consolidation_id}")
+        where_clauses.append("ConsolidationID = :consolidation_id")
+        params['consolidation_id'] = consolidation_id
     
     # Add DisectionGroupID filter for dissection data
     if data_type == 'dissection' and dissection_group_id is not None:
-        where_clauses.append(f"DisectionGroupID = {dissection_group_id}")
+        where_clauses.append("DisectionGroupID = :dissection_group_id")
+        params['dissection_group_id'] = dissection_group_id
     
     where_clause = " AND ".join(where_clauses)
     
@@ -884,50 +914,50 @@ def resolve_relative_period(db, company_id, metric_name, period_term, consolidat
     
     # Handle different relative period terms
     if normalized_period_term in ['most recent', 'latest', 'last reported', 'current period', 'current']:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 PeriodEnd, TermID 
         FROM {table_name} 
         WHERE {where_clause} 
         ORDER BY PeriodEnd DESC
-        """
+        """, params)
     elif normalized_period_term in ['ytd', 'year to date']:
         # Get the current year
         current_year = datetime.now().year
         
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 PeriodEnd, TermID 
         FROM {table_name} 
         WHERE {where_clause} 
-        AND YEAR(PeriodEnd) = {current_year} 
+        AND YEAR(PeriodEnd) = :current_year 
         ORDER BY PeriodEnd DESC
-        """
+        """, {**params, 'current_year': current_year})
     elif normalized_period_term in ['previous year', 'last year']:
         # Get the previous year
         previous_year = datetime.now().year - 1
         
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 PeriodEnd, TermID 
         FROM {table_name} 
         WHERE {where_clause} 
-        AND YEAR(PeriodEnd) = {previous_year} 
+        AND YEAR(PeriodEnd) = :previous_year 
         ORDER BY PeriodEnd DESC
-        """
+        """, {**params, 'previous_year': previous_year})
     elif normalized_period_term in ['previous quarter', 'last quarter']:
-        query = f"""
+        query = BoundQuery(f"""
         SELECT PeriodEnd, TermID 
         FROM {table_name} 
         WHERE {where_clause} 
         ORDER BY PeriodEnd DESC 
         OFFSET 1 ROWS FETCH NEXT 1 ROWS ONLY
-        """
+        """, params)
     else:
         logger.warning(f"Unrecognized period term: {period_term}, defaulting to most recent")
-        query = f"""
+        query = BoundQuery(f"""
         SELECT TOP 1 PeriodEnd, TermID 
         FROM {table_name} 
         WHERE {where_clause} 
         ORDER BY PeriodEnd DESC
-        """
+        """, params)
     
     logger.info(f"Executing query to resolve relative period: {query}")
     result = db.execute_query(query)
@@ -940,7 +970,7 @@ def resolve_relative_period(db, company_id, metric_name, period_term, consolidat
             where_clauses = [clause for clause in where_clauses if 'DisectionGroupID' not in clause]
             where_clause = " AND ".join(where_clauses)
             
-            query = query.replace(f"WHERE {where_clause}", f"WHERE {where_clause}")
+            query = BoundQuery(query.replace(f"WHERE {where_clause}", f"WHERE {where_clause}"), query.params)
             logger.info(f"Executing query without DisectionGroupID filter: {query}")
             result = db.execute_query(query)
     
@@ -11,10 +11,47 @@ from typing import Dict, Any, Optional, Union, List, Tuple
 from app.core.database.financial_db import FinancialDatabase
 from app.core.database.fix_head_id import get_available_head_id
 from app.core.database.query_builder import build_financial_query
+from app.core.database.query_catalog import BoundQuery, like_pattern
+from app.core.database.query_planner import QueryPlan
 from app.core.database.term_resolution import get_term_id
 
 logger = logging.getLogger(__name__)
 
+# Company mentions: "... for/of <company> ..." and "<company>'s <metric>"
+COMPANY_PATTERNS = [
+    r"(?:for|of)\s+([A-Za-z0-9\s]+?)(?:'s|\s+(?:in|for|from|on|at|during|by|with|and|or|\.|,|$))",
+    r"([A-Za-z0-9\s]+?)(?:'s)\s+(?:revenue|profit|eps|pe|roe|roa|debt|assets|liabilities|equity|ratio)"
+]
+
+# Metric name -> patterns of the ways questions refer to it
+METRIC_PATTERNS = {
+    "Revenue": [r"revenue", r"sales", r"top\s*line"],
+    "Net Income": [r"net\s*income", r"profit", r"earnings", r"bottom\s*line"],
+    "EPS": [r"eps", r"earnings\s*per\s*share"],
+    "PE Ratio": [r"pe\s*ratio", r"price\s*to\s*earnings"],
+    "ROE": [r"roe", r"return\s*on\s*equity"],
+    "ROA": [r"roa", r"return\s*on\s*assets"],
+    "Debt to Equity Ratio": [r"debt\s*to\s*equity", r"d/e\s*ratio"],
+    "Total Assets": [r"total\s*assets", r"assets"],
+    "Total Liabilities": [r"total\s*liabilities", r"liabilities"],
+    "Total Equity": [r"total\s*equity", r"equity", r"shareholder\s*equity"]
+}
+
+# Period name -> patterns of the ways questions refer to it
+PERIOD_PATTERNS = {
+    "TTM": [r"ttm", r"trailing\s*twelve\s*months", r"trailing\s*12\s*months"],
+    "Q1": [r"q1", r"first\s*quarter", r"1st\s*quarter"],
+    "Q2": [r"q2", r"second\s*quarter", r"2nd\s*quarter"],
+    "Q3": [r"q3", r"third\s*quarter", r"3rd\s*quarter"],
+    "Q4": [r"q4", r"fourth\s*quarter", r"4th\s*quarter"],
+    "3M": [r"3\s*months", r"three\s*months", r"3m"],
+    "6M": [r"6\s*months", r"six\s*months", r"6m", r"half\s*year"],
+    "9M": [r"9\s*months", r"nine\s*months", r"9m"],
+    "12M": [r"12\s*months", r"twelve\s*months", r"12m", r"annual", r"yearly", r"full\s*year"],
+    "Most Recent Period": [r"most\s*recent", r"latest", r"current", r"last\s*reported"],
+    "YTD": [r"ytd", r"year\s*to\s*date"]
+}
+
 def process_query(query: str, db: FinancialDatabase) -> Dict[str, Any]:
     """
     Process a natural language financial query and return the result.
@@ -77,32 +114,14 @@ def extract_entities(query: str) -> Dict[str, Any]:
     }
     
     # Extract company
-    company_patterns = [
-        r"(?:for|of)\s+([A-Za-z0-9\s]+?)(?:'s|\s+(?:in|for|from|on|at|during|by|with|and|or|\.|,|$))",
-        r"([A-Za-z0-9\s]+?)(?:'s)\s+(?:revenue|profit|eps|pe|roe|roa|debt|assets|liabilities|equity|ratio)"
-    ]
-    
-    for pattern in company_patterns:
+    for pattern in COMPANY_PATTERNS:
         company_match = re.search(pattern, query, re.IGNORECASE)
         if company_match:
             entities["company"] = company_match.group(1).strip()
             break
     
     # Extract metric
-    metric_patterns = {
-        "Revenue": [r"revenue", r"sales", r"top\s*line"],
-        "Net Income": [r"net\s*income", r"profit", r"earnings", r"bottom\s*line"],
-        "EPS": [r"eps", r"earnings\s*per\s*share"],
-        "PE Ratio": [r"pe\s*ratio", r"price\s*to\s*earnings"],
-        "ROE": [r"roe", r"return\s*on\s*equity"],
-        "ROA": [r"roa", r"return\s*on\s*assets"],
-        "Debt to Equity Ratio": [r"debt\s*to\s*equity", r"d/e\s*ratio"],
-        "Total Assets": [r"total\s*assets", r"assets"],
-        "Total Liabilities": [r"total\s*liabilities", r"liabilities"],
-        "Total Equity": [r"total\s*equity", r"equity", r"shareholder\s*equity"]
-    }
-    
-    for metric_name, patterns in metric_patterns.items():
+    for metric_name, patterns in METRIC_PATTERNS.items():
         for pattern in patterns:
             if re.search(pattern, query, re.IGNORECASE):
                 entities["metric"] = metric_name
@@ -111,21 +130,7 @@ def extract_entities(query: str) -> Dict[str, Any]:
             break
     
     # Extract period
-    period_patterns = {
-        "TTM": [r"ttm", r"trailing\s*twelve\s*months", r"trailing\s*12\s*months"],
-        "Q1": [r"q1", r"first\s*quarter", r"1st\s*quarter"],
-        "Q2": [r"q2", r"second\s*quarter", r"2nd\s*quarter"],
-        "Q3": [r"q3", r"third\s*quarter", r"3rd\s*quarter"],
-        "Q4": [r"q4", r"fourth\s*quarter", r"4th\s*quarter"],
-        "3M": [r"3\s*months", r"three\s*months", r"3m"],
-        "6M": [r"6\s*months", r"six\s*months", r"6m", r"half\s*year"],
-        "9M": [r"9\s*months", r"nine\s*months", r"9m"],
-        "12M": [r"12\s*months", r"twelve\s*months", r"12m", r"annual", r"yearly", r"full\s*year"],
-        "Most Recent Period": [r"most\s*recent", r"latest", r"current", r"last\s*reported"],
-        "YTD": [r"ytd", r"year\s*to\s*date"]
-    }
-    
-    for period_name, patterns in period_patterns.items():
+    for period_name, patterns in PERIOD_PATTERNS.items():
         for pattern in patterns:
             if re.search(pattern, query, re.IGNORECASE):
                 entities["period"] = period_name
@@ -244,6 +249,10 @@ def execute_financial_query(entities: Dict[str, Any], db: FinancialDatabase) ->
     """
     logger.info(f"Executing financial query with entities: {entities}")
     
+    # Explicit periods run as one ranked statement over the head's raw data tables
+    if not entities.get("is_relative", False):
+        return execute_planned_query(entities, db)
+    
     # Build the SQL query
     sql_query = build_financial_query(
         db=db,
@@ -281,43 +290,65 @@ def execute_financial_query(entities: Dict[str, Any], db: FinancialDatabase) ->
     logger.info(f"Formatted result: {formatted_result}")
     return formatted_result
 
-def get_company_id(company_name: str, db: FinancialDatabase) -> Optional[int]:
+def execute_planned_query(entities: Dict[str, Any], db: FinancialDatabase) -> Dict[str, Any]:
     """
-    Get company ID from company name or symbol.
+    Read the value for validated entities with a QueryPlan: the regular / Quarter / TTM or
+    ratio table fallbacks are ranked in one statement instead of probed one by one.
     
     Args:
-        company_name: Company name or symbol
+        entities: Dictionary of validated entities
         db: FinancialDatabase instance
         
     Returns:
-        Company ID if found, None otherwise
+        Dictionary containing the query result and the plan's round trips
     """
-    logger.info(f"Getting company ID for: {company_name}")
+    heads = [(entities["head_id"], entities["is_ratio"])]
+    plan = QueryPlan(company_id=entities["company_id"], consolidation_id=entities["consolidation_id"],
+                     term_id=entities.get("term_id"), fiscal_year=entities.get("fiscal_year"),
+                     period_end=entities.get("period_end"), heads=heads,
+                     branches=db.plan_branches(heads, entities.get("term_id")))
+    sql_query = plan.statement()
+    result = db.run_plan(plan)
     
-    # Try exact match on company name
-    query = f"""
-    SELECT CompanyID FROM tbl_companieslist 
-    WHERE CompanyName = '{company_name}' OR Symbol = '{company_name}'
-    """
+    if result.empty:
+        raise ValueError("No data found for the given parameters")
     
-    result = db.execute_query(query)
+    row = result.iloc[0]
+    formatted_result = {
+        "value": float(row["Value"]),
+        "unit": row["Unit"],
+        "term": row["Term"],
+        "company": row["Company"],
+        "metric": row["Metric"],
+        "consolidation": row["Consolidation"],
+        "period_end": row["PeriodEnd"].strftime("%Y-%m-%d") if row["PeriodEnd"] else None,
+        "sql_query": sql_query,
+        "round_trips": plan.round_trips,
+    }
     
-    if not result.empty:
-        company_id = int(result.iloc[0]["CompanyID"])
-        logger.info(f"Found company ID: {company_id} for exact match: {company_name}")
-        return company_id
+    logger.info(f"Formatted result: {formatted_result}")
+    return formatted_result
+
+def get_company_id(company_name: str, db: FinancialDatabase) -> Optional[int]:
+    """
+    Get company ID from company name or symbol.
     
-    # Try contains match on company name
-    query = f"""
-    SELECT CompanyID, CompanyName FROM tbl_companieslist 
-    WHERE CompanyName LIKE '%{company_name}%' OR Symbol LIKE '%{company_name}%'
+    Args:
+        company_name: Company name or symbol
+        db: FinancialDatabase instance
+        
+    Returns:
+        Company ID if found, None otherwise
     """
+    logger.info(f"Getting company ID for: {company_name}")
     
-    result = db.execute_query(query)
+    # Ticker, exact name, then fuzzy name match against the cached companies table
+    match = db.get_company_resolver().resolve(company_name)
     
-    if not result.empty:
-        company_id = int(result.iloc[0]["CompanyID"])
-        logger.info(f"Found company ID: {company_id} for contains match: {company_name}")
+    if match is not None:
+        company_id, matched_name, match_type, score = match
+        company_id = int(company_id)
+        logger.info(f"Found company ID: {company_id} for {match_type} match: {company_name} -> {matched_name} (score {score})")
         return company_id
     
     logger.warning(f"Company not found: {company_name}")
@@ -336,42 +367,12 @@ def get_company_metadata(company_id: int, db: FinancialDatabase) -> Dict[str, An
     """
     logger.info(f"Getting company metadata for company ID: {company_id}")
     
-    # Query for company metadata
-    query = f"""
-    SELECT c.CompanyID, c.CompanyName, c.SectorID, s.SectorName
-    FROM tbl_companieslist c
-    LEFT JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-    WHERE c.CompanyID = {company_id}
-    """
-    
-    company_result = db.execute_query(query)
-    
-    if company_result.empty:
+    # Sector and industry come from the memoized company context instead of per-call queries
+    company_data = db.get_company_metadata(company_id)
+    if not company_data:
         logger.warning(f"Company metadata not found for company ID: {company_id}")
         return {}
     
-    company_data = {
-        "company_id": company_result.iloc[0]["CompanyID"],
-        "company_name": company_result.iloc[0]["CompanyName"],
-        "sector_id": company_result.iloc[0]["SectorID"],
-        "sector_name": company_result.iloc[0]["SectorName"]
-    }
-    
-    # Get industry information if sector ID is available
-    if company_data["sector_id"]:
-        industry_query = f"""
-        SELECT i.IndustryID, i.IndustryName
-        FROM tbl_industrynames i
-        JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-        WHERE m.sectorid = {company_data['sector_id']}
-        """
-        
-        industry_result = db.execute_query(industry_query)
-        
-        if not industry_result.empty:
-            company_data["industry_id"] = industry_result.iloc[0]["IndustryID"]
-            company_data["industry_name"] = industry_result.iloc[0]["IndustryName"]
-    
     logger.info(f"Company metadata: {company_data}")
     return company_data
 
@@ -416,36 +417,40 @@ def get_head_id(metric: str, company_id: int, sector_id: Optional[int], industry
     # If no available head ID, try to get basic head ID without data validation
     if is_ratio:
         # For ratio metrics, search in tbl_ratiosheadmaster
-        query = f"""
+        query = """
         SELECT rh.SubHeadID
         FROM tbl_ratiosheadmaster rh
-        WHERE rh.HeadNames = '{metric}'
+        WHERE rh.HeadNames = :metric
         """
+        params = {'metric': metric}
         
         if sector_id and industry_id:
-            query += f"""
+            query += """
             AND rh.IndustryID IN (
                 SELECT industryid FROM tbl_industryandsectormapping
-                WHERE sectorid = {sector_id} AND industryid = {industry_id}
+                WHERE sectorid = :sector_id AND industryid = :industry_id
             )
             """
+            params.update(sector_id=sector_id, industry_id=industry_id)
     else:
         # For regular metrics, search in tbl_headsmaster
-        query = f"""
+        query = """
         SELECT h.SubHeadID
         FROM tbl_headsmaster h
-        WHERE h.SubHeadName = '{metric}'
+        WHERE h.SubHeadName = :metric
         """
+        params = {'metric': metric}
         
         if sector_id and industry_id:
-            query += f"""
+            query += """
             AND h.IndustryID IN (
                 SELECT industryid FROM tbl_industryandsectormapping
-                WHERE sectorid = {sector_id} AND industryid = {industry_id}
+                WHERE sectorid = :sector_id AND industryid = :industry_id
             )
             """
+            params.update(sector_id=sector_id, industry_id=industry_id)
     
-    result = db.execute_query(query)
+    result = db.execute_query(query, params)
     
     if not result.empty:
         head_id = int(result.iloc[0]["SubHeadID"])
@@ -454,35 +459,39 @@ def get_head_id(metric: str, company_id: int, sector_id: Optional[int], industry
     
     # If still no head ID, try contains match
     if is_ratio:
-        query = f"""
+        query = """
         SELECT rh.SubHeadID
         FROM tbl_ratiosheadmaster rh
-        WHERE rh.HeadNames LIKE '%{metric}%'
+        WHERE LOWER(rh.HeadNames) LIKE :pattern
         """
+        params = {'pattern': like_pattern(metric)}
         
         if sector_id and industry_id:
-            query += f"""
+            query += """
             AND rh.IndustryID IN (
                 SELECT industryid FROM tbl_industryandsectormapping
-                WHERE sectorid = {sector_id} AND industryid = {industry_id}
+                WHERE sectorid = :sector_id AND industryid = :industry_id
             )
             """
+            params.update(sector_id=sector_id, industry_id=industry_id)
     else:
-        query = f"""
+        query = """
         SELECT h.SubHeadID
         FROM tbl_headsmaster h
-        WHERE h.SubHeadName LIKE '%{metric}%'
+        WHERE LOWER(h.SubHeadName) LIKE :pattern
         """
+        params = {'pattern': like_pattern(metric)}
         
         if sector_id and industry_id:
-            query += f"""
+            query += """
             AND h.IndustryID IN (
                 SELECT industryid FROM tbl_industryandsectormapping
-                WHERE sectorid = {sector_id} AND industryid = {industry_id}
+                WHERE sectorid = :sector_id AND industryid = :industry_id
             )
             """
+            params.update(sector_id=sector_id, industry_id=industry_id)
     
-    result = db.execute_query(query)
+    result = db.execute_query(query, params)
     
     if not result.empty:
         head_id = int(result.iloc[0]["SubHeadID"])
@@ -505,10 +514,10 @@ def get_consolidation_id(consolidation: str, db: FinancialDatabase) -> Optional[
     """
     logger.info(f"Getting consolidation ID for: {consolidation}")
     
-    query = f"""
+    query = BoundQuery("""
     SELECT ConsolidationID FROM tbl_consolidation 
-    WHERE consolidationname = '{consolidation}'
-    """
+    WHERE consolidationname = :consolidation
+    """, {'consolidation': consolidation})
     
     result = db.execute_query(query)
     
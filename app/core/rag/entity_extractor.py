@@ -0,0 +1,320 @@
+'''
+Author: AI Assistant
+Date: 2024-06-03
+Description: Deterministic entity extractor over gazetteers of the loaded companies, heads and terms
+'''
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils import logger
+
+from app.core.database.company_resolver import CompanyResolver, normalize_name, strip_suffixes
+from app.core.database.detect_dissection_metrics import is_dissection_metric
+from app.core.database.metric_index import MetricIndex
+from app.core.process_query import COMPANY_PATTERNS, METRIC_PATTERNS, PERIOD_PATTERNS
+
+# Confidence of each kind of match; the extraction's confidence is the lowest of company, metric and term
+EXACT_SCORE = 1.0
+ALIAS_SCORE = 0.85
+RELATIVE_SCORE = 0.9
+PARTIAL_TERM_SCORE = 0.8
+LOWERCASE_TICKER_SCORE = 0.7
+FUZZY_COMPANY_FACTOR = 0.8
+RESIDUAL_METRIC_SCORE = 0.5
+UNKNOWN_METRIC_SCORE = 0.2
+
+# Longest company / head names looked up, in words
+MAX_COMPANY_WORDS = 6
+MAX_METRIC_WORDS = 8
+
+# Relative period type -> pattern, checked in order (mirrors FinancialRAG's relative term detection)
+RELATIVE_PATTERNS = [
+    ('ytd', r"\bytd\b|\byear[\s-]*to[\s-]*date\b"),
+    ('last_quarter', r"\blast\s+(?:reported\s+)?quarter\b"),
+    ('current', r"\bcurrent\b"),
+    ('most_recent_quarter', r"\bmost\s+recent\b|\blatest\b|\blast\s+available\b|\blast\s+reported\b"),
+]
+
+# DisectionGroupID -> phrase in a question, and the suffix is_dissection_metric recognises
+DISSECTION_PHRASES = {
+    1: (r"(?:/\s*share|\bper[\s-]*share)\b", 'per share'),
+    2: (r"\b(?:annual|yoy|year[\s-]*over[\s-]*year)\s+growth(?:\s+rate)?\b", 'annual growth'),
+    3: (r"(?:\bpercentage|\bpercent|%)\s*of\s+(?:total\s+)?assets?\b", '% of asset'),
+    4: (r"(?:\bpercentage|\bpercent|%)\s*of\s+(?:total\s+)?(?:sales|revenue)\b", '% of revenue'),
+    5: (r"\b(?:quarterly|qoq|q/q|quarter[\s-]*over[\s-]*quarter)\s+growth(?:\s+rate)?\b", 'quarterly growth'),
+}
+
+DATE_PATTERNS = [
+    (r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", ('year', 'month', 'day')),
+    (r"\b(\d{1,2})[-/](\d{1,2})[-/](\d{4})\b", ('day', 'month', 'year')),
+]
+YEAR_PATTERN = r"\b(fy\s*|fiscal\s+year\s*)?((?:19|20)\d{2})\b"
+CONSOLIDATION_PATTERNS = [
+    ('Unconsolidated', r"\b(?:un-?consolidated|standalone|stand-alone|separate|not\s+consolidated)\b"),
+    ('Consolidated', r"\bconsolidated\b"),
+]
+
+# Words never taken for a ticker, and left out of a residual metric phrase
+RESERVED_WORDS = {'eps', 'roe', 'roa', 'pe', 'ttm', 'fy', 'ytd', 'q1', 'q2', 'q3', 'q4'}
+STOPWORDS = {'what', 'whats', 'was', 'is', 'are', 'were', 'the', 'a', 'an', 'of', 'for', 'in', 'on', 'at', 'by',
+             'with', 'and', 'to', 'me', 'show', 'give', 'tell', 'get', 'find', 'value', 'values', 'period',
+             'periodend', 'quarter', 'quarterly', 'year', 'as', 'its', 'their', 'please', 'how', 'much', 'did',
+             'does', 'do', 'has', 'have', 'had', 'company', 'reported', 'available', 'rate', 's'}
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_POSSESSIVE_RE = re.compile(r"['’]s\b")
+
+
+def _mask(text: str, start: int, end: int) -> str:
+    """
+    Blank out text[start:end], keeping every other offset in place
+    """
+    return text[:start] + ' ' * (end - start) + text[end:]
+
+
+def _words(text: str) -> List[Tuple[int, int, str]]:
+    return [(m.start(), m.end(), m.group()) for m in _WORD_RE.finditer(text)]
+
+
+def _longest_phrase(words: List[Tuple[int, int, str]], lookup: Dict[str, Any],
+                    max_words: int) -> Optional[Tuple[int, int, int, Any]]:
+    """
+    Longest run of words whose normalized text is a key of lookup, earliest on ties
+
+    Returns:
+        Tuple of (start, end, number of words, lookup value), or None
+    """
+    best = None
+    for i in range(len(words)):
+        for n in range(min(max_words, len(words) - i), 0, -1):
+            if best is not None and n <= best[2]:
+                break
+            phrase = " ".join(word.lower() for _, _, word in words[i:i + n])
+            if phrase in lookup:
+                best = (words[i][0], words[i + n - 1][1], n, lookup[phrase])
+                break
+    return best
+
+
+class EntityExtractor:
+    """
+    Pulls company, metric, term and consolidation out of a question without the LLM.
+
+    Companies are matched against the tickers and names of the company resolver, metrics
+    against the head names of the metric index and the METRIC_PATTERNS aliases, terms against
+    PERIOD_PATTERNS, the loaded term names, dates and relative-period keywords. Every field
+    carries a score; the extraction's confidence is the lowest one, so the caller can hand
+    unclear questions to the LLM.
+    """
+
+    def __init__(self, company_resolver: CompanyResolver, metric_index: MetricIndex,
+                 term_names: Iterable[str] = ()):
+        """
+        Args:
+            company_resolver: Resolver over tbl_companieslist
+            metric_index: Index over tbl_headsmaster / tbl_ratiosheadmaster
+            term_names: Names of tbl_terms ('3M', 'Q1', 'TTM', ...)
+        """
+        self.company_resolver = company_resolver
+        self.metric_index = metric_index
+        # Normalized head name -> (head name, is_ratio); regular heads win over ratio heads
+        self.heads: Dict[str, Tuple[str, bool]] = {}
+        for is_ratio, table in ((False, metric_index.heads), (True, metric_index.ratio_heads)):
+            for name in table.names:
+                self.heads.setdefault(normalize_name(name), (name, is_ratio))
+        self.terms = {normalize_name(name): name for name in term_names if isinstance(name, str) and name.strip()}
+        self.aliases = [(metric_name, re.compile(rf"\b{pattern}\b", re.IGNORECASE))
+                        for metric_name, patterns in METRIC_PATTERNS.items() for pattern in patterns]
+        self.periods = [(period_name, re.compile(rf"\b{pattern}\b", re.IGNORECASE))
+                        for period_name, patterns in PERIOD_PATTERNS.items()
+                        if period_name not in ('Most Recent Period', 'YTD') for pattern in patterns]
+        logger.info(f"Entity extractor built: {len(company_resolver)} companies, {len(self.heads)} head names, "
+                    f"{len(self.terms)} terms")
+
+    @classmethod
+    def from_database(cls, db) -> 'EntityExtractor':
+        """
+        Build the gazetteers from a FinancialDatabase's loaded metadata
+        """
+        terms_df = db.metadata_cache.get('terms')
+        term_names = terms_df['term'].tolist() if terms_df is not None and 'term' in terms_df.columns else []
+        return cls(db.get_company_resolver(), db.get_metric_index(), term_names)
+
+    def _company(self, text: str) -> Tuple[Optional[str], float, Optional[Tuple[int, int]]]:
+        resolver = self.company_resolver
+        words = _words(text)
+        names = {}
+        for i in range(len(words)):
+            for n in range(1, min(MAX_COMPANY_WORDS, len(words) - i) + 1):
+                phrase = " ".join(word.lower() for _, _, word in words[i:i + n])
+                if len(phrase) < 3:
+                    continue
+                pos = resolver.exact_names.get(phrase, resolver.exact_names.get(strip_suffixes(phrase)))
+                if pos is not None:
+                    names[phrase] = pos
+        match = _longest_phrase(words, names, MAX_COMPANY_WORDS)
+        if match is not None:
+            start, end, _, pos = match
+            return resolver.names[pos], EXACT_SCORE, (start, end)
+
+        lowercase = None
+        for start, end, word in words:
+            pos = resolver.tickers.get(word.lower())
+            if pos is None or word.lower() in RESERVED_WORDS:
+                continue
+            if word.isupper():
+                return resolver.names[pos], EXACT_SCORE, (start, end)
+            if lowercase is None and len(word) >= 3 and word.lower() not in STOPWORDS:
+                lowercase = (resolver.names[pos], LOWERCASE_TICKER_SCORE, (start, end))
+        if lowercase is not None:
+            return lowercase
+
+        for pattern in COMPANY_PATTERNS:
+            found = re.search(pattern, text, re.IGNORECASE)
+            if found and found.group(1).strip():
+                resolved = resolver.resolve(found.group(1).strip())
+                if resolved is not None:
+                    return resolved[1], resolved[3] * FUZZY_COMPANY_FACTOR, found.span(1)
+        return None, 0.0, None
+
+    def _metric(self, text: str) -> Optional[Tuple[str, float, Tuple[int, int]]]:
+        """
+        Longest head name or alias in text, a head name winning ties
+        """
+        best = None
+        head = _longest_phrase(_words(text), self.heads, MAX_METRIC_WORDS)
+        if head is not None:
+            start, end, n, (name, _) = head
+            best = (n, 1, name, EXACT_SCORE, (start, end))
+        for metric_name, pattern in self.aliases:
+            for found in pattern.finditer(text):
+                n = len(_words(found.group()))
+                if best is None or (n, 0) > best[:2]:
+                    best = (n, 0, metric_name, ALIAS_SCORE, found.span())
+        return best[2:] if best is not None else None
+
+    def _residual_metric(self, text: str) -> Tuple[Optional[str], float]:
+        words = [word for _, _, word in _words(text) if word.lower() not in STOPWORDS
+                 and not re.fullmatch(r"(?:19|20)\d{2}|\d+", word)]
+        if not words:
+            return None, 0.0
+        phrase = " ".join(words)
+        if self.metric_index.resolve(phrase, prefer_ratio=False) is not None:
+            return phrase, RESIDUAL_METRIC_SCORE
+        return phrase, UNKNOWN_METRIC_SCORE
+
+    def _term(self, text: str) -> Tuple[Optional[str], float, str]:
+        family = None
+        for period_name, pattern in self.periods:
+            found = pattern.search(text)
+            if found:
+                family = period_name
+                text = _mask(text, *found.span())
+                break
+        if family is None:
+            for start, end, word in _words(text):
+                if word.lower() in self.terms:
+                    family = self.terms[word.lower()]
+                    text = _mask(text, start, end)
+                    break
+
+        year, is_fiscal = None, False
+        found = re.search(YEAR_PATTERN, text, re.IGNORECASE)
+        if found:
+            year, is_fiscal = found.group(2), bool(found.group(1))
+            text = _mask(text, *found.span())
+
+        if family is not None and family.upper() == 'TTM':
+            return 'TTM', EXACT_SCORE, text
+        if family is not None:
+            return (f"{family} {year}", EXACT_SCORE, text) if year else (family, PARTIAL_TERM_SCORE, text)
+        if year:
+            return f"FY {year}", EXACT_SCORE if is_fiscal else PARTIAL_TERM_SCORE, text
+        return None, 0.0, text
+
+    def extract(self, query: str) -> Dict[str, Any]:
+        """
+        Extract the entities of a question
+
+        Args:
+            query: Natural language question
+
+        Returns:
+            Dict with company, metric, term, consolidation, is_relative_term, relative_type,
+            is_dissection, dissection_group_id, dissection_data_type, period_end (when the
+            question has a date), the per-field scores and confidence (the lowest of the
+            company, metric and term scores)
+        """
+        text = _POSSESSIVE_RE.sub('  ', query)
+        entities: Dict[str, Any] = {'is_relative_term': False, 'relative_type': None}
+        scores = {}
+
+        # Dates: the period end is looked up directly, as FinancialRAG does for dated terms
+        for pattern, order in DATE_PATTERNS:
+            found = re.search(pattern, text)
+            if found:
+                parts = dict(zip(order, found.groups()))
+                entities['period_end'] = f"{parts['year']}-{int(parts['month']):02d}-{int(parts['day']):02d}"
+                text = _mask(text, *found.span())
+                break
+
+        entities['consolidation'] = 'Unconsolidated'
+        for consolidation, pattern in CONSOLIDATION_PATTERNS:
+            found = re.search(pattern, text, re.IGNORECASE)
+            if found:
+                entities['consolidation'] = consolidation
+                text = _mask(text, *found.span())
+                break
+
+        for relative_type, pattern in RELATIVE_PATTERNS:
+            found = re.search(pattern, text, re.IGNORECASE)
+            if found:
+                entities['is_relative_term'], entities['relative_type'] = True, relative_type
+                text = _mask(text, *found.span())
+                break
+
+        entities['company'], scores['company'], span = self._company(text)
+        if span is not None:
+            text = _mask(text, *span)
+
+        # A dissection phrase is kept out of the metric unless a head name or alias covers it
+        # ('earnings per share')
+        dissection = None
+        for pattern, suffix in DISSECTION_PHRASES.values():
+            found = re.search(pattern, text, re.IGNORECASE)
+            if found:
+                dissection = (found.span(), suffix)
+                break
+        metric = self._metric(text)
+        if dissection is not None and not (metric is not None and metric[2][0] <= dissection[0][0]
+                                           and metric[2][1] >= dissection[0][1]):
+            text = _mask(text, *dissection[0])
+            metric = self._metric(text)
+        else:
+            dissection = None
+        if metric is not None:
+            name, scores['metric'], span = metric
+            text = _mask(text, *span)
+        else:
+            name, scores['metric'] = None, 0.0
+
+        entities['term'], scores['term'], text = self._term(text)
+        if name is None:
+            name, scores['metric'] = self._residual_metric(text)
+        if name is not None and dissection is not None:
+            name = f"{name} {dissection[1]}"
+        entities['metric'] = name
+
+        if 'period_end' in entities:
+            entities['term'], scores['term'] = entities['term'] or '3M', EXACT_SCORE
+        elif entities['is_relative_term']:
+            entities['term'] = entities['term'] or 'TTM'
+            scores['term'] = max(scores['term'], RELATIVE_SCORE)
+
+        is_dissection, dissection_group_id, dissection_data_type = is_dissection_metric(name) if name else (False, None, None)
+        entities.update(is_dissection=is_dissection, dissection_group_id=dissection_group_id,
+                        dissection_data_type=dissection_data_type)
+        entities['scores'] = scores
+        entities['confidence'] = min(scores['company'], scores['metric'], scores['term'])
+        return entities
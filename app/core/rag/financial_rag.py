@@ -5,11 +5,15 @@ Description: Financial RAG system integrating Mistral and SQL database
 '''
 
 import os
-from typing import Dict, List, Optional, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 from utils import logger
 
+from conf import config
 from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
 from app.core.chat.mistral_chat import MistralChat
+from app.core.rag.entity_extractor import EntityExtractor
 
 class FinancialRAG:
     def __init__(self, server: str, database: str, model_path: str = "Mistral-7B-Instruct-v0.1.Q4_K_M.gguf"):
@@ -26,9 +30,79 @@ class FinancialRAG:
         
         # Load metadata on initialization
         self.db.load_metadata()
+
+        # Build the data-availability index so head existence checks stay in memory
+        try:
+            self.db.build_availability_index()
+        except Exception as e:
+            logger.error(f"Error building availability index, existence checks will query the database: {e}")
+
+        # Build the latest-period index so relative periods ('latest', 'last quarter', 'ytd') resolve in memory
+        try:
+            self.db.build_period_index()
+        except Exception as e:
+            logger.error(f"Error building period index, relative periods will query the database: {e}")
+
+        # The ratio screener and the sector / industry aggregates for compare_to_peers read whole
+        # raw tables, so they load in the background
+        self.db.update_ratio_screener_in_background()
+        self.db.update_peer_aggregates_in_background()
+
+        # Gazetteers of the loaded companies, heads and terms for rule-based entity extraction,
+        # as (db.metadata_version, extractor); rebuilt when the metadata is reinstalled
+        self._entity_extractor: Optional[Tuple[int, EntityExtractor]] = None
+        self.get_entity_extractor()
         logger.info("Financial RAG system initialized")
     
-    def _extract_entities(self, query: str) -> Dict[str, str]:
+    def close(self) -> None:
+        """
+        Stop the inference workers and the database's background threads
+        """
+        self.mistral.close()
+        self.db.close()
+
+    def get_entity_extractor(self) -> EntityExtractor:
+        """
+        Get the rule-based entity extractor, rebuilding it when the database has installed
+        new metadata since it was built (e.g. after a stale snapshot was revalidated)
+        """
+        built = self._entity_extractor
+        version = self.db.metadata_version
+        if built is None or built[0] != version:
+            built = (version, EntityExtractor.from_database(self.db))
+            self._entity_extractor = built
+        return built[1]
+    
+    def _extract_entities(self, query: str) -> Dict[str, Any]:
+        """
+        Extract financial entities from a natural language query
+        
+        The deterministic extractor answers when its confidence reaches
+        config.ENTITY_CONFIDENCE_THRESHOLD; otherwise Mistral extracts the entities and the
+        rule-based values fill in whatever it leaves empty.
+        
+        Args:
+            query: Natural language query
+            
+        Returns:
+            Dictionary with the keys of _extract_entities_llm plus confidence, the rule-based
+            extraction's confidence
+        """
+        entities = self.get_entity_extractor().extract(query)
+        if entities['confidence'] >= config.ENTITY_CONFIDENCE_THRESHOLD:
+            logger.info(f"Rule-based entity extraction (confidence {entities['confidence']:.2f}): {entities}")
+            return entities
+        
+        logger.info(f"Rule-based entity extraction confidence {entities['confidence']:.2f} is below "
+                    f"{config.ENTITY_CONFIDENCE_THRESHOLD}, asking Mistral")
+        llm_entities = self._extract_entities_llm(query)
+        for key in ('company', 'metric', 'term'):
+            if not llm_entities.get(key) and entities.get(key):
+                llm_entities[key] = entities[key]
+        llm_entities['confidence'] = entities['confidence']
+        return llm_entities
+    
+    def _extract_entities_llm(self, query: str) -> Dict[str, str]:
         """
         Extract financial entities from a natural language query using Mistral
         
@@ -238,121 +312,155 @@ class FinancialRAG:
         
         return entities
     
-    def process_query(self, query: str) -> str:
+    def _lookup(self, query: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
-        Process a natural language financial query
+        Extract the entities of a query and look up its financial data
         
         Args:
             query: Natural language query
             
         Returns:
-            Response with financial information including values for the requested metrics
+            Tuple of (entities, financial_data); financial_data holds only 'message', the reply
+            to send, when the query is missing a company, metric or period
         """
-        try:
-            # Extract entities from the query
-            entities = self._extract_entities(query)
-            logger.info(f"Extracted entities: {entities}")
-            
-            # Check if we have the required entities
-            if not all(k in entities for k in ["company", "metric", "term"]):
-                missing = [k for k in ["company", "metric", "term"] if k not in entities]
-                return f"I couldn't extract all the required information from your query. Missing: {', '.join(missing)}"
-                
-            # Ensure term is not empty
-            if not entities["term"].strip():
-                # If this is a relative term query, set a default term
-                if entities.get("is_relative_term", False):
-                    entities["term"] = "TTM"
-                    logger.info("Setting default term 'TTM' for empty relative term")
-                else:
-                    return f"I couldn't determine the time period from your query. Please specify a time period like 'Q1 2023' or 'latest'."
-            
-            # Get company metadata for better context
-            company_id = self.db.get_company_id(entities["company"])
-            if company_id is not None:
-                # Get sector and industry information
-                sector_query = f"""
-                SELECT c.SectorID, s.SectorName 
-                FROM tbl_companieslist c
-                JOIN tbl_sectornames s ON c.SectorID = s.SectorID
-                WHERE c.CompanyID = {company_id}
-                """
-                sector_result = self.db.execute_query(sector_query)
-                
-                if not sector_result.empty:
-                    sector_id = sector_result.iloc[0]['SectorID']
-                    sector_name = sector_result.iloc[0]['SectorName']
-                    logger.info(f"Company {entities['company']} is in sector: {sector_name} (ID: {sector_id})")
-                    
-                    # Get industry information
-                    industry_query = f"""
-                    SELECT i.IndustryID, i.IndustryName 
-                    FROM tbl_industrynames i
-                    JOIN tbl_industryandsectormapping m ON i.IndustryID = m.industryid
-                    WHERE m.sectorid = {sector_id}
-                    """
-                    industry_result = self.db.execute_query(industry_query)
-                    
-                    if not industry_result.empty:
-                        industry_id = industry_result.iloc[0]['IndustryID']
-                        industry_name = industry_result.iloc[0]['IndustryName']
-                        logger.info(f"Company {entities['company']} is in industry: {industry_name} (ID: {industry_id})")
-                        
-                        # Log available metrics for this industry-sector combination
-                        metrics_query = f"""
-                        SELECT h.SubHeadID, h.SubHeadName
-                        FROM tbl_headsmaster h
-                        """
-                        metrics_result = self.db.execute_query(metrics_query)
-                        
-                        if not metrics_result.empty:
-                            logger.info(f"Found {len(metrics_result)} metrics for this industry-sector combination")
-                            # Check if the requested metric is similar to any available metrics
-                            similar_metrics = []
-                            for _, row in metrics_result.iterrows():
-                                if entities["metric"].lower() in row['SubHeadName'].lower() or \
-                                   any(token in row['SubHeadName'].lower() for token in entities["metric"].lower().split()):
-                                    similar_metrics.append(row['SubHeadName'])
-                            
-                            if similar_metrics:
-                                logger.info(f"Found similar metrics to '{entities['metric']}': {similar_metrics[:5]}")
-            
-            # Get financial data from the database using enhanced query logic
-            # Get financial data with relative term handling
-            is_relative_term = entities.get("is_relative_term", False)
-            relative_term_type = entities.get("relative_term_type", None)
-            relative_type = entities.get("relative_type", None)
-            
-            period_end = entities.get("period_end", None)
+        # Extract entities from the query
+        entities = self._extract_entities(query)
+        logger.info(f"Extracted entities: {entities}")
+        
+        # Check if we have the required entities
+        if not all(k in entities for k in ["company", "metric", "term"]):
+            missing = [k for k in ["company", "metric", "term"] if k not in entities]
+            return entities, {"message": f"I couldn't extract all the required information from your query. Missing: {', '.join(missing)}"}
             
-            # Get consolidation_id for dissection filtering
-            consolidation_id = None
-            if entities.get("consolidation", "unconsolidated") == "consolidated":
-                consolidation_id = 1
+        # Ensure term is not empty
+        if not entities["term"].strip():
+            # If this is a relative term query, set a default term
+            if entities.get("is_relative_term", False):
+                entities["term"] = "TTM"
+                logger.info("Setting default term 'TTM' for empty relative term")
             else:
-                consolidation_id = 2  # unconsolidated
+                return entities, {"message": "I couldn't determine the time period from your query. Please specify a time period like 'Q1 2023' or 'latest'."}
+        
+        # Get company metadata for better context
+        company_id = self.db.get_company_id(entities["company"])
+        if company_id is not None:
+            # Get sector and industry information
+            context = self.db.get_company_context(company_id)
+            if context is not None:
+                logger.info(f"Company {entities['company']} is in sector: {context.sector_name} (ID: {context.sector_id}), "
+                            f"industry: {context.industry_name} (ID: {context.industry_id})")
             
-            financial_data = self.db.get_financial_data(
-                entities["company"], 
-                entities["metric"], 
-                entities["term"],
-                entities.get("consolidation", "unconsolidated"),
-                period_end,
-                is_relative_term,
-                relative_term_type,
-                relative_type,
-                company_id=company_id,
-                consolidation_id=consolidation_id
-            )
+            # Log metrics similar to the requested one
+            similar_metrics = self.db.get_metric_index().similar(entities["metric"])
+            if similar_metrics:
+                logger.info(f"Found similar metrics to '{entities['metric']}': {similar_metrics}")
+        
+        # Get financial data from the database using enhanced query logic
+        # Get financial data with relative term handling
+        is_relative_term = entities.get("is_relative_term", False)
+        relative_term_type = entities.get("relative_term_type", None)
+        relative_type = entities.get("relative_type", None)
+        
+        period_end = entities.get("period_end", None)
+        
+        # Get consolidation_id for dissection filtering
+        consolidation_id = None
+        if entities.get("consolidation", "unconsolidated") == "consolidated":
+            consolidation_id = 1
+        else:
+            consolidation_id = 2  # unconsolidated
+        
+        financial_data = self.db.get_financial_data(
+            entities["company"], 
+            entities["metric"], 
+            entities["term"],
+            entities.get("consolidation", "unconsolidated"),
+            period_end,
+            is_relative_term,
+            relative_term_type,
+            relative_type,
+            company_id=company_id,
+            consolidation_id=consolidation_id,
+            context=QueryContext()
+        )
+        
+        return entities, financial_data
+    
+    def process_query(self, query: str, narrate: Optional[bool] = None) -> str:
+        """
+        Process a natural language financial query
+        
+        Args:
+            query: Natural language query
+            narrate: Whether Mistral writes the answer instead of the answer template;
+                defaults to config.ANSWER_NARRATION
             
-            # Generate response using Mistral
-            response = self.mistral.financial_rag_response(financial_data, query)
+        Returns:
+            Response with financial information including values for the requested metrics
+        """
+        try:
+            entities, financial_data = self._lookup(query)
+            if "message" in financial_data:
+                return financial_data["message"]
+            
+            # Render the answer, with Mistral narration only when requested
+            response = self.mistral.financial_rag_response(financial_data, query, metric=entities["metric"],
+                                                           narrate=narrate)
             
             return response
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return f"I'm sorry, I encountered an error while processing your query: {str(e)}"
     
+    def process_query_stream(self, query: str, narrate: Optional[bool] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Streaming variant of process_query
+        
+        The looked-up value is yielded as soon as the database returns it, before the answer
+        is rendered or generated.
+        
+        Args:
+            query: Natural language query
+            narrate: Whether Mistral writes the answer instead of the answer template;
+                defaults to config.ANSWER_NARRATION
+            
+        Yields:
+            ('data', financial_data) once the lookup returned, then ('token', text) chunks of the answer
+        """
+        try:
+            entities, financial_data = self._lookup(query)
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            yield "token", f"I'm sorry, I encountered an error while processing your query: {str(e)}"
+            return
+        if "message" in financial_data:
+            yield "token", financial_data["message"]
+            return
+        
+        yield "data", financial_data
+        for chunk in self.mistral.financial_rag_response_stream(financial_data, query, metric=entities["metric"],
+                                                                narrate=narrate):
+            yield "token", chunk
+    
+    def process_queries(self, queries: List[str], max_workers: int = 4) -> List[str]:
+        """
+        Process several natural language queries concurrently on a thread pool
+        
+        Each query resolves with its own QueryContext, so database round trips for
+        different questions overlap; Mistral generation is serialized by MistralChat.
+        
+        Args:
+            queries: Natural language queries
+            max_workers: Maximum number of queries processed at the same time
+            
+        Returns:
+            Responses in the same order as queries
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return list(executor.map(self.process_query, queries))
+    
     def get_rag_result(self, init_inputs: Dict[str, Any], messages: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, Any]]]:
         """
         Get RAG result for integration with FinRAG server
@@ -384,4 +492,27 @@ class FinancialRAG:
             "source": "Financial Database"
         }
         
-        return response, [retrieval_result]
\ No newline at end of file
+        return response, [retrieval_result]
+    
+    def get_rag_result_stream(self, init_inputs: Dict[str, Any], messages: List[Dict[str, str]]) -> Iterator[Tuple[str, Any]]:
+        """
+        Streaming variant of get_rag_result for the FinRAG server's /chat/stream
+        
+        Args:
+            init_inputs: Initial inputs from the FinRAG server
+            messages: List of chat messages
+            
+        Yields:
+            Events of process_query_stream for the latest user query
+        """
+        user_query = ""
+        for message in reversed(messages):
+            if message["role"].lower() == "user":
+                user_query = message["content"]
+                break
+        
+        if not user_query:
+            yield "token", "I couldn't find a user query to process."
+            return
+        
+        yield from self.process_query_stream(user_query)
@@ -7,11 +7,12 @@ Description: file content
 """
 
 import time
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 import requests
 import httpx
 import uvicorn
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
 import os
@@ -41,6 +42,8 @@ try:
             model_path=model_path
         )
         logger.info("Financial RAG system initialized successfully")
+        # Open pooled connections now so the first questions skip the ODBC login
+        financial_rag.db.warmup(config.DB_POOL_WARMUP)
     else:
         logger.error(f"Mistral model not found at {model_path}")
         financial_rag = None
@@ -82,8 +85,82 @@ def notify_another(notify_msg: Notify):
     # print('Content:', response.message)
     return response
 
+def is_financial_question(messages):
+    """Whether the latest user message asks for financial data the Financial RAG system can answer"""
+    if financial_rag is None:
+        return False
+    # Check if the latest user message contains financial keywords
+    for message in reversed(messages):
+        if message["role"] == "user":
+            content = message["content"].lower()
+            financial_keywords = ["eps", "revenue", "profit", "financial", "quarter", "q1", "q2", "q3", "q4", 
+                                 "roe", "ratio", "balance sheet", "income statement", "consolidated", "standalone"]
+            return any(keyword in content for keyword in financial_keywords)
+    return False
+
+
+def format_chunks(retrieval_results):
+    chunks = [{
+        "index": x[1],
+        "chunk": x[2],
+        "score": x[0]
+    } for x in retrieval_results]
+    logger.info("chunks"+str(chunks))
+    return chunks
+
+
+def suggest_questions(messages):
+    """Three follow-up questions for a conversation that ends with the assistant's answer"""
+    suggestedQuestions = open_chat.chat(messages + [{
+        "role": "user",
+        "content": "根据上面我们的历史对话，为我推荐三个接下来我可能要问的问题。每个问题以？结尾"
+    }])
+    try:
+        suggestedQuestions = suggestedQuestions.split('？')
+        suggestedQuestions=[x.strip() for x in suggestedQuestions[:3]]
+    except:
+        suggestedQuestions = [suggestedQuestions]
+    return suggestedQuestions
+
+
+def summarize_chat_name(messages, chatName):
+    """Title for a new knowledge Q&A conversation, summarized by the model"""
+    if chatName != "知识问答助手":
+        return chatName
+    try:
+        new_messages = [
+        {
+            "role":"system",
+            "content":"你是一位得力的助手"
+        },
+        {
+            "role":"user",
+            "content":config.DIALOGUE_SUMMARY.format(context=str(messages))
+        }
+        ]
+        chatName = open_chat.chat(new_messages)
+            
+        logger.info("大模型总结的chatName:"+str(chatName))
+    except:
+        chatName = chatName
+    return chatName
+
+
+def sse_event(event, data):
+    """One Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
 app = FastAPI()
 
+
+@app.on_event("shutdown")
+def shutdown():
+    # Stop the inference worker processes and the database's prefetch threads and connections
+    if financial_rag is not None:
+        financial_rag.close()
+
+
 @app.post("/chat")
 async def chat(query: Query):
     logger.info("Entering Chat")
@@ -107,67 +184,25 @@ async def chat(query: Query):
         category_ids = initInputs.get("categoryIds", [])
         
         # Check if this is a financial query
-        is_financial_query = False
-        if financial_rag is not None:
-            # Check if the latest user message contains financial keywords
-            for message in reversed(messages):
-                if message["role"] == "user":
-                    content = message["content"].lower()
-                    financial_keywords = ["eps", "revenue", "profit", "financial", "quarter", "q1", "q2", "q3", "q4", 
-                                         "roe", "ratio", "balance sheet", "income statement", "consolidated", "standalone"]
-                    
-                    if any(keyword in content for keyword in financial_keywords):
-                        is_financial_query = True
-                    break
+        is_financial_query = is_financial_question(messages)
         
         if len(category_ids) == 0 and not is_financial_query:
             # Open domain question answering
             logger.info("Entering open domain Q&A, answer generated by the model!")
-            response = open_chat.chat(messages)
-        elif is_financial_query and financial_rag is not None:
-            # Financial RAG
+            response = await asyncio.to_thread(open_chat.chat, messages)
+        elif is_financial_query:
+            # Financial RAG; extraction and generation block, so they run off the event loop
             logger.info("Entering Financial RAG Q&A!")
-            response, retrieval_results = financial_rag.get_rag_result(initInputs, messages)
+            response, retrieval_results = await asyncio.to_thread(financial_rag.get_rag_result, initInputs, messages)
         else:
             # Regular RAG
             logger.info("Entering RAG Q&A, answer generated based on knowledge base!")
-            response, retrieval_results = cmc.get_rag_result(initInputs, messages)
+            response, retrieval_results = await asyncio.to_thread(cmc.get_rag_result, initInputs, messages)
             if len(retrieval_results):
-                chunks = [{
-                    "index": x[1],
-                    "chunk": x[2],
-                    "score": x[0]
-                } for x in retrieval_results]
-                logger.info("chunks"+str(chunks))
+                chunks = format_chunks(retrieval_results)
         messages.append({"role": "assistant", "content": response})
-        messages.append({
-            "role": "user",
-            "content": "根据上面我们的历史对话，为我推荐三个接下来我可能要问的问题。每个问题以？结尾"
-        })
-        suggestedQuestions = open_chat.chat(messages)
-        try:
-            suggestedQuestions = suggestedQuestions.split('？')
-            suggestedQuestions=[x.strip() for x in suggestedQuestions[:3]]
-        except:
-            suggestedQuestions = [suggestedQuestions]
-            
-        if chatName == "知识问答助手":
-            try:
-                new_messages = [
-                {
-                    "role":"system",
-                    "content":"你是一位得力的助手"
-                },
-                {
-                    "role":"user",
-                    "content":config.DIALOGUE_SUMMARY.format(context=str(messages[:-1]))
-                }
-                ]
-                chatName = open_chat.chat(new_messages)
-                    
-                logger.info("大模型总结的chatName:"+str(chatName))
-            except:
-                chatName = chatName
+        suggestedQuestions = await asyncio.to_thread(suggest_questions, messages)
+        chatName = await asyncio.to_thread(summarize_chat_name, messages, chatName)
 
         return {
             "code": "000000",
@@ -190,6 +225,103 @@ async def chat(query: Query):
         return ErrorMsg.to_dict()
 
 
+def chat_events(query: Query):
+    """
+    Events of /chat/stream: the looked-up value as soon as the SQL returns, the answer token
+    by token, then the suggested questions and the chat name. StreamingResponse iterates this
+    generator in its thread pool, so the blocking calls stay off the event loop.
+    """
+    messages = [{
+        "role": x.get("role").lower(),
+        "content": x.get("rawContent")
+    } for x in query.chatMessages]
+
+    try:
+        category_ids = query.initInputs.get("categoryIds", [])
+        is_financial_query = is_financial_question(messages)
+        answer = []
+
+        if len(category_ids) == 0 and not is_financial_query:
+            logger.info("Entering open domain Q&A (stream), answer generated by the model!")
+            for token in open_chat.chat_stream(messages):
+                answer.append(token)
+                yield sse_event("token", {"text": token})
+        elif is_financial_query:
+            logger.info("Entering Financial RAG Q&A (stream)!")
+            for event, payload in financial_rag.get_rag_result_stream(query.initInputs, messages):
+                if event == "token":
+                    answer.append(payload)
+                    payload = {"text": payload}
+                yield sse_event(event, payload)
+        else:
+            logger.info("Entering RAG Q&A (stream), answer generated based on knowledge base!")
+            response, retrieval_results = cmc.get_rag_result(query.initInputs, messages)
+            if len(retrieval_results):
+                yield sse_event("chunks", format_chunks(retrieval_results))
+            answer.append(response)
+            yield sse_event("token", {"text": response})
+
+        response = "".join(answer)
+        messages.append({"role": "assistant", "content": response})
+        yield sse_event("suggestions", suggest_questions(messages))
+        yield sse_event("done", {
+            "chatId": query.chatId,
+            "chatName": summarize_chat_name(messages, query.chatName),
+            "answer": response,
+        })
+    except Exception as e:
+        logger.error(f"RAG问答出错，请检查！{e}")
+        yield sse_event("error", ErrorMsg.to_dict())
+
+
+@app.post("/chat/stream")
+async def chat_stream(query: Query):
+    """Streaming variant of /chat over Server-Sent Events"""
+    logger.info("Entering Chat (stream)")
+    return StreamingResponse(chat_events(query), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/metrics/db")
+async def db_metrics():
+    """MSSQL connection pool state, checkout wait and timeout counters"""
+    if financial_rag is None:
+        return ErrorMsg.to_dict()
+    result = SuccessMsg.to_dict()
+    result["data"] = financial_rag.db.get_pool_metrics()
+    return result
+
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """get_financial_data result cache size, hit / miss, eviction and invalidation counters"""
+    if financial_rag is None:
+        return ErrorMsg.to_dict()
+    result = SuccessMsg.to_dict()
+    result["data"] = financial_rag.db.get_result_cache_stats()
+    return result
+
+
+@app.get("/metrics/inference")
+async def inference_metrics():
+    """Mistral worker pool layout, queued and running requests, and request outcome counters"""
+    if financial_rag is None or financial_rag.mistral.pool is None:
+        return ErrorMsg.to_dict()
+    result = SuccessMsg.to_dict()
+    result["data"] = financial_rag.mistral.pool.stats()
+    return result
+
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(company_id: Optional[int] = None):
+    """Drop cached financial data results for one company (or all), e.g. after new data was loaded"""
+    if financial_rag is None:
+        return ErrorMsg.to_dict()
+    result = SuccessMsg.to_dict()
+    result["data"] = {"removed": financial_rag.db.invalidate_cached_results(company_id)}
+    return result
+
+
 async def async_update(item:Item):
     try:
         logger.info("开始更新向量")
@@ -20,6 +20,50 @@ STORAGE_TYPE="local" # oss # 使用loca还是osss[新增功能]
 STORAGE_DIR="/data/storage/" # 本地文件 [新增功能]
 if not os.path.exists(CACHE_DIR):
     os.mkdir(CACHE_DIR)
+
+# MSSQL (MGFinancials) 连接池配置
+DB_POOL_SIZE = 5 # 连接池常驻连接数
+DB_MAX_OVERFLOW = 10 # 高峰时允许额外打开的连接数
+DB_POOL_TIMEOUT = 10 # 等待空闲连接的最长秒数
+DB_POOL_RECYCLE = 1800 # 连接使用超过该秒数后重建, 避免被服务器或防火墙断开
+DB_POOL_PRE_PING = True # 取出连接前先检测是否可用
+DB_POOL_WARMUP = 2 # 启动时预先建立的连接数
+DB_LOGIN_TIMEOUT = 15 # ODBC 登录超时(秒)
+DB_QUERY_TIMEOUT = 30 # 单条SQL语句超时(秒), 超时后驱动取消该语句, 0 表示不限制
+
+# get_financial_data 结果缓存 (LRU + TTL)
+RESULT_CACHE_MAX_ENTRIES = 4096 # 最多缓存的结果条数, 0 表示关闭缓存
+RESULT_CACHE_TTL = 900 # 结果缓存有效期(秒), 过期后重新查询, 以便读到新入库的数据
+
+# 元数据加载
+METADATA_LOAD_WORKERS = 4 # 并发加载元数据表的线程数(每个线程占用一个连接池连接)
+METADATA_SNAPSHOT = True # 启动时优先读取 CACHE_DIR 下的元数据快照, 并在后台与数据库校验
+
+# 批量查询 (get_financial_data_batch)
+BATCH_MAX_PARAMS = 2000 # 每条SQL最多绑定的参数个数, SQL Server 上限为 2100
+
+# 时间序列 (get_time_series)
+SERIES_CACHE_MAX_ENTRIES = 256 # 最多缓存的时间序列条数, 0 表示关闭; 有效期同 RESULT_CACHE_TTL
+
+# 报表预取 (prefetch_statement)
+STATEMENT_PREFETCH = True # 查到一个科目后, 用一条查询取回同一报表的全部科目放入结果缓存, 供追问直接命中
+STATEMENT_PREFETCH_WORKERS = 2 # 后台预取线程数; 预取在回答返回后进行, 每个线程各占用一个连接池连接
+
+# 实体抽取 (FinancialRAG._extract_entities)
+ENTITY_CONFIDENCE_THRESHOLD = 0.75 # 规则抽取的置信度低于此值时才调用 Mistral 抽取实体
+
+# Mistral 推理进程池 (MistralChat / InferencePool)
+INFERENCE_WORKERS = 2 # 推理工作进程数, 每个进程各加载一份模型; 0 表示在服务进程内直接推理
+INFERENCE_THREADS = 4 # 每个工作进程的生成线程数, WORKERS * THREADS 不宜超过物理核数
+INFERENCE_QUEUE_SIZE = 8 # 所有进程都在生成时最多排队的请求数, 超出后拒绝新请求
+INFERENCE_QUEUE_TIMEOUT = 0 # 队列已满时等待空位的秒数, 0 表示立即拒绝
+INFERENCE_TIMEOUT = 120 # 单个请求从提交到生成结束的期限(秒), 超时后取消
+
+# 回答生成 (MistralChat.financial_rag_response)
+ANSWER_NARRATION = False # 单值结果默认按模板直接生成回答; 设为 True 时仍由 Mistral 复述数据
+
+# 横截面筛选 (screen_companies)
+SCREENER_TOP_N = 50 # 筛选结果默认最多返回的公司数
     
 # 对话内容总结标题的prompt
 DIALOGUE_SUMMARY = """为以下对话内容总结一个标题
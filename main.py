@@ -1,5 +1,6 @@
 import uvicorn
-from app.finrag_server import app
     
 if __name__ == '__main__':
+    # Imported under the guard: inference worker processes re-import this module on start
+    from app.finrag_server import app
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -10,6 +10,9 @@ import pandas as pd
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
 from app.core.database.financial_db import FinancialDatabase
+from conf import config
+from app.core.database.query_catalog import BoundQuery, expand_in_list, like_pattern
+from app.core.database.time_series import period_row
 
 def setup_database():
     """Initialize database connection"""
@@ -19,15 +22,15 @@ def setup_database():
 
 def query_company_info(db, company_name):
     """Query company information including industry and sector"""
-    query = f"""
+    query = BoundQuery("""
     SELECT c.CompanyName, i.IndustryName, s.SectorName, cn.CountryName
     FROM tbl_companieslist c
     JOIN tbl_industryandsectormapping ism ON c.SectorID = ism.sectorid
     JOIN tbl_industrynames i ON ism.industryid = i.IndustryID
     JOIN tbl_sectornames s ON ism.sectorid = s.SectorID
     JOIN tbl_countriesnames cn ON c.CountryID = cn.CountryID
-    WHERE c.CompanyName LIKE '%{company_name}%' OR c.CompanyTicker LIKE '%{company_name}%'
-    """
+    WHERE LOWER(c.CompanyName) LIKE :pattern OR LOWER(c.CompanyTicker) LIKE :pattern
+    """, {'pattern': like_pattern(company_name)})
     
     try:
         result = db.execute_query(query)
@@ -44,15 +47,15 @@ def query_company_info(db, company_name):
 
 def query_companies_by_sector(db, sector_name):
     """Query companies belonging to a specific sector"""
-    query = f"""
+    query = BoundQuery("""
     SELECT c.CompanyName, c.CompanyTicker, i.IndustryName
     FROM tbl_companieslist c
     JOIN tbl_industryandsectormapping ism ON c.SectorID = ism.sectorid
     JOIN tbl_industrynames i ON ism.industryid = i.IndustryID
     JOIN tbl_sectornames s ON ism.sectorid = s.SectorID
-    WHERE s.SectorName LIKE '%{sector_name}%'
+    WHERE LOWER(s.SectorName) LIKE :pattern
     ORDER BY c.CompanyName
-    """
+    """, {'pattern': like_pattern(sector_name)})
     
     try:
         result = db.execute_query(query)
@@ -67,16 +70,16 @@ def query_companies_by_sector(db, sector_name):
 
 def query_companies_by_country_and_sector(db, country_name, sector_name):
     """Query companies from a specific country and sector"""
-    query = f"""
+    query = BoundQuery("""
     SELECT c.CompanyName, c.CompanyTicker, i.IndustryName
     FROM tbl_companieslist c
     JOIN tbl_industryandsectormapping ism ON c.SectorID = ism.sectorid
     JOIN tbl_industrynames i ON ism.industryid = i.IndustryID
     JOIN tbl_sectornames s ON ism.sectorid = s.SectorID
     JOIN tbl_countriesnames cn ON c.CountryID = cn.CountryID
-    WHERE cn.CountryName LIKE '%{country_name}%' AND s.SectorName LIKE '%{sector_name}%'
+    WHERE LOWER(cn.CountryName) LIKE :country_name_pattern AND LOWER(s.SectorName) LIKE :sector_name_pattern
     ORDER BY c.CompanyName
-    """
+    """, {'country_name_pattern': like_pattern(country_name), 'sector_name_pattern': like_pattern(sector_name)})
     
     try:
         result = db.execute_query(query)
@@ -91,14 +94,14 @@ def query_companies_by_country_and_sector(db, country_name, sector_name):
 
 def query_industries_by_sector(db, sector_name):
     """Query industries under a specific sector"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT i.IndustryName
     FROM tbl_industryandsectormapping ism
     JOIN tbl_industrynames i ON ism.industryid = i.IndustryID
     JOIN tbl_sectornames s ON ism.sectorid = s.SectorID
-    WHERE s.SectorName LIKE '%{sector_name}%'
+    WHERE LOWER(s.SectorName) LIKE :pattern
     ORDER BY i.IndustryName
-    """
+    """, {'pattern': like_pattern(sector_name)})
     
     try:
         result = db.execute_query(query)
@@ -113,13 +116,13 @@ def query_industries_by_sector(db, sector_name):
 
 def query_statement_heads(db, statement_name):
     """Query heads belonging to a specific financial statement"""
-    query = f"""
+    query = BoundQuery("""
     SELECT h.SubHeadName
     FROM tbl_headsmaster h
     JOIN tbl_statementsname s ON h.StatementID = s.StatementID
-    WHERE s.StatementName LIKE '%{statement_name}%'
+    WHERE LOWER(s.StatementName) LIKE :pattern
     ORDER BY h.SubHeadName
-    """
+    """, {'pattern': like_pattern(statement_name)})
     
     try:
         result = db.execute_query(query)
@@ -179,7 +182,7 @@ def query_ratio_data(db, company_name, ratio_name, term, consolidation_type="Con
         consolidation_id = db.get_consolidation_id(consolidation_type)
         
         # Direct SQL query for ratio data
-        query = f"""
+        query = BoundQuery("""
         SELECT r.Value_ as Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company,
                h.SubHeadName AS Metric, con.consolidationname AS Consolidation, r.PeriodEnd as PeriodEnd
         FROM tbl_ratiorawdata r
@@ -189,12 +192,12 @@ def query_ratio_data(db, company_name, ratio_name, term, consolidation_type="Con
         JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
         JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID
         JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID
-        WHERE c.CompanyName LIKE '%{company_name}%'
-        AND h.SubHeadName LIKE '%{ratio_name}%'
-        AND t.term LIKE '%{term}%'
-        AND con.consolidationname LIKE '%{consolidation_type}%'
+        WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+        AND LOWER(h.SubHeadName) LIKE :ratio_name_pattern
+        AND LOWER(t.term) LIKE :term_pattern
+        AND LOWER(con.consolidationname) LIKE :consolidation_type_pattern
         ORDER BY r.PeriodEnd DESC
-        """
+        """, {'company_name_pattern': like_pattern(company_name), 'ratio_name_pattern': like_pattern(ratio_name), 'term_pattern': like_pattern(term), 'consolidation_type_pattern': like_pattern(consolidation_type)})
         
         result = db.execute_query(query)
         
@@ -211,13 +214,13 @@ def query_ratio_data(db, company_name, ratio_name, term, consolidation_type="Con
 
 def query_subheads_for_ratio(db, ratio_name):
     """Query subheads available under a specific ratio"""
-    query = f"""
+    query = BoundQuery("""
     SELECT s.SubHeadName
     FROM tbl_ratio_subhead_mapping m
     JOIN tbl_ratiosheadmaster r ON m.RatioHeadID = r.SubHeadID
     JOIN tbl_headsmaster s ON m.SubHeadID = s.SubHeadID
-    WHERE r.SubHeadName LIKE '%{ratio_name}%'
-    """
+    WHERE LOWER(r.SubHeadName) LIKE :pattern
+    """, {'pattern': like_pattern(ratio_name)})
     
     try:
         result = db.execute_query(query)
@@ -232,12 +235,12 @@ def query_subheads_for_ratio(db, ratio_name):
 
 def query_statement_for_head(db, head_name):
     """Query which financial statement a specific head appears in"""
-    query = f"""
+    query = BoundQuery("""
     SELECT s.StatementName
     FROM tbl_headsmaster h
     JOIN tbl_statementsname s ON h.StatementID = s.StatementID
-    WHERE h.SubHeadName LIKE '%{head_name}%'
-    """
+    WHERE LOWER(h.SubHeadName) LIKE :pattern
+    """, {'pattern': like_pattern(head_name)})
     
     try:
         result = db.execute_query(query)
@@ -252,13 +255,13 @@ def query_statement_for_head(db, head_name):
 
 def query_heads_for_metric(db, metric_name):
     """Query which heads are mapped to a specific metric"""
-    query = f"""
+    query = BoundQuery("""
     SELECT h.SubHeadName
     FROM tbl_keystatssubheadsmapping m
     JOIN tbl_keystatsmaster k ON m.KeyStatsID = k.KeyStatsID
     JOIN tbl_headsmaster h ON m.SubHeadID = h.SubHeadID
-    WHERE k.KeyStatsName LIKE '%{metric_name}%'
-    """
+    WHERE LOWER(k.KeyStatsName) LIKE :pattern
+    """, {'pattern': like_pattern(metric_name)})
     
     try:
         result = db.execute_query(query)
@@ -273,7 +276,7 @@ def query_heads_for_metric(db, metric_name):
 
 def query_most_recent_data(db, company_name, metric_name, consolidation_type="Consolidated"):
     """Query the most recent data for a specific company and metric"""
-    query = f"""
+    query = BoundQuery("""
     SELECT TOP 1 f.Value_ as Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company,
            h.SubHeadName AS Metric, con.consolidationname AS Consolidation, f.PeriodEnd as PeriodEnd
     FROM tbl_financialrawdata f
@@ -283,11 +286,11 @@ def query_most_recent_data(db, company_name, metric_name, consolidation_type="Co
     JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
     JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID
     JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND h.SubHeadName LIKE '%{metric_name}%'
-    AND con.consolidationname LIKE '%{consolidation_type}%'
+    WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+    AND LOWER(h.SubHeadName) LIKE :metric_name_pattern
+    AND LOWER(con.consolidationname) LIKE :consolidation_type_pattern
     ORDER BY f.PeriodEnd DESC
-    """
+    """, {'company_name_pattern': like_pattern(company_name), 'metric_name_pattern': like_pattern(metric_name), 'consolidation_type_pattern': like_pattern(consolidation_type)})
     
     try:
         result = db.execute_query(query)
@@ -303,68 +306,39 @@ def query_most_recent_data(db, company_name, metric_name, consolidation_type="Co
         print(f"Error querying most recent data: {e}")
 
 def query_compare_periods(db, company_name, metric_name, period1, period2, consolidation_type="Consolidated"):
-    """Compare data for a company and metric between two periods"""
-    query1 = f"""
-    SELECT f.Value_ as Value, u.unitname AS Unit, t.term AS Term, f.PeriodEnd as PeriodEnd
-    FROM tbl_financialrawdata f
-    JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
-    JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
-    JOIN tbl_terms t ON f.TermID = t.TermID
-    JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
-    JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND h.SubHeadName LIKE '%{metric_name}%'
-    AND t.term LIKE '%{period1}%'
-    AND con.consolidationname LIKE '%{consolidation_type}%'
-    ORDER BY f.PeriodEnd DESC
-    """
-    
-    query2 = f"""
-    SELECT f.Value_ as Value, u.unitname AS Unit, t.term AS Term, f.PeriodEnd as PeriodEnd
-    FROM tbl_financialrawdata f
-    JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
-    JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
-    JOIN tbl_terms t ON f.TermID = t.TermID
-    JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
-    JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND h.SubHeadName LIKE '%{metric_name}%'
-    AND t.term LIKE '%{period2}%'
-    AND con.consolidationname LIKE '%{consolidation_type}%'
-    ORDER BY f.PeriodEnd DESC
-    """
-    
+    """Compare data for a company and metric between two periods, read from one time-series query"""
     try:
-        result1 = db.execute_query(query1)
-        result2 = db.execute_query(query2)
+        series = db.get_time_series(company_name, metric_name, consolidation_type)
         
         print(f"\nComparing {metric_name} for {company_name} between {period1} and {period2}:")
         
-        if not result1.empty:
-            row1 = result1.iloc[0]
-            print(f"{period1}: {row1['Value']} {row1['Unit']} (Period End: {row1['PeriodEnd']})")
+        if series is None:
+            print(f"No data found for {metric_name}")
+            return
+        unit = series.attrs.get('unit')
+        
+        row1 = period_row(series, period1)
+        if row1 is not None:
+            print(f"{period1}: {row1['Value']} {unit} (Period End: {row1.name:%Y-%m-%d})")
         else:
             print(f"No data found for {period1}")
             
-        if not result2.empty:
-            row2 = result2.iloc[0]
-            print(f"{period2}: {row2['Value']} {row2['Unit']} (Period End: {row2['PeriodEnd']})")
+        row2 = period_row(series, period2)
+        if row2 is not None:
+            print(f"{period2}: {row2['Value']} {unit} (Period End: {row2.name:%Y-%m-%d})")
         else:
             print(f"No data found for {period2}")
             
-        if not result1.empty and not result2.empty:
-            row1 = result1.iloc[0]
-            row2 = result2.iloc[0]
-            if row1['Unit'] == row2['Unit']:
-                change = row2['Value'] - row1['Value']
-                pct_change = (change / row1['Value']) * 100 if row1['Value'] != 0 else float('inf')
-                print(f"Change: {change} {row1['Unit']} ({pct_change:.2f}%)")
+        if row1 is not None and row2 is not None:
+            change = row2['Value'] - row1['Value']
+            pct_change = (change / row1['Value']) * 100 if row1['Value'] != 0 else float('inf')
+            print(f"Change: {change} {unit} ({pct_change:.2f}%)")
     except Exception as e:
         print(f"Error comparing periods: {e}")
 
 def query_ttm_data(db, company_name, metric_name, consolidation_type="Consolidated"):
     """Query TTM (Trailing Twelve Months) data for a specific company and metric"""
-    query = f"""
+    query = BoundQuery("""
     SELECT TOP 1 f.Value_ as Value, u.unitname AS Unit, t.term AS Term, c.CompanyName AS Company,
            h.SubHeadName AS Metric, con.consolidationname AS Consolidation, f.PeriodEnd as PeriodEnd
     FROM tbl_financialrawdataTTM f
@@ -374,11 +348,11 @@ def query_ttm_data(db, company_name, metric_name, consolidation_type="Consolidat
     JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
     JOIN tbl_industryandsectormapping im ON im.sectorid = c.SectorID
     JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND h.SubHeadName LIKE '%{metric_name}%'
-    AND con.consolidationname LIKE '%{consolidation_type}%'
+    WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+    AND LOWER(h.SubHeadName) LIKE :metric_name_pattern
+    AND LOWER(con.consolidationname) LIKE :consolidation_type_pattern
     ORDER BY f.PeriodEnd DESC
-    """
+    """, {'company_name_pattern': like_pattern(company_name), 'metric_name_pattern': like_pattern(metric_name), 'consolidation_type_pattern': like_pattern(consolidation_type)})
     
     try:
         result = db.execute_query(query)
@@ -394,14 +368,14 @@ def query_ttm_data(db, company_name, metric_name, consolidation_type="Consolidat
 
 def query_ratios_for_industry(db, industry_name):
     """Query ratios available for a specific industry"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT r.SubHeadName
     FROM tbl_industryandkeystatsandratiosmapping m
     JOIN tbl_industrynames i ON m.IndustryID = i.IndustryID
     JOIN tbl_ratiosheadmaster r ON m.RatioHeadID = r.SubHeadID
-    WHERE i.IndustryName LIKE '%{industry_name}%'
+    WHERE LOWER(i.IndustryName) LIKE :pattern
     ORDER BY r.SubHeadName
-    """
+    """, {'pattern': like_pattern(industry_name)})
     
     try:
         result = db.execute_query(query)
@@ -414,22 +388,44 @@ def query_ratios_for_industry(db, industry_name):
     except Exception as e:
         print(f"Error querying ratios for industry: {e}")
 
-def query_companies_with_high_ratio(db, ratio_name, threshold, term):
+def query_companies_with_high_ratio(db, ratio_name, threshold, term, limit=config.SCREENER_TOP_N):
     """List companies with a ratio higher than a threshold for a specific term"""
-    query = f"""
-    SELECT c.CompanyName, r.Value_, u.unitname AS Unit, t.term AS Term, r.PeriodEnd
-    FROM tbl_ratiorawdata r
-    JOIN tbl_ratiosheadmaster h ON r.SubHeadID = h.SubHeadID
-    JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
-    JOIN tbl_terms t ON r.TermID = t.TermID
-    JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
-    WHERE h.SubHeadName LIKE '%{ratio_name}%'
-    AND t.term LIKE '%{term}%'
-    AND r.Value_ > {threshold}
-    ORDER BY r.Value_ DESC
-    """
-    
     try:
+        if term.strip().lower() in ('latest', 'latest quarter', 'most recent', 'current'):
+            # Latest values come from the in-memory ratio snapshot
+            if db.get_ratio_screener() is None:
+                print("The ratio screener is still being loaded, please try again shortly")
+                return
+            result = db.screen_companies([(ratio_name, '>', threshold)], top=limit)
+            if not result.empty:
+                print(f"\nCompanies with {ratio_name} > {threshold} in {term}:")
+                label = result.columns[3]
+                for idx, row in result.iterrows():
+                    print(f"{row['Company']}: {row[label]} (Period End: {row[label + ' PeriodEnd']:%Y-%m-%d})")
+            else:
+                print(f"No companies found with {ratio_name} > {threshold} in {term}")
+            return
+        
+        index = db.get_metric_index()
+        heads = index.exact_all(ratio_name, True) or index.contains_all(ratio_name, True)
+        if not heads:
+            print(f"No ratio found matching {ratio_name}")
+            return
+        head_list, params = expand_in_list('head_ids', [head_id for head_id, _, _ in heads])
+        params.update({'term_pattern': like_pattern(term), 'threshold': threshold, 'limit': limit})
+        query = BoundQuery(f"""
+        SELECT TOP (:limit) c.CompanyName, r.Value_, u.unitname AS Unit, t.term AS Term, r.PeriodEnd
+        FROM tbl_ratiorawdata r
+        JOIN tbl_ratiosheadmaster h ON r.SubHeadID = h.SubHeadID
+        JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
+        JOIN tbl_terms t ON r.TermID = t.TermID
+        JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
+        WHERE r.SubHeadID IN ({head_list})
+        AND LOWER(t.term) LIKE :term_pattern
+        AND r.Value_ > :threshold
+        ORDER BY r.Value_ DESC
+        """, params)
+        
         result = db.execute_query(query)
         if not result.empty:
             print(f"\nCompanies with {ratio_name} > {threshold} in {term}:")
@@ -442,16 +438,16 @@ def query_companies_with_high_ratio(db, ratio_name, threshold, term):
 
 def query_live_keystats(db, company_name, keystat_name):
     """Query live key stats for a specific company"""
-    query = f"""
+    query = BoundQuery("""
     SELECT k.KeyStatsValue, u.unitname AS Unit, ks.KeyStatsName, c.CompanyName, k.UpdateDate
     FROM tbl_keystatslive k
     JOIN tbl_keystatsmaster ks ON k.KeyStatsID = ks.KeyStatsID
     JOIN tbl_unitofmeasurement u ON ks.UnitID = u.UnitID
     JOIN tbl_companieslist c ON k.CompanyID = c.CompanyID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND ks.KeyStatsName LIKE '%{keystat_name}%'
+    WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+    AND LOWER(ks.KeyStatsName) LIKE :keystat_name_pattern
     ORDER BY k.UpdateDate DESC
-    """
+    """, {'company_name_pattern': like_pattern(company_name), 'keystat_name_pattern': like_pattern(keystat_name)})
     
     try:
         result = db.execute_query(query)
@@ -467,16 +463,16 @@ def query_live_keystats(db, company_name, keystat_name):
 
 def query_historical_keystats(db, company_name, keystat_name, years=5):
     """Query historical key stats for a specific company over a number of years"""
-    query = f"""
+    query = BoundQuery("""
     SELECT k.KeyStatsValue, u.unitname AS Unit, ks.KeyStatsName, c.CompanyName, k.PeriodEnd
     FROM tbl_keystatshistory k
     JOIN tbl_keystatsmaster ks ON k.KeyStatsID = ks.KeyStatsID
     JOIN tbl_unitofmeasurement u ON ks.UnitID = u.UnitID
     JOIN tbl_companieslist c ON k.CompanyID = c.CompanyID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND ks.KeyStatsName LIKE '%{keystat_name}%'
+    WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+    AND LOWER(ks.KeyStatsName) LIKE :keystat_name_pattern
     ORDER BY k.PeriodEnd DESC
-    """
+    """, {'company_name_pattern': like_pattern(company_name), 'keystat_name_pattern': like_pattern(keystat_name)})
     
     try:
         result = db.execute_query(query)
@@ -492,14 +488,14 @@ def query_historical_keystats(db, company_name, keystat_name, years=5):
 
 def query_available_keystats(db, company_name):
     """Query available key stats for a specific company"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT ks.KeyStatsName
     FROM tbl_keystatslive k
     JOIN tbl_keystatsmaster ks ON k.KeyStatsID = ks.KeyStatsID
     JOIN tbl_companieslist c ON k.CompanyID = c.CompanyID
-    WHERE c.CompanyName LIKE '%{company_name}%'
+    WHERE LOWER(c.CompanyName) LIKE :pattern
     ORDER BY ks.KeyStatsName
-    """
+    """, {'pattern': like_pattern(company_name)})
     
     try:
         result = db.execute_query(query)
@@ -556,14 +552,14 @@ def query_compare_consolidation(db, company_name, metric_name, term):
 
 def query_unit_info(db, company_name):
     """Query the unit of measurement used for a specific company's financial results"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT u.unitname, u.UnitDescription
     FROM tbl_financialrawdata f
     JOIN tbl_headsmaster h ON f.SubHeadID = h.SubHeadID
     JOIN tbl_unitofmeasurement u ON h.UnitID = u.UnitID
     JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    """
+    WHERE LOWER(c.CompanyName) LIKE :pattern
+    """, {'pattern': like_pattern(company_name)})
     
     try:
         result = db.execute_query(query)
@@ -578,14 +574,14 @@ def query_unit_info(db, company_name):
 
 def query_industries_by_sector(db, sector_name):
     """Query industries belonging to a specific sector"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT i.IndustryName
     FROM tbl_industryandsectormapping m
     JOIN tbl_industrynames i ON m.industryid = i.IndustryID
     JOIN tbl_sectornames s ON m.sectorid = s.SectorID
-    WHERE s.SectorName LIKE '%{sector_name}%'
+    WHERE LOWER(s.SectorName) LIKE :pattern
     ORDER BY i.IndustryName
-    """
+    """, {'pattern': like_pattern(sector_name)})
     
     try:
         result = db.execute_query(query)
@@ -600,14 +596,14 @@ def query_industries_by_sector(db, sector_name):
 
 def query_heads_for_industry(db, industry_name):
     """Query heads mapped to a specific industry"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT h.SubHeadName
     FROM tbl_industryandheadsmastermapping m
     JOIN tbl_industrynames i ON m.IndustryID = i.IndustryID
     JOIN tbl_headsmaster h ON m.SubHeadID = h.SubHeadID
-    WHERE i.IndustryName LIKE '%{industry_name}%'
+    WHERE LOWER(i.IndustryName) LIKE :pattern
     ORDER BY h.SubHeadName
-    """
+    """, {'pattern': like_pattern(industry_name)})
     
     try:
         result = db.execute_query(query)
@@ -622,13 +618,13 @@ def query_heads_for_industry(db, industry_name):
 
 def query_sector_for_industry(db, industry_name):
     """Query the sector for a specific industry"""
-    query = f"""
+    query = BoundQuery("""
     SELECT DISTINCT s.SectorName
     FROM tbl_industryandsectormapping m
     JOIN tbl_industrynames i ON m.industryid = i.IndustryID
     JOIN tbl_sectornames s ON m.sectorid = s.SectorID
-    WHERE i.IndustryName LIKE '%{industry_name}%'
-    """
+    WHERE LOWER(i.IndustryName) LIKE :pattern
+    """, {'pattern': like_pattern(industry_name)})
     
     try:
         result = db.execute_query(query)
@@ -643,11 +639,11 @@ def query_sector_for_industry(db, industry_name):
 
 def query_term_definition(db, term_name):
     """Query the definition of a specific term"""
-    query = f"""
+    query = BoundQuery("""
     SELECT t.term, t.TermDescription
     FROM tbl_terms t
-    WHERE t.term LIKE '%{term_name}%'
-    """
+    WHERE LOWER(t.term) LIKE :pattern
+    """, {'pattern': like_pattern(term_name)})
     
     try:
         result = db.execute_query(query)
@@ -662,13 +658,13 @@ def query_term_definition(db, term_name):
 
 def query_term_mapping(db, term_name):
     """Query which term is mapped to a specific term"""
-    query = f"""
+    query = BoundQuery("""
     SELECT t1.term AS SourceTerm, t2.term AS MappedTerm
     FROM tbl_termsmapping m
     JOIN tbl_terms t1 ON m.SourceTermID = t1.TermID
     JOIN tbl_terms t2 ON m.MappedTermID = t2.TermID
-    WHERE t1.term LIKE '%{term_name}%' OR t2.term LIKE '%{term_name}%'
-    """
+    WHERE LOWER(t1.term) LIKE :pattern OR LOWER(t2.term) LIKE :pattern
+    """, {'pattern': like_pattern(term_name)})
     
     try:
         result = db.execute_query(query)
@@ -703,13 +699,13 @@ def query_profitability_definitions(db):
 
 def query_latest_file(db, company_name):
     """Query the latest file containing results for a specific company"""
-    query = f"""
+    query = BoundQuery("""
     SELECT TOP 1 f.FileName, f.FilePath, f.UploadDate
     FROM tbl_financialfiles f
     JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
-    WHERE c.CompanyName LIKE '%{company_name}%'
+    WHERE LOWER(c.CompanyName) LIKE :pattern
     ORDER BY f.UploadDate DESC
-    """
+    """, {'pattern': like_pattern(company_name)})
     
     try:
         result = db.execute_query(query)
@@ -726,16 +722,16 @@ def query_latest_file(db, company_name):
 
 def query_data_edits(db, company_name, fiscal_year):
     """Query data edits made to a specific company's results for a fiscal year"""
-    query = f"""
+    query = BoundQuery("""
     SELECT e.EditDate, e.OldValue, e.NewValue, h.SubHeadName, u.username
     FROM tbl_financialdataedit e
     JOIN tbl_headsmaster h ON e.SubHeadID = h.SubHeadID
     JOIN tbl_companieslist c ON e.CompanyID = c.CompanyID
     JOIN tbl_users u ON e.UserID = u.UserID
-    WHERE c.CompanyName LIKE '%{company_name}%'
-    AND e.FiscalYear = {fiscal_year}
+    WHERE LOWER(c.CompanyName) LIKE :pattern
+    AND e.FiscalYear = :fiscal_year
     ORDER BY e.EditDate DESC
-    """
+    """, {'pattern': like_pattern(company_name), 'fiscal_year': fiscal_year})
     
     try:
         result = db.execute_query(query)
@@ -755,12 +751,12 @@ def query_data_edits(db, company_name, fiscal_year):
 
 def query_metric_calculation(db, metric_name):
     """Query how a specific metric is calculated in the system"""
-    query = f"""
+    query = BoundQuery("""
     SELECT m.CalculationFormula, c.CategoryName
     FROM tbl_financialmetriccalculationmapping m
     JOIN tbl_financialmetriccategories c ON m.CategoryID = c.CategoryID
-    WHERE m.MetricName LIKE '%{metric_name}%'
-    """
+    WHERE LOWER(m.MetricName) LIKE :pattern
+    """, {'pattern': like_pattern(metric_name)})
     
     try:
         result = db.execute_query(query)
@@ -776,12 +772,12 @@ def query_metric_calculation(db, metric_name):
 
 def query_metric_category(db, metric_name):
     """Query which category a specific metric belongs to"""
-    query = f"""
+    query = BoundQuery("""
     SELECT c.CategoryName
     FROM tbl_financialmetriccalculationmapping m
     JOIN tbl_financialmetriccategories c ON m.CategoryID = c.CategoryID
-    WHERE m.MetricName LIKE '%{metric_name}%'
-    """
+    WHERE LOWER(m.MetricName) LIKE :pattern
+    """, {'pattern': like_pattern(metric_name)})
     
     try:
         result = db.execute_query(query)
@@ -796,13 +792,13 @@ def query_metric_category(db, metric_name):
 
 def query_metrics_by_category(db, category_name):
     """Query metrics under a specific category"""
-    query = f"""
+    query = BoundQuery("""
     SELECT m.MetricName
     FROM tbl_financialmetriccalculationmapping m
     JOIN tbl_financialmetriccategories c ON m.CategoryID = c.CategoryID
-    WHERE c.CategoryName LIKE '%{category_name}%'
+    WHERE LOWER(c.CategoryName) LIKE :pattern
     ORDER BY m.MetricName
-    """
+    """, {'pattern': like_pattern(category_name)})
     
     try:
         result = db.execute_query(query)
@@ -819,13 +815,13 @@ def query_dissection_metrics(db, sector_name):
     """Query dissection metrics available for a specific sector"""
     try:
         # First, let's get the industry IDs for the sector
-        industry_query = f"""
+        industry_query = BoundQuery("""
         SELECT i.IndustryID, i.IndustryName
         FROM tbl_industryandsectormapping m 
         JOIN tbl_industrynames i ON m.industryid = i.IndustryID
         JOIN tbl_sectornames s ON m.sectorid = s.SectorID
-        WHERE s.SectorName LIKE '%{sector_name}%'
-        """
+        WHERE LOWER(s.SectorName) LIKE :pattern
+        """, {'pattern': like_pattern(sector_name)})
         
         industry_result = db.execute_query(industry_query)
         
@@ -838,14 +834,14 @@ def query_dissection_metrics(db, sector_name):
             print(f"- {row['IndustryName']}")
             
         # Now query for common financial metrics used in this sector
-        metrics_query = f"""
+        metrics_query = BoundQuery("""
         SELECT DISTINCT r.HeadNames
         FROM tbl_ratiosheadmaster r
         JOIN tbl_industryandsectormapping m ON r.IndustryID = m.industryid
         JOIN tbl_sectornames s ON m.sectorid = s.SectorID
-        WHERE s.SectorName LIKE '%{sector_name}%'
+        WHERE LOWER(s.SectorName) LIKE :pattern
         ORDER BY r.HeadNames
-        """
+        """, {'pattern': like_pattern(sector_name)})
         
         try:
             metrics_result = db.execute_query(metrics_query)
@@ -864,11 +860,11 @@ def query_ratio_dissections(db, company_name, ratio_name, term, consolidation_ty
     """Query ratio dissections for a specific company, ratio, term, and consolidation"""
     try:
         # First, get the SubHeadID for the ratio
-        ratio_query = f"""
+        ratio_query = BoundQuery("""
         SELECT SubHeadID, HeadNames 
         FROM tbl_ratiosheadmaster 
-        WHERE HeadNames LIKE '%{ratio_name}%'
-        """
+        WHERE LOWER(HeadNames) LIKE :pattern
+        """, {'pattern': like_pattern(ratio_name)})
         ratio_result = db.execute_query(ratio_query)
         
         if ratio_result.empty:
@@ -878,19 +874,19 @@ def query_ratio_dissections(db, company_name, ratio_name, term, consolidation_ty
         subhead_id = ratio_result.iloc[0]['SubHeadID']
         
         # Now query the ratio data with the correct SubHeadID
-        query = f"""
+        query = BoundQuery("""
         SELECT r.Value_, r.PeriodEnd, c.CompanyName, t.term, con.consolidationname
         FROM tbl_ratiorawdata r
         JOIN tbl_ratiosheadmaster h ON r.SubHeadID = h.SubHeadID
         JOIN tbl_terms t ON r.TermID = t.TermID
         JOIN tbl_companieslist c ON r.CompanyID = c.CompanyID
         JOIN tbl_consolidation con ON r.ConsolidationID = con.ConsolidationID
-        WHERE c.CompanyName LIKE '%{company_name}%'
-        AND r.SubHeadID = {subhead_id}
-        AND t.term LIKE '%{term}%'
-        AND con.consolidationname LIKE '%{consolidation_type}%'
+        WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+        AND r.SubHeadID = :subhead_id
+        AND LOWER(t.term) LIKE :term_pattern
+        AND LOWER(con.consolidationname) LIKE :consolidation_type_pattern
         ORDER BY r.PeriodEnd DESC
-        """
+        """, {'company_name_pattern': like_pattern(company_name), 'term_pattern': like_pattern(term), 'consolidation_type_pattern': like_pattern(consolidation_type), 'subhead_id': subhead_id})
         
         result = db.execute_query(query)
         if not result.empty:
@@ -909,20 +905,20 @@ def query_ratio_dissections(db, company_name, ratio_name, term, consolidation_ty
                 period_end = result.iloc[0]['PeriodEnd']
                 
                 # Query for financial data that might be components of this ratio
-                components_query = f"""
+                components_query = BoundQuery("""
                 SELECT h.HeadName, f.Value_, c.CompanyName, t.term
                 FROM tbl_financialrawdata f
                 JOIN tbl_headsmaster h ON f.HeadID = h.HeadID
                 JOIN tbl_companieslist c ON f.CompanyID = c.CompanyID
                 JOIN tbl_terms t ON f.TermID = t.TermID
                 JOIN tbl_consolidation con ON f.ConsolidationID = con.ConsolidationID
-                WHERE c.CompanyName LIKE '%{company_name}%'
-                AND t.term LIKE '%{term}%'
-                AND con.consolidationname LIKE '%{consolidation_type}%'
-                AND f.PeriodEnd = '{period_end}'
+                WHERE LOWER(c.CompanyName) LIKE :company_name_pattern
+                AND LOWER(t.term) LIKE :term_pattern
+                AND LOWER(con.consolidationname) LIKE :consolidation_type_pattern
+                AND f.PeriodEnd = :period_end
                 AND (h.HeadName LIKE '%Debt%' OR h.HeadName LIKE '%Equity%')
                 ORDER BY h.HeadName
-                """
+                """, {'company_name_pattern': like_pattern(company_name), 'term_pattern': like_pattern(term), 'consolidation_type_pattern': like_pattern(consolidation_type), 'period_end': period_end})
                 
                 components_result = db.execute_query(components_query)
                 if not components_result.empty:
@@ -1012,6 +1008,14 @@ def main():
     # List all companies with a Debt to Equity ratio higher than 2 in FY 2023
     query_companies_with_high_ratio(db, "Debt to Equity", 2, "FY 2023")
     
+    # Banks with ROE above 20% and P/E below 6 on their latest reports
+    db.update_ratio_screener_in_background().join()
+    print(db.screen_companies([("Return on Equity", '>', 20), ("Price to Earnings", '<', 6)], sector="Commercial Banks"))
+    
+    # HBL's ROE against the banking sector
+    db.update_peer_aggregates_in_background().join()
+    print(db.compare_to_peers("HBL", "Return on Equity", "12M 2023"))
+    
     # 5. Key Stats
     print("\n=== Key Stats ===\n")
     
@@ -0,0 +1,80 @@
+'''
+Benchmark: end-to-end answer latency with the answer templates vs Mistral narration
+
+A single-value question needs one lookup and one sentence. With narration Mistral reads a
+prompt built from the value and generates the sentence token by token on the CPU; the
+template renders it in microseconds.
+
+Usage:
+    python support/benchmarks/bench_answer_rendering.py                      # simulated database, modelled generation
+    python support/benchmarks/bench_answer_rendering.py --live MODEL_PATH    # FinancialRAG on MGFinancials with Mistral
+'''
+
+import os
+import sys
+import time
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.chat.answer_templates import render_answer
+from bench_concurrent_queries import QUESTIONS, run, simulated_database
+
+# Mistral-7B Q4_K_M on the CPU (gpu_layers=0): prompt evaluation and generation speed
+PROMPT_S = 1.5
+TOKENS_PER_S = 8.0
+# Tokens of a narrated single-value answer
+ANSWER_TOKENS = 60
+
+LIVE_QUESTIONS = [
+    "Give me HBL's consolidated EPS for Q2 2023",
+    "What is the latest ROE of UBL?",
+    "Give me MCB's consolidated net profit for 6M 2023",
+    "What is OGDC's revenue annual growth for 2023?",
+    "What is the current total assets of PSO?",
+]
+
+
+def main():
+    if '--live' in sys.argv:
+        from app.core.rag.financial_rag import FinancialRAG
+        model_path = sys.argv[sys.argv.index('--live') + 1]
+        rag = FinancialRAG('MUHAMMADUSMAN', 'MGFinancials', model_path=model_path)
+        for narrate in (False, True):
+            rag.db.invalidate_cached_results()
+            start = time.perf_counter()
+            answers = [rag.process_query(question, narrate=narrate) for question in LIVE_QUESTIONS]
+            elapsed = time.perf_counter() - start
+            print(f"{'Mistral narration' if narrate else 'Answer templates'}: "
+                  f"{elapsed * 1000 / len(LIVE_QUESTIONS):9.1f} ms/question")
+            for question, answer in zip(LIVE_QUESTIONS, answers):
+                print(f"    {question} -> {answer}")
+        return
+
+    db = simulated_database()
+    db.result_cache.max_entries = db.question_cache.max_entries = 0
+    run(db, QUESTIONS[0])
+
+    lookup_s = render_s = 0.0
+    answers = []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        financial_data = run(db, question)
+        lookup_s += time.perf_counter() - start
+        start = time.perf_counter()
+        answers.append(render_answer(financial_data, question[1]))
+        render_s += time.perf_counter() - start
+
+    n = len(QUESTIONS)
+    narration_s = PROMPT_S + ANSWER_TOKENS / TOKENS_PER_S
+    print(f"{n} single-value questions, simulated database")
+    print(f"Lookup:                          {lookup_s * 1000 / n:9.3f} ms/question")
+    print(f"Answer templates:                {render_s * 1000 / n:9.3f} ms/question to render, "
+          f"{(lookup_s + render_s) * 1000 / n:9.3f} ms end to end")
+    print(f"Mistral narration (modelled):    {narration_s * 1000:9.1f} ms/question to generate, "
+          f"{(lookup_s / n + narration_s) * 1000:9.1f} ms end to end")
+    print(f"Rendered: {sum(answer is not None for answer in answers)}/{n}, e.g. {answers[1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Benchmark: memory footprint and lookup time of the data-availability index
+
+Usage:
+    python support/benchmarks/bench_availability_index.py           # synthetic Mettis-sized universe
+    python support/benchmarks/bench_availability_index.py --live    # raw data tables from MGFinancials
+'''
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.availability_index import AVAILABILITY_TABLES, DISSECTION_FAMILIES, AvailabilityIndex
+
+# Rough shape of the full universe: listed companies, heads with data per company, consolidations
+N_COMPANIES = 800
+HEADS_PER_COMPANY = {'regular': 900, 'quarter': 700, 'ttm': 400, 'ratio': 150,
+                     'dissection': 250, 'dissection_quarter': 200, 'dissection_ttm': 100, 'dissection_ratio': 60}
+N_SUB_HEADS = 20000
+N_GROUPS = 5
+
+
+def synthetic_fetch(seed=11):
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for family, table_name in AVAILABILITY_TABLES.items():
+        per_company = HEADS_PER_COMPANY[family]
+        n = N_COMPANIES * per_company * 2
+        frame = pd.DataFrame({
+            'CompanyID': np.repeat(np.arange(1, N_COMPANIES + 1), per_company * 2),
+            'SubHeadID': rng.integers(1, N_SUB_HEADS, n),
+            'ConsolidationID': np.tile([1, 2], n // 2),
+            'Watermark': pd.Timestamp('2024-06-30'),
+        })
+        if family in DISSECTION_FAMILIES:
+            frame['DisectionGroupID'] = rng.integers(1, N_GROUPS + 1, n)
+        frames[table_name] = frame
+
+    def fetch(query):
+        return next(frame for table_name, frame in frames.items() if f"FROM {table_name}\n" in query)
+    return fetch
+
+
+def main():
+    if '--live' in sys.argv:
+        from app.core.database.financial_db import FinancialDatabase
+        fetch = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials').execute_query
+    else:
+        fetch = synthetic_fetch()
+
+    start = time.perf_counter()
+    index = AvailabilityIndex(fetch).build()
+    build_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(3)
+    lookups = list(zip(rng.integers(1, N_COMPANIES, 20000).tolist(), rng.integers(1, N_SUB_HEADS, 20000).tolist()))
+
+    timings = {}
+    for label, kwargs in [('company+head', {}), ('company+head+consolidation', {'consolidation_id': 2})]:
+        start = time.perf_counter()
+        for company_id, sub_head_id in lookups:
+            index.has_data('tbl_financialrawdata', company_id, sub_head_id, **kwargs)
+        timings[label] = (time.perf_counter() - start) / len(lookups)
+
+    start = time.perf_counter()
+    for company_id, sub_head_id in lookups:
+        index.has_data('tbl_disectionrawdata', company_id, sub_head_id, 2, 3)
+    timings['dissection exact key'] = (time.perf_counter() - start) / len(lookups)
+
+    print(f"{'family':<20}{'keys':>12}{'MB':>10}")
+    for family, keys in index.keys.items():
+        print(f"{family:<20}{len(keys):>12,}{keys.nbytes / 1e6:>10.1f}")
+    print(f"{'total':<20}{sum(len(k) for k in index.keys.values()):>12,}{index.nbytes() / 1e6:>10.1f}")
+    print(f"\nBuild: {build_s:.2f} s")
+    for label, seconds in timings.items():
+        print(f"has_data ({label}): {seconds * 1e6:.2f} us/lookup")
+
+
+if __name__ == '__main__':
+    main()
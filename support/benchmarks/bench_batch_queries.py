@@ -0,0 +1,209 @@
+'''
+Benchmark: a banks x metrics x quarters grid through get_financial_data_batch vs a loop of get_financial_data
+
+The loop resolves every combination on its own (head candidates, availability probe, term,
+value query); the batch resolves IDs in bulk and reads all values with one VALUES-join
+statement per raw data table.
+
+Usage:
+    python support/benchmarks/bench_batch_queries.py           # simulated database latency
+    python support/benchmarks/bench_batch_queries.py --live    # MGFinancials
+'''
+
+import os
+import re
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+from bench_concurrent_queries import LATENCY_S
+
+BANKS = [f"BANK{i:02d}" for i in range(20)]
+HEADS = {11: 'Net Profit', 12: 'Total Deposits', 13: 'Advances', 14: 'Total Income'}
+RATIO_HEADS = {101: 'Return on Equity', 102: 'Return on Assets'}
+METRICS = list(HEADS.values()) + list(RATIO_HEADS.values())
+TERMS = [f"Q{quarter} {year}" for year in (2022, 2023) for quarter in range(1, 5)]
+
+LIVE_BANKS = ['UBL', 'HBL', 'MCB', 'ABL', 'BAFL', 'MEBL']
+LIVE_METRICS = ['Net Profit', 'Total Deposits', 'Return on Equity']
+LIVE_TERMS = ['Q1 2023', 'Q2 2023', 'Q3 2023', 'Q4 2023']
+
+QUARTER_TERM_IDS = {1: 4, 2: 5, 3: 6, 4: 7}
+QUARTER_ENDS = {1: '03-31', 2: '06-30', 3: '09-30', 4: '12-31'}
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': range(1, len(BANKS) + 1), 'CompanyName': [f"{bank} Limited" for bank in BANKS],
+                               'Symbol': BANKS, 'SectorID': 10}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'heads': pd.DataFrame({'SubHeadID': list(HEADS), 'SubHeadName': list(HEADS.values()), 'IndustryID': 100}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': list(RATIO_HEADS), 'HeadNames': list(RATIO_HEADS.values()), 'IndustryID': 100}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2, 3, 4, 5, 6, 7], 'term': ['3M', '6M', 'TTM', 'Q1', 'Q2', 'Q3', 'Q4']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+TERM_NAMES = dict(zip(METADATA['terms']['TermID'], METADATA['terms']['term']))
+NAMES = {**HEADS, **RATIO_HEADS}
+
+
+def build_raw_data():
+    """Quarterly rows for every bank, head and quarter (one bank misses its ratios)"""
+    rng = np.random.default_rng(3)
+    rows = {'tbl_financialrawdata_Quarter': [], 'tbl_ratiorawdata': []}
+    for company_id in range(1, len(BANKS) + 1):
+        for year in (2022, 2023):
+            for quarter, term_id in QUARTER_TERM_IDS.items():
+                period_end = pd.Timestamp(f"{year}-{QUARTER_ENDS[quarter]}")
+                for head_id in HEADS:
+                    rows['tbl_financialrawdata_Quarter'].append((company_id, head_id, term_id, 2, year, period_end, rng.uniform(1, 1e4)))
+                if company_id != 1:
+                    for head_id in RATIO_HEADS:
+                        rows['tbl_ratiorawdata'].append((company_id, head_id, term_id, 2, year, period_end, rng.uniform(0, 0.3)))
+    columns = ['CompanyID', 'SubHeadID', 'TermID', 'ConsolidationID', 'FY', 'PeriodEnd', 'Value_']
+    return {table_name: pd.DataFrame(table_rows, columns=columns) for table_name, table_rows in rows.items()}
+
+
+class SimulatedServer:
+    """Answers the statements of both paths from in-memory raw data, sleeping LATENCY_S per statement"""
+
+    def __init__(self):
+        self.tables = build_raw_data()
+        # The regular table holds the same periods; quarterly terms are read from the Quarter table
+        self.tables['tbl_financialrawdata'] = self.tables['tbl_financialrawdata_Quarter'].assign(Value_=-1.0)
+        self.statements = 0
+
+    def records(self, table_name, company_ids, head_ids, consolidation_id=None, term_id=None, fiscal_year=None):
+        df = self.tables.get(table_name)
+        if df is None:
+            return pd.DataFrame(columns=['CompanyID', 'SubHeadID', 'TermID', 'PeriodEnd', 'Value_'])
+        mask = df['CompanyID'].isin(company_ids) & df['SubHeadID'].isin(head_ids)
+        for column, value in (('ConsolidationID', consolidation_id), ('TermID', term_id), ('FY', fiscal_year)):
+            if value is not None:
+                mask &= df[column] == value
+        return df[mask].sort_values('PeriodEnd', ascending=False)
+
+    @staticmethod
+    def output(df):
+        return pd.DataFrame({'Value': df['Value_'], 'Unit': 'PKR mn', 'Term': df['TermID'].map(TERM_NAMES),
+                             'Company': df['CompanyID'].map(lambda company_id: f"{BANKS[company_id - 1]} Limited"),
+                             'Metric': df['SubHeadID'].map(NAMES), 'Consolidation': 'Unconsolidated',
+                             'PeriodEnd': df['PeriodEnd']})
+
+    def execute_query(self, query, params=None, timeout=None):
+        time.sleep(LATENCY_S)
+        self.statements += 1
+        params = params if params is not None else getattr(query, 'params', None) or {}
+        listed = lambda prefix: [value for name, value in params.items() if name.startswith(prefix)]
+        if 'INFORMATION_SCHEMA' in query:
+            return pd.DataFrame([(table_name, 'CompanyID', 'int') for table_name in self.tables],
+                                columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+        if getattr(query, 'name', None) == 'query_plan':
+            frames = []
+            for branch_rank, (branch, table_name) in enumerate(re.findall(r"AS (k\d+)\(SubHeadID, HeadRank\)\s+JOIN (\w+) d", query)):
+                ranks = {params[name]: params[name[:-1] + '1'] for name in params
+                         if name.startswith(f"{branch}_") and name.endswith('_0')}
+                df = self.records(table_name, [params['company_id']], list(ranks), params.get('consolidation_id'),
+                                  params.get('term_id'), params.get('fiscal_year'))
+                frames.append(self.output(df).assign(SubHeadID=df['SubHeadID'], SourceTable=table_name,
+                                                     HeadRank=df['SubHeadID'].map(ranks), BranchRank=branch_rank))
+            df = pd.concat(frames).sort_values(['HeadRank', 'BranchRank', 'PeriodEnd'], ascending=[True, True, False])
+            return df.head(1)
+        if 'RowRank' in query:
+            rows = len([name for name in params if name.startswith('k_') and name.endswith('_0')])
+            keys = pd.DataFrame([[params[f"k_{i}_{j}"] for j in range(5)] for i in range(rows)],
+                                columns=['RowID', 'CompanyID', 'SubHeadID', 'TermID', 'KeyFY'])
+            df = self.tables[re.search(r"JOIN (\w+) d ON", query).group(1)].merge(keys, on=['CompanyID', 'SubHeadID', 'TermID'])
+            df = df[(df['ConsolidationID'] == params['consolidation_id']) & ((df['KeyFY'] == 0) | (df['FY'] == df['KeyFY']))]
+            df = df.sort_values('PeriodEnd', ascending=False).drop_duplicates('RowID')
+            return self.output(df).assign(RowID=df['RowID'])
+        if 'GROUP BY d.CompanyID, d.SubHeadID' in query:
+            df = self.records(re.search(r"FROM (\w+) d", query).group(1), listed('company_ids_'), listed('sub_head_ids_'),
+                              params.get('consolidation_id'))
+            return df.groupby(['CompanyID', 'SubHeadID']).size().rename('count').reset_index()
+        if 'AS TableName' in query:
+            rows = []
+            for table_name in re.findall(r"SELECT '(\w+)' AS TableName", query):
+                df = self.records(table_name, [params['company_id']], listed('sub_head_ids_'), params.get('consolidation_id'))
+                rows += [(table_name, head_id, 1) for head_id in df['SubHeadID'].unique()]
+            return pd.DataFrame(rows, columns=['TableName', 'SubHeadID', 'count'])
+        match = re.search(r'FROM (tbl_headsmaster|tbl_ratiosheadmaster) h', query)
+        if match and 'SubHeadID, h.' in query:
+            heads = METADATA['ratio_heads' if match.group(1) == 'tbl_ratiosheadmaster' else 'heads']
+            name_col = heads.columns[1]
+            if 'name' in params:
+                found = heads[name_col].str.lower() == params['name'].lower()
+            else:
+                found = heads[name_col].str.lower().str.contains(params['pattern'].strip('%'), regex=False)
+            return heads[found][['SubHeadID', name_col]]
+        if 'SELECT term FROM tbl_terms' in query:
+            return pd.DataFrame({'term': [TERM_NAMES[params['term_id']]]})
+        if 'COUNT(*)' in query and 'FROM tbl_financialrawdata' in query:
+            df = self.records(re.search(r"FROM (\w+)", query).group(1), [params['company_id']], [params['head_id']],
+                              params['consolidation_id'], params.get('term_id'), params.get('fiscal_year'))
+            return pd.DataFrame({'count': [len(df)]})
+        if 'COUNT(*)' in query:
+            return pd.DataFrame({'count': [1]})
+        if re.search(r'\bAS Value\b', query, re.I):
+            df = self.records(re.search(r"FROM (\w+) [fr]\b", query).group(1), [params['company_id']], [params['head_id']],
+                              params['consolidation_id'], params.get('term_id'), params.get('fiscal_year'))
+            return self.output(df)
+        return pd.DataFrame()
+
+
+def main():
+    server = None
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        companies, metrics, terms = LIVE_BANKS, LIVE_METRICS, LIVE_TERMS
+    else:
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock.MagicMock()):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache.update(METADATA)
+        server = SimulatedServer()
+        db.execute_query = server.execute_query
+        companies, metrics, terms = BANKS, METRICS, TERMS
+
+    # Measure the uncached resolution chain; the loop would otherwise hit the result cache
+    db.result_cache.max_entries = db.question_cache.max_entries = 0
+    db.get_financial_data(companies[0], metrics[0], terms[0], 'unconsolidated', context=QueryContext())
+    cells = len(companies) * len(metrics) * len(terms)
+
+    statements = server.statements if server else 0
+    start = time.perf_counter()
+    loop = {(company, metric, term): db.get_financial_data(company, metric, term, 'unconsolidated', context=QueryContext())
+            for company in companies for metric in metrics for term in terms}
+    loop_s = time.perf_counter() - start
+    loop_statements = server.statements - statements if server else 0
+
+    statements = server.statements if server else 0
+    start = time.perf_counter()
+    batch = db.get_financial_data_batch(companies, metrics, terms, 'unconsolidated')
+    batch_s = time.perf_counter() - start
+    batch_statements = server.statements - statements if server else 0
+
+    mismatches = sum(
+        ('error' in loop[(row.company, row.metric, row.term)]) != (row.error is not None)
+        or ('value' in loop[(row.company, row.metric, row.term)]
+            and loop[(row.company, row.metric, row.term)]['value'] != row.value)
+        for row in batch.itertuples())
+    print(f"Grid: {len(companies)} companies x {len(metrics)} metrics x {len(terms)} terms = {cells} values")
+    print(f"Loop of get_financial_data: {loop_s * 1000:8.1f} ms" + (f"  {loop_statements:5d} statements" if server else ""))
+    print(f"get_financial_data_batch:   {batch_s * 1000:8.1f} ms" + (f"  {batch_statements:5d} statements" if server else "")
+          + f"  ({loop_s / batch_s:.1f}x)")
+    print(f"Answered: {batch['error'].isna().sum()} of {cells}, differing from the loop: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+'''
+Benchmark: derived figures (quarterly, TTM, YoY growth, EPS, margin) computed in memory vs looked up row by row
+
+The lookup path reads every derived value with its own statement from the precomputed
+Quarter / TTM / dissection tables; the engine reads the cumulative 3M / 6M / 9M / 12M rows
+of all companies with one statement (get_cumulative_panel) and derives every figure with
+vectorized numpy. Both are compared for agreement.
+
+Usage:
+    python support/benchmarks/bench_calculations.py           # simulated database latency
+    python support/benchmarks/bench_calculations.py --live    # MGFinancials
+'''
+
+import os
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.calculations import CUMULATIVE_TERMS, per_share, percent_of
+from app.core.database.financial_db import FinancialDatabase
+from bench_concurrent_queries import LATENCY_S
+
+COMPANIES = list(range(1, 31))
+YEARS = (2020, 2021, 2022, 2023)
+PROFIT, REVENUE, SHARES = 11, 12, 13
+QUARTER_ENDS = {'3M': '03-31', '6M': '06-30', '9M': '09-30', '12M': '12-31'}
+TERMS = pd.DataFrame({'TermID': [1, 2, 3, 4], 'term': list(CUMULATIVE_TERMS)})
+
+LIVE_COMPANIES = ['UBL', 'HBL', 'MCB', 'ABL', 'BAFL', 'MEBL']
+LIVE_METRICS = ['Net Profit', 'Total Income']
+
+FIGURES = ['quarterly', 'ttm', 'yoy']
+
+
+def build_raw_data():
+    """Cumulative rows of every company (company 1 misses one 9M, company 2 starts a year late)"""
+    rng = np.random.default_rng(5)
+    rows = []
+    for company_id in COMPANIES:
+        shares = rng.uniform(1e2, 1e3)
+        for year in YEARS[1:] if company_id == 2 else YEARS:
+            for head_id in (PROFIT, REVENUE):
+                quarters = rng.uniform(10, 1e3, 4) * (1 if head_id == REVENUE else 0.2)
+                for term, value in zip(CUMULATIVE_TERMS, np.cumsum(quarters)):
+                    if not (company_id == 1 and year == 2022 and term == '9M'):
+                        rows.append((company_id, head_id, year, term, pd.Timestamp(f"{year}-{QUARTER_ENDS[term]}"), value))
+            for term in CUMULATIVE_TERMS:
+                rows.append((company_id, SHARES, year, term, pd.Timestamp(f"{year}-{QUARTER_ENDS[term]}"), shares))
+    return pd.DataFrame(rows, columns=['CompanyID', 'SubHeadID', 'FY', 'Term', 'PeriodEnd', 'Value'])
+
+
+def reference_tables(raw):
+    """
+    Derived tables as the lookup path stores them, computed one value at a time:
+    {(figure, company_id, head_id, period_end): value}
+    """
+    cumulative = {(row.CompanyID, row.SubHeadID, row.FY, row.Term): row.Value for row in raw.itertuples()}
+    table = {}
+    series = raw.loc[raw['SubHeadID'] != SHARES, ['CompanyID', 'SubHeadID']].drop_duplicates()
+    for company_id, head_id in series.itertuples(index=False):
+        for year in YEARS:
+            for i, term in enumerate(CUMULATIVE_TERMS):
+                if (company_id, head_id, year, term) not in cumulative:
+                    continue
+                period_end = pd.Timestamp(f"{year}-{QUARTER_ENDS[term]}")
+                current = cumulative[(company_id, head_id, year, term)]
+                before = cumulative.get((company_id, head_id, year, CUMULATIVE_TERMS[i - 1])) if i else 0.0
+                if before is not None:
+                    table[('quarterly', company_id, head_id, period_end)] = current - before
+                previous_full = cumulative.get((company_id, head_id, year - 1, '12M'))
+                previous_to_date = cumulative.get((company_id, head_id, year - 1, term))
+                if term == '12M':
+                    table[('ttm', company_id, head_id, period_end)] = current
+                elif previous_full is not None and previous_to_date is not None:
+                    table[('ttm', company_id, head_id, period_end)] = current + previous_full - previous_to_date
+        for year in YEARS:
+            for term in CUMULATIVE_TERMS:
+                period_end = pd.Timestamp(f"{year}-{QUARTER_ENDS[term]}")
+                current = table.get(('quarterly', company_id, head_id, period_end))
+                previous = table.get(('quarterly', company_id, head_id, period_end - pd.DateOffset(years=1)))
+                if current is not None and previous:
+                    table[('yoy', company_id, head_id, period_end)] = (current - previous) / abs(previous) * 100
+    for (figure, company_id, head_id, period_end), value in list(table.items()):
+        shares = cumulative.get((company_id, SHARES, period_end.year, '3M'))
+        if figure == 'ttm' and head_id == PROFIT and shares:
+            table[('eps', company_id, PROFIT, period_end)] = value / shares
+        revenue = table.get(('quarterly', company_id, REVENUE, period_end))
+        if figure == 'quarterly' and head_id == PROFIT and revenue:
+            table[('margin', company_id, PROFIT, period_end)] = value / revenue * 100
+    return table
+
+
+def engine_figures(panel, shares_panel):
+    """Every figure of reference_tables from the panels, keyed the same way"""
+    frames = {figure: panel.to_frame(values) for figure, values in
+              (('quarterly', panel.quarterly()), ('ttm', panel.ttm()), ('yoy', panel.yoy_growth()))}
+    profit = lambda frame: frame[frame['SubHeadID'] == PROFIT]
+    revenue = frames['quarterly'][frames['quarterly']['SubHeadID'] == REVENUE]
+    frames['eps'] = per_share(profit(frames['ttm']), shares_panel.to_frame(shares_panel.values))
+    frames['margin'] = percent_of(profit(frames['quarterly']), revenue)
+    return {(figure, company_id, head_id, pd.Timestamp(period_end)): value
+            for figure, frame in frames.items()
+            for company_id, head_id, period_end, value in
+            zip(frame['CompanyID'], frame['SubHeadID'], frame['PeriodEnd'], frame['Value'])}
+
+
+class SimulatedServer:
+    """Serves cumulative reads and single derived-value lookups, sleeping LATENCY_S per statement"""
+
+    def __init__(self):
+        self.raw = build_raw_data()
+        self.derived = reference_tables(self.raw)
+        self.statements = 0
+
+    def execute_query(self, query, params=None, timeout=None):
+        time.sleep(LATENCY_S)
+        self.statements += 1
+        listed = lambda prefix: [value for name, value in query.params.items() if name.startswith(prefix)]
+        term_ids = dict(zip(TERMS['term'], TERMS['TermID']))
+        df = self.raw[self.raw['CompanyID'].isin(listed('company_ids_')) & self.raw['SubHeadID'].isin(listed('head_ids_'))]
+        return df.assign(TermID=df['Term'].map(term_ids)).drop(columns='Term')
+
+    def lookup(self, key):
+        """One derived value, as one statement against its table"""
+        time.sleep(LATENCY_S)
+        self.statements += 1
+        return self.derived.get(key)
+
+
+def live_comparison(db):
+    """Engine quarterly / TTM figures against tbl_financialrawdata_Quarter / tbl_financialrawdataTTM"""
+    consolidation_id = db.get_consolidation_id('unconsolidated')
+    company_ids = [db.get_company_id(company) for company in LIVE_COMPANIES]
+    head_ids = [int(db.get_head_id(metric, company_ids[0], consolidation_id)[0]) for metric in LIVE_METRICS]
+
+    start = time.perf_counter()
+    panel = db.get_cumulative_panel(company_ids, head_ids, consolidation_id)
+    engine = {'tbl_financialrawdata_Quarter': panel.to_frame(panel.quarterly()),
+              'tbl_financialrawdataTTM': panel.to_frame(panel.ttm())}
+    engine_s = time.perf_counter() - start
+
+    lookups, lookup_s, differences = 0, 0.0, []
+    for table_name, frame in engine.items():
+        for row in frame.itertuples():
+            start = time.perf_counter()
+            stored = db.execute_query(f"""
+                SELECT TOP 1 Value_ AS Value FROM {table_name}
+                WHERE CompanyID = :company_id AND SubHeadID = :head_id AND ConsolidationID = :consolidation_id
+                AND PeriodEnd = :period_end
+                """, {'company_id': int(row.CompanyID), 'head_id': int(row.SubHeadID),
+                      'consolidation_id': consolidation_id, 'period_end': row.PeriodEnd.strftime('%Y-%m-%d')})
+            lookup_s += time.perf_counter() - start
+            lookups += 1
+            if not stored.empty:
+                differences.append(abs(float(stored['Value'].iloc[0]) - row.Value))
+    print(f"Engine (one read + numpy): {engine_s * 1000:8.1f} ms for {sum(len(frame) for frame in engine.values())} values")
+    print(f"Row lookups:               {lookup_s * 1000:8.1f} ms for {lookups} values  ({lookup_s / engine_s:.1f}x)")
+    print(f"Stored values compared: {len(differences)}, max abs difference: {max(differences, default=0.0):.6g}")
+
+
+def main():
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        live_comparison(db)
+        return
+
+    with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock.MagicMock()):
+        db = FinancialDatabase('server', 'database')
+    db.metadata_cache['terms'] = TERMS
+    server = SimulatedServer()
+    db.execute_query = server.execute_query
+    keys = sorted(server.derived, key=str)
+
+    start = time.perf_counter()
+    looked_up = {key: server.lookup(key) for key in keys}
+    lookup_s = time.perf_counter() - start
+    lookup_statements = server.statements
+
+    start = time.perf_counter()
+    panel = db.get_cumulative_panel(COMPANIES, [PROFIT, REVENUE], 1)
+    shares_panel = db.get_cumulative_panel(COMPANIES, [SHARES], 1)
+    computed = engine_figures(panel, shares_panel)
+    engine_s = time.perf_counter() - start
+    engine_statements = server.statements - lookup_statements
+
+    missing = sum(key not in computed for key in looked_up)
+    extra = sum(key not in looked_up for key in computed)
+    max_diff = max((abs(computed[key] - value) for key, value in looked_up.items() if key in computed), default=0.0)
+    counts = pd.Series([key[0] for key in keys]).value_counts()
+    print(f"{len(COMPANIES)} companies x {len(YEARS)} years: " + ", ".join(f"{counts.get(figure, 0)} {figure}"
+                                                                          for figure in FIGURES + ['eps', 'margin']))
+    print(f"Row lookups:               {lookup_s * 1000:8.1f} ms  {lookup_statements:5d} statements")
+    print(f"Engine (one read + numpy): {engine_s * 1000:8.1f} ms  {engine_statements:5d} statements  ({lookup_s / engine_s:.1f}x)")
+    print(f"Agreement: {len(looked_up) - missing} of {len(looked_up)} values, {extra} extra, max abs difference {max_diff:.3g}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Benchmark: time to first byte of /chat vs /chat/stream on a running FinRAG server
+
+/chat answers with one JSON body once extraction, lookup, generation, suggestions and the
+chat name are all done, so its first byte arrives with the last. /chat/stream sends the
+looked-up value as soon as the SQL returns, then the answer token by token. For each
+question this prints when the first byte, the 'data' event, the first 'token' event and
+the 'done' event arrived.
+
+Usage:
+    uvicorn app.finrag_server:app --port 8000 &
+    python support/benchmarks/bench_chat_ttfb.py
+    python support/benchmarks/bench_chat_ttfb.py --url http://host:8000 --repeat 3
+'''
+
+import statistics
+import sys
+import time
+
+import httpx
+
+QUESTIONS = [
+    "What is the most recent EPS of HBL?",
+    "Show me OGDC's revenue for Q2 2023",
+    "Give me MCB's consolidated net profit for 6M 2023",
+    "What was LUCK's debt to equity ratio in Q1 2023?",
+    "What is the current total assets of PSO?",
+]
+
+
+def request_body(question):
+    return {'chatId': 'bench', 'ownerId': 'bench', 'chatName': 'bench', 'initInputs': {}, 'initOpening': None,
+            'chatMessages': [{'role': 'user', 'rawContent': question}]}
+
+
+def time_chat(client, url, question):
+    """Seconds until the first byte of /chat, which is also its last"""
+    start = time.perf_counter()
+    with client.stream('POST', f"{url}/chat", json=request_body(question)) as response:
+        first_byte = None
+        for _ in response.iter_bytes():
+            first_byte = first_byte or time.perf_counter() - start
+    return {'first_byte': first_byte, 'done': time.perf_counter() - start}
+
+
+def time_chat_stream(client, url, question):
+    """Seconds until the first byte and the first data, token and done events of /chat/stream"""
+    timings = {}
+    start = time.perf_counter()
+    with client.stream('POST', f"{url}/chat/stream", json=request_body(question)) as response:
+        for line in response.iter_lines():
+            timings.setdefault('first_byte', time.perf_counter() - start)
+            if line.startswith('event: '):
+                timings.setdefault(line[len('event: '):], time.perf_counter() - start)
+    return timings
+
+
+def report(label, runs, keys):
+    parts = []
+    for key in keys:
+        values = [run[key] for run in runs if run.get(key) is not None]
+        if values:
+            parts.append(f"{key} {statistics.median(values) * 1000:8.1f} ms")
+    print(f"{label:12s} " + ", ".join(parts))
+
+
+def main():
+    url = sys.argv[sys.argv.index('--url') + 1] if '--url' in sys.argv else 'http://localhost:8000'
+    repeat = int(sys.argv[sys.argv.index('--repeat') + 1]) if '--repeat' in sys.argv else 1
+
+    with httpx.Client(timeout=300) as client:
+        chat_runs, stream_runs = [], []
+        for _ in range(repeat):
+            for question in QUESTIONS:
+                chat_runs.append(time_chat(client, url, question))
+                stream_runs.append(time_chat_stream(client, url, question))
+
+    print(f"{len(QUESTIONS)} questions x {repeat} against {url}, medians")
+    report('/chat', chat_runs, ['first_byte', 'done'])
+    report('/chat/stream', stream_runs, ['first_byte', 'data', 'token', 'done'])
+
+
+if __name__ == '__main__':
+    main()
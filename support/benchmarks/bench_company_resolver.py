@@ -0,0 +1,91 @@
+'''
+Benchmark: company lookup with the pandas scan vs the prebuilt CompanyResolver
+
+Usage:
+    python support/benchmarks/bench_company_resolver.py           # synthetic company list
+    python support/benchmarks/bench_company_resolver.py --live    # tbl_companieslist from MGFinancials
+'''
+
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.company_resolver import CompanyResolver
+
+WORDS = ['united', 'habib', 'national', 'lucky', 'engro', 'fauji', 'pakistan', 'oil', 'gas', 'cement',
+         'bank', 'textile', 'mills', 'power', 'fertilizer', 'sugar', 'steel', 'chemical', 'motors', 'insurance',
+         'petroleum', 'refinery', 'glass', 'paper', 'foods', 'pharma', 'energy', 'islamic', 'investment', 'modaraba']
+
+
+def synthetic_companies(n=1200, seed=5):
+    rng = random.Random(seed)
+    names, symbols = [], []
+    for i in range(n):
+        words = rng.sample(WORDS, rng.randint(2, 4))
+        names.append(' '.join(words).title() + ' Limited')
+        symbols.append(''.join(w[0] for w in words).upper() + str(i))
+    return pd.DataFrame({'CompanyID': range(1, n + 1), 'CompanyName': names, 'Symbol': symbols})
+
+
+def live_companies():
+    from app.core.database.financial_db import FinancialDatabase
+    db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+    return db.execute_query("SELECT * FROM tbl_companieslist")
+
+
+def pandas_lookup(companies_df, query):
+    """The scan FinancialDatabase.get_company_id ran before the resolver"""
+    ticker_match = companies_df[companies_df['Symbol'].str.lower() == query.lower()]
+    if not ticker_match.empty:
+        return ticker_match.iloc[0]['CompanyID']
+    name_match = companies_df[companies_df['CompanyName'].str.lower().str.contains(query.lower(), regex=False)]
+    if not name_match.empty:
+        return name_match.iloc[0]['CompanyID']
+    return None
+
+
+def timed(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def main():
+    companies = live_companies() if '--live' in sys.argv else synthetic_companies()
+    rng = random.Random(1)
+    rows = companies.sample(n=min(50, len(companies)), random_state=1)
+
+    # Mix of tickers, full names, lowercase partial names and typos
+    queries = rows['Symbol'].dropna().astype(str).tolist()[:15]
+    queries += rows['CompanyName'].dropna().tolist()[:15]
+    queries += [' '.join(name.lower().split()[:2]) for name in rows['CompanyName'].dropna().tolist()[15:30]]
+    for name in rows['CompanyName'].dropna().tolist()[30:40]:
+        i = rng.randrange(1, len(name) - 1)
+        queries.append(name[:i] + name[i + 1:])
+
+    start = time.perf_counter()
+    resolver = CompanyResolver(companies)
+    build_s = time.perf_counter() - start
+
+    pandas_s = timed(lambda q: pandas_lookup(companies, q), queries, repeat=5)
+    resolver_s = timed(resolver.resolve, queries, repeat=50)
+    resolved = sum(resolver.resolve(q) is not None for q in queries)
+    scanned = sum(pandas_lookup(companies, q) is not None for q in queries)
+
+    print(f"Companies: {len(companies)}, queries: {len(queries)}")
+    print(f"Resolver build:    {build_s * 1000:8.1f} ms")
+    print(f"pandas scan:       {pandas_s * 1000:8.3f} ms/lookup ({scanned}/{len(queries)} found)")
+    print(f"CompanyResolver:   {resolver_s * 1000:8.3f} ms/lookup ({resolved}/{len(queries)} found, "
+          f"{pandas_s / resolver_s:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+'''
+Benchmark: sequential vs thread-pool throughput of FinancialDatabase.get_financial_data
+
+Every request carries its own QueryContext, so one FinancialDatabase instance can
+serve several questions at once and their database round trips overlap.
+
+Usage:
+    python support/benchmarks/bench_concurrent_queries.py                # simulated database latency
+    python support/benchmarks/bench_concurrent_queries.py --live         # MGFinancials
+    python support/benchmarks/bench_concurrent_queries.py --workers 8
+'''
+
+import os
+import re
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+
+# Simulated round-trip latency in seconds
+LATENCY_S = 0.004
+
+QUESTIONS = [
+    ('UBL', 'Net Profit', 'Q1 2023', 'unconsolidated'),
+    ('HBL', 'Net Profit', 'TTM', 'consolidated'),
+    ('UBL', 'Return on Equity', '6M 2023', 'unconsolidated'),
+    ('HBL', 'Total Deposits', '3M 2024', 'consolidated'),
+] * 6
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1, 2], 'CompanyName': ['United Bank Limited', 'Habib Bank Limited'],
+                               'Symbol': ['UBL', 'HBL'], 'SectorID': [10, 10]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'heads': pd.DataFrame({'SubHeadID': [11, 12], 'SubHeadName': ['Net Profit', 'Total Deposits'], 'IndustryID': [100, 100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2, 3, 4], 'term': ['3M', '6M', 'TTM', 'Q1']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+SCHEMA = pd.DataFrame([(table, column, 'int') for table in ('tbl_financialrawdata', 'tbl_financialrawdata_Quarter',
+                                                            'tbl_financialrawdataTTM', 'tbl_ratiorawdata')
+                       for column in ('CompanyID', 'SubHeadID', 'TermID', 'ConsolidationID', 'PeriodEnd', 'Value_')],
+                      columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+
+
+def answer(query, params=None):
+    """Result the simulated database returns for query and its bound parameters"""
+    params = params if params is not None else getattr(query, 'params', None) or {}
+    if 'INFORMATION_SCHEMA.COLUMNS' in query:
+        return SCHEMA
+    if 'AS TableName' in query:
+        rows = []
+        for table_name, placeholders in re.findall(r"SELECT '(\w+)' AS TableName.*?SubHeadID IN \(([^)]+)\)", query, re.S):
+            ids = dict.fromkeys(params[placeholder.strip().lstrip(':')] for placeholder in placeholders.split(','))
+            rows += [(table_name, int(i), 1) for i in ids]
+        return pd.DataFrame(rows, columns=['TableName', 'SubHeadID', 'count'])
+    if 'COUNT(*)' in query:
+        return pd.DataFrame({'count': [1]})
+    if 'FROM tbl_headsmaster' in query and 'LIKE' in query:
+        return METADATA['heads'][['SubHeadID', 'SubHeadName']]
+    if 'FROM tbl_ratiosheadmaster' in query and 'LIKE' in query:
+        return METADATA['ratio_heads'][['SubHeadID', 'HeadNames']]
+    if re.search(r'\bAS Value\b', query, re.I):
+        # Value derived from the SQL and its parameters, so requests that leak state into each other change results
+        return pd.DataFrame({'Value': [float(zlib.crc32((query + repr(sorted(params.items()))).encode()))], 'Unit': ['PKR mn'], 'Term': ['3M'], 'Company': ['United Bank Limited'],
+                             'Metric': ['Net Profit'], 'Consolidation': ['Unconsolidated'],
+                             'PeriodEnd': [pd.Timestamp('2023-03-31')]})
+    return pd.DataFrame()
+
+
+def simulated_database():
+    """FinancialDatabase whose execute_query sleeps for LATENCY_S and answers from METADATA"""
+    with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock.MagicMock()):
+        db = FinancialDatabase('server', 'database')
+    db.metadata_cache.update(METADATA)
+
+    def execute_query(query, params=None, timeout=None):
+        time.sleep(LATENCY_S)
+        return answer(query, params)
+
+    db.execute_query = execute_query
+    return db
+
+
+def run(db, question):
+    company, metric, term, consolidation = question
+    return db.get_financial_data(company, metric, term, consolidation, context=QueryContext())
+
+
+def main():
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else 4
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+    else:
+        db = simulated_database()
+
+    # Measure the uncached resolution chain; repeated questions would otherwise be result cache hits
+    db.result_cache.max_entries = db.question_cache.max_entries = 0
+
+    # Warm the lazily built indexes so both runs measure steady state
+    run(db, QUESTIONS[0])
+
+    start = time.perf_counter()
+    sequential = [run(db, question) for question in QUESTIONS]
+    sequential_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        concurrent = list(executor.map(lambda question: run(db, question), QUESTIONS))
+    concurrent_s = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(sequential, concurrent))
+    print(f"Questions: {len(QUESTIONS)}, workers: {workers}")
+    print(f"Sequential:  {sequential_s:6.2f} s  ({len(QUESTIONS) / sequential_s:6.1f} questions/s)")
+    print(f"Thread pool: {concurrent_s:6.2f} s  ({len(QUESTIONS) / concurrent_s:6.1f} questions/s, "
+          f"{sequential_s / concurrent_s:.1f}x)")
+    print(f"Results differing between runs: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
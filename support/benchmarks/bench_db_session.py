@@ -0,0 +1,91 @@
+'''
+Benchmark: connection checkouts per question with and without a request-scoped session
+
+Without a session every execute_query checks a connection out of the pool (reset on
+return, pre-ping / ODBC handshake on a pool miss). FinancialDatabase.session() holds one
+connection for the whole resolution chain.
+
+Usage:
+    python support/benchmarks/bench_db_session.py           # simulated checkout and statement latency
+    python support/benchmarks/bench_db_session.py --live    # MGFinancials
+'''
+
+import os
+import sys
+import time
+from unittest import mock
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+from bench_concurrent_queries import LATENCY_S, METADATA, QUESTIONS, answer
+
+# Simulated cost of a pool checkout (reset of the returned connection plus pre-ping)
+CHECKOUT_S = 0.003
+
+
+def simulated_engine():
+    def connect():
+        time.sleep(CHECKOUT_S)
+        connection = mock.MagicMock()
+        connection.__enter__.return_value = connection
+        return connection
+
+    return mock.Mock(connect=mock.Mock(side_effect=connect))
+
+
+def simulated_read_sql_query(query, con, params=None):
+    time.sleep(LATENCY_S)
+    return answer(str(query), params)
+
+
+def measure(db, resolve):
+    db.connection_stats.reset()
+    start = time.perf_counter()
+    for company, metric, term, consolidation in QUESTIONS:
+        resolve(company, metric, term, consolidation, context=QueryContext())
+    elapsed = time.perf_counter() - start
+    return elapsed, db.get_connection_stats()
+
+
+def report(label, elapsed, stats):
+    print(f"{label:<22} {elapsed * 1000 / len(QUESTIONS):7.1f} ms/question  "
+          f"{stats['checkouts'] / len(QUESTIONS):5.1f} checkouts/question  "
+          f"{stats['statements'] / len(QUESTIONS):5.1f} statements/question")
+
+
+def main():
+    patcher = None
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+    else:
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=simulated_engine()):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache.update(METADATA)
+        patcher = mock.patch('app.core.database.financial_db.pd.read_sql_query', side_effect=simulated_read_sql_query)
+        patcher.start()
+
+    # Measure the uncached resolution chain; repeated questions would otherwise be result cache hits
+    db.result_cache.max_entries = db.question_cache.max_entries = 0
+
+    # Warm the lazily built indexes so both runs measure steady state
+    db.get_financial_data(*QUESTIONS[0], context=QueryContext())
+
+    # _get_financial_data is the same resolution chain without the surrounding session
+    per_statement = measure(db, db._get_financial_data)
+    per_request = measure(db, db.get_financial_data)
+
+    print(f"Questions: {len(QUESTIONS)}")
+    report("Checkout per statement", *per_statement)
+    report("Session per question", *per_request)
+    print(f"Speedup: {per_statement[0] / per_request[0]:.2f}x")
+
+    if patcher is not None:
+        patcher.stop()
+
+
+if __name__ == '__main__':
+    main()
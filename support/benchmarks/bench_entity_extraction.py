@@ -0,0 +1,134 @@
+'''
+Benchmark: accuracy and latency of the rule-based entity extractor on the questions of support/tests
+
+Each question is labelled with the company, metric, term, relative period type and
+dissection group it asks for. The rule-based extractor is scored field by field; questions
+below config.ENTITY_CONFIDENCE_THRESHOLD are the ones FinancialRAG still sends to Mistral.
+
+Usage:
+    python support/benchmarks/bench_entity_extraction.py                      # gazetteers of the labelled companies
+    python support/benchmarks/bench_entity_extraction.py --live MODEL_PATH    # MGFinancials metadata, and Mistral timed too
+'''
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from conf import config
+from app.core.database.company_resolver import CompanyResolver
+from app.core.database.metric_index import MetricIndex
+from app.core.rag.entity_extractor import EntityExtractor
+
+COMPANIES = pd.DataFrame({
+    'CompanyID': range(1, 12),
+    'CompanyName': ['Habib Bank Limited', 'United Bank Limited', 'MCB Bank Limited', 'Oil & Gas Development Company Limited',
+                    'Pakistan State Oil Company Limited', 'Engro Corporation Limited', 'Lucky Cement Limited',
+                    'TRG Pakistan Limited', 'Mari Energies Limited', 'Atlas Honda Limited', 'Bank Alfalah Limited'],
+    'Symbol': ['HBL', 'UBL', 'MCB', 'OGDC', 'PSO', 'ENGRO', 'LUCK', 'TRG', 'MARI', 'ATLH', 'BAFL'],
+})
+HEADS = pd.DataFrame({'SubHeadID': range(1, 9),
+                      'SubHeadName': ['Total Assets', 'Net Profit', 'Revenue', 'Cash and Balances', 'Gross Profit',
+                                      'Operating Expenses', 'Cost of Sales', 'Book Value per Share']})
+RATIO_HEADS = pd.DataFrame({'SubHeadID': range(100, 106),
+                            'HeadNames': ['Return on Equity', 'Debt to Equity Ratio', 'Gross Profit Margin',
+                                          'Dividend Payout', 'EPS', 'Return on Assets']})
+TERMS = ['3M', '6M', '9M', '12M', 'Q1', 'Q2', 'Q3', 'Q4', 'TTM']
+
+# Question -> (company, metric, term, relative_type, dissection group); None term means the
+# question names no period, so a correct extraction is not confident
+LABELLED = [
+    ("What is the most recent EPS of HBL?", ('HBL', 'EPS', 'TTM', 'most_recent_quarter', None)),
+    ("Show me OGDC's revenue for Q2 2023", ('OGDC', 'Revenue', 'Q2 2023', None, None)),
+    ("What was UBL's ROE in the latest quarter?", ('UBL', 'ROE', 'TTM', 'most_recent_quarter', None)),
+    ("Give me MCB's consolidated net profit for 6M 2023", ('MCB', 'Net Profit', '6M 2023', None, None)),
+    ("What is the current year-to-date revenue of PSO?", ('PSO', 'Revenue', 'TTM', 'ytd', None)),
+    ("Show me ENGRO's standalone total assets for the most recent period", ('ENGRO', 'Total Assets', 'TTM', 'most_recent_quarter', None)),
+    ("What was LUCK's debt to equity ratio in Q1 2023?", ('LUCK', 'Debt to Equity Ratio', 'Q1 2023', None, None)),
+    ("Give me the latest quarterly EPS for Habib Bank Limited", ('HBL', 'EPS', 'TTM', 'most_recent_quarter', None)),
+    ("What is HBL's EPS per share for the latest quarter?", ('HBL', 'EPS per share', 'TTM', 'most_recent_quarter', 1)),
+    ("Show me OGDC's revenue per share in Q2 2023", ('OGDC', 'Revenue per share', 'Q2 2023', None, 1)),
+    ("Give me UBL's book value per share for the most recent period", ('UBL', 'Book Value per Share', 'TTM', 'most_recent_quarter', 1)),
+    ("What is MCB's net profit as % of revenue?", ('MCB', 'Net Profit % of revenue', None, None, 4)),
+    ("Give me ENGRO's cost of sales as % of revenue for Q1 2023", ('ENGRO', 'Cost of Sales % of revenue', 'Q1 2023', None, 4)),
+    ("What is LUCK's cash as % of assets?", ('LUCK', 'cash % of asset', None, None, 3)),
+    ("Give me UBL's equity as % of assets for the latest quarter", ('UBL', 'Total Equity % of asset', 'TTM', 'most_recent_quarter', 3)),
+    ("What is OGDC's revenue annual growth?", ('OGDC', 'Revenue annual growth', None, None, 2)),
+    ("Give me PSO's assets annual growth for 2023", ('PSO', 'Total Assets annual growth', 'FY 2023', None, 2)),
+    ("What is ENGRO's quarterly growth in revenue?", ('ENGRO', 'Revenue quarterly growth', None, None, 5)),
+    ("What was the Assets of HBL on 30-6-2023 consolidated?", ('HBL', 'Total Assets', '3M', None, None)),
+    ("What was the Assets of HBL on 3-6-2023 consolidated?", ('HBL', 'Total Assets', '3M', None, None)),
+    ("What was the Assets of HBL 6M in FY 2023 consolidated?", ('HBL', 'Total Assets', '6M 2023', None, None)),
+    ("Mari Energies Limited's ROE with Unconsolidated on periodend 31-12-2023", ('MARI', 'ROE', '3M', None, None)),
+    ("Mari Energies Limited's ROE with Unconsolidated on periodend 2023-12-31", ('MARI', 'ROE', '3M', None, None)),
+    ("What is the latest EPS of HBL?", ('HBL', 'EPS', 'TTM', 'most_recent_quarter', None)),
+    ("What was the latest reported gross profit margin of MCB?", ('MCB', 'Gross Profit Margin', 'TTM', 'most_recent_quarter', None)),
+    ("What's the last available value of total assets for Engro Corp?", ('ENGRO', 'Total Assets', 'TTM', 'most_recent_quarter', None)),
+    ("What is the latest ROE of TRG?", ('TRG', 'ROE', 'TTM', 'most_recent_quarter', None)),
+    ("What's the most recent dividend payout of OGDC?", ('OGDC', 'Dividend Payout', 'TTM', 'most_recent_quarter', None)),
+    ("What is the most recent quarterly Revenue for Atlas Honda (unconsolidated)?", ('ATLH', 'Revenue', 'TTM', 'most_recent_quarter', None)),
+    ("What is the current total assets of PSO?", ('PSO', 'Total Assets', 'TTM', 'current', None)),
+    ("What is HBL's EPS?", ('HBL', 'EPS', None, None, None)),
+]
+
+FIELDS = ['company', 'metric', 'term', 'relative_type', 'dissection_group_id']
+
+
+def score(extract, resolve_company):
+    """Per-field accuracy, full matches, confident questions and wrong confident answers"""
+    correct = {field: 0 for field in FIELDS}
+    full = confident = confident_wrong = 0
+    latencies = []
+    for query, expected in LABELLED:
+        start = time.perf_counter()
+        entities = extract(query)
+        latencies.append(time.perf_counter() - start)
+        found = (resolve_company(entities.get('company')), (entities.get('metric') or '').lower(), entities.get('term'),
+                 entities.get('relative_type'), entities.get('dissection_group_id'))
+        wanted = (resolve_company(expected[0]), expected[1].lower()) + expected[2:]
+        matches = [a == b for a, b in zip(found, wanted)]
+        for field, match in zip(FIELDS, matches):
+            correct[field] += match
+        full += all(matches)
+        if entities.get('confidence', 0.0) >= config.ENTITY_CONFIDENCE_THRESHOLD:
+            confident += 1
+            confident_wrong += not all(matches)
+    return correct, full, confident, confident_wrong, latencies
+
+
+def report(label, correct, full, confident, confident_wrong, latencies):
+    n = len(LABELLED)
+    print(f"{label}: {full}/{n} fully correct; " + ", ".join(f"{field} {correct[field]}/{n}" for field in FIELDS))
+    print(f"    {sum(latencies) * 1000 / n:9.3f} ms/question (max {max(latencies) * 1000:.3f} ms); "
+          f"{confident}/{n} above the {config.ENTITY_CONFIDENCE_THRESHOLD} threshold, {confident_wrong} of them wrong")
+
+
+def main():
+    if '--live' in sys.argv:
+        from app.core.rag.financial_rag import FinancialRAG
+        model_path = sys.argv[sys.argv.index('--live') + 1]
+        rag = FinancialRAG('MUHAMMADUSMAN', 'MGFinancials', model_path=model_path)
+        resolve = rag.db.get_company_id
+        report("Rule-based", *score(rag.get_entity_extractor().extract, lambda name: resolve(name) if name else None))
+        report("Mistral", *score(rag._extract_entities_llm, lambda name: resolve(name) if name else None))
+        return
+
+    start = time.perf_counter()
+    resolver = CompanyResolver(COMPANIES)
+    extractor = EntityExtractor(resolver, MetricIndex(HEADS, RATIO_HEADS), TERMS)
+    build_s = time.perf_counter() - start
+
+    def resolve(name):
+        match = resolver.resolve(name) if name else None
+        return match[0] if match else None
+
+    print(f"{len(LABELLED)} labelled questions from support/tests; gazetteers built in {build_s * 1000:.1f} ms")
+    report("Rule-based", *score(extractor.extract, resolve))
+
+
+if __name__ == '__main__':
+    main()
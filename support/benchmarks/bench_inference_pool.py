@@ -0,0 +1,115 @@
+'''
+Benchmark: throughput and p95 latency of the inference worker pool under concurrent load
+
+Concurrent clients submit prompts to an InferencePool for several splits of the CPU cores
+into worker processes x generation threads, and to one in-process model under a lock (the
+INFERENCE_WORKERS = 0 path). The synthetic model is a matrix product per token whose BLAS
+thread count is pinned in each worker the way ctransformers pins its own.
+
+Usage:
+    python support/benchmarks/bench_inference_pool.py                        # synthetic model, splits of os.cpu_count()
+    python support/benchmarks/bench_inference_pool.py --splits 1x4,2x2,4x1
+    python support/benchmarks/bench_inference_pool.py --live MODEL_PATH      # Mistral GGUF model
+'''
+
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.chat.inference_pool import InferencePool, load_model
+
+CLIENTS = 8
+REQUESTS = 32
+TOKENS = 24
+MATRIX = 320
+
+PROMPT = "<s>[INST] You are a financial analyst assistant. Restate: HBL EPS Q2 2023 was 9.87 PKR. [/INST]\n\n"
+
+
+class MatmulModel:
+    """Stands in for the GGUF model: one matrix product per generated token"""
+
+    def __init__(self, np):
+        self.np = np
+        rng = np.random.default_rng(0)
+        self.weights = rng.standard_normal((MATRIX, MATRIX)).astype(np.float32)
+        self.state = rng.standard_normal((MATRIX, MATRIX)).astype(np.float32)
+
+    def __call__(self, prompt, stream=False, max_new_tokens=TOKENS, **generation):
+        for _ in range(max_new_tokens):
+            yield f"{float(self.np.tanh(self.state @ self.weights)[0, 0]):.3f} "
+
+
+def matmul_loader(model_path, threads):
+    """Pin the BLAS thread count before numpy loads in the worker, then build the synthetic model"""
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    import numpy as np
+    return MatmulModel(np)
+
+
+def drive(generate):
+    """Run REQUESTS generations from CLIENTS threads; throughput and latency percentiles"""
+    latencies = []
+    lock = threading.Lock()
+
+    def request(_):
+        start = time.perf_counter()
+        generate(PROMPT)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CLIENTS) as executor:
+        list(executor.map(request, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=20)
+    return REQUESTS / elapsed, statistics.median(latencies), percentiles[18]
+
+
+def main():
+    cores = os.cpu_count() or 1
+    if '--splits' in sys.argv:
+        splits = [tuple(int(part) for part in split.split('x')) for split in sys.argv[sys.argv.index('--splits') + 1].split(',')]
+    else:
+        splits = sorted({(workers, max(cores // workers, 1)) for workers in (1, 2, 4, 8) if workers <= max(cores, 2)})
+    if '--live' in sys.argv:
+        model_path, loader, generation = sys.argv[sys.argv.index('--live') + 1], load_model, {'max_new_tokens': 64}
+    else:
+        model_path, loader, generation = 'synthetic', matmul_loader, {'max_new_tokens': TOKENS}
+
+    print(f"{cores} cores, {CLIENTS} concurrent clients, {REQUESTS} requests of {generation['max_new_tokens']} tokens")
+
+    # INFERENCE_WORKERS = 0: the model in the calling process, requests take turns under a lock
+    threads = cores
+    model = loader(model_path, threads)
+    model_lock = threading.Lock()
+
+    def in_process(prompt):
+        with model_lock:
+            return ''.join(model(prompt, stream=True, **generation))
+
+    in_process(PROMPT)
+    throughput, p50, p95 = drive(in_process)
+    print(f"In-process, 1 x {threads} threads: {throughput:6.2f} requests/s, p50 {p50 * 1000:8.1f} ms, p95 {p95 * 1000:8.1f} ms")
+
+    for workers, threads in splits:
+        pool = InferencePool(model_path, workers=workers, threads=threads, queue_size=CLIENTS, timeout=None,
+                             loader=loader)
+        try:
+            pool.generate(PROMPT, **generation)
+            throughput, p50, p95 = drive(lambda prompt: pool.generate(prompt, **generation))
+            print(f"Pool, {workers} x {threads} threads:    {throughput:6.2f} requests/s, "
+                  f"p50 {p50 * 1000:8.1f} ms, p95 {p95 * 1000:8.1f} ms, rejected {pool.stats()['rejected']}")
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+'''
+Benchmark: startup metadata loading
+
+Compares the previous sequential SELECT * of every metadata table with the parallel,
+column-projected load, and with a warm start served from the local snapshot (revalidated
+in the background with one checksum query).
+
+Usage:
+    python support/benchmarks/bench_metadata_load.py           # simulated statement and transfer cost
+    python support/benchmarks/bench_metadata_load.py --live    # MGFinancials
+'''
+
+import os
+import re
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metadata_loader import METADATA_TABLES, MetadataLoader
+from bench_concurrent_queries import LATENCY_S
+from bench_db_session import simulated_engine
+
+# Simulated cost of reading one cell over ODBC into pandas
+CELL_S = 1e-6
+
+# Table -> (rows, columns used by the readers, other columns)
+TABLE_SHAPES = {
+    'tbl_companieslist': (700, ['CompanyID', 'CompanyName', 'Symbol', 'SectorID'], 18),
+    'tbl_industrynames': (40, ['IndustryID', 'IndustryName'], 4),
+    'tbl_sectornames': (60, ['SectorID', 'SectorName'], 4),
+    'tbl_industryandsectormapping': (60, ['sectorid', 'industryid'], 2),
+    'tbl_unitofmeasurement': (20, ['UnitID', 'UnitName'], 3),
+    'tbl_statementsname': (10, ['StatementID', 'StatementName'], 2),
+    'tbl_headsmaster': (25000, ['SubHeadID', 'SubHeadName', 'IndustryID', 'UnitID', 'StatementID'], 12),
+    'tbl_ratiosheadmaster': (4000, ['SubHeadID', 'HeadNames', 'IndustryID', 'UnitID'], 10),
+    'tbl_consolidation': (2, ['ConsolidationID', 'ConsolidationName'], 2),
+    'tbl_terms': (60, ['TermID', 'term'], 3),
+    'tbl_termsmapping': (200, ['TermMappingID', 'TermID'], 3),
+    'tbl_disectionmaster': (10, ['DisectionGroupID', 'DisectionName'], 2),
+}
+
+
+def build_tables():
+    tables = {}
+    for table_name, (rows, used, other) in TABLE_SHAPES.items():
+        data = {column: np.arange(rows) for column in used}
+        data.update({f"Extra{i}": np.arange(rows) for i in range(other)})
+        tables[table_name] = pd.DataFrame(data)
+    return tables
+
+
+class SimulatedServer:
+    """Answers metadata, schema and checksum queries, sleeping per statement and per cell returned"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.schema = pd.DataFrame([(table_name, column, 'int') for table_name, df in tables.items()
+                                    for column in df.columns],
+                                   columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+
+    def read_sql_query(self, query, con, params=None):
+        sql = str(query)
+        if 'INFORMATION_SCHEMA' in sql:
+            result = self.schema
+        elif 'CHECKSUM_AGG' in sql:
+            keys = re.findall(r"SELECT '(\w+)' AS TableKey", sql)
+            result = pd.DataFrame({'TableKey': keys, 'RowCount': [1] * len(keys), 'RowChecksum': [0] * len(keys)})
+        else:
+            columns, table_name = re.match(r"SELECT (.+) FROM (\w+)", sql).groups()
+            df = self.tables[table_name]
+            result = df if columns == '*' else df[columns.split(', ')]
+        time.sleep(LATENCY_S + result.size * CELL_S)
+        return result.copy()
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    patcher = None
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+    else:
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=simulated_engine()):
+            db = FinancialDatabase('server', 'database')
+        server = SimulatedServer(build_tables())
+        patcher = mock.patch('app.core.database.financial_db.pd.read_sql_query', side_effect=server.read_sql_query)
+        patcher.start()
+
+    with tempfile.TemporaryDirectory() as cache_dir, mock.patch('conf.config.CACHE_DIR', cache_dir):
+        sequential = timed(lambda: MetadataLoader(db.execute_query, max_workers=1).load())
+        cold = timed(lambda: db.load_metadata(use_snapshot=True))
+        warm = timed(lambda: db.load_metadata(use_snapshot=True))
+        revalidation = timed(db.metadata_revalidation.join) + warm
+
+    print(f"Metadata tables: {len(METADATA_TABLES)}")
+    print(f"{'Sequential SELECT *':<34} {sequential * 1000:8.1f} ms")
+    print(f"{'Parallel, projected (cold start)':<34} {cold * 1000:8.1f} ms  (includes schema catalog and snapshot write)")
+    print(f"{'Snapshot (warm start)':<34} {warm * 1000:8.1f} ms  (revalidated in background after {revalidation * 1000:.1f} ms)")
+    print(f"Speedup: cold {sequential / cold:.1f}x, warm {sequential / warm:.0f}x")
+
+    if patcher is not None:
+        patcher.stop()
+
+
+if __name__ == '__main__':
+    main()
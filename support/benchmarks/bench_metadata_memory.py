@@ -0,0 +1,116 @@
+'''
+Benchmark: bytes per metadata table as raw object-dtype frames vs compact frames
+
+Compact frames use int32 ids, categorical (or interned) names and precomputed lowercase
+name columns. The snapshot section shows how much of the compact metadata is memory-mapped
+from the snapshot file, i.e. shared between worker processes rather than held per worker.
+
+Usage:
+    python support/benchmarks/bench_metadata_memory.py           # synthetic master tables
+    python support/benchmarks/bench_metadata_memory.py --live    # MGFinancials
+'''
+
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.compact_metadata import compact_frame, frame_nbytes, memory_report
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metadata_loader import MetadataLoader
+from bench_db_session import simulated_engine
+from bench_metadata_load import SimulatedServer
+
+INDUSTRIES = 40
+HEAD_NAMES = 6000
+RATIO_NAMES = 900
+
+
+def build_tables():
+    rng = np.random.default_rng(7)
+    heads = rng.integers(0, HEAD_NAMES, 25000)
+    ratios = rng.integers(0, RATIO_NAMES, 4000)
+    return {
+        'tbl_companieslist': pd.DataFrame({
+            'CompanyID': np.arange(1, 701), 'CompanyName': [f"Company {i} Limited" for i in range(700)],
+            'Symbol': [f"C{i:03d}" for i in range(700)], 'SectorID': rng.integers(1, 60, 700)}),
+        'tbl_industrynames': pd.DataFrame({'IndustryID': np.arange(1, INDUSTRIES + 1),
+                                           'IndustryName': [f"Industry {i}" for i in range(INDUSTRIES)]}),
+        'tbl_sectornames': pd.DataFrame({'SectorID': np.arange(1, 61), 'SectorName': [f"Sector {i}" for i in range(60)]}),
+        'tbl_industryandsectormapping': pd.DataFrame({'sectorid': np.arange(1, 61),
+                                                      'industryid': rng.integers(1, INDUSTRIES + 1, 60)}),
+        'tbl_unitofmeasurement': pd.DataFrame({'UnitID': np.arange(1, 21), 'UnitName': [f"Unit {i}" for i in range(20)]}),
+        'tbl_statementsname': pd.DataFrame({'StatementID': np.arange(1, 11),
+                                            'StatementName': [f"Statement {i}" for i in range(10)]}),
+        'tbl_headsmaster': pd.DataFrame({
+            'SubHeadID': np.arange(1, 25001), 'SubHeadName': [f"Financial Head Name {i}" for i in heads],
+            'IndustryID': rng.integers(1, INDUSTRIES + 1, 25000), 'UnitID': rng.integers(1, 21, 25000),
+            'StatementID': rng.integers(1, 11, 25000)}),
+        'tbl_ratiosheadmaster': pd.DataFrame({
+            'SubHeadID': np.arange(1, 4001), 'HeadNames': [f"Ratio Head Name {i}" for i in ratios],
+            'IndustryID': rng.integers(1, INDUSTRIES + 1, 4000), 'UnitID': rng.integers(1, 21, 4000)}),
+        'tbl_consolidation': pd.DataFrame({'ConsolidationID': [1, 2],
+                                           'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+        'tbl_terms': pd.DataFrame({'TermID': np.arange(1, 61), 'term': [f"{i}M" for i in range(60)]}),
+        'tbl_termsmapping': pd.DataFrame({'TermMappingID': np.arange(1, 201), 'TermID': rng.integers(1, 61, 200)}),
+        'tbl_disectionmaster': pd.DataFrame({'DisectionGroupID': np.arange(1, 6),
+                                             'DisectionName': [f"Group {i}" for i in range(5)]}),
+    }
+
+
+def shared_bytes(frames):
+    """Bytes of numeric / categorical-code arrays backed by the memory-mapped snapshot"""
+    total = 0
+    for df in frames.values():
+        for column in df.columns:
+            values = df[column].array
+            array = values.codes if isinstance(values, pd.Categorical) else np.asarray(values)
+            if array.dtype != object and not array.flags.writeable:
+                total += array.nbytes
+    return total
+
+
+def main():
+    patcher = None
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+    else:
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=simulated_engine()):
+            db = FinancialDatabase('server', 'database')
+        patcher = mock.patch('app.core.database.financial_db.pd.read_sql_query',
+                             side_effect=SimulatedServer(build_tables()).read_sql_query)
+        patcher.start()
+
+    loader = MetadataLoader(db.execute_query)
+    catalog = db.get_schema_catalog()
+    raw = loader.load(catalog, compact=False)
+    compact = {key: compact_frame(df, loader.tables[key].names) for key, df in raw.items()}
+
+    print(f"{'Table':<26} {'raw bytes':>12} {'compact bytes':>14} {'ratio':>7}")
+    report = memory_report(raw, compact)
+    for key, sizes in report.items():
+        print(f"{key:<26} {sizes['before']:>12,} {sizes['after']:>14,} {sizes['before'] / sizes['after']:>6.1f}x")
+    before = sum(sizes['before'] for sizes in report.values())
+    after = sum(sizes['after'] for sizes in report.values())
+    print(f"{'Total':<26} {before:>12,} {after:>14,} {before / after:>6.1f}x")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        loader.path = os.path.join(cache_dir, 'metadata.pkl')
+        loader.write_snapshot(compact, {})
+        mapped = loader.read_snapshot().frames
+        shared = shared_bytes(mapped)
+        private = sum(frame_nbytes(df) for df in mapped.values()) - shared
+        print(f"Snapshot: {shared:,} bytes memory-mapped (shared across workers), {private:,} bytes per worker")
+
+    if patcher is not None:
+        patcher.stop()
+
+
+if __name__ == '__main__':
+    main()
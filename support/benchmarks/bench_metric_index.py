@@ -0,0 +1,97 @@
+'''
+Benchmark: metric-name resolution with pandas scans vs the prebuilt MetricIndex
+
+Usage:
+    python support/benchmarks/bench_metric_index.py           # synthetic head tables
+    python support/benchmarks/bench_metric_index.py --live    # heads loaded from MGFinancials
+'''
+
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.metric_index import MetricIndex
+
+WORDS = ['total', 'net', 'gross', 'operating', 'profit', 'revenue', 'assets', 'liabilities', 'equity',
+         'cash', 'income', 'expense', 'tax', 'interest', 'depreciation', 'amortisation', 'deposits',
+         'advances', 'investments', 'reserves', 'capital', 'margin', 'return', 'on', 'ratio', 'debt']
+
+
+def synthetic_heads(n_heads=12000, n_ratios=2500, seed=7):
+    rng = random.Random(seed)
+    heads = pd.DataFrame({
+        'SubHeadID': range(1, n_heads + 1),
+        'SubHeadName': [' '.join(rng.sample(WORDS, rng.randint(2, 5))).title() for _ in range(n_heads)],
+    })
+    ratios = pd.DataFrame({
+        'SubHeadID': range(1, n_ratios + 1),
+        'HeadNames': [' '.join(rng.sample(WORDS, rng.randint(2, 4))).title() for _ in range(n_ratios)],
+    })
+    return heads, ratios
+
+
+def live_heads():
+    from app.core.database.financial_db import FinancialDatabase
+    db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+    return db.execute_query("SELECT * FROM tbl_headsmaster"), db.execute_query("SELECT * FROM tbl_ratiosheadmaster")
+
+
+def pandas_resolve(heads, ratios, metric_name, prefer_ratio):
+    """The scan sequence FinancialDatabase.get_head_id ran before the index"""
+    order = [(ratios, 'HeadNames', True), (heads, 'SubHeadName', False)]
+    if not prefer_ratio:
+        order.reverse()
+    for df, name_col, is_ratio in order:
+        lowered = df[name_col].str.lower()
+        match = df[lowered == metric_name.lower()]
+        if match.empty:
+            match = df[lowered.str.contains(metric_name.lower(), regex=False)]
+        if match.empty:
+            match = df[lowered.apply(lambda x: metric_name.lower() in x)]
+        if not match.empty:
+            return match.iloc[0]['SubHeadID'], is_ratio
+    return None, False
+
+
+def timed(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for metric, prefer_ratio in queries:
+            fn(metric, prefer_ratio)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def main():
+    heads, ratios = live_heads() if '--live' in sys.argv else synthetic_heads()
+    queries = [('total assets', False), ('net profit', False), ('return on equity', True),
+               ('gross margin', True), ('deposits', False), ('no such metric', False)]
+
+    start = time.perf_counter()
+    index = MetricIndex(heads, ratios)
+    build_s = time.perf_counter() - start
+
+    for metric, prefer_ratio in queries:
+        expected = pandas_resolve(heads, ratios, metric, prefer_ratio)
+        match = index.resolve(metric, prefer_ratio)
+        actual = (match[0], match[1]) if match else (None, False)
+        assert actual == expected, (metric, actual, expected)
+
+    pandas_s = timed(lambda m, r: pandas_resolve(heads, ratios, m, r), queries, repeat=5)
+    index_s = timed(index.resolve, queries, repeat=200)
+    similar_s = timed(lambda m, r: index.similar(m), queries, repeat=50)
+
+    print(f"Heads: {len(heads)} regular, {len(ratios)} ratio")
+    print(f"Index build:          {build_s * 1000:8.1f} ms")
+    print(f"pandas resolve:       {pandas_s * 1000:8.3f} ms/lookup")
+    print(f"MetricIndex resolve:  {index_s * 1000:8.3f} ms/lookup ({pandas_s / index_s:,.0f}x)")
+    print(f"MetricIndex similar:  {similar_s * 1000:8.3f} ms/lookup")
+
+
+if __name__ == '__main__':
+    main()
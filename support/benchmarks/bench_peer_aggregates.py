@@ -0,0 +1,129 @@
+'''
+Benchmark: build / refresh time of the peer aggregates and peer-comparison latency
+
+The per-peer path reads every company of the sector with its own statement and computes
+the statistics on the fly; the aggregates answer the same comparison with one dictionary
+lookup. Refresh time is measured after a new quarter lands in the ratio table.
+
+Usage:
+    python support/benchmarks/bench_peer_aggregates.py           # synthetic Mettis-sized universe
+    python support/benchmarks/bench_peer_aggregates.py --live    # MGFinancials
+'''
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.peer_aggregates import PeerAggregates
+from bench_concurrent_queries import LATENCY_S
+
+# Rough shape of the listed universe: companies, sectors, ratio heads reported per company, quarters kept
+N_COMPANIES = 800
+N_SECTORS = 35
+N_RATIO_HEADS = 400
+HEADS_PER_COMPANY = 150
+N_PERIODS = 12
+N_COMPARISONS = 20
+TERM_ID = 4
+
+LIVE_COMPARISONS = [('HBL', 'Return on Equity', '12M 2023'), ('LUCK', 'Gross Profit Margin', '12M 2023'),
+                    ('ENGRO', 'Return on Assets', '12M 2023')]
+
+
+def build_ratio_table(periods, seed=29):
+    rng = np.random.default_rng(seed)
+    heads = np.concatenate([rng.choice(N_RATIO_HEADS, HEADS_PER_COMPANY, replace=False) + 1 for _ in range(N_COMPANIES)])
+    companies = np.repeat(np.arange(1, N_COMPANIES + 1), HEADS_PER_COMPANY)
+    return pd.DataFrame({
+        'CompanyID': np.repeat(companies, len(periods)),
+        'SubHeadID': np.repeat(heads, len(periods)),
+        'TermID': TERM_ID,
+        'ConsolidationID': 1,
+        'PeriodEnd': np.tile(periods.to_numpy(), len(heads)),
+        'Value': rng.normal(10, 8, len(heads) * len(periods)),
+    })
+
+
+def per_peer_statistics(table, company_groups, sector_id, head_id, period_end):
+    """One statement per peer, then the statistics in Python"""
+    values = []
+    for company_id in company_groups.loc[company_groups['SectorID'] == sector_id, 'CompanyID']:
+        time.sleep(LATENCY_S)
+        rows = table[(table['CompanyID'] == company_id) & (table['SubHeadID'] == head_id)
+                     & (table['PeriodEnd'] == period_end)]
+        values += rows['Value'].tolist()
+    return len(values), float(np.mean(values)) if values else None, float(np.median(values)) if values else None
+
+
+def main():
+    if '--live' in sys.argv:
+        from app.core.database.financial_db import FinancialDatabase
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        start = time.perf_counter()
+        store = db.build_peer_aggregates()
+        print(f"Built in {time.perf_counter() - start:.1f} s, {store.nbytes() / 1e6:.1f} MB")
+        start = time.perf_counter()
+        store.refresh()
+        print(f"Refreshed in {time.perf_counter() - start:.1f} s")
+        for comparison in LIVE_COMPARISONS:
+            start = time.perf_counter()
+            response = db.compare_to_peers(*comparison)
+            print(f"{comparison}: {(time.perf_counter() - start) * 1000:.1f} ms -> {response}")
+        return
+
+    periods = pd.date_range('2021-03-31', periods=N_PERIODS + 1, freq='Q')
+    full = build_ratio_table(periods)
+    table = full[full['PeriodEnd'] < periods[-1]]
+    company_groups = pd.DataFrame({'CompanyID': np.arange(1, N_COMPANIES + 1)})
+    company_groups['SectorID'] = company_groups['CompanyID'] % N_SECTORS + 1
+    company_groups['IndustryID'] = company_groups['SectorID'] * 10
+
+    def fetch(query):
+        time.sleep(LATENCY_S)
+        since = (query.params or {}).get('since')
+        return table if since is None else table[table['PeriodEnd'] >= since]
+
+    start = time.perf_counter()
+    store = PeerAggregates(fetch, company_groups, {'ratio': 'tbl_ratiorawdata'}).build()
+    build_s = time.perf_counter() - start
+
+    # A new quarter lands; the refresh re-reads the watermark quarter and the new one
+    table = full
+    start = time.perf_counter()
+    replaced = store.refresh()
+    refresh_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(31)
+    comparisons = [(int(rng.integers(1, N_SECTORS + 1)), int(rng.integers(1, N_RATIO_HEADS + 1)), periods[-1])
+                   for _ in range(N_COMPARISONS)]
+    start = time.perf_counter()
+    expected = [per_peer_statistics(table, company_groups, *comparison) for comparison in comparisons]
+    per_peer_s = (time.perf_counter() - start) / N_COMPARISONS
+
+    start = time.perf_counter()
+    found = [store.lookup('tbl_ratiorawdata', 'sector', sector_id, head_id, TERM_ID, 1, period_end)
+             for sector_id, head_id, period_end in comparisons]
+    lookup_s = (time.perf_counter() - start) / N_COMPARISONS
+
+    mismatches = sum((stats is None) != (count == 0)
+                     or (stats is not None and (stats['Count'] != count or not np.isclose(stats['Mean'], mean)
+                                                or not np.isclose(stats['Median'], median)))
+                     for stats, (count, mean, median) in zip(found, expected))
+    print(f"Universe: {N_COMPANIES} companies in {N_SECTORS} sectors, {len(full):,} ratio rows over {N_PERIODS + 1} quarters")
+    print(f"Build:              {build_s * 1000:9.1f} ms  {sum(len(frame) for frame in store.frames.values()):,} groups, "
+          f"{store.nbytes() / 1e6:.1f} MB")
+    print(f"Refresh (1 quarter): {refresh_s * 1000:8.1f} ms  {replaced:,} groups re-aggregated")
+    print(f"Per-peer queries:   {per_peer_s * 1000:9.2f} ms/comparison (~{N_COMPANIES // N_SECTORS} statements)")
+    print(f"Aggregate lookup:   {lookup_s * 1000:9.3f} ms/comparison  ({per_peer_s / lookup_s:.0f}x)")
+    print(f"Comparisons differing from per-peer statistics: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
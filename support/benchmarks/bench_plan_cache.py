@@ -0,0 +1,178 @@
+'''
+Benchmark: plan-cache entries and compilations with inlined literals vs bound parameters
+
+With literals inlined every new CompanyID / SubHeadID / date / LIKE pattern is new SQL text,
+so SQL Server compiles (and caches) a single-use plan for it. With bound parameters the text
+only changes with the statement shape and warm plans are reused.
+
+Each mode first answers a warmup set of questions, then a measured set of different questions,
+so the measured half shows the steady state of a warm server.
+
+Usage:
+    python support/benchmarks/bench_plan_cache.py           # simulated compile and statement latency
+    python support/benchmarks/bench_plan_cache.py --live    # MGFinancials (needs VIEW SERVER STATE)
+'''
+
+import datetime
+import os
+import re
+import sys
+import time
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+from bench_concurrent_queries import LATENCY_S, METADATA, answer
+from bench_db_session import simulated_engine
+
+# Simulated cost of compiling a statement the plan cache has not seen
+COMPILE_S = 0.003
+
+COMPANIES = 40
+METRICS = ['Net Profit', 'Total Deposits', 'Return on Equity']
+TERMS = ['Q1 2023', '6M 2023', '3M 2024', 'TTM']
+
+COMPILATIONS_SQL = """
+    SELECT cntr_value FROM sys.dm_os_performance_counters
+    WHERE counter_name = 'SQL Compilations/sec'"""
+SINGLE_USE_PLANS_SQL = """
+    SELECT COUNT(*) AS plans FROM sys.dm_exec_cached_plans
+    WHERE usecounts = 1 AND objtype IN ('Adhoc', 'Prepared')"""
+
+
+def build_metadata():
+    """METADATA with COMPANIES companies, so questions differ in their CompanyID"""
+    metadata = dict(METADATA)
+    ids = list(range(1, COMPANIES + 1))
+    metadata['companies'] = pd.DataFrame({'CompanyID': ids,
+                                          'CompanyName': [f"Company {i:02d} Limited" for i in ids],
+                                          'Symbol': [f"C{i:02d}" for i in ids],
+                                          'SectorID': [10] * COMPANIES})
+    return metadata
+
+
+def build_questions():
+    questions = []
+    for i in range(1, COMPANIES + 1):
+        questions.append((f"C{i:02d}", METRICS[i % len(METRICS)], TERMS[i % len(TERMS)],
+                          'consolidated' if i % 2 else 'unconsolidated'))
+    return questions
+
+
+def sql_literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return f"'{value:%Y-%m-%d}'"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def inline_sql(query, params):
+    """query with every :name placeholder replaced by its literal value, as before binding"""
+    if not params:
+        return str(query)
+    return re.sub(r':(\w+)\b', lambda m: sql_literal(params[m.group(1)]) if m.group(1) in params else m.group(0),
+                  str(query))
+
+
+class SimulatedPlanCache:
+    """Sleeps for COMPILE_S the first time it sees a statement text, LATENCY_S per execution"""
+
+    def __init__(self):
+        self.plans = {}
+
+    def read_sql_query(self, query, con, params=None):
+        sql = str(query)
+        if sql not in self.plans:
+            time.sleep(COMPILE_S)
+            self.plans[sql] = 0
+        self.plans[sql] += 1
+        time.sleep(LATENCY_S)
+        return answer(sql, params)
+
+    def counters(self):
+        return {'compilations': len(self.plans), 'single_use_plans': sum(1 for uses in self.plans.values() if uses == 1)}
+
+
+def live_counters(db):
+    try:
+        compilations = int(db.execute_query(COMPILATIONS_SQL).iloc[0]['cntr_value'])
+        plans = int(db.execute_query(SINGLE_USE_PLANS_SQL).iloc[0]['plans'])
+    except Exception as e:
+        sys.exit(f"Could not read plan cache counters (VIEW SERVER STATE required): {e}")
+    return {'compilations': compilations, 'single_use_plans': plans}
+
+
+def run(db, questions, inline, counters):
+    """Answer questions, returning elapsed seconds and the change in counters"""
+    original = FinancialDatabase._read_sql
+
+    def read_sql(self, query, params, connection, timeout):
+        return original(self, inline_sql(query, params), None, connection, timeout)
+
+    patcher = mock.patch.object(FinancialDatabase, '_read_sql', read_sql) if inline else None
+    if patcher is not None:
+        patcher.start()
+    try:
+        before = counters()
+        start = time.perf_counter()
+        for company, metric, term, consolidation in questions:
+            db.get_financial_data(company, metric, term, consolidation, context=QueryContext())
+        elapsed = time.perf_counter() - start
+        after = counters()
+    finally:
+        if patcher is not None:
+            patcher.stop()
+    return elapsed, {name: after[name] - before[name] for name in after}
+
+
+def report(label, questions, elapsed, deltas):
+    print(f"{label:<20} {elapsed * 1000 / len(questions):7.1f} ms/question  "
+          f"{deltas['compilations'] / len(questions):5.1f} compilations/question  "
+          f"{deltas['single_use_plans']:+5d} single-use plans")
+
+
+def main():
+    questions = build_questions()
+    warmup, measured = questions[::2], questions[1::2]
+    patcher = None
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        counters = lambda: live_counters(db)
+    else:
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=simulated_engine()):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache.update(build_metadata())
+        plan_cache = SimulatedPlanCache()
+        counters = plan_cache.counters
+        patcher = mock.patch('app.core.database.financial_db.pd.read_sql_query', side_effect=plan_cache.read_sql_query)
+        patcher.start()
+
+    # Both modes answer the same questions; keep the result cache from serving the second one
+    db.result_cache.max_entries = db.question_cache.max_entries = 0
+
+    results = {}
+    for label, inline in (("Inlined literals", True), ("Bound parameters", False)):
+        run(db, warmup, inline, counters)
+        results[label] = run(db, measured, inline, counters)
+
+    print(f"Questions: {len(warmup)} warmup + {len(measured)} measured per mode")
+    for label, (elapsed, deltas) in results.items():
+        report(label, measured, elapsed, deltas)
+    inlined, bound = results["Inlined literals"], results["Bound parameters"]
+    print(f"Speedup: {inlined[0] / bound[0]:.2f}x")
+
+    if patcher is not None:
+        patcher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Benchmark: multi-condition screens over every listed company, SQL per screen vs the in-memory ratio screener
+
+The SQL path filters the ratio table once per screen (one statement, a scan of every row of
+the screened heads, then the latest row per company); the screener loads the latest-row
+snapshot once and answers each screen with numpy over the companies x heads matrix.
+
+Usage:
+    python support/benchmarks/bench_screener.py           # synthetic Mettis-sized universe
+    python support/benchmarks/bench_screener.py --live    # MGFinancials
+'''
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.screener import OPERATORS, Condition, RatioScreener
+from bench_concurrent_queries import LATENCY_S
+
+# Rough shape of the listed universe: companies, ratio heads reported per company, periods kept
+N_COMPANIES = 800
+N_RATIO_HEADS = 400
+HEADS_PER_COMPANY = 150
+N_PERIODS = 24
+N_SCREENS = 200
+TOP_N = 50
+
+LIVE_SCREENS = [
+    [('Return on Equity', '>', 20), ('Price to Earnings', '<', 6)],
+    [('Return on Assets', '>', 2)],
+    [('Debt to Equity', '<', 1), ('Return on Equity', '>', 10)],
+]
+
+
+def build_ratio_table(seed=17):
+    """Every company reports HEADS_PER_COMPANY heads for N_PERIODS quarters, consolidated and not"""
+    rng = np.random.default_rng(seed)
+    heads = np.concatenate([rng.choice(N_RATIO_HEADS, HEADS_PER_COMPANY, replace=False) + 1 for _ in range(N_COMPANIES)])
+    companies = np.repeat(np.arange(1, N_COMPANIES + 1), HEADS_PER_COMPANY)
+    periods = pd.date_range('2018-03-31', periods=N_PERIODS, freq='Q')
+    n = len(heads) * N_PERIODS
+    table = pd.DataFrame({
+        'CompanyID': np.repeat(companies, N_PERIODS),
+        'SubHeadID': np.repeat(heads, N_PERIODS),
+        'PeriodEnd': np.tile(periods.to_numpy(), len(heads)),
+        'Value': rng.normal(10, 8, n),
+    })
+    return pd.concat([table.assign(ConsolidationID=1), table.assign(ConsolidationID=2, Value=table['Value'] * 0.9)],
+                     ignore_index=True)
+
+
+def random_screens(seed=23):
+    rng = np.random.default_rng(seed)
+    screens = []
+    for _ in range(N_SCREENS):
+        head_ids = rng.choice(N_RATIO_HEADS, rng.integers(1, 4), replace=False) + 1
+        screens.append([Condition((int(head_id),), str(rng.choice(['>', '<'])), float(rng.normal(10, 4)), f"h{head_id}")
+                        for head_id in head_ids])
+    return screens
+
+
+def sql_screen(table, conditions, consolidation_id):
+    """What one statement per screen does on the server: latest row per company of each head, then filter"""
+    time.sleep(LATENCY_S)
+    result = None
+    for condition in conditions:
+        rows = table[(table['SubHeadID'] == condition.head_ids[0]) & (table['ConsolidationID'] == consolidation_id)]
+        latest = rows.sort_values('PeriodEnd').drop_duplicates('CompanyID', keep='last')
+        latest = latest[OPERATORS[condition.op](latest['Value'], condition.threshold)]
+        latest = latest[['CompanyID', 'Value']].rename(columns={'Value': condition.label})
+        result = latest if result is None else result.merge(latest, on='CompanyID')
+    return result.sort_values(conditions[0].label, ascending=False, kind='stable').head(TOP_N)
+
+
+def main():
+    if '--live' in sys.argv:
+        from app.core.database.financial_db import FinancialDatabase
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        start = time.perf_counter()
+        db.build_ratio_screener()
+        print(f"Snapshot built in {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"{db.ratio_screener.nbytes() / 1e6:.1f} MB")
+        for conditions in LIVE_SCREENS:
+            start = time.perf_counter()
+            result = db.screen_companies(conditions)
+            print(f"{conditions}: {len(result)} companies in {(time.perf_counter() - start) * 1000:.2f} ms")
+        return
+
+    table = build_ratio_table()
+    screens = random_screens()
+
+    def fetch(query):
+        time.sleep(LATENCY_S)
+        return table.sort_values('PeriodEnd').drop_duplicates(['CompanyID', 'SubHeadID', 'ConsolidationID'], keep='last')
+
+    start = time.perf_counter()
+    sql_results = [sql_screen(table, conditions, 1) for conditions in screens]
+    sql_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    screener = RatioScreener(fetch).build()
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    screened = [screener.screen(conditions, 1, top=TOP_N) for conditions in screens]
+    screen_s = time.perf_counter() - start
+
+    mismatches = sum(expected['CompanyID'].tolist() != result['CompanyID'].tolist()
+                     or not np.allclose(expected.iloc[:, 1].to_numpy(), result.iloc[:, 1].to_numpy())
+                     for expected, result in zip(sql_results, screened))
+    print(f"Universe: {N_COMPANIES} companies x {N_RATIO_HEADS} ratio heads, {len(table):,} ratio rows; "
+          f"{N_SCREENS} screens of 1-3 conditions, top {TOP_N}")
+    print(f"SQL per screen:    {sql_s * 1000 / N_SCREENS:8.2f} ms/screen")
+    print(f"Screener build:    {build_s * 1000:8.1f} ms once, {screener.nbytes() / 1e6:.1f} MB")
+    print(f"Screener:          {screen_s * 1000 / N_SCREENS:8.2f} ms/screen  ({sql_s / screen_s:.0f}x)")
+    print(f"Screens differing from SQL: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+'''
+Benchmark: follow-up questions about one statement, one lookup per question vs the statement prefetch
+
+A session asks several line items of the same balance sheet in a row (assets, then
+liabilities, then equity ...). Without the prefetch every question sends its own value
+statement; with it the first question reads the whole statement once and the follow-ups are
+answered from the result cache. Every statement costs LATENCY_S.
+
+Usage:
+    python support/benchmarks/bench_statement_prefetch.py           # synthetic statements
+    python support/benchmarks/bench_statement_prefetch.py --live    # MGFinancials
+'''
+
+import os
+import re
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_planner import PLAN_COLUMNS
+from app.core.database.statement_prefetch import STATEMENT_COLUMNS
+from bench_concurrent_queries import LATENCY_S
+
+N_COMPANIES = 30
+HEADS_PER_STATEMENT = 40
+FOLLOW_UPS = 5
+TERM = '12M 2023'
+
+LIVE_SESSIONS = [('HBL', ['Total Assets', 'Total Liabilities', 'Total Equity', 'Deposits', 'Advances'])]
+
+
+def build_metadata():
+    ids = list(range(1, N_COMPANIES + 1))
+    head_ids = list(range(1, 2 * HEADS_PER_STATEMENT + 1))
+    return {
+        'companies': pd.DataFrame({'CompanyID': ids, 'CompanyName': [f"Company {i:02d} Limited" for i in ids],
+                                   'Symbol': [f"C{i:02d}" for i in ids], 'SectorID': 10}),
+        'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+        'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+        'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+        'statements': pd.DataFrame({'StatementID': [1, 2], 'StatementName': ['Balance Sheet', 'Profit and Loss']}),
+        'heads': pd.DataFrame({'SubHeadID': head_ids, 'SubHeadName': [f"Line Item {i:03d}" for i in head_ids],
+                               'IndustryID': 100, 'StatementID': [1 + (i > HEADS_PER_STATEMENT) for i in head_ids]}),
+        'ratio_heads': pd.DataFrame({'SubHeadID': [900], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+        'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+        'terms': pd.DataFrame({'TermID': [1, 2], 'term': ['6M', '12M']}),
+        'terms_mapping': pd.DataFrame(),
+        'dissection': pd.DataFrame(),
+    }
+
+
+class SimulatedServer:
+    """Answers the lookups of get_financial_data from a generated raw table, LATENCY_S per statement"""
+
+    def __init__(self, metadata, seed=41):
+        rng = np.random.default_rng(seed)
+        heads = metadata['heads']
+        companies = np.repeat(metadata['companies']['CompanyID'].to_numpy(), len(heads))
+        self.rows = pd.DataFrame({
+            'Value': rng.normal(1000, 300, len(companies)), 'Unit': 'PKR mn', 'Term': '12M',
+            'Company': 'Company', 'Metric': np.tile(heads['SubHeadName'].to_numpy(), len(metadata['companies'])),
+            'Consolidation': 'Consolidated', 'PeriodEnd': pd.Timestamp('2023-12-31'),
+            'SubHeadID': np.tile(heads['SubHeadID'].to_numpy(), len(metadata['companies'])),
+            'SourceTable': 'tbl_financialrawdata', 'DisectionGroupID': None,
+            'StatementID': np.tile(heads['StatementID'].to_numpy(), len(metadata['companies'])), 'Statement': 'Balance Sheet',
+            'CompanyID': companies,
+        })
+        self.heads = heads
+        self.round_trips = 0
+        self.value_statements = 0
+
+    def execute_query(self, query, params=None, timeout=None):
+        params = params if params is not None else getattr(query, 'params', None) or {}
+        self.round_trips += 1
+        time.sleep(LATENCY_S)
+        if 'INFORMATION_SCHEMA' in query:
+            return pd.DataFrame([('tbl_financialrawdata', 'CompanyID', 'int')], columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+        rows = self.rows[self.rows['CompanyID'] == params.get('company_id')]
+        if getattr(query, 'name', None) in ('query_plan', 'statement_prefetch'):
+            self.value_statements += 1
+        if getattr(query, 'name', None) == 'query_plan':
+            heads = [value for name, value in params.items() if re.fullmatch(r'k\d+_\d+_0', name)]
+            return rows[rows['SubHeadID'].isin(heads)].head(1)[PLAN_COLUMNS]
+        if getattr(query, 'name', None) == 'statement_prefetch':
+            return rows[rows['StatementID'] == params['statement_id']][STATEMENT_COLUMNS]
+        if 'AS TableName' in query:
+            heads = [value for name, value in params.items() if name.startswith('sub_head_ids_')]
+            return pd.DataFrame([('tbl_financialrawdata', head_id, 1) for head_id in heads],
+                                columns=['TableName', 'SubHeadID', 'count'])
+        if re.search(r'FROM tbl_headsmaster h', query) and 'SubHeadID, h.' in query:
+            match = self.heads['SubHeadName'].str.lower() == params.get('name', '').lower()
+            return self.heads[match][['SubHeadID', 'SubHeadName']]
+        return pd.DataFrame()
+
+
+def run(metadata, sessions, prefetch):
+    server = SimulatedServer(metadata)
+    with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+        db = FinancialDatabase('server', 'database')
+    db.metadata_cache.update(metadata)
+    db.execute_query = server.execute_query
+    db.session = mock.MagicMock()
+    db.question_cache.max_entries = 0
+    db.has_table('tbl_financialrawdata')
+    server.round_trips = server.value_statements = 0
+    # Follow-ups arrive after the user has read the answer, by which time the background
+    # prefetch has landed; wait for it between questions to model that
+    prefetches = []
+    submit = db.prefetch_statement_in_background
+    db.prefetch_statement_in_background = lambda *args: prefetches.append(submit(*args))
+
+    answers = []
+    with mock.patch('app.core.database.financial_db.config.STATEMENT_PREFETCH', prefetch):
+        start = time.perf_counter()
+        for company, metrics in sessions:
+            for metric in metrics:
+                answers.append(db.get_financial_data(company, metric, TERM).get('value'))
+                while prefetches:
+                    prefetches.pop().result()
+        elapsed = time.perf_counter() - start
+    return elapsed, (server.round_trips, server.value_statements), answers, db.get_result_cache_stats()['prefetch']
+
+
+def main():
+    if '--live' in sys.argv:
+        db = FinancialDatabase('MUHAMMADUSMAN', 'MGFinancials')
+        db.load_metadata()
+        for company, metrics in LIVE_SESSIONS:
+            for metric in metrics:
+                start = time.perf_counter()
+                response = db.get_financial_data(company, metric, TERM)
+                print(f"{company} {metric}: {(time.perf_counter() - start) * 1000:.1f} ms -> {response.get('value')}")
+        print(f"Prefetch: {db.get_result_cache_stats()['prefetch']}")
+        return
+
+    metadata = build_metadata()
+    rng = np.random.default_rng(43)
+    sessions = [(f"C{i:02d}", [f"Line Item {head_id:03d}" for head_id in
+                               rng.choice(HEADS_PER_STATEMENT, FOLLOW_UPS, replace=False) + 1])
+                for i in range(1, N_COMPANIES + 1)]
+    n_questions = N_COMPANIES * FOLLOW_UPS
+
+    plain_s, plain_trips, expected, _ = run(metadata, sessions, prefetch=False)
+    prefetch_s, prefetch_trips, answers, stats = run(metadata, sessions, prefetch=True)
+
+    mismatches = sum(a != b for a, b in zip(expected, answers))
+    print(f"{N_COMPANIES} sessions of {FOLLOW_UPS} line items from a {HEADS_PER_STATEMENT}-item balance sheet")
+    # Term, head and availability lookups of the resolution chain run either way
+    print(f"One lookup per question: {plain_s * 1000 / n_questions:7.2f} ms/question, "
+          f"{plain_trips[0]} statements ({plain_trips[1]} value reads)")
+    print(f"Statement prefetch:      {prefetch_s * 1000 / n_questions:7.2f} ms/question, "
+          f"{prefetch_trips[0]} statements ({prefetch_trips[1]} value reads, {plain_s / prefetch_s:.2f}x)")
+    print(f"Prefetch: {stats['statements']} statements, {stats['prefetched']} line items cached, "
+          f"{stats['used']} read by follow-ups (hit rate {stats['hit_rate']:.1%})")
+    print(f"Answers differing from per-question lookups: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+'''
+In-memory stand-in for the financial database, shared by the query-path unit tests
+'''
+
+import re
+
+import pandas as pd
+
+from app.core.database.query_planner import PLAN_COLUMNS
+from app.core.database.statement_prefetch import STATEMENT_COLUMNS
+
+RAW_COLUMNS = ['CompanyID', 'SubHeadID', 'TermID', 'ConsolidationID', 'FY', 'PeriodEnd', 'Value_']
+
+
+def data_rows(rows):
+    return pd.DataFrame(rows, columns=RAW_COLUMNS)
+
+
+class FakeServer:
+    """
+    Answers the statements of the query path from in-memory raw data tables: query plans,
+    statement prefetches, time series, cumulative panels, batch values, availability probes
+    and the head / term lookups of the resolution chain.
+
+    Labels (company, metric, term, consolidation, statement) come from the same metadata
+    frames the FinancialDatabase under test is given, so a test module only declares its
+    raw tables and metadata.
+    """
+
+    def __init__(self, tables, metadata, unit='PKR mn'):
+        self.tables = dict(tables)
+        self.metadata = metadata
+        self.unit = unit
+        self.queries = []
+
+        heads, ratio_heads = metadata['heads'], metadata['ratio_heads']
+        self.company_names = dict(zip(metadata['companies']['CompanyID'], metadata['companies']['CompanyName']))
+        self.head_names = {**dict(zip(heads['SubHeadID'], heads['SubHeadName'])),
+                           **dict(zip(ratio_heads['SubHeadID'], ratio_heads['HeadNames']))}
+        self.term_names = dict(zip(metadata['terms']['TermID'], metadata['terms']['term']))
+        self.consolidation_names = dict(zip(metadata['consolidation']['ConsolidationID'],
+                                            metadata['consolidation']['ConsolidationName']))
+        self.head_statements = dict(zip(heads['SubHeadID'], heads['StatementID'])) if 'StatementID' in heads else {}
+        statements = metadata.get('statements')
+        self.statement_names = ({} if statements is None else
+                                dict(zip(statements['StatementID'], statements['StatementName'])))
+
+    def names(self):
+        return [getattr(query, 'name', None) for query in self.queries]
+
+    def records(self, table_name, company_ids=None, head_ids=None, consolidation_id=None, term_id=None,
+                fiscal_year=None, period_end=None):
+        df = self.tables.get(table_name, data_rows([]))
+        for column, values in (('CompanyID', company_ids), ('SubHeadID', head_ids)):
+            if values is not None:
+                df = df[df[column].isin(values)]
+        for column, value in (('ConsolidationID', consolidation_id), ('TermID', term_id), ('FY', fiscal_year)):
+            if value is not None:
+                df = df[df[column] == value]
+        if period_end is not None:
+            df = df[df['PeriodEnd'] == pd.Timestamp(period_end)]
+        return df.sort_values('PeriodEnd', ascending=False)
+
+    def period_records(self, table_name, params, company_ids=None, head_ids=None):
+        """Rows matching the consolidation and period_filter parameters of a statement"""
+        return self.records(table_name, company_ids, head_ids, params.get('consolidation_id'), params.get('term_id'),
+                            params.get('fiscal_year'), params.get('period_end'))
+
+    def output(self, df, table_name=None):
+        return pd.DataFrame({
+            'Value': df['Value_'], 'Unit': self.unit, 'Term': df['TermID'].map(self.term_names),
+            'Company': df['CompanyID'].map(self.company_names), 'Metric': df['SubHeadID'].map(self.head_names),
+            'Consolidation': df['ConsolidationID'].map(self.consolidation_names), 'PeriodEnd': df['PeriodEnd'],
+            'SubHeadID': df['SubHeadID'], 'SourceTable': table_name, 'DisectionGroupID': None,
+        })
+
+    def query_plan(self, query, params):
+        frames = []
+        branches = re.findall(r"AS (k\d+)\(SubHeadID, HeadRank\)\s+JOIN (\w+) d", query)
+        for branch_rank, (branch, table_name) in enumerate(branches):
+            ranks = {params[name]: params[name[:-1] + '1'] for name in params
+                     if name.startswith(f"{branch}_") and name.endswith('_0')}
+            df = self.period_records(table_name, params, [params['company_id']], list(ranks))
+            frames.append(self.output(df, table_name).assign(HeadRank=df['SubHeadID'].map(ranks),
+                                                             BranchRank=branch_rank))
+        if not frames:
+            return pd.DataFrame(columns=PLAN_COLUMNS)
+        df = pd.concat(frames).sort_values(['HeadRank', 'BranchRank', 'PeriodEnd'], ascending=[True, True, False])
+        return df.head(1)[PLAN_COLUMNS]
+
+    def statement_prefetch(self, query, params):
+        frames = []
+        for branch_rank, table_name in enumerate(re.findall(r"'(\w+)' AS SourceTable", query)):
+            df = self.period_records(table_name, params, [params['company_id']])
+            df = df[df['SubHeadID'].map(self.head_statements) == params['statement_id']]
+            frames.append(self.output(df, table_name).assign(
+                StatementID=params['statement_id'], Statement=self.statement_names.get(params['statement_id']),
+                BranchRank=branch_rank))
+        df = pd.concat(frames).sort_values(['BranchRank', 'PeriodEnd'], ascending=[True, False])
+        return df.drop_duplicates('SubHeadID').sort_values('SubHeadID')[STATEMENT_COLUMNS]
+
+    def execute_query(self, query, params=None, timeout=None):
+        params = params if params is not None else getattr(query, 'params', None) or {}
+        self.queries.append(query)
+        name = getattr(query, 'name', None)
+        if 'INFORMATION_SCHEMA' in query:
+            return pd.DataFrame([(table, 'CompanyID', 'int') for table in self.tables],
+                                columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+        if name == 'query_plan':
+            return self.query_plan(query, params)
+        if name == 'statement_prefetch':
+            return self.statement_prefetch(query, params)
+        if name == 'cumulative_panel':
+            companies, heads, terms = ([value for key, value in params.items() if key.startswith(prefix)]
+                                       for prefix in ('company_ids_', 'head_ids_', 'term_ids_'))
+            df = self.records('tbl_financialrawdata', companies, heads, params['consolidation_id'])
+            df = df[df['TermID'].isin(terms)]
+            return df[['CompanyID', 'SubHeadID', 'TermID', 'FY', 'PeriodEnd']].assign(Value=df['Value_'])
+        if name == 'derived_labels':
+            return pd.DataFrame({'Company': [self.company_names[params['company_id']]],
+                                 'Metric': [self.head_names[params['head_id']]], 'Unit': [self.unit],
+                                 'Consolidation': [self.consolidation_names[params['consolidation_id']]]})
+        if name == 'time_series':
+            frames = []
+            for table_name in re.findall(r"SELECT '(\w+)' AS Source", query):
+                df = self.records(table_name, [params['company_id']], [params['head_id']], params['consolidation_id'])
+                frames.append(self.output(df).assign(Source=table_name, TermID=df['TermID'], FY=df['FY']))
+            return pd.concat(frames).sort_values('PeriodEnd')
+        if 'RowRank' in query:
+            table_name = re.search(r"JOIN (\w+) d ON", query).group(1)
+            frames = []
+            rows = sorted({int(name.split('_')[1]) for name in params if name.startswith('k_')})
+            for i in rows:
+                row_id, company_id, head_id, term_id, fy = (params[f"k_{i}_{j}"] for j in range(5))
+                df = self.records(table_name, [company_id], [head_id], params['consolidation_id'], term_id, fy or None)
+                frames.append(self.output(df.head(1)).assign(RowID=row_id))
+            return pd.concat(frames) if frames else pd.DataFrame()
+        if 'GROUP BY d.CompanyID, d.SubHeadID' in query:
+            table_name = re.search(r"FROM (\w+) d", query).group(1)
+            companies = [value for key, value in params.items() if key.startswith('company_ids_')]
+            heads = [value for key, value in params.items() if key.startswith('sub_head_ids_')]
+            df = self.records(table_name, companies, heads, params.get('consolidation_id'))
+            return df.groupby(['CompanyID', 'SubHeadID']).size().rename('count').reset_index()
+        if 'AS TableName' in query:
+            rows = []
+            for table_name in re.findall(r"SELECT '(\w+)' AS TableName", query):
+                heads = [value for key, value in params.items() if key.startswith('sub_head_ids_')]
+                df = self.records(table_name, [params['company_id']], heads, params.get('consolidation_id'))
+                rows += [(table_name, head_id, 1) for head_id in df['SubHeadID'].unique()]
+            return pd.DataFrame(rows, columns=['TableName', 'SubHeadID', 'count'])
+        if re.search(r'FROM (tbl_headsmaster|tbl_ratiosheadmaster) h', query) and 'SubHeadID, h.' in query:
+            is_ratio = 'tbl_ratiosheadmaster' in query
+            heads = self.metadata['ratio_heads' if is_ratio else 'heads']
+            name_col = 'HeadNames' if is_ratio else 'SubHeadName'
+            if 'name' in params:
+                match = heads[name_col].str.lower() == params['name'].lower()
+            else:
+                match = heads[name_col].str.lower().str.contains(params['pattern'].strip('%'), regex=False)
+            return heads[match][['SubHeadID', name_col]]
+        if 'SELECT term FROM tbl_terms' in query:
+            return pd.DataFrame({'term': [self.term_names[params['term_id']]]})
+        if 'COUNT(*)' in query and 'FROM tbl_financialrawdata' in query and 'head_id' in params:
+            table_name = re.search(r"FROM (\w+)", query).group(1)
+            df = self.records(table_name, [params['company_id']], [params['head_id']], params['consolidation_id'],
+                              params.get('term_id'), params.get('fiscal_year'))
+            return pd.DataFrame({'count': [len(df)]})
+        if 'COUNT(*)' in query:
+            return pd.DataFrame({'count': [1]})
+        if re.search(r'\bAS Value\b', query, re.I):
+            table_name = re.search(r"FROM (\w+) [fr]\b", query).group(1)
+            df = self.records(table_name, [params['company_id']], [params['head_id']], params['consolidation_id'],
+                              params.get('term_id'), params.get('fiscal_year'))
+            return self.output(df, table_name)
+        return pd.DataFrame()
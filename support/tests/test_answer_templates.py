@@ -0,0 +1,66 @@
+'''
+Unit tests for the template-rendered answers
+'''
+
+import os
+import sys
+import unittest
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.chat.answer_templates import format_value, metric_type, render_answer
+
+
+def result(metric, value, unit='PKR', term='Q2 2023', consolidation='Consolidated', date='2023-06-30'):
+    return {'company': 'Habib Bank Limited', 'metric': metric, 'term': term, 'consolidation': consolidation,
+            'value': value, 'unit': unit, 'date': date}
+
+
+class TestAnswerTemplates(unittest.TestCase):
+    """
+    One template per metric type; anything that is not a single value is left to the LLM
+    """
+
+    def test_metric_type(self):
+        self.assertEqual(metric_type('Total Assets', '12M 2023'), 'value')
+        self.assertEqual(metric_type('Return on Equity', 'Q1 2023'), 'ratio')
+        self.assertEqual(metric_type('EPS', 'Q2 2023'), 'per_share')
+        self.assertEqual(metric_type('Revenue annual growth', 'FY 2023'), 'growth')
+        self.assertEqual(metric_type('Revenue quarterly growth', 'TTM'), 'growth')
+        self.assertEqual(metric_type('Net Profit', 'TTM'), 'ttm')
+        self.assertEqual(metric_type('Net Profit % of revenue', 'Q1 2023'), 'ratio')
+
+    def test_format_value(self):
+        self.assertEqual(format_value(4000, 'PKR mn'), '4,000.00 PKR mn')
+        self.assertEqual(format_value(18.4, '%'), '18.40%')
+        self.assertEqual(format_value(12.5, None, percent=True, signed=True), '+12.50%')
+        self.assertEqual(format_value(1.25, ''), '1.25')
+
+    def test_render(self):
+        self.assertEqual(render_answer(result('EPS', 9.87)),
+                         "Habib Bank Limited's consolidated EPS for Q2 2023 was 9.87 PKR per share (period ended 2023-06-30).")
+        self.assertEqual(render_answer(result('Total Assets', 4123456.5, unit='PKR mn', term='12M 2023', date=None)),
+                         "Habib Bank Limited's consolidated Total Assets for 12M 2023 was 4,123,456.50 PKR mn.")
+        self.assertEqual(render_answer(result('Return on Equity', 18.4, unit='%', consolidation='Unconsolidated')),
+                         "Habib Bank Limited's unconsolidated Return on Equity for Q2 2023 stood at 18.40% (period ended 2023-06-30).")
+        self.assertEqual(render_answer(result('Net Profit', 61.2, unit='PKR bn', term='TTM')),
+                         "Habib Bank Limited's consolidated trailing twelve-month Net Profit was 61.20 PKR bn "
+                         "(period ended 2023-06-30).")
+
+    def test_dissection_metric_as_asked(self):
+        # The database names the underlying head; the requested metric picks the template
+        growth = render_answer(result('Revenue', -3.2, unit='', term='12M 2023'), metric='Revenue annual growth')
+        self.assertEqual(growth, "Habib Bank Limited's consolidated Revenue annual growth for 12M 2023 was -3.20% "
+                                 "(period ended 2023-06-30).")
+        per_share = render_answer(result('Book Value', 120.0), metric='Book Value per Share')
+        self.assertIn("Book Value for Q2 2023 was 120.00 PKR per share", per_share)
+
+    def test_not_renderable(self):
+        self.assertIsNone(render_answer({'error': "Metric 'X' not found"}))
+        self.assertIsNone(render_answer(result('EPS', None)))
+        self.assertIsNone(render_answer(result('EPS', 'n/a')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+'''
+Unit tests for the in-memory data-availability index
+'''
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.availability_index import AvailabilityIndex, pack_keys
+from app.core.database.financial_db import FinancialDatabase
+
+
+TABLES = {
+    'regular': 'tbl_financialrawdata',
+    'dissection': 'tbl_disectionrawdata',
+}
+
+
+def fake_fetch(rows):
+    """Return a fetch callable serving rows per table, filtered by the watermark clause"""
+    def fetch(query):
+        table_name = next(t for t in TABLES.values() if f"FROM {t}\n" in query)
+        df = rows[table_name]
+        if query.params.get('since') is not None:
+            df = df[df['Watermark'] >= pd.Timestamp(query.params['since'])]
+        return df.copy()
+    return fetch
+
+
+class TestAvailabilityIndex(unittest.TestCase):
+    """
+    Test cases for AvailabilityIndex
+    """
+
+    def setUp(self):
+        self.rows = {
+            'tbl_financialrawdata': pd.DataFrame({
+                'CompanyID': [5, 5, 7],
+                'SubHeadID': [10, 11, 10],
+                'ConsolidationID': [1, 2, 2],
+                'Watermark': pd.to_datetime(['2024-03-31', '2024-06-30', '2024-06-30']),
+            }),
+            'tbl_disectionrawdata': pd.DataFrame({
+                'CompanyID': [5, 5],
+                'SubHeadID': [20, 20],
+                'ConsolidationID': [1, 2],
+                'DisectionGroupID': [3, 4],
+                'Watermark': pd.to_datetime(['2024-06-30', '2024-06-30']),
+            }),
+        }
+        self.index = AvailabilityIndex(fake_fetch(self.rows), TABLES).build()
+
+    def test_has_data(self):
+        self.assertTrue(self.index.has_data('tbl_financialrawdata', 5, 10))
+        self.assertTrue(self.index.has_data('tbl_financialrawdata', 5, 10, consolidation_id=1))
+        self.assertFalse(self.index.has_data('tbl_financialrawdata', 5, 10, consolidation_id=2))
+        self.assertFalse(self.index.has_data('tbl_financialrawdata', 6, 10))
+        self.assertFalse(self.index.has_data('tbl_financialrawdata', 5, 12))
+
+    def test_dissection_wildcards(self):
+        self.assertTrue(self.index.has_data('tbl_disectionrawdata', 5, 20))
+        self.assertTrue(self.index.has_data('tbl_disectionrawdata', 5, 20, dissection_group_id=3))
+        self.assertTrue(self.index.has_data('tbl_disectionrawdata', 5, 20, consolidation_id=2))
+        self.assertFalse(self.index.has_data('tbl_disectionrawdata', 5, 20, consolidation_id=1, dissection_group_id=4))
+        self.assertFalse(self.index.has_data('tbl_disectionrawdata', 5, 20, dissection_group_id=5))
+
+    def test_incremental_refresh(self):
+        self.rows['tbl_financialrawdata'] = pd.concat([self.rows['tbl_financialrawdata'], pd.DataFrame({
+            'CompanyID': [9, 8], 'SubHeadID': [10, 10], 'ConsolidationID': [1, 1],
+            'Watermark': pd.to_datetime(['2024-09-30', '2023-12-31']),
+        })], ignore_index=True)
+
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertTrue(self.index.has_data('tbl_financialrawdata', 9, 10))
+        # Rows older than the watermark are picked up by the next full build only
+        self.assertFalse(self.index.has_data('tbl_financialrawdata', 8, 10))
+        self.assertEqual(self.index.watermarks['regular'], pd.Timestamp('2024-09-30'))
+
+    def test_refresh_publishes_new_keys(self):
+        before = self.index.keys
+        regular = before['regular'].copy()
+        self.rows['tbl_financialrawdata'] = pd.concat([self.rows['tbl_financialrawdata'], pd.DataFrame({
+            'CompanyID': [9], 'SubHeadID': [10], 'ConsolidationID': [1],
+            'Watermark': pd.to_datetime(['2024-09-30']),
+        })], ignore_index=True)
+
+        self.index.refresh()
+
+        # A lookup holding the old keys still reads them unchanged
+        self.assertIsNot(self.index.keys, before)
+        self.assertTrue((before['regular'] == regular).all())
+
+    def test_rebuild_picks_up_late_rows(self):
+        self.rows['tbl_financialrawdata'] = pd.concat([self.rows['tbl_financialrawdata'], pd.DataFrame({
+            'CompanyID': [8], 'SubHeadID': [10], 'ConsolidationID': [1],
+            'Watermark': pd.to_datetime(['2023-12-31']),
+        })], ignore_index=True)
+        self.index.refreshed_at -= 3600
+
+        self.index.maybe_refresh()
+        self.assertFalse(self.index.has_data('tbl_financialrawdata', 8, 10))
+
+        # Once the last build is old enough the refresh becomes a full rebuild
+        self.index.refreshed_at -= 3600
+        self.index.built_at -= 3600
+        self.index.maybe_refresh(rebuild_interval=1800)
+        self.assertTrue(self.index.has_data('tbl_financialrawdata', 8, 10))
+
+    def test_date_column_per_family(self):
+        # Dissection tables have FinDate, not PeriodEnd
+        query = self.index._query('dissection', since=pd.Timestamp('2024-06-30'))
+        self.assertIn('MAX(FinDate) AS Watermark', query)
+        self.assertIn('WHERE FinDate >= :since', query)
+        self.assertNotIn('PeriodEnd', query)
+        self.assertIn('MAX(PeriodEnd) AS Watermark', self.index._query('regular'))
+
+    def test_failed_family_is_not_covered(self):
+        def fetch(query):
+            if 'tbl_disectionrawdata' in query:
+                raise RuntimeError('boom')
+            return fake_fetch(self.rows)(query)
+
+        index = AvailabilityIndex(fetch, TABLES).build()
+        self.assertTrue(index.covers('tbl_financialrawdata'))
+        self.assertFalse(index.covers('tbl_disectionrawdata'))
+
+    def test_pack_keys_range(self):
+        with self.assertRaises(ValueError):
+            pack_keys([1 << 20], [1], [1])
+
+
+def probe_rows():
+    return {
+        'tbl_financialrawdata': pd.DataFrame({
+            'CompanyID': [5, 5], 'SubHeadID': [10, 11], 'ConsolidationID': [1, 1],
+            'Watermark': pd.to_datetime(['2024-03-31', '2024-03-31']),
+        }),
+        'tbl_disectionrawdata': pd.DataFrame(columns=['CompanyID', 'SubHeadID', 'ConsolidationID',
+                                                      'DisectionGroupID', 'Watermark']),
+    }
+
+
+class TestProbeWithIndex(unittest.TestCase):
+    """
+    probe_head_data should answer from the index when no period filter is given
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.availability_index = AvailabilityIndex(fake_fetch(probe_rows()), TABLES).build()
+        self.db.execute_query = mock.Mock(return_value=pd.DataFrame({
+            'TableName': ['tbl_financialrawdata'], 'SubHeadID': [10], 'count': [2],
+        }))
+
+    def test_no_period_uses_index_only(self):
+        availability = self.db.probe_head_data({'tbl_financialrawdata': [10, 11, 12]}, 5)
+        self.assertEqual(availability, {'tbl_financialrawdata': {10: 1, 11: 1}})
+        self.db.execute_query.assert_not_called()
+
+    def test_period_probe_skips_heads_without_data(self):
+        availability = self.db.probe_head_data({'tbl_financialrawdata': [10, 12]}, 5, 1, '2024-03-31')
+        self.assertEqual(availability, {'tbl_financialrawdata': {10: 2}})
+        query = self.db.execute_query.call_args[0][0]
+        self.assertIn('d.SubHeadID IN (:sub_head_ids_0_0)', query)
+        self.assertEqual(query.params['sub_head_ids_0_0'], 10)
+
+    def test_stale_index_refreshes_in_the_background(self):
+        index = self.db.availability_index
+        index.refreshed_at -= 3600
+        release = threading.Event()
+        fetch = index.fetch
+        index.fetch = lambda query: release.wait(5) and fetch(query)
+
+        # The probe answers from the current keys while the refresh runs on its own thread
+        self.assertEqual(self.db.probe_head_data({'tbl_financialrawdata': [10]}, 5), {'tbl_financialrawdata': {10: 1}})
+        update = self.db.availability_index_update.thread
+        self.assertTrue(update.is_alive())
+        release.set()
+        update.join()
+        self.assertFalse(index.is_stale())
+
+    def test_all_ruled_out_skips_query(self):
+        self.assertEqual(self.db.probe_head_data({'tbl_financialrawdata': [12]}, 5, 1, '2024-03-31'),
+                         {'tbl_financialrawdata': {}})
+        self.db.execute_query.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
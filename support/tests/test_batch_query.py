@@ -0,0 +1,142 @@
+'''
+Unit tests for the batch financial data API
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.batch_query import BATCH_COLUMNS, batch_value_query
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_catalog import chunked, values_table
+from app.core.database.query_context import QueryContext
+from support.tests.fake_server import FakeServer, data_rows
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1, 2], 'CompanyName': ['United Bank Limited', 'Habib Bank Limited'],
+                               'Symbol': ['UBL', 'HBL'], 'SectorID': [10, 10]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'heads': pd.DataFrame({'SubHeadID': [11, 12], 'SubHeadName': ['Net Profit', 'Total Deposits'], 'IndustryID': [100, 100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2, 3, 4], 'term': ['3M', '6M', 'TTM', 'Q1']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+TABLES = {
+    'tbl_financialrawdata': data_rows([
+        (1, 11, 2, 2, 2023, pd.Timestamp('2023-06-30'), 10.0),
+        (1, 11, 2, 2, 2022, pd.Timestamp('2022-06-30'), 9.0),
+        (1, 11, 4, 2, 2023, pd.Timestamp('2023-03-31'), 4.0),
+        (2, 11, 2, 2, 2023, pd.Timestamp('2023-06-30'), 20.0),
+        (2, 12, 4, 2, 2023, pd.Timestamp('2023-03-31'), 7.0),
+    ]),
+    'tbl_financialrawdata_Quarter': data_rows([
+        (1, 11, 4, 2, 2023, pd.Timestamp('2023-03-31'), 5.0),
+    ]),
+    'tbl_ratiorawdata': data_rows([
+        (1, 100, 2, 2, 2023, pd.Timestamp('2023-06-30'), 0.15),
+        (2, 100, 4, 2, 2023, pd.Timestamp('2023-03-31'), 0.12),
+    ]),
+}
+
+
+class TestQueryHelpers(unittest.TestCase):
+    """
+    VALUES tables bind every key and chunks stay under the parameter limit
+    """
+
+    def test_values_table(self):
+        sql, params = values_table('k', ('A', 'B'), [(1, 2), (3, 4)])
+        self.assertEqual(sql, "(VALUES (:k_0_0, :k_0_1), (:k_1_0, :k_1_1)) AS k(A, B)")
+        self.assertEqual(params, {'k_0_0': 1, 'k_0_1': 2, 'k_1_0': 3, 'k_1_1': 4})
+        with self.assertRaises(ValueError):
+            values_table('k', ('A', 'B'), [(1,)])
+
+    def test_chunked(self):
+        self.assertEqual(chunked(list(range(5)), 2, 4), [[0, 1], [2, 3], [4]])
+        query = batch_value_query('tbl_ratiorawdata', [(0, 1, 100, 2, 0)], 2)
+        self.assertIn('JOIN tbl_ratiosheadmaster h', query)
+        self.assertEqual(len(query.params), 6)
+
+
+class TestFinancialDataBatch(unittest.TestCase):
+    """
+    get_financial_data_batch answers a grid with a few set-based statements
+    """
+
+    def setUp(self):
+        self.server = FakeServer(TABLES, METADATA)
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.db.execute_query = self.server.execute_query
+        self.db.session = mock.MagicMock()
+        self.db.result_cache.max_entries = self.db.question_cache.max_entries = 0
+
+    def test_grid(self):
+        df = self.db.get_financial_data_batch(['UBL', 'HBL', 'XYZ'], ['Net Profit', 'Return on Equity'],
+                                              ['6M 2023', 'Q1 2023'], 'unconsolidated')
+
+        self.assertEqual(df.columns.tolist(), BATCH_COLUMNS)
+        self.assertEqual(len(df), 12)
+        values = df.set_index(['company', 'metric', 'term'])['value']
+        self.assertEqual(values[('UBL', 'Net Profit', '6M 2023')], 10.0)
+        self.assertEqual(values[('HBL', 'Return on Equity', 'Q1 2023')], 0.12)
+        # Quarterly terms prefer the Quarter table, as get_financial_data does
+        self.assertEqual(values[('UBL', 'Net Profit', 'Q1 2023')], 5.0)
+        missing = df[(df['company'] == 'HBL') & (df['metric'] == 'Net Profit') & (df['term'] == 'Q1 2023')].iloc[0]
+        self.assertTrue(pd.isna(missing['value']))
+        self.assertEqual(missing['error'], "No data found for the specified parameters")
+        self.assertTrue((df[df['company'] == 'XYZ']['error'] == "Company 'XYZ' not found").all())
+
+        # One availability probe per raw data table, one value statement per table
+        self.assertEqual(sum('RowRank' in query for query in self.server.queries), 3)
+        self.assertEqual(sum('GROUP BY d.CompanyID, d.SubHeadID' in query for query in self.server.queries), 2)
+
+    def test_matches_single_questions(self):
+        companies, metrics, terms = ['UBL', 'HBL'], ['Net Profit', 'Total Deposits', 'Return on Equity'], ['6M 2023', 'Q1 2023']
+        df = self.db.get_financial_data_batch(companies, metrics, terms, 'unconsolidated')
+
+        for row in df.itertuples():
+            single = self.db.get_financial_data(row.company, row.metric, row.term, 'unconsolidated', context=QueryContext())
+            if 'error' in single:
+                self.assertIsNotNone(row.error, row)
+            else:
+                self.assertEqual((row.value, row.date, row.metric_name), (single['value'], single['date'], single['metric']))
+
+    def test_quarter_derived_from_cumulative_rows(self):
+        # HBL has no Q1 row, but its 3M figure is the first quarter
+        self.server.tables['tbl_financialrawdata'] = pd.concat([
+            TABLES['tbl_financialrawdata'], data_rows([(2, 11, 1, 2, 2023, pd.Timestamp('2023-03-31'), 8.0)])])
+
+        df = self.db.get_financial_data_batch(['UBL', 'HBL'], ['Net Profit'], ['Q1 2023'], 'unconsolidated')
+        single = self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2023', 'unconsolidated', context=QueryContext())
+
+        self.assertEqual(df['value'].tolist(), [5.0, 8.0])
+        self.assertEqual(self.server.names().count('cumulative_panel'), 2)
+        self.assertEqual((single['value'], single['term'], single['date']), (8.0, 'Q1', '2023-03-31'))
+
+    def test_chunks_stay_under_parameter_limit(self):
+        expected = self.db.get_financial_data_batch(['UBL', 'HBL'], ['Net Profit'], ['6M 2023', 'Q1 2023'], 'unconsolidated')
+        self.server.queries.clear()
+
+        with mock.patch('conf.config.BATCH_MAX_PARAMS', 12):
+            df = self.db.get_financial_data_batch(['UBL', 'HBL'], ['Net Profit'], ['6M 2023', 'Q1 2023'], 'unconsolidated')
+
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertTrue(all(len(query.params) <= 12 for query in self.server.queries if 'RowRank' in query))
+        self.assertGreater(sum('RowRank' in query for query in self.server.queries), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
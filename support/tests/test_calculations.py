@@ -0,0 +1,227 @@
+'''
+Unit tests for the vectorized calculation engine
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.calculations import CumulativePanel, per_share, percent_of
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.result_cache import ResultKey
+
+TERMS = pd.DataFrame({'TermID': [1, 2, 3, 4, 5], 'term': ['3M', '6M', '9M', '12M', 'TTM']})
+TERM_IDS = dict(zip(TERMS['term'], TERMS['TermID']))
+QUARTER_ENDS = {'3M': '03-31', '6M': '06-30', '9M': '09-30', '12M': '12-31'}
+
+
+def raw_rows(company_id, head_id, fiscal_year, cumulative):
+    """Rows of one fiscal year from {term: value}"""
+    return [(company_id, head_id, fiscal_year, term, pd.Timestamp(f"{fiscal_year}-{QUARTER_ENDS[term]}"), value)
+            for term, value in cumulative.items()]
+
+
+def raw_frame(rows):
+    return pd.DataFrame(rows, columns=['CompanyID', 'SubHeadID', 'FY', 'Term', 'PeriodEnd', 'Value'])
+
+
+class TestCumulativePanel(unittest.TestCase):
+    """
+    Quarterly, TTM and growth figures derived from cumulative rows
+    """
+
+    def setUp(self):
+        self.panel = CumulativePanel.from_frame(raw_frame(
+            raw_rows(1, 11, 2022, {'3M': 10.0, '6M': 25.0, '9M': 45.0, '12M': 70.0})
+            + raw_rows(1, 11, 2023, {'3M': 20.0, '6M': 35.0, '12M': 100.0})
+            + raw_rows(2, 11, 2020, {'3M': 5.0, '12M': 40.0})
+            + raw_rows(2, 11, 2022, {'3M': 8.0})
+            # Other terms are ignored
+            + [(1, 11, 2023, 'TTM', pd.Timestamp('2023-06-30'), 999.0)]))
+
+    def row(self, values, company_id, fiscal_year):
+        return values[self.panel.index.get_loc((company_id, 11, fiscal_year))]
+
+    def test_layout(self):
+        # Company 2 gets an empty 2021 row, so the previous year is always the row above
+        self.assertEqual(list(self.panel.index), [(1, 11, 2022), (1, 11, 2023), (2, 11, 2020), (2, 11, 2021), (2, 11, 2022)])
+        self.assertEqual(self.panel.prev_valid.tolist(), [False, True, False, True, True])
+        self.assertTrue(np.isnan(self.panel.values[3]).all())
+
+    def test_quarterly(self):
+        quarterly = self.panel.quarterly()
+
+        np.testing.assert_allclose(self.row(quarterly, 1, 2022), [10.0, 15.0, 20.0, 25.0])
+        # A missing 9M leaves Q3 and Q4 unknown
+        np.testing.assert_allclose(self.row(quarterly, 1, 2023), [20.0, 15.0, np.nan, np.nan])
+
+    def test_ttm(self):
+        ttm = self.panel.ttm()
+
+        np.testing.assert_allclose(self.row(ttm, 1, 2023), [80.0, 80.0, np.nan, 100.0])
+        # Without a previous year only the 12M figure is a full year
+        np.testing.assert_allclose(self.row(ttm, 1, 2022), [np.nan, np.nan, np.nan, 70.0])
+        # The previous year of company 2's 2022 is the empty 2021, not company 1's data
+        np.testing.assert_allclose(self.row(ttm, 2, 2022), [np.nan, np.nan, np.nan, np.nan])
+
+    def test_growth(self):
+        np.testing.assert_allclose(self.row(self.panel.yoy_growth(), 1, 2023), [100.0, 0.0, np.nan, np.nan])
+        # Q1 is compared with the previous year's Q4
+        np.testing.assert_allclose(self.row(self.panel.qoq_growth(), 1, 2023), [-20.0, -25.0, np.nan, np.nan])
+        np.testing.assert_allclose(self.row(self.panel.yoy_growth(self.panel.values), 1, 2023),
+                                   [100.0, 40.0, np.nan, 100 * 30.0 / 70.0])
+
+    def test_to_frame(self):
+        frame = self.panel.to_frame(self.panel.ttm())
+
+        # 12M of 2022 and 2020, Q1, Q2 and Q4 of 2023
+        self.assertEqual(len(frame), 5)
+        record = frame[(frame['CompanyID'] == 1) & (frame['FY'] == 2023) & (frame['Quarter'] == 'Q2')].iloc[0]
+        self.assertEqual((record['PeriodEnd'], record['Value']), (pd.Timestamp('2023-06-30'), 80.0))
+
+
+class TestRatios(unittest.TestCase):
+    """
+    Per-share and percent-of figures join on company and period end
+    """
+
+    def setUp(self):
+        self.values = pd.DataFrame({'CompanyID': [1, 1, 2], 'PeriodEnd': pd.to_datetime(['2023-03-31', '2023-06-30', '2023-03-31']),
+                                    'Value': [50.0, 60.0, 10.0]})
+        self.base = pd.DataFrame({'CompanyID': [1, 1, 2], 'PeriodEnd': pd.to_datetime(['2023-03-31', '2023-06-30', '2023-03-31']),
+                                  'Value': [200.0, 0.0, 40.0]})
+
+    def test_per_share(self):
+        result = per_share(self.values, self.base)
+
+        # Zero shares give no value rather than inf
+        self.assertEqual(result['Value'].tolist(), [0.25, 0.25])
+        self.assertEqual(result['CompanyID'].tolist(), [1, 2])
+
+    def test_percent_of(self):
+        self.assertEqual(percent_of(self.values, self.base)['Value'].tolist(), [25.0, 25.0])
+
+
+class TestCumulativeReads(unittest.TestCase):
+    """
+    get_cumulative_panel reads every company and head in one statement
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache['terms'] = TERMS
+        self.db.session = mock.MagicMock()
+        self.rows = raw_frame(raw_rows(1, 11, 2023, {'3M': 10.0, '6M': 30.0}) + raw_rows(2, 11, 2023, {'3M': 7.0})
+                              + raw_rows(3, 11, 2023, {'3M': 1.0}))
+        self.queries = []
+
+    def execute_query(self, query, params=None, timeout=None):
+        self.queries.append(query)
+        params = query.params
+        df = self.rows[self.rows['CompanyID'].isin([v for k, v in params.items() if k.startswith('company_ids_')])
+                       & self.rows['SubHeadID'].isin([v for k, v in params.items() if k.startswith('head_ids_')])]
+        terms = {TERM_IDS[term] for term in df['Term']}
+        self.assertTrue(terms <= {v for k, v in params.items() if k.startswith('term_ids_')})
+        return df.assign(TermID=df['Term'].map(TERM_IDS)).drop(columns='Term')
+
+    def test_one_statement(self):
+        self.db.execute_query = self.execute_query
+
+        panel = self.db.get_cumulative_panel([1, 2, 1], [11], 1)
+
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(self.queries[0].name, 'cumulative_panel')
+        # TTM is not a cumulative term
+        self.assertEqual(len([k for k in self.queries[0].params if k.startswith('term_ids_')]), 4)
+        np.testing.assert_allclose(panel.quarterly()[:, :2], [[10.0, 20.0], [7.0, np.nan]])
+
+    def test_chunks(self):
+        self.db.execute_query = self.execute_query
+
+        with mock.patch('app.core.database.financial_db.config.BATCH_MAX_PARAMS', 11):
+            panel = self.db.get_cumulative_panel([1, 2, 3], [11], 1)
+
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(len(panel), 3)
+
+
+class TestDerivedFallback(unittest.TestCase):
+    """
+    Quarter, TTM and growth lookups the stored tables cannot answer are derived from the panel
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache['terms'] = pd.DataFrame({'TermID': [1, 2, 3, 4, 5, 6],
+                                                        'term': ['3M', '6M', '9M', '12M', 'TTM', 'Q2']})
+        self.panel = CumulativePanel.from_frame(raw_frame(
+            raw_rows(1, 11, 2022, {'3M': 10.0, '6M': 25.0, '9M': 45.0, '12M': 70.0})
+            + raw_rows(1, 11, 2023, {'3M': 20.0, '6M': 35.0})))
+        self.db.get_cumulative_panel = mock.MagicMock(return_value=self.panel)
+        self.db.execute_query = mock.MagicMock(return_value=pd.DataFrame({
+            'Company': ['United Bank Limited'], 'Metric': ['Net Profit'], 'Unit': ['PKR'], 'Consolidation': ['Consolidated']}))
+
+    def key(self, term_id, fiscal_year=None, period_end=None, is_ttm=False, dissection_group_id=None):
+        return ResultKey(company_id=1, head_id=11, is_ratio=False, term_id=term_id, consolidation_id=1,
+                         period_end=period_end, resolved_period_end=None, fiscal_year=fiscal_year, relative_type=None,
+                         is_ttm=is_ttm, dissection_group_id=dissection_group_id, dissection_data_type=None)
+
+    def test_quarter(self):
+        response = self.db._derived_response(self.key(6, fiscal_year=2022))
+
+        self.assertEqual(response, {'company': 'United Bank Limited', 'metric': 'Net Profit', 'term': 'Q2',
+                                    'consolidation': 'Consolidated', 'value': 15.0, 'unit': 'PKR', 'date': '2022-06-30'})
+        self.db.get_cumulative_panel.assert_called_once_with([1], [11], 1)
+        # Without a fiscal year the latest Q2 wins
+        self.assertEqual(self.db._derived_response(self.key(6))['date'], '2023-06-30')
+
+    def test_ttm(self):
+        response = self.db._derived_response(self.key(5, is_ttm=True))
+
+        self.assertEqual((response['term'], response['value'], response['date']), ('TTM', 80.0, '2023-06-30'))
+        by_period = self.db._derived_response(self.key(5, period_end='2023-03-31', is_ttm=True))
+        self.assertEqual(by_period['value'], 80.0)
+
+    def test_growth(self):
+        qoq = self.db._derived_response(self.key(6, fiscal_year=2023, dissection_group_id=5))
+        self.assertEqual((qoq['value'], qoq['unit']), (-25.0, '%'))
+        yoy = self.db._derived_response(self.key(2, fiscal_year=2023, dissection_group_id=2))
+        self.assertEqual((yoy['term'], yoy['value']), ('6M', 40.0))
+
+    def test_not_derivable(self):
+        # Annual terms, ratio heads and per-share groups still come only from the stored tables
+        self.assertIsNone(self.db._derived_response(self.key(4)))
+        self.assertIsNone(self.db._derived_response(self.key(6)._replace(is_ratio=True)))
+        self.assertIsNone(self.db._derived_response(self.key(6, dissection_group_id=1)))
+        self.db.get_cumulative_panel.assert_not_called()
+        # A period the panel has no value for
+        self.assertIsNone(self.db._derived_response(self.key(6, fiscal_year=2021)))
+
+    def test_plan_miss_falls_back(self):
+        self.db.execute_plan = mock.MagicMock(return_value={'error': 'No data found for the specified parameters'})
+        self.db._derived_response = mock.MagicMock(return_value={'value': 15.0})
+        self.db.get_company_id = mock.MagicMock(return_value=1)
+        self.db._get_company_sector_industry = mock.MagicMock(return_value=(10, 100))
+        self.db.get_consolidation_id = mock.MagicMock(return_value=1)
+        self.db.get_term_id = mock.MagicMock(return_value=6)
+        self.db.plan_branches = mock.MagicMock(return_value=[])
+
+        with mock.patch('app.core.database.fix_head_id.get_available_head_id', return_value=(11, False)), \
+                mock.patch('app.core.database.financial_db.config.STATEMENT_PREFETCH', False):
+            response = self.db._get_financial_data('UBL', 'Net Profit', 'Q2 2022')
+
+        self.assertEqual(response, {'value': 15.0})
+        self.assertEqual(self.db._derived_response.call_args[0][0].term_id, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+'''
+Unit tests for compact metadata frames
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.company_context import build_company_contexts
+from app.core.database.compact_metadata import compact_frame, frame_nbytes, memory_report
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metadata_loader import METADATA_TABLES, MetadataLoader
+from app.core.database.metric_index import MetricIndex
+
+METADATA = {
+    'heads': pd.DataFrame({
+        'SubHeadID': np.arange(10, 22, dtype=np.int64),
+        'SubHeadName': ['Revenue', 'Net Revenue', 'Total Assets', 'EPS - Basic', 'Revenue', 'Total Assets'] * 2,
+        'IndustryID': [1, 1, 1, 1, 2, 2] * 2,
+    }),
+    'ratio_heads': pd.DataFrame({
+        'SubHeadID': np.arange(100, 104, dtype=np.int64),
+        'HeadNames': ['Return on Equity', 'Debt to Equity', 'Gross Profit Margin', None],
+    }),
+    'terms': pd.DataFrame({'TermID': np.arange(1, 5, dtype=np.int64), 'term': ['3M', '6M', '9M', '12M']}),
+    'companies': pd.DataFrame({'CompanyID': [1, 2, 3], 'CompanyName': ['HBL', 'UBL', 'MCB'],
+                               'Symbol': ['HBL', 'UBL', 'MCB'], 'SectorID': [10.0, 10.0, np.nan]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Banks']}),
+}
+
+
+def normalized(series):
+    return [None if pd.isna(value) else value for value in series.tolist()]
+
+
+def compact(metadata):
+    return {key: compact_frame(df, METADATA_TABLES[key].names) for key, df in metadata.items()}
+
+
+class TestCompactFrame(unittest.TestCase):
+    """
+    Compaction narrows ids and names without changing values or lookups
+    """
+
+    def setUp(self):
+        self.compact = compact(METADATA)
+
+    def test_dtypes(self):
+        heads = self.compact['heads']
+        self.assertEqual(heads['SubHeadID'].dtype, np.int32)
+        self.assertIsInstance(heads['SubHeadName'].dtype, pd.CategoricalDtype)
+        self.assertEqual(heads['SubHeadName_lower'].tolist()[:2], ['revenue', 'net revenue'])
+        # Nullable ids stay float so NaN checks behave as before
+        self.assertEqual(self.compact['companies']['SectorID'].dtype, np.float64)
+        self.assertNotIn('CompanyName_lower', self.compact['companies'].columns)
+
+    def test_values_unchanged(self):
+        for key, df in METADATA.items():
+            for column in df.columns:
+                self.assertEqual(normalized(self.compact[key][column]), normalized(df[column]), (key, column))
+        # NULL names stay None rather than becoming NaN
+        self.assertIsNone(self.compact['ratio_heads']['HeadNames'].iloc[3])
+
+    def test_lookups_unchanged(self):
+        raw_index, compact_index = MetricIndex.from_metadata(METADATA), MetricIndex.from_metadata(self.compact)
+        for name in ['revenue', 'eps', 'equity', 'assets', 'missing']:
+            for prefer_ratio in (False, True):
+                self.assertEqual(compact_index.resolve(name, prefer_ratio), raw_index.resolve(name, prefer_ratio))
+        self.assertEqual(build_company_contexts(self.compact), build_company_contexts(METADATA))
+
+    def test_get_term_id(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache.update(self.compact)
+        db.metadata_cache['terms_mapping'] = pd.DataFrame()
+
+        self.assertEqual(db.get_term_id('6M 2023', 1), 2)
+
+    def test_memory_report(self):
+        report = memory_report(METADATA, self.compact)
+        self.assertEqual(set(report), set(METADATA))
+        self.assertEqual(report['heads']['before'], frame_nbytes(METADATA['heads']))
+
+
+class TestSharedSnapshot(unittest.TestCase):
+    """
+    Snapshot frames are read-only views of the memory-mapped file
+    """
+
+    def test_numeric_columns_are_mapped(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            loader = MetadataLoader(None, os.path.join(cache_dir, 'metadata.pkl'))
+            frames = compact(METADATA)
+            loader.write_snapshot(frames, {})
+            mapped = loader.read_snapshot().frames
+
+            heads = mapped['heads']
+            self.assertFalse(heads['SubHeadID'].to_numpy().flags.writeable)
+            self.assertFalse(heads['SubHeadName'].array.codes.flags.writeable)
+            for key, df in frames.items():
+                pd.testing.assert_frame_equal(mapped[key], df)
+            del heads, mapped
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+Unit tests for the memoized company context
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.company_context import build_company_contexts
+from app.core.database.financial_db import FinancialDatabase
+
+
+METADATA = {
+    'companies': pd.DataFrame({
+        'CompanyID': [1, 2, 3],
+        'CompanyName': ['United Bank Limited', 'Habib Bank Limited', 'No Sector Ltd'],
+        'Symbol': ['UBL', 'HBL', 'NSL'],
+        'SectorID': [10, 10, np.nan],
+    }),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100, 101], 'IndustryName': ['Banking', 'Leasing']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10, 10, 10], 'industryid': [999, 101, 100]}),
+}
+
+
+class TestCompanyContext(unittest.TestCase):
+    """
+    Test cases for build_company_contexts and FinancialDatabase.get_company_context
+    """
+
+    def test_build(self):
+        contexts = build_company_contexts(METADATA)
+        ubl = contexts[1]
+        self.assertEqual((ubl.company_name, ubl.ticker), ('United Bank Limited', 'UBL'))
+        self.assertEqual((ubl.sector_id, ubl.sector_name), (10, 'Commercial Banks'))
+        # First mapped industry that exists in tbl_industrynames
+        self.assertEqual((ubl.industry_id, ubl.industry_name), (101, 'Leasing'))
+        self.assertEqual(ubl.industry_ids, (101, 100))
+
+        no_sector = contexts[3]
+        self.assertIsNone(no_sector.sector_id)
+        self.assertIsNone(no_sector.industry_id)
+
+    def test_database_uses_cache_only(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache.update(METADATA)
+        db.execute_query = mock.Mock(side_effect=AssertionError('unexpected database call'))
+
+        self.assertEqual(db._get_company_sector_industry(2), (10, 101))
+        self.assertEqual(db.get_company_metadata(1)['sector_name'], 'Commercial Banks')
+        self.assertEqual(db.get_company_metadata(42), {})
+        self.assertIs(db.get_company_context(1), db.get_company_context(np.int64(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
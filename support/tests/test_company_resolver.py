@@ -0,0 +1,76 @@
+'''
+Unit tests for the company name/ticker resolver
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.company_resolver import CompanyResolver
+from app.core.database.financial_db import FinancialDatabase
+
+
+COMPANIES = pd.DataFrame({
+    'CompanyID': [1, 2, 3, 4, 5, 6],
+    'CompanyName': ['Dubai Islamic Bank Pakistan Limited', 'United Bank Limited', 'Habib Bank Limited',
+                    'Lucky Cement Limited', 'Oil & Gas Development Company Limited', None],
+    'Symbol': ['DIBPL', 'UBL', 'HBL', 'LUCK', 'OGDC', 'XYZ'],
+})
+
+
+class TestCompanyResolver(unittest.TestCase):
+    """
+    Test cases for CompanyResolver
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.resolver = CompanyResolver(COMPANIES)
+
+    def test_ticker_beats_substring(self):
+        # "ubl" is a substring of "Dubai Islamic Bank...", which the old contains scan returned first
+        self.assertEqual(self.resolver.resolve('UBL')[:3], (2, 'United Bank Limited', 'ticker'))
+        self.assertEqual(self.resolver.resolve(' xyz ')[0], 6)
+
+    def test_exact_name(self):
+        self.assertEqual(self.resolver.resolve('habib bank limited')[2:], ('name', 1.0))
+        self.assertEqual(self.resolver.resolve('Habib Bank Ltd.')[0], 3)
+        self.assertEqual(self.resolver.resolve('oil and gas development')[0], 5)
+
+    def test_fuzzy(self):
+        company_id, _, match_type, score = self.resolver.resolve('Lucky Cemnt')
+        self.assertEqual((company_id, match_type), (4, 'fuzzy'))
+        self.assertGreater(score, 0.45)
+        self.assertEqual(self.resolver.resolve('lucky')[0], 4)
+        self.assertEqual(self.resolver.resolve('luck cement')[0], 4)
+        self.assertEqual(self.resolver.resolve('habib')[0], 3)
+
+    def test_fuzzy_ranking(self):
+        matches = self.resolver.fuzzy('bank limited', limit=3)
+        self.assertEqual([m[0] for m in matches], [1, 2, 3])
+        self.assertTrue(all(m[3] >= matches[-1][3] for m in matches))
+
+    def test_not_found(self):
+        self.assertIsNone(self.resolver.resolve('Tesla'))
+        self.assertIsNone(self.resolver.resolve('  '))
+        self.assertIsNone(self.resolver.resolve('--'))
+
+    def test_database_get_company_id(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        db.metadata_cache['companies'] = COMPANIES
+        db.execute_query = mock.Mock(side_effect=AssertionError('unexpected database call'))
+
+        self.assertEqual(db.get_company_id('UBL'), 2)
+        self.assertEqual(db.get_company_id('Lucky Cement'), 4)
+        self.assertIsNone(db.get_company_id(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
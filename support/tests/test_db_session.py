@@ -0,0 +1,183 @@
+'''
+Unit tests for request-scoped database sessions in FinancialDatabase
+'''
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as SQLAlchemyPoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.exceptions import PoolTimeoutError, QueryTimeoutError
+from app.core.database.financial_db import FinancialDatabase
+
+
+def mock_engine():
+    """Engine whose connect() hands out a new mock connection every call"""
+    engine = mock.Mock()
+
+    def connect():
+        connection = mock.MagicMock()
+        connection.__enter__.return_value = connection
+        connection.execution_options.return_value = connection
+        connection.in_transaction.return_value = True
+        return connection
+
+    engine.connect.side_effect = connect
+    return engine
+
+
+class TestDatabaseSession(unittest.TestCase):
+    """
+    execute_query should reuse the session connection instead of checking out one per statement
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock_engine()):
+            self.db = FinancialDatabase('server', 'database')
+        self.connections = []
+        patcher = mock.patch('app.core.database.financial_db.pd.read_sql_query',
+                             side_effect=lambda query, con, params=None: self.connections.append(con) or pd.DataFrame())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_session_each_statement_checks_out(self):
+        for _ in range(3):
+            self.db.execute_query("SELECT 1")
+
+        self.assertEqual(self.db.engine.connect.call_count, 3)
+        self.assertEqual(len(set(map(id, self.connections))), 3)
+        self.assertEqual(self.db.get_connection_stats()['checkouts'], 3)
+
+    def test_session_reuses_one_connection(self):
+        with self.db.session() as session:
+            for _ in range(3):
+                self.db.execute_query("SELECT 1")
+            with self.db.session() as nested:
+                self.db.execute_query("SELECT 2")
+                self.assertIs(nested, session)
+
+        self.assertEqual(self.db.engine.connect.call_count, 1)
+        self.assertTrue(all(con is session.connection for con in self.connections))
+        self.assertEqual(session.statements, 4)
+        session.connection.rollback.assert_called_once()
+
+        stats = self.db.get_connection_stats()
+        self.assertEqual((stats['checkouts'], stats['sessions'], stats['statements']), (1, 1, 4))
+        self.assertEqual(stats['statements_per_checkout'], 4.0)
+
+        # Outside the block statements check out their own connection again
+        self.db.execute_query("SELECT 3")
+        self.assertEqual(self.db.engine.connect.call_count, 2)
+
+    def test_snapshot_isolation(self):
+        with self.db.session(snapshot=True) as session:
+            self.db.execute_query("SELECT 1")
+
+        session.connection.execution_options.assert_called_once_with(isolation_level="SNAPSHOT")
+        session.connection.begin.assert_called_once()
+
+    def test_sessions_are_per_thread(self):
+        seen = {}
+        barrier = threading.Barrier(2)
+
+        def worker(name):
+            with self.db.session() as session:
+                barrier.wait()
+                self.db.execute_query("SELECT 1")
+                seen[name] = session.connection
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsNot(seen['a'], seen['b'])
+        self.assertEqual(self.db.engine.connect.call_count, 2)
+
+    def test_get_financial_data_runs_in_one_session(self):
+        def resolve(*args, **kwargs):
+            for _ in range(5):
+                self.db.execute_query("SELECT 1")
+            return {}
+
+        with mock.patch.object(self.db, '_get_financial_data', side_effect=resolve):
+            self.db.get_financial_data('UBL', 'Net Profit', 'Q1 2023')
+
+        self.assertEqual(self.db.engine.connect.call_count, 1)
+        self.assertEqual(self.db.get_connection_stats()['statements_in_sessions'], 5)
+
+
+class TestPoolAndTimeouts(unittest.TestCase):
+    """
+    Statement / pool timeouts surface as typed errors, warmup fills the pool, metrics report it
+    """
+
+    def test_query_timeout_raises_typed_error(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock_engine()):
+            db = FinancialDatabase('server', 'database')
+        driver_error = Exception('HYT00', '[HYT00] [Microsoft][ODBC Driver 17 for SQL Server]Query timeout expired (0)')
+
+        with mock.patch('app.core.database.financial_db.pd.read_sql_query', side_effect=driver_error):
+            with self.assertRaises(QueryTimeoutError) as raised:
+                db.execute_query("SELECT * FROM tbl_financialrawdata", timeout=5)
+
+        self.assertEqual(raised.exception.timeout, 5)
+        self.assertIs(raised.exception.__cause__, driver_error)
+        self.assertEqual(db.get_connection_stats()['query_timeouts'], 1)
+
+    def test_statement_timeout_override_is_restored(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock_engine()):
+            db = FinancialDatabase('server', 'database')
+        seen = []
+
+        def read_sql_query(query, con, params=None):
+            seen.append(con.connection.dbapi_connection.timeout)
+            return pd.DataFrame()
+
+        with mock.patch('app.core.database.financial_db.pd.read_sql_query', side_effect=read_sql_query):
+            with db.session() as session:
+                session.connection.connection.dbapi_connection.timeout = 30
+                db.execute_query("SELECT 1", timeout=2)
+                self.assertEqual(session.connection.connection.dbapi_connection.timeout, 30)
+
+        self.assertEqual(seen, [2])
+
+    def test_pool_timeout_raises_typed_error(self):
+        engine = mock.Mock(connect=mock.Mock(side_effect=SQLAlchemyPoolTimeout('QueuePool limit reached')))
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=engine):
+            db = FinancialDatabase('server', 'database')
+
+        with self.assertRaises(PoolTimeoutError):
+            db.execute_query("SELECT 1")
+        self.assertEqual(db.get_connection_stats()['pool_timeouts'], 1)
+
+    def test_warmup_and_pool_metrics(self):
+        engine = create_engine('sqlite://', poolclass=QueuePool, pool_size=5, max_overflow=0)
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=engine):
+            db = FinancialDatabase('server', 'database')
+
+        with mock.patch('conf.config.DB_POOL_SIZE', 5):
+            self.assertEqual(db.warmup(3), 3)
+            self.assertEqual(db.warmup(50), 5)
+
+        metrics = db.get_pool_metrics()
+        self.assertEqual((metrics['pool_size'], metrics['checked_out'], metrics['checked_in']), (5, 0, 5))
+
+        with db.session():
+            self.assertEqual(db.execute_query("SELECT 1 AS one").iloc[0]['one'], 1)
+            self.assertEqual(db.get_pool_metrics()['checked_out'], 1)
+        self.assertEqual(db.get_pool_metrics()['checkouts'], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+Unit tests for the deterministic entity extractor
+'''
+
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.company_resolver import CompanyResolver
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metric_index import MetricIndex
+from app.core.rag.entity_extractor import EntityExtractor
+
+COMPANIES = pd.DataFrame({
+    'CompanyID': [1, 2, 3, 4, 5],
+    'CompanyName': ['Habib Bank Limited', 'United Bank Limited', 'Engro Corporation Limited',
+                    'Mari Energies Limited', 'Lucky Cement Limited'],
+    'Symbol': ['HBL', 'UBL', 'ENGRO', 'MARI', 'LUCK'],
+})
+HEADS = pd.DataFrame({'SubHeadID': [1, 2, 3, 4], 'SubHeadName': ['Total Assets', 'Net Profit', 'Cash and Balances',
+                                                                 'Book Value per Share']})
+RATIO_HEADS = pd.DataFrame({'SubHeadID': [100, 101], 'HeadNames': ['Debt to Equity Ratio', 'Dividend Payout']})
+TERMS = ['3M', '6M', '9M', '12M', 'Q1', 'Q2', 'Q3', 'Q4', 'TTM']
+
+
+class TestEntityExtractor(unittest.TestCase):
+    """
+    Gazetteer and pattern matches, and the confidence that gates the LLM fallback
+    """
+
+    def setUp(self):
+        self.extractor = EntityExtractor(CompanyResolver(COMPANIES), MetricIndex(HEADS, RATIO_HEADS), TERMS)
+
+    def fields(self, query):
+        entities = self.extractor.extract(query)
+        return entities['company'], entities['metric'], entities['term'], entities['consolidation']
+
+    def test_explicit_question(self):
+        entities = self.extractor.extract("Give me HBL's consolidated net profit for 6M 2023")
+
+        self.assertEqual((entities['company'], entities['metric'], entities['term'], entities['consolidation']),
+                         ('Habib Bank Limited', 'Net Profit', '6M 2023', 'Consolidated'))
+        self.assertFalse(entities['is_relative_term'])
+        self.assertFalse(entities['is_dissection'])
+        self.assertEqual(entities['confidence'], 1.0)
+
+    def test_companies(self):
+        # Names with or without the legal suffix, and tickers
+        self.assertEqual(self.fields("What was the net profit of Engro Corp in Q1 2023?")[0], 'Engro Corporation Limited')
+        self.assertEqual(self.fields("Mari Energies Limited's total assets for Q2 2023")[0], 'Mari Energies Limited')
+        self.assertEqual(self.fields("What was LUCK's debt to equity ratio in Q1 2023?")[:3],
+                         ('Lucky Cement Limited', 'Debt to Equity Ratio', 'Q1 2023'))
+        # A lowercase ticker is a weaker match
+        entities = self.extractor.extract("ubl net profit q1 2023")
+        self.assertEqual((entities['company'], entities['confidence']), ('United Bank Limited', 0.7))
+
+    def test_metrics(self):
+        # The longest head name or alias wins; METRIC_PATTERNS aliases score below head names
+        entities = self.extractor.extract("What was UBL's ROE in Q2 2023?")
+        self.assertEqual((entities['metric'], entities['scores']['metric']), ('ROE', 0.85))
+        self.assertEqual(self.fields("UBL's cash and balances for 9M 2023")[1], 'Cash and Balances')
+        self.assertEqual(self.fields("HBL earnings per share for Q1 2023")[1], 'EPS')
+
+    def test_dissection(self):
+        entities = self.extractor.extract("What is HBL's net profit as % of revenue for Q1 2023?")
+        self.assertEqual((entities['metric'], entities['dissection_group_id']), ('Net Profit % of revenue', 4))
+
+        growth = self.extractor.extract("Give me UBL's assets annual growth for FY 2023")
+        self.assertEqual((growth['metric'], growth['term'], growth['dissection_group_id']),
+                         ('Total Assets annual growth', 'FY 2023', 2))
+        # A head name that contains the phrase is kept whole
+        self.assertEqual(self.fields("UBL's book value per share for Q1 2023")[1], 'Book Value per Share')
+
+    def test_periods(self):
+        entities = self.extractor.extract("What was the Assets of HBL on 30-6-2023 consolidated?")
+        self.assertEqual((entities['term'], entities['period_end'], entities['consolidation']),
+                         ('3M', '2023-06-30', 'Consolidated'))
+
+        latest = self.extractor.extract("What is the most recent EPS of HBL?")
+        self.assertEqual((latest['term'], latest['is_relative_term'], latest['relative_type']),
+                         ('TTM', True, 'most_recent_quarter'))
+        self.assertEqual(self.extractor.extract("What is the year-to-date net profit of UBL?")['relative_type'], 'ytd')
+        self.assertEqual(self.fields("HBL total assets six months 2022")[2], '6M 2022')
+
+    def test_low_confidence(self):
+        # Missing term, missing company and unknown metric leave it to the LLM
+        self.assertEqual(self.extractor.extract("What is HBL's EPS?")['confidence'], 0.0)
+        self.assertEqual(self.extractor.extract("What is the EPS for Q1 2023?")['confidence'], 0.0)
+        unknown = self.extractor.extract("What is the invalid metric for HBL in Q1 2023?")
+        self.assertEqual(unknown['metric'], 'invalid metric')
+        self.assertLess(unknown['confidence'], 0.5)
+
+
+class TestExtractorRebuild(unittest.TestCase):
+    """
+    The RAG's extractor follows metadata the database reinstalls after startup
+    """
+
+    def setUp(self):
+        # The chat model (and ctransformers) is not needed to resolve entities
+        mistral_chat = types.ModuleType('app.core.chat.mistral_chat')
+        mistral_chat.MistralChat = mock.MagicMock()
+        modules = mock.patch.dict(sys.modules, {'app.core.chat.mistral_chat': mistral_chat})
+        modules.start()
+        self.addCleanup(modules.stop)
+        sys.modules.pop('app.core.rag.financial_rag', None)
+
+    def test_rebuilt_with_new_metadata(self):
+        from app.core.rag.financial_rag import FinancialRAG
+
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        metadata = {'companies': COMPANIES.iloc[:4], 'heads': HEADS, 'ratio_heads': RATIO_HEADS,
+                    'terms': pd.DataFrame({'term': TERMS})}
+        db._set_metadata(metadata)
+        rag = FinancialRAG.__new__(FinancialRAG)
+        rag.db, rag._entity_extractor = db, None
+
+        extractor = rag.get_entity_extractor()
+        self.assertIs(rag.get_entity_extractor(), extractor)
+        self.assertIsNone(extractor.extract('LUCK total assets 12M 2023')['company'])
+
+        # A revalidated snapshot installs the new company list
+        db._set_metadata({'companies': COMPANIES})
+        self.assertIsNot(rag.get_entity_extractor(), extractor)
+        self.assertEqual(rag.get_entity_extractor().extract('LUCK total assets 12M 2023')['company'],
+                         'Lucky Cement Limited')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+'''
+Unit tests for the batched SubHeadID data-availability probe
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.fix_head_id import select_head_with_data
+
+
+def make_db():
+    with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+        return FinancialDatabase('server', 'database')
+
+
+class TestProbeHeadData(unittest.TestCase):
+    """
+    Test cases for FinancialDatabase.probe_head_data
+    """
+
+    def setUp(self):
+        self.db = make_db()
+        self.db.execute_query = mock.Mock(return_value=pd.DataFrame({
+            'TableName': ['tbl_financialrawdata', 'tbl_ratiorawdata'],
+            'SubHeadID': [12, 100],
+            'count': [4, 2],
+        }))
+
+    def test_single_round_trip(self):
+        availability = self.db.probe_head_data(
+            {'tbl_financialrawdata': [10, 11, 12, 12], 'tbl_ratiorawdata': [100, 101]},
+            company_id=5, consolidation_id=2, period_end='2024-12-31')
+
+        self.assertEqual(self.db.execute_query.call_count, 1)
+        query = self.db.execute_query.call_args[0][0]
+        self.assertIn('UNION ALL', query)
+        # Values are bound, and the IN list is padded to a power of two (10, 11, 12, 12)
+        self.assertIn('d.SubHeadID IN (:sub_head_ids_0_0, :sub_head_ids_0_1, :sub_head_ids_0_2, :sub_head_ids_0_3)', query)
+        self.assertIn('d.PeriodEnd = :period_end', query)
+        self.assertEqual([query.params[f'sub_head_ids_0_{i}'] for i in range(4)], [10, 11, 12, 12])
+        self.assertEqual((query.params['company_id'], query.params['period_end']), (5, '2024-12-31'))
+        self.assertEqual(availability, {'tbl_financialrawdata': {12: 4}, 'tbl_ratiorawdata': {100: 2}})
+
+    def test_no_candidates_skips_query(self):
+        self.assertEqual(self.db.probe_head_data({'tbl_financialrawdata': []}, company_id=5),
+                         {'tbl_financialrawdata': {}})
+        self.db.execute_query.assert_not_called()
+
+    def test_dissection_ranking_unchanged(self):
+        self.db.execute_query = mock.Mock(return_value=pd.DataFrame({
+            'TableName': ['tbl_disectionrawdata', 'tbl_disectionrawdata'],
+            'SubHeadID': [30, 20],
+            'count': [1, 3],
+        }))
+        counts = self.db.get_heads_with_data('tbl_disectionrawdata', 5, [10, 20, 30], dissection_group_id=1)
+        self.assertEqual(counts, {20: 3, 30: 1})
+        query = self.db.execute_query.call_args[0][0]
+        self.assertIn('d.DisectionGroupID = :disection_group_id', query)
+        self.assertEqual(query.params['disection_group_id'], 1)
+
+
+class TestSelectHeadWithData(unittest.TestCase):
+    """
+    fix_head_id should keep its stage priority while probing all candidates at once
+    """
+
+    def test_first_stage_with_data_wins(self):
+        db = make_db()
+        db.probe_head_data = mock.Mock(return_value={
+            'tbl_financialrawdata': {11: 1},
+            'tbl_ratiorawdata': {100: 5},
+        })
+        stages = [
+            ("Exact match", pd.DataFrame({'SubHeadID': [10], 'SubHeadName': ['Revenue']}), False),
+            ("Contains match", pd.DataFrame({'SubHeadID': [10, 11], 'SubHeadName': ['Revenue', 'Net Revenue']}), False),
+            ("Fallback exact match", pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Revenue Growth']}), True),
+        ]
+
+        self.assertEqual(select_head_with_data(db, stages, company_id=5), (11, False))
+        db.probe_head_data.assert_called_once_with(
+            {'tbl_financialrawdata': [10, 10, 11], 'tbl_ratiorawdata': [100]}, 5, None, None)
+
+    def test_no_data(self):
+        db = make_db()
+        db.probe_head_data = mock.Mock(return_value={'tbl_financialrawdata': {}})
+        stages = [("Exact match", pd.DataFrame({'SubHeadID': [10], 'SubHeadName': ['Revenue']}), False)]
+        self.assertIsNone(select_head_with_data(db, stages, company_id=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+'''
+Unit tests for the process-isolated inference worker pool
+'''
+
+import os
+import sys
+import time
+import unittest
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.chat.exceptions import InferenceCancelled, InferenceError, InferenceQueueFull, InferenceTimeout
+from app.core.chat.inference_pool import InferencePool
+
+
+class FakeModel:
+    """Streams the words of the prompt back, token_s seconds per token"""
+
+    def __init__(self, threads):
+        self.threads = threads
+
+    def __call__(self, prompt, stream=False, max_new_tokens=512, token_s=0.0):
+        for word in (prompt.split() * max_new_tokens)[:max_new_tokens]:
+            time.sleep(token_s)
+            yield f"{word}@{self.threads} "
+
+
+def fake_loader(model_path, threads):
+    return FakeModel(threads)
+
+
+def failing_loader(model_path, threads):
+    raise FileNotFoundError(f"Model file not found: {model_path}")
+
+
+class TestInferencePool(unittest.TestCase):
+    """
+    Workers generate in their own processes; requests are bounded, have deadlines and can be cancelled
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = InferencePool('model.gguf', workers=2, threads=3, queue_size=2, timeout=30, loader=fake_loader)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def wait_idle(self):
+        """Wait until requests abandoned by an earlier call have been reported by their workers"""
+        deadline = time.monotonic() + 5
+        while self.pool.stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_generate(self):
+        self.assertEqual(self.pool.generate("net profit", max_new_tokens=3), "net@3 profit@3 net@3 ")
+        # A request timed out by an earlier test holds its slot until its worker stops
+        self.wait_idle()
+        futures = [self.pool.submit(f"question {i}", queue_timeout=5, max_new_tokens=2) for i in range(4)]
+        self.assertEqual([future.result(timeout=10) for future in futures],
+                         [f"question@3 {i}@3 " for i in range(4)])
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['workers'], stats['threads'], stats['capacity'], stats['alive']), (2, 3, 4, 2))
+        self.assertGreaterEqual(stats['completed'], 5)
+
+    def test_deadline(self):
+        start = time.perf_counter()
+        with self.assertRaises(InferenceTimeout):
+            self.pool.generate("slow answer", timeout=0.2, max_new_tokens=200, token_s=0.02)
+        self.assertLess(time.perf_counter() - start, 2)
+        # The worker stops at the deadline and takes the next request
+        self.assertEqual(self.pool.generate("eps", timeout=10, max_new_tokens=1), "eps@3 ")
+
+    def test_cancel(self):
+        future = self.pool.submit("long answer", max_new_tokens=500, token_s=0.01)
+        time.sleep(0.1)
+        self.assertTrue(self.pool.cancel(future))
+        with self.assertRaises(InferenceCancelled):
+            future.result(timeout=5)
+        self.assertFalse(self.pool.cancel(future))
+
+    def test_stream(self):
+        self.assertEqual(list(self.pool.stream("net profit", max_new_tokens=3)), ['net@3 ', 'profit@3 ', 'net@3 '])
+        with self.assertRaises(InferenceTimeout):
+            list(self.pool.stream("slow answer", timeout=0.2, max_new_tokens=200, token_s=0.02))
+
+        # Closing the stream early, as a disconnected client does, cancels the request
+        self.wait_idle()
+        cancelled = self.pool.stats()['cancelled']
+        stream = self.pool.stream("long answer", max_new_tokens=500, token_s=0.01)
+        self.assertEqual(next(stream), 'long@3 ')
+        stream.close()
+        deadline = time.monotonic() + 5
+        while self.pool.stats()['cancelled'] == cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.stats()['cancelled'], cancelled + 1)
+
+
+class TestInferencePoolLimits(unittest.TestCase):
+    """
+    Backpressure when every slot is taken, and workers that cannot load the model
+    """
+
+    def test_queue_full(self):
+        pool = InferencePool('model.gguf', workers=1, threads=1, queue_size=1, loader=fake_loader)
+        try:
+            running = [pool.submit("busy", max_new_tokens=20, token_s=0.02) for _ in range(2)]
+            with self.assertRaises(InferenceQueueFull):
+                pool.submit("one too many")
+            # Waiting for a slot succeeds once a request finishes
+            self.assertEqual(pool.submit("next", queue_timeout=5, max_new_tokens=1).result(timeout=5), "next@1 ")
+            self.assertEqual([future.result(timeout=5).count('busy') for future in running], [20, 20])
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            pool.close()
+
+    def test_worker_killed_mid_request(self):
+        pool = InferencePool('model.gguf', workers=1, threads=1, queue_size=1, timeout=None, loader=fake_loader)
+        try:
+            running = pool.submit("long answer", max_new_tokens=500, token_s=0.01)
+            queued = pool.submit("next", max_new_tokens=1)
+            time.sleep(0.1)
+            pool.processes[0].kill()
+
+            # The request the worker was running fails instead of waiting forever
+            with self.assertRaises(InferenceError):
+                running.result(timeout=10)
+            # The replacement worker takes the queued request once it has loaded the model
+            self.assertEqual(queued.result(timeout=30), "next@1 ")
+            self.assertEqual(pool.generate("eps", max_new_tokens=1), "eps@1 ")
+            stats = pool.stats()
+            self.assertEqual((stats['alive'], stats['in_flight'], stats['failed'], stats['respawned']), (1, 0, 1, 1))
+        finally:
+            pool.close()
+
+    def test_load_failure(self):
+        with self.assertRaises(InferenceError):
+            InferencePool('missing.gguf', workers=1, loader=failing_loader, start_timeout=30)
+
+
+if __name__ == '__main__':
+    unittest.main()
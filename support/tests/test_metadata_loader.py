@@ -0,0 +1,166 @@
+'''
+Unit tests for parallel, projected metadata loading and the metadata snapshot
+'''
+
+import os
+import re
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metadata_loader import MetadataLoader, MetadataTable, select_query
+from app.core.database.schema_catalog import SchemaCatalog
+
+TABLES = {
+    'companies': MetadataTable('tbl_companieslist', ('CompanyID', 'company_id', 'CompanyName', 'Symbol')),
+    'terms': MetadataTable('tbl_terms', ('TermID', 'term')),
+    'dissection': MetadataTable('tbl_disectionmaster'),
+}
+
+SCHEMA = pd.DataFrame([
+    ('tbl_companieslist', 'CompanyID', 'int'),
+    ('tbl_companieslist', 'CompanyName', 'varchar'),
+    ('tbl_companieslist', 'Address', 'varchar'),
+    ('tbl_companieslist', 'Symbol', 'varchar'),
+    ('tbl_terms', 'TermID', 'int'),
+    ('tbl_terms', 'term', 'varchar'),
+], columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+
+
+class FakeServer:
+    """Answers metadata, schema and checksum queries and records the table queries it saw"""
+
+    def __init__(self):
+        self.frames = {
+            'tbl_companieslist': pd.DataFrame({'CompanyID': [1], 'CompanyName': ['HBL'], 'Address': ['x'],
+                                               'Symbol': ['HBL']}),
+            'tbl_terms': pd.DataFrame({'TermID': [1], 'term': ['3M']}),
+            'tbl_disectionmaster': pd.DataFrame({'DisectionGroupID': [1]}),
+        }
+        self.checksums = {'companies': 1, 'terms': 1, 'dissection': 1}
+        self.table_queries = []
+
+    def execute_query(self, query, params=None, timeout=None):
+        if 'INFORMATION_SCHEMA' in query:
+            return SCHEMA
+        if 'CHECKSUM_AGG' in query:
+            keys = re.findall(r"SELECT '(\w+)' AS TableKey", query)
+            return pd.DataFrame({'TableKey': keys, 'RowCount': [1] * len(keys),
+                                 'RowChecksum': [self.checksums[key] for key in keys]})
+        self.table_queries.append(query)
+        columns, table_name = re.match(r"SELECT (.+) FROM (\w+)", query).groups()
+        df = self.frames[table_name]
+        return df if columns == '*' else df[columns.split(', ')]
+
+
+class TestMetadataLoader(unittest.TestCase):
+    """
+    Tables are read in parallel with only the columns the readers use
+    """
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.catalog = SchemaCatalog(self.server.execute_query).load()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'metadata.pkl')
+        self.loader = MetadataLoader(self.server.execute_query, self.path, TABLES)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_projection(self):
+        self.assertEqual(select_query(TABLES['companies'], self.catalog),
+                         "SELECT CompanyID, CompanyName, Symbol FROM tbl_companieslist")
+        self.assertEqual(select_query(TABLES['companies']), "SELECT * FROM tbl_companieslist")
+        self.assertEqual(select_query(TABLES['dissection'], self.catalog), "SELECT * FROM tbl_disectionmaster")
+
+    def test_load(self):
+        frames = self.loader.load(self.catalog)
+
+        self.assertEqual(set(frames), set(TABLES))
+        self.assertEqual(frames['companies'].columns.tolist(), ['CompanyID', 'CompanyName', 'Symbol'])
+        self.assertEqual(set(self.loader.load(self.catalog, keys=['terms'])), {'terms'})
+
+    def test_snapshot_round_trip(self):
+        frames = self.loader.load(self.catalog)
+        checksums = self.loader.checksums(self.catalog)
+        self.loader.write_snapshot(frames, checksums)
+
+        snapshot = self.loader.read_snapshot()
+        pd.testing.assert_frame_equal(snapshot.frames['companies'], frames['companies'])
+        self.assertEqual(self.loader.stale_tables(snapshot, checksums), [])
+
+        self.server.checksums['terms'] = 2
+        self.assertEqual(self.loader.stale_tables(snapshot, self.loader.checksums(self.catalog)), ['terms'])
+        self.assertEqual(self.loader.stale_tables(snapshot, {}), list(TABLES))
+
+    def test_corrupt_or_foreign_snapshot_is_ignored(self):
+        self.loader.write_snapshot(self.loader.load(self.catalog), {})
+        with open(self.path, 'r+b') as f:
+            f.seek(-8, os.SEEK_END)
+            f.write(b'\xff' * 8)
+        self.assertIsNone(self.loader.read_snapshot())
+
+        self.loader.write_snapshot(self.loader.load(self.catalog), {})
+        other = MetadataLoader(self.server.execute_query, self.path, {'terms': TABLES['terms']})
+        self.assertIsNone(other.read_snapshot())
+
+
+class TestLoadMetadataSnapshot(unittest.TestCase):
+    """
+    A warm start serves metadata from the snapshot and revalidates it in the background
+    """
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patchers = [mock.patch('conf.config.CACHE_DIR', self.temp_dir.name),
+                    mock.patch('app.core.database.metadata_loader.METADATA_TABLES', TABLES)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def new_database(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        db.execute_query = self.server.execute_query
+        return db
+
+    def test_warm_start_reads_snapshot(self):
+        self.new_database().load_metadata(use_snapshot=True)
+        self.assertEqual(len(self.server.table_queries), 3)
+
+        db = self.new_database()
+        db.load_metadata(use_snapshot=True)
+        db.metadata_revalidation.join()
+
+        self.assertEqual(len(self.server.table_queries), 3)
+        self.assertEqual(db.metadata_cache['companies']['CompanyName'].tolist(), ['HBL'])
+
+    def test_revalidation_reloads_changed_tables(self):
+        self.new_database().load_metadata(use_snapshot=True)
+        self.server.frames['tbl_terms'] = pd.DataFrame({'TermID': [1, 2], 'term': ['3M', '6M']})
+        self.server.checksums['terms'] = 2
+
+        db = self.new_database()
+        db.load_metadata(use_snapshot=True)
+        db.metadata_revalidation.join()
+
+        self.assertEqual(self.server.table_queries[3:], ["SELECT TermID, term FROM tbl_terms"])
+        self.assertEqual(db.metadata_cache['terms']['term'].tolist(), ['3M', '6M'])
+
+    def test_without_snapshot(self):
+        self.new_database().load_metadata(use_snapshot=False)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
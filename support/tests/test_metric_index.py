@@ -0,0 +1,112 @@
+'''
+Unit tests for the in-memory metric index
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.metric_index import MetricIndex
+
+
+HEADS = pd.DataFrame({
+    'SubHeadID': [10, 11, 12, 13, 14, 15, 16],
+    'SubHeadName': ['Revenue', 'Net Revenue', 'Total Assets', 'EPS - Basic',
+                    'Depreciation and Amortisation', 'Revenue', None],
+    'IndustryID': [1, 1, 1, 1, 2, 2, 2],
+})
+
+RATIO_HEADS = pd.DataFrame({
+    'SubHeadID': [100, 101, 102, 103],
+    'HeadNames': ['Return on Equity', 'Debt to Equity', 'Gross Profit Margin', 'EPS Growth'],
+    'IndustryID': [1, 1, 1, 1],
+})
+
+
+def reference_lookup(df, id_col, name_col, metric_name):
+    """The pandas scan that get_head_id used before the index existed"""
+    names = df[name_col].fillna('')
+    exact = df[names.str.lower() == metric_name.lower()]
+    if not exact.empty:
+        return exact.iloc[0][id_col]
+    contains = df[names.str.lower().apply(lambda x: metric_name.lower() in x)]
+    if not contains.empty:
+        return contains.iloc[0][id_col]
+    return None
+
+
+class TestMetricIndex(unittest.TestCase):
+    """
+    Test cases for MetricIndex lookups
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = MetricIndex(HEADS, RATIO_HEADS)
+
+    def test_exact_returns_first_row(self):
+        self.assertEqual(self.index.exact('revenue', is_ratio=False), (10, False, 'Revenue'))
+        self.assertIsNone(self.index.exact('revenues', is_ratio=False))
+
+    def test_prefix(self):
+        self.assertEqual([e[0] for e in self.index.prefix('rev', is_ratio=False)], [10, 15])
+        self.assertEqual([e[0] for e in self.index.prefix('debt', is_ratio=True)], [101])
+
+    def test_contains_matches_reference_scan(self):
+        for metric in ['revenue', 'assets', 'eps', 'amort', 'ta', 'e', 'equity', 'missing metric']:
+            expected = reference_lookup(HEADS, 'SubHeadID', 'SubHeadName', metric)
+            entry = self.index.exact(metric, False) or self.index.contains(metric, False)
+            self.assertEqual(entry[0] if entry else None, expected, metric)
+
+            expected = reference_lookup(RATIO_HEADS, 'SubHeadID', 'HeadNames', metric)
+            entry = self.index.exact(metric, True) or self.index.contains(metric, True)
+            self.assertEqual(entry[0] if entry else None, expected, metric)
+
+    def test_resolve_priority(self):
+        # Regular heads first for non-ratio metrics, ratio heads first otherwise
+        self.assertEqual(self.index.resolve('eps', prefer_ratio=False)[:2], (13, False))
+        self.assertEqual(self.index.resolve('eps', prefer_ratio=True)[:2], (103, True))
+        # Falls back to the other table
+        self.assertEqual(self.index.resolve('debt to equity', prefer_ratio=False)[:2], (101, True))
+        self.assertIsNone(self.index.resolve('unknown head', prefer_ratio=False))
+
+    def test_similar(self):
+        similar = self.index.similar('total equity')
+        self.assertEqual(similar[0], 'Total Assets')
+        self.assertIn('Return on Equity', similar)
+        self.assertEqual(self.index.similar(''), [])
+
+
+class TestGetHeadIdWithIndex(unittest.TestCase):
+    """
+    FinancialDatabase.get_head_id should resolve from the cached head tables only
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache['heads'] = HEADS
+        self.db.metadata_cache['ratio_heads'] = RATIO_HEADS
+        self.db.execute_query = mock.Mock(side_effect=AssertionError('unexpected database call'))
+
+    def test_regular_and_ratio_lookup(self):
+        self.assertEqual(self.db.get_head_id('Net Revenue'), (11, False))
+        self.assertEqual(self.db.get_head_id('Return on Equity'), (100, True))
+        self.assertEqual(self.db.get_head_id('gross profit'), (102, True))
+
+    def test_ttm_eps(self):
+        self.assertEqual(self.db.get_head_id('TTM EPS'), (13, False))
+
+    def test_not_found(self):
+        self.assertEqual(self.db.get_head_id('Nonexistent'), (None, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
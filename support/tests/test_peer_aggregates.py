@@ -0,0 +1,226 @@
+'''
+Unit tests for the materialized sector / industry aggregates
+'''
+
+import os
+import re
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.peer_aggregates import PeerAggregates, aggregate, percentile_rank
+from app.core.database.query_planner import PLAN_COLUMNS
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1, 2, 3, 4], 'CompanyName': ['UBL Ltd', 'HBL Ltd', 'MCB Ltd', 'Lucky Cement'],
+                               'Symbol': ['UBL', 'HBL', 'MCB', 'LUCK'], 'SectorID': [10, 10, 10, 20]}),
+    'sectors': pd.DataFrame({'SectorID': [10, 20], 'SectorName': ['Commercial Banks', 'Cement']}),
+    'industries': pd.DataFrame({'IndustryID': [100, 200], 'IndustryName': ['Banking', 'Cement']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10, 20], 'industryid': [100, 200]}),
+    'heads': pd.DataFrame({'SubHeadID': [11], 'SubHeadName': ['Net Profit'], 'IndustryID': [100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2], 'term': ['6M', '12M']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+COMPANY_GROUPS = pd.DataFrame({'CompanyID': [1, 2, 3, 4], 'SectorID': [10, 10, 10, 20], 'IndustryID': [100, 100, 100, 200]})
+
+TABLES = {'ratio': 'tbl_ratiorawdata'}
+
+
+def ratio_rows(rows):
+    return pd.DataFrame(rows, columns=['CompanyID', 'SubHeadID', 'TermID', 'ConsolidationID', 'PeriodEnd', 'Value'])
+
+
+RATIOS = ratio_rows([
+    (1, 100, 2, 1, pd.Timestamp('2022-12-31'), 10.0),
+    (2, 100, 2, 1, pd.Timestamp('2022-12-31'), 20.0),
+    (1, 100, 2, 1, pd.Timestamp('2023-12-31'), 15.0),
+    (2, 100, 2, 1, pd.Timestamp('2023-12-31'), 25.0),
+    (3, 100, 2, 1, pd.Timestamp('2023-12-31'), 35.0),
+    (4, 100, 2, 1, pd.Timestamp('2023-12-31'), 5.0),
+    (3, 100, 2, 1, pd.Timestamp('2024-12-31'), None),
+])
+
+
+class FakeRawTable:
+    """Answers the aggregate loads from in-memory rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def fetch(self, query):
+        self.queries.append(query)
+        since = (getattr(query, 'params', None) or {}).get('since')
+        return self.rows if since is None else self.rows[self.rows['PeriodEnd'] >= since]
+
+
+class TestPeerAggregates(unittest.TestCase):
+    """
+    Statistics per group, lookups and incremental refresh
+    """
+
+    def setUp(self):
+        self.table = FakeRawTable(RATIOS.copy())
+        self.store = PeerAggregates(self.table.fetch, COMPANY_GROUPS, TABLES).build()
+
+    def test_aggregate(self):
+        stats = aggregate(RATIOS, COMPANY_GROUPS)
+
+        banks = stats[(stats['GroupKind'] == 'sector') & (stats['GroupID'] == 10)
+                      & (stats['PeriodEnd'] == pd.Timestamp('2023-12-31'))].iloc[0]
+        self.assertEqual((banks['Count'], banks['Mean'], banks['Median'], banks['Min'], banks['Max']), (3, 25.0, 25.0, 15.0, 35.0))
+        self.assertAlmostEqual(banks['P25'], 20.0)
+        self.assertAlmostEqual(banks['P90'], 33.0)
+        # Sector and industry groups, missing values left out
+        self.assertEqual(sorted(stats['GroupKind'].unique()), ['industry', 'sector'])
+        self.assertNotIn(pd.Timestamp('2024-12-31'), stats['PeriodEnd'].tolist())
+
+    def test_lookup(self):
+        latest = self.store.lookup('tbl_ratiorawdata', 'industry', 100, 100, 2, 1)
+        self.assertEqual((latest['PeriodEnd'], latest['Count'], latest['Mean']), (pd.Timestamp('2023-12-31'), 3, 25.0))
+
+        previous = self.store.lookup('tbl_ratiorawdata', 'sector', 10, 100, 2, 1, '2022-12-31')
+        self.assertEqual((previous['Count'], previous['Median']), (2, 15.0))
+        self.assertIsNone(self.store.lookup('tbl_ratiorawdata', 'sector', 10, 100, 2, 2))
+        self.assertIsNone(self.store.lookup('tbl_financialrawdata', 'sector', 10, 100, 2, 1))
+        self.assertFalse(self.store.covers('tbl_financialrawdata'))
+
+    def test_refresh(self):
+        self.table.rows = pd.concat([self.table.rows, ratio_rows([
+            (1, 100, 2, 1, pd.Timestamp('2024-12-31'), 18.0),
+            (2, 100, 2, 1, pd.Timestamp('2024-12-31'), 22.0),
+        ])], ignore_index=True)
+
+        replaced = self.store.refresh()
+
+        self.assertEqual(self.table.queries[-1].params, {'since': pd.Timestamp('2024-12-31')})
+        # One 2024 period for the sector and the industry
+        self.assertEqual(replaced, 2)
+        latest = self.store.lookup('tbl_ratiorawdata', 'sector', 10, 100, 2, 1)
+        self.assertEqual((latest['PeriodEnd'], latest['Count'], latest['Mean']), (pd.Timestamp('2024-12-31'), 2, 20.0))
+        self.assertEqual(self.store.lookup('tbl_ratiorawdata', 'sector', 10, 100, 2, 1, '2023-12-31')['Count'], 3)
+
+        # Re-reading the watermark period replaces it rather than duplicating it
+        self.store.refresh()
+        self.assertEqual(len(self.store.frames['ratio']), 8)
+
+    def test_refresh_publishes_frame_with_its_index(self):
+        before = self.store.aggregates['ratio']
+        self.table.rows = pd.concat([self.table.rows, ratio_rows([
+            (1, 100, 2, 1, pd.Timestamp('2024-12-31'), 18.0),
+        ])], ignore_index=True)
+
+        self.store.refresh()
+
+        # A lookup holding the old aggregates still reads positions of the old frame
+        after = self.store.aggregates['ratio']
+        self.assertIsNot(after, before)
+        self.assertEqual(len(before.positions), len(before.frame))
+        self.assertEqual(len(after.positions), len(after.frame))
+
+    def test_one_update_at_a_time(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            db = FinancialDatabase('server', 'database')
+        release = threading.Event()
+        update = db.peer_aggregates_update.update = mock.Mock(side_effect=lambda: release.wait(5))
+
+        first = db.update_peer_aggregates_in_background()
+        self.assertIs(db.update_peer_aggregates_in_background(), first)
+        self.assertIsNone(db.get_peer_aggregates())
+        release.set()
+        first.join()
+        self.assertEqual(update.call_count, 1)
+
+    def test_percentile_rank(self):
+        stats = self.store.lookup('tbl_ratiorawdata', 'sector', 10, 100, 2, 1)
+
+        self.assertEqual(percentile_rank(25.0, stats), 50.0)
+        self.assertEqual(percentile_rank(40.0, stats), 100.0)
+        self.assertIsNone(percentile_rank(float('nan'), stats))
+
+
+class FakeServer:
+    """Answers plan statements, head lookups and aggregate loads"""
+
+    def __init__(self):
+        self.ratios = RATIOS.copy()
+        self.queries = []
+
+    def execute_query(self, query, params=None, timeout=None):
+        params = params if params is not None else getattr(query, 'params', None) or {}
+        self.queries.append(query)
+        if 'INFORMATION_SCHEMA' in query:
+            return pd.DataFrame([('tbl_ratiorawdata', 'CompanyID', 'int')], columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+        if getattr(query, 'name', None) == 'peer_aggregates':
+            return self.ratios if 'FROM tbl_ratiorawdata' in query else pd.DataFrame(columns=self.ratios.columns)
+        if getattr(query, 'name', None) == 'query_plan':
+            df = self.ratios[(self.ratios['CompanyID'] == params['company_id']) & (self.ratios['TermID'] == params['term_id'])
+                             & (self.ratios['ConsolidationID'] == params['consolidation_id'])]
+            if 'fiscal_year' in params:
+                df = df[df['PeriodEnd'].dt.year == params['fiscal_year']]
+            df = df.dropna(subset=['Value']).sort_values('PeriodEnd', ascending=False).head(1)
+            return pd.DataFrame({'Value': df['Value'], 'Unit': '%', 'Term': '12M', 'Company': 'HBL Ltd',
+                                 'Metric': 'Return on Equity', 'Consolidation': 'Consolidated', 'PeriodEnd': df['PeriodEnd'],
+                                 'SubHeadID': df['SubHeadID'], 'SourceTable': 'tbl_ratiorawdata', 'DisectionGroupID': None},
+                                columns=PLAN_COLUMNS)
+        if re.search(r'FROM (tbl_headsmaster|tbl_ratiosheadmaster) h', query) and 'SubHeadID, h.' in query:
+            is_ratio = 'tbl_ratiosheadmaster' in query
+            heads = METADATA['ratio_heads' if is_ratio else 'heads']
+            name_col = 'HeadNames' if is_ratio else 'SubHeadName'
+            if 'name' in params:
+                match = heads[name_col].str.lower() == params['name'].lower()
+            else:
+                match = heads[name_col].str.lower().str.contains(params['pattern'].strip('%'), regex=False)
+            return heads[match][['SubHeadID', name_col]]
+        if 'COUNT(*)' in query:
+            return pd.DataFrame({'count': [1]})
+        return pd.DataFrame()
+
+
+class TestCompareToPeers(unittest.TestCase):
+    """
+    compare_to_peers reads the company's value once and the peers from the aggregates
+    """
+
+    def setUp(self):
+        self.server = FakeServer()
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.db.execute_query = self.server.execute_query
+        self.db.session = mock.MagicMock()
+
+    def test_compare(self):
+        # The aggregates load on a background thread, never inside the request
+        loading = self.db.compare_to_peers('HBL', 'Return on Equity', '12M 2023')
+        self.assertIn('still being loaded', loading['error'])
+        self.db.update_peer_aggregates_in_background().join()
+
+        response = self.db.compare_to_peers('HBL', 'Return on Equity', '12M 2023')
+
+        self.assertEqual((response['value'], response['date']), (25.0, '2023-12-31'))
+        self.assertEqual((response['peer_group'], response['peer_count']), ('Commercial Banks', 3))
+        self.assertEqual((response['peer_mean'], response['peer_median'], response['percentile']), (25.0, 25.0, 50.0))
+
+        industry = self.db.compare_to_peers('HBL', 'Return on Equity', '12M 2023', group='industry')
+        self.assertEqual(industry['peer_group'], 'Banking')
+        # The aggregates are built once
+        self.assertEqual(sum(getattr(query, 'name', None) == 'peer_aggregates' for query in self.server.queries), 4)
+
+        self.assertIn('error', self.db.compare_to_peers('HBL', 'Return on Equity', '12M 2023', group='country'))
+        self.assertIn('error', self.db.compare_to_peers('XYZ', 'Return on Equity', '12M 2023'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+'''
+Unit tests for the in-memory latest-period index
+'''
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database import term_resolution
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.period_index import PeriodIndex
+
+
+TABLES = {
+    'regular': 'tbl_financialrawdata',
+    'quarter': 'tbl_financialrawdata_Quarter',
+    'dissection': 'tbl_disectionrawdata',
+}
+
+
+def fake_fetch(rows):
+    """Return a fetch callable serving rows per table, filtered by the watermark clause"""
+    def fetch(query):
+        table_name = next(t for t in TABLES.values() if f"FROM {t}\n" in query)
+        df = rows[table_name]
+        if query.params.get('since') is not None:
+            df = df[df['PeriodEnd'] >= pd.Timestamp(query.params['since'])]
+        return df.copy()
+    return fetch
+
+
+def period_rows(company_ids, consolidation_ids, term_ids, period_ends, annual, **extra):
+    return pd.DataFrame({'CompanyID': company_ids, 'ConsolidationID': consolidation_ids, **extra,
+                         'TermID': term_ids, 'PeriodEnd': pd.to_datetime(period_ends), 'IsAnnual': annual})
+
+
+def build_rows():
+    return {
+        'tbl_financialrawdata': period_rows(
+            [5, 5, 5], [1, 1, 2], [4, 1, 4], ['2023-12-31', '2024-03-31', '2022-12-31'], [1, 0, 1]),
+        'tbl_financialrawdata_Quarter': period_rows(
+            [5, 5, 5, 7], [1, 1, 2, 1], [11, 12, 13, 11], ['2024-03-31', '2024-06-30', '2024-09-30', '2024-03-31'],
+            [0, 0, 0, 0]),
+        'tbl_disectionrawdata': period_rows(
+            [5, 5], [1, 1], [1, 1], ['2024-03-31', '2023-03-31'], [0, 0],
+            DisectionGroupID=[2, 2], SubHeadID=[20, 21]),
+    }
+
+
+class TestPeriodIndex(unittest.TestCase):
+    """
+    Test cases for PeriodIndex
+    """
+
+    def setUp(self):
+        self.rows = build_rows()
+        self.index = PeriodIndex(fake_fetch(self.rows), TABLES, depth=2).build()
+
+    def test_latest_and_previous(self):
+        periods = self.index.latest('tbl_financialrawdata_Quarter', 5, consolidation_id=1)
+        self.assertEqual(periods, [(12, pd.Timestamp('2024-06-30')), (11, pd.Timestamp('2024-03-31'))])
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 5)[0], (13, pd.Timestamp('2024-09-30')))
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 6), [])
+
+    def test_annual(self):
+        self.assertEqual(self.index.latest('tbl_financialrawdata', 5, consolidation_id=1, annual=True),
+                         [(4, pd.Timestamp('2023-12-31'))])
+        self.assertEqual(self.index.latest('tbl_financialrawdata', 5, consolidation_id=1)[0],
+                         (1, pd.Timestamp('2024-03-31')))
+
+    def test_dissection_wildcards(self):
+        self.assertEqual(self.index.latest('tbl_disectionrawdata', 5, 1, 2, sub_head_id=21),
+                         [(1, pd.Timestamp('2023-03-31'))])
+        self.assertEqual(len(self.index.latest('tbl_disectionrawdata', 5, dissection_group_id=2)), 2)
+        self.assertEqual(self.index.latest('tbl_disectionrawdata', 5, dissection_group_id=3), [])
+
+    def test_incremental_refresh(self):
+        self.rows['tbl_financialrawdata_Quarter'] = pd.concat([self.rows['tbl_financialrawdata_Quarter'], period_rows(
+            [5, 5], [1, 1], [14, 10], ['2024-12-31', '2023-12-31'], [0, 0])], ignore_index=True)
+
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 5, consolidation_id=1),
+                         [(14, pd.Timestamp('2024-12-31')), (12, pd.Timestamp('2024-06-30'))])
+
+    def test_refresh_publishes_new_partitions(self):
+        before = self.index.periods['quarter']
+        keys = before.company_keys[5]
+        self.rows['tbl_financialrawdata_Quarter'] = pd.concat([self.rows['tbl_financialrawdata_Quarter'], period_rows(
+            [5], [3], [14], ['2024-12-31'], [0])], ignore_index=True)
+
+        self.index.refresh()
+
+        # A lookup holding the old partitions iterates them unchanged
+        self.assertIsNot(self.index.periods['quarter'], before)
+        self.assertEqual(before.company_keys[5], keys)
+        self.assertNotIn((5, 3), before.partitions)
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 5)[0], (14, pd.Timestamp('2024-12-31')))
+
+    def test_rebuild_picks_up_late_filers(self):
+        # Company 7 files a quarter older than the family's watermark
+        self.rows['tbl_financialrawdata_Quarter'] = pd.concat([self.rows['tbl_financialrawdata_Quarter'], period_rows(
+            [7], [1], [12], ['2024-06-30'], [0])], ignore_index=True)
+        self.index.refreshed_at -= 3600
+
+        self.index.maybe_refresh()
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 7)[0], (11, pd.Timestamp('2024-03-31')))
+
+        # Once the last build is old enough the refresh becomes a full rebuild
+        self.index.refreshed_at -= 3600
+        self.index.built_at -= 3600
+        self.index.maybe_refresh(rebuild_interval=1800)
+        self.assertEqual(self.index.latest('tbl_financialrawdata_Quarter', 7)[0], (12, pd.Timestamp('2024-06-30')))
+
+    def test_query_is_one_ranked_aggregate(self):
+        query = self.index._query('dissection', since=pd.Timestamp('2024-01-01'))
+        self.assertIn('ROW_NUMBER() OVER (PARTITION BY CompanyID, ConsolidationID, DisectionGroupID, SubHeadID', query)
+        self.assertIn('FinDate AS PeriodEnd', query)
+        self.assertEqual(query.params['depth'], 2)
+
+
+class TestRelativePeriodResolution(unittest.TestCase):
+    """
+    Relative periods resolve from the index without querying the raw tables
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.period_index = PeriodIndex(fake_fetch(build_rows()), TABLES, depth=2).build()
+        self.db.execute_query = mock.Mock(side_effect=AssertionError('unexpected query'))
+
+    def test_resolve_relative_period(self):
+        self.assertEqual(self.db.resolve_relative_period(5, 1, 'most_recent_quarter'), (12, '2024-06-30'))
+        self.assertEqual(self.db.resolve_relative_period(5, 1, 'last_quarter'), (11, '2024-03-31'))
+        self.assertEqual(self.db.resolve_relative_period(5, 1, 'ytd'), (4, '2023-12-31'))
+        self.assertEqual(self.db.resolve_relative_period(7, 1, 'last_quarter'), (None, None))
+
+    def test_resolve_dissection_relative_period(self):
+        self.assertEqual(self.db.resolve_dissection_relative_period(5, 1, 'current', 2, 'regular', sub_head_id=20),
+                         (1, '2024-03-31'))
+
+    def test_term_resolution(self):
+        self.assertEqual(term_resolution.resolve_last_quarter(self.db, company_id=5, consolidation_id=2),
+                         (13, '2024-09-30'))
+        self.assertEqual(term_resolution.resolve_most_recent_period(self.db, company_id=5, consolidation_id=1),
+                         (1, '2024-03-31'))
+
+    def test_stale_index_refreshes_in_the_background(self):
+        index = self.db.period_index
+        index.refreshed_at -= 3600
+        release = threading.Event()
+        fetch = index.fetch
+        index.fetch = lambda query: release.wait(5) and fetch(query)
+
+        # The period resolves from the current index while the refresh runs on its own thread
+        self.assertEqual(self.db.resolve_relative_period(5, 1, 'most_recent_quarter'), (12, '2024-06-30'))
+        update = self.db.period_index_update.thread
+        self.assertTrue(update.is_alive())
+        release.set()
+        update.join()
+        self.assertFalse(index.is_stale())
+
+    def test_falls_back_to_query_without_index(self):
+        self.db.period_index = None
+        self.db.execute_query = mock.Mock(return_value=pd.DataFrame({
+            'TermID': [12], 'PeriodEnd': [pd.Timestamp('2024-06-30')]}))
+
+        self.assertEqual(self.db.resolve_relative_period(5, 1, 'most_recent_quarter')[0], 12)
+        self.assertEqual(self.db.execute_query.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+'''
+Unit tests for the named, parameterized statements in query_catalog
+'''
+
+import datetime
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database import query_catalog
+from app.core.database.query_catalog import BoundQuery, equality_filters, expand_in_list, like_pattern
+
+
+class TestQueryCatalog(unittest.TestCase):
+    """
+    Statements bind typed values instead of formatting them into the SQL text
+    """
+
+    def test_bind_converts_values(self):
+        query = query_catalog.bind('latest_quarter_period', company_id=np.int64(7), consolidation_id=2.0)
+
+        self.assertIsInstance(query, BoundQuery)
+        self.assertEqual(query.params, {'company_id': 7, 'consolidation_id': 2})
+        self.assertIsInstance(query.params['company_id'], int)
+        self.assertIn(':company_id', query)
+        self.assertNotIn('7', query)
+
+    def test_sql_text_does_not_depend_on_values(self):
+        first = query_catalog.bind('heads_like_in_sector', sector_id=1, pattern="Net Profit")
+        second = query_catalog.bind('heads_like_in_sector', sector_id=2, pattern="Banks' Deposits")
+
+        self.assertEqual(str(first), str(second))
+        self.assertEqual(second.params['pattern'], "%banks' deposits%")
+
+    def test_like_pattern_escapes_wildcards(self):
+        self.assertEqual(like_pattern(' 50%_Share[A] '), '%50[%][_]share[[]a]%')
+
+    def test_bind_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            query_catalog.bind('term_name')
+        with self.assertRaises(ValueError):
+            query_catalog.bind('term_name', term_id=1, company_id=2)
+        with self.assertRaises(ValueError):
+            query_catalog.bind('term_name', term_id=None)
+        with self.assertRaises(ValueError):
+            query_catalog.bind('term_name', term_id=1.5)
+        with self.assertRaises(ValueError):
+            query_catalog.bind('head_count', table='tbl_companieslist; --', sub_head_id=1)
+        with self.assertRaises(KeyError):
+            query_catalog.bind('no_such_statement')
+
+    def test_table_placeholder_is_whitelisted(self):
+        query = query_catalog.bind('head_count', table='tbl_ratiosheadmaster', sub_head_id=5)
+
+        self.assertIn('FROM tbl_ratiosheadmaster h', query)
+        self.assertEqual(query.params, {'sub_head_id': 5})
+
+    def test_in_list_is_padded_to_power_of_two(self):
+        placeholders, params = expand_in_list('ids', [3, 5, 8])
+
+        self.assertEqual(placeholders, ':ids_0, :ids_1, :ids_2, :ids_3')
+        self.assertEqual(params, {'ids_0': 3, 'ids_1': 5, 'ids_2': 8, 'ids_3': 8})
+        with self.assertRaises(ValueError):
+            expand_in_list('ids', [])
+
+    def test_equality_filters_skip_none(self):
+        clauses, params = equality_filters(
+            {'CompanyID': 1, 'DisectionGroupID': None, 'PeriodEnd': pd.Timestamp('2023-03-31')}, alias='d')
+
+        self.assertEqual(clauses, ['d.CompanyID = :company_id', 'd.PeriodEnd = :period_end'])
+        self.assertEqual(params, {'company_id': 1, 'period_end': datetime.datetime(2023, 3, 31)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+'''
+Unit tests for per-request QueryContext state in FinancialDatabase
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+
+
+class TestQueryContext(unittest.TestCase):
+    """
+    get_term_id should record resolution state on the context it is given, not on the instance
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache['terms'] = pd.DataFrame({'TermID': [1, 3], 'term': ['3M', 'TTM']})
+        self.db.metadata_cache['terms_mapping'] = pd.DataFrame()
+
+        def execute_query(query, params=None, timeout=None):
+            if 'INFORMATION_SCHEMA' in query:
+                return pd.DataFrame({'count': [1]})
+            if 'tbl_financialrawdataTTM' in query:
+                return pd.DataFrame({'TermID': [3], 'PeriodEnd': [pd.Timestamp('2024-06-30')]})
+            return pd.DataFrame()
+
+        self.db.execute_query = execute_query
+
+    def test_ttm_state_is_per_context(self):
+        ttm_context, plain_context = QueryContext(), QueryContext()
+
+        self.assertEqual(self.db.get_term_id('TTM', 1, context=ttm_context), 3)
+        self.assertEqual(self.db.get_term_id('3M', 1, context=plain_context), 1)
+
+        self.assertTrue(ttm_context.is_ttm_query)
+        self.assertEqual(ttm_context.resolved_period_end, '2024-06-30')
+        self.assertFalse(plain_context.is_ttm_query)
+        self.assertIsNone(plain_context.resolved_period_end)
+        self.assertFalse(hasattr(self.db, 'is_ttm_query'))
+        self.assertFalse(hasattr(self.db, 'resolved_period_end'))
+
+    def test_context_is_optional(self):
+        self.assertEqual(self.db.get_term_id('TTM', 1), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+'''
+Unit tests for the single-statement query planner
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+from app.core.database.query_planner import PlanBranch, QueryPlan
+from app.core.process_query import execute_financial_query
+from support.tests.fake_server import FakeServer, data_rows
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1], 'CompanyName': ['United Bank Limited'], 'Symbol': ['UBL'], 'SectorID': [10]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'heads': pd.DataFrame({'SubHeadID': [11, 12], 'SubHeadName': ['Net Profit', 'Gross Profit'], 'IndustryID': [100, 100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2, 3, 4], 'term': ['3M', '6M', 'TTM', 'Q1']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+TABLES = {
+    'tbl_financialrawdata': data_rows([
+        (1, 11, 2, 2, 2022, pd.Timestamp('2022-06-30'), 9.0),
+        (1, 11, 4, 2, 2023, pd.Timestamp('2023-03-31'), 4.0),
+        (1, 12, 2, 2, 2023, pd.Timestamp('2023-06-30'), 30.0),
+    ]),
+    'tbl_financialrawdata_Quarter': data_rows([
+        (1, 12, 4, 2, 2023, pd.Timestamp('2023-03-31'), 7.0),
+    ]),
+    'tbl_ratiorawdata': data_rows([
+        (1, 100, 2, 2, 2023, pd.Timestamp('2023-06-30'), 0.15),
+    ]),
+}
+
+
+class TestQueryPlan(unittest.TestCase):
+    """
+    A plan ranks every (head, table) candidate in one statement
+    """
+
+    def setUp(self):
+        self.plan = QueryPlan(company_id=1, consolidation_id=2, term_id=4, fiscal_year=2023,
+                              heads=[(11, False), (100, True), (12, False)],
+                              branches=[PlanBranch('tbl_financialrawdata_Quarter', False),
+                                        PlanBranch('tbl_financialrawdata', False), PlanBranch('tbl_ratiorawdata', True)])
+
+    def test_statement(self):
+        query = self.plan.statement()
+
+        self.assertEqual(query.name, 'query_plan')
+        self.assertEqual(query.count('UNION ALL'), 2)
+        self.assertIn('ROW_NUMBER() OVER (ORDER BY b.HeadRank, b.BranchRank, b.PeriodEnd DESC)', query)
+        self.assertIn('WHERE PlanRank = 1', query)
+        # Head ranks follow the candidate order across regular and ratio heads
+        self.assertEqual((query.params['k0_0_0'], query.params['k0_0_1']), (11, 0))
+        self.assertEqual((query.params['k0_1_0'], query.params['k0_1_1']), (12, 2))
+        self.assertEqual((query.params['k2_0_0'], query.params['k2_0_1']), (100, 1))
+        self.assertEqual((query.params['term_id'], query.params['fiscal_year']), (4, 2023))
+        self.assertEqual(len(self.plan.candidates()), 5)
+
+    def test_dissection_and_consolidation(self):
+        plan = QueryPlan(company_id=1, period_end='2023-12-31', heads=[(11, False)],
+                         branches=[PlanBranch('tbl_disectionrawdata', False, 1), PlanBranch('tbl_disectionrawdata', False)])
+        query = plan.statement()
+
+        self.assertNotIn('ConsolidationID = :consolidation_id', query)
+        self.assertEqual(query.count('d.DisectionGroupID = :dissection_group_id_'), 1)
+        self.assertEqual(query.params['dissection_group_id_0'], 1)
+        self.assertEqual(query.params['period_end'], '2023-12-31')
+        # Dissection tables are read with their own columns and label tables
+        self.assertIn('d.Amount AS Value', query)
+        self.assertIn('d.FinDate AS PeriodEnd', query)
+        self.assertIn('JOIN tbl_termsmaster t', query)
+        self.assertIn('JOIN tbl_consolidationmaster con', query)
+        self.assertIn('AND d.FinDate = :period_end', query)
+        self.assertNotIn('d.PeriodEnd', query)
+
+        by_year = QueryPlan(company_id=1, term_id=2, fiscal_year=2023, heads=[(11, False)],
+                            branches=[PlanBranch('tbl_disectionrawdata', False)]).statement()
+        self.assertIn('AND d.TermID = :term_id AND YEAR(d.FinDate) = :fiscal_year', by_year)
+
+        with self.assertRaises(ValueError):
+            QueryPlan(company_id=1, term_id=2, heads=[(100, True)], branches=[PlanBranch('tbl_financialrawdata', False)]).statement()
+
+
+class TestPlannedLookups(unittest.TestCase):
+    """
+    Fallbacks across heads and tables resolve in one round trip, without probes
+    """
+
+    def setUp(self):
+        self.server = FakeServer(TABLES, METADATA)
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.db.execute_query = self.server.execute_query
+        self.db.session = mock.MagicMock()
+        self.db.result_cache.max_entries = self.db.question_cache.max_entries = 0
+        self.db.has_table('tbl_financialrawdata')
+
+    def data_queries(self):
+        return [query for query in self.server.queries
+                if getattr(query, 'name', None) == 'query_plan' or 'COUNT(*)' in query or 'AS TableName' in query]
+
+    def test_alternative_head_in_one_round_trip(self):
+        plan = self.db.plan_financial_query('UBL', 'Profit', '6M 2023', 'unconsolidated', context=QueryContext())
+        self.assertEqual(plan.heads, [(11, False), (12, False)])
+        self.assertFalse(self.data_queries())
+
+        response = self.db.execute_plan(plan)
+
+        # Net Profit has no 6M 2023 row, so the next candidate answers
+        self.assertEqual((response['metric'], response['value']), ('Gross Profit', 30.0))
+        self.assertEqual(plan.round_trips, 1)
+        self.assertEqual(len(self.data_queries()), 1)
+
+        missing = self.db.plan_financial_query('UBL', 'Profit', '3M 2023', 'unconsolidated')
+        self.assertEqual(self.db.execute_plan(missing), {"error": "No data found for the specified parameters"})
+        self.assertEqual(self.db.plan_financial_query('XYZ', 'Profit', '6M 2023').error, "Company 'XYZ' not found")
+
+    def test_quarter_table_fallback(self):
+        self.server.queries.clear()
+        response = self.db.get_financial_data('UBL', 'Net Profit', 'Q1', 'unconsolidated', context=QueryContext())
+
+        # No Quarter-table row for Net Profit: the regular table answers in the same statement
+        self.assertEqual(response['value'], 4.0)
+        self.assertEqual(sum(getattr(query, 'name', None) == 'query_plan' for query in self.server.queries), 1)
+        # Only the head availability probe runs before it, no per-table COUNT(*) checks
+        self.assertFalse([query for query in self.server.queries
+                          if ('COUNT(*)' in query and 'AS TableName' not in query) or 'SELECT term FROM' in query])
+
+    def test_process_query_path(self):
+        entities = {'company_id': 1, 'head_id': 12, 'is_ratio': False, 'consolidation_id': 2, 'term_id': 4}
+
+        result = execute_financial_query(entities, self.db)
+
+        self.assertEqual(result['value'], 7.0)
+        self.assertEqual(result['round_trips'], 1)
+        self.assertEqual(result['period_end'], '2023-03-31')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+'''
+Unit tests for the get_financial_data result cache
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.result_cache import ResultCache, ResultKey
+
+
+def mock_engine():
+    """Engine whose connect() hands out a mock connection"""
+    engine = mock.Mock()
+    connection = mock.MagicMock()
+    connection.__enter__.return_value = connection
+    connection.execution_options.return_value = connection
+    engine.connect.return_value = connection
+    return engine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def result_key(company_id, head_id=1):
+    return ResultKey(company_id=company_id, head_id=head_id, is_ratio=False, term_id=1, consolidation_id=1,
+                     period_end='2024-06-30', resolved_period_end=None, fiscal_year=None, relative_type=None,
+                     is_ttm=False, dissection_group_id=None, dissection_data_type=None)
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    LRU eviction, TTL expiry, per-company invalidation and counters
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResultCache(max_entries=2, ttl_seconds=60, clock=self.clock)
+
+    def test_lru_eviction(self):
+        self.cache.put(result_key(1), 'a', company_id=1)
+        self.cache.put(result_key(2), 'b', company_id=2)
+        self.assertEqual(self.cache.get(result_key(1)), 'a')
+        self.cache.put(result_key(3), 'c', company_id=3)
+
+        self.assertIsNone(self.cache.get(result_key(2)))
+        self.assertEqual(self.cache.get(result_key(1)), 'a')
+        self.assertEqual(self.cache.get(result_key(3)), 'c')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        self.cache.put(result_key(1), 'a', company_id=1)
+        self.clock.now = 59
+        self.assertEqual(self.cache.get(result_key(1)), 'a')
+        self.clock.now = 60
+
+        self.assertIsNone(self.cache.get(result_key(1)))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_invalidate_company(self):
+        self.cache.put(result_key(1, head_id=1), 'a', company_id=1)
+        self.cache.put(result_key(2), 'b', company_id=2)
+
+        self.assertEqual(self.cache.invalidate_company(1), 1)
+        self.assertIsNone(self.cache.get(result_key(1, head_id=1)))
+        self.assertEqual(self.cache.get(result_key(2)), 'b')
+        self.assertEqual(self.cache.invalidate_company(1), 0)
+
+    def test_stats_and_disabled_cache(self):
+        self.cache.put(result_key(1), 'a', company_id=1)
+        self.cache.get(result_key(1))
+        self.cache.get(result_key(2))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+        disabled = ResultCache(max_entries=0, ttl_seconds=60)
+        disabled.put(result_key(1), 'a', company_id=1)
+        self.assertIsNone(disabled.get(result_key(1)))
+
+
+class TestFinancialDatabaseResultCache(unittest.TestCase):
+    """
+    A repeated question is answered from the cache without running the resolution chain
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=mock_engine()):
+            self.db = FinancialDatabase('server', 'database')
+        self.response = {'company': 'HBL', 'metric': 'Net Profit', 'value': 10.0}
+
+        def resolve(*args, question=None, **kwargs):
+            key = result_key(7)
+            self.db.result_cache.put(key, dict(self.response), company_id=7)
+            if question is not None:
+                self.db.question_cache.put(question, key, company_id=7)
+            return dict(self.response)
+
+        self.resolve = mock.Mock(side_effect=resolve)
+        self.db._get_financial_data = self.resolve
+
+    def test_repeated_question_is_cached(self):
+        first = self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024')
+        second = self.db.get_financial_data(' hbl ', 'net profit', 'q1 2024')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.resolve.call_count, 1)
+        second['value'] = 0
+        self.assertEqual(self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024')['value'], 10.0)
+        self.assertEqual(self.db.get_result_cache_stats()['results']['hits'], 2)
+
+    def test_invalidation_forces_resolution(self):
+        self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024')
+
+        self.assertEqual(self.db.invalidate_cached_results(company_id=8), 0)
+        self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024')
+        self.assertEqual(self.resolve.call_count, 1)
+
+        self.assertEqual(self.db.invalidate_cached_results(company_id=7), 1)
+        self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024')
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_relative_periods_always_resolve(self):
+        # The latest period changes when a new quarter is loaded, so these re-run get_term_id
+        for _ in range(2):
+            self.db.get_financial_data('HBL', 'Net Profit', 'latest')
+            self.db.get_financial_data('HBL', 'Net Profit', 'TTM')
+            self.db.get_financial_data('HBL', 'Net Profit', 'Q1 2024', relative_type='last_quarter')
+            self.db.get_financial_data('HBL', 'Net Profit', '', is_relative_term=True)
+
+        self.assertEqual(self.resolve.call_count, 8)
+        self.assertEqual(self.db.get_result_cache_stats()['questions']['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+'''
+Unit tests for the in-memory schema catalog
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database import query_builder
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.schema_catalog import SchemaCatalog
+
+SCHEMA = pd.DataFrame([
+    ('tbl_financialrawdata', 'CompanyID', 'int'),
+    ('tbl_financialrawdata', 'SubHeadID', 'int'),
+    ('tbl_financialrawdata', 'Value_', 'float'),
+    ('tbl_financialrawdata', 'PeriodEnd', 'date'),
+    ('tbl_financialrawdataTTM', 'CompanyID', 'int'),
+    ('tbl_financialrawdataTTM', 'Value_', 'float'),
+], columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+
+
+class TestSchemaCatalog(unittest.TestCase):
+    """
+    Table existence and column names come from one INFORMATION_SCHEMA read
+    """
+
+    def setUp(self):
+        self.execute_query = mock.Mock(return_value=SCHEMA)
+        self.catalog = SchemaCatalog(self.execute_query).load()
+
+    def test_tables_and_columns(self):
+        self.assertTrue(self.catalog.loaded)
+        self.assertTrue(self.catalog.has_table('tbl_financialrawdataTTM'))
+        self.assertTrue(self.catalog.has_table('TBL_FINANCIALRAWDATA'))
+        self.assertFalse(self.catalog.has_table('tbl_financialrawdata_TTM'))
+        self.assertEqual(self.catalog.columns('tbl_financialrawdata'), ['CompanyID', 'SubHeadID', 'Value_', 'PeriodEnd'])
+        self.assertEqual(self.catalog.columns('tbl_missing'), [])
+        self.assertEqual(self.catalog.column_type('tbl_financialrawdata', 'PeriodEnd'), 'date')
+
+    def test_resolve_column(self):
+        self.assertEqual(self.catalog.resolve_column('tbl_financialrawdata', ['Amount', 'Value_'], 'Value'), 'Value_')
+        self.assertEqual(self.catalog.resolve_column('tbl_financialrawdata', ['FinDate'], 'PeriodEnd'), 'PeriodEnd')
+        self.assertEqual(self.catalog.resolve_column('tbl_missing', ['Value_'], 'Value'), 'Value')
+
+    def test_refresh_reloads(self):
+        self.execute_query.return_value = SCHEMA[SCHEMA['TABLE_NAME'] == 'tbl_financialrawdata']
+        self.catalog.refresh()
+
+        self.assertFalse(self.catalog.has_table('tbl_financialrawdataTTM'))
+        self.assertEqual(self.execute_query.call_count, 2)
+
+
+class TestSchemaLookups(unittest.TestCase):
+    """
+    Query builders resolve schema from the catalog instead of querying per build
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.execute_query = mock.Mock(return_value=SCHEMA)
+
+    def test_builders_use_one_schema_query(self):
+        for _ in range(3):
+            self.assertTrue(query_builder.check_table_exists(self.db, 'tbl_financialrawdataTTM'))
+            self.assertFalse(query_builder.check_table_exists(self.db, 'tbl_financialrawdata_Quarter'))
+            self.assertEqual(query_builder.get_column_name(self.db, 'tbl_financialrawdata', ['Amount', 'Value_'], 'Value'),
+                             'Value_')
+
+        self.assertEqual(self.db.execute_query.call_count, 1)
+
+    def test_falls_back_to_queries_when_catalog_fails(self):
+        def execute_query(query, params=None, timeout=None):
+            if 'ORDINAL_POSITION' in query and 'JOIN' in query:
+                raise RuntimeError('permission denied')
+            if 'INFORMATION_SCHEMA.TABLES' in query:
+                return pd.DataFrame({'found': [1]})
+            return pd.DataFrame({'COLUMN_NAME': ['CompanyID', 'Amount']})
+
+        self.db.execute_query = execute_query
+
+        self.assertIsNone(self.db.get_schema_catalog())
+        self.assertTrue(self.db.has_table('tbl_financialrawdata'))
+        self.assertEqual(self.db.get_column_name('tbl_financialrawdata', ['Amount', 'Value_'], 'Value'), 'Amount')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+'''
+Unit tests for the in-memory ratio screener
+'''
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.screener import Condition, RatioScreener
+
+ROE, PE, CEMENT_ROE = 100, 101, 200
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1, 2, 3, 4], 'CompanyName': ['UBL Ltd', 'HBL Ltd', 'MCB Ltd', 'Lucky Cement'],
+                               'Symbol': ['UBL', 'HBL', 'MCB', 'LUCK'], 'SectorID': [10, 10, 10, 20]}),
+    'sectors': pd.DataFrame({'SectorID': [10, 20], 'SectorName': ['Commercial Banks', 'Cement']}),
+    'industries': pd.DataFrame({'IndustryID': [100, 200], 'IndustryName': ['Banking', 'Cement']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10, 20], 'industryid': [100, 200]}),
+    'heads': pd.DataFrame({'SubHeadID': [11], 'SubHeadName': ['Net Profit'], 'IndustryID': [100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [ROE, PE, CEMENT_ROE],
+                                 'HeadNames': ['Return on Equity', 'Price to Earnings', 'Return on Equity'],
+                                 'IndustryID': [100, 100, 200]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1], 'term': ['12M']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+
+def ratio_rows(rows):
+    return pd.DataFrame(rows, columns=['CompanyID', 'SubHeadID', 'ConsolidationID', 'PeriodEnd', 'Value'])
+
+
+class FakeRatioTable:
+    """Answers the latest-row query from in-memory ratio rows"""
+
+    def __init__(self, rows):
+        self.rows = ratio_rows(rows)
+        self.queries = []
+
+    def fetch(self, query):
+        self.queries.append(query)
+        df = self.rows
+        since = (query.params or {}).get('since')
+        if since is not None:
+            df = df[df['PeriodEnd'] >= since]
+        return df.sort_values('PeriodEnd').drop_duplicates(['CompanyID', 'SubHeadID', 'ConsolidationID'], keep='last')
+
+
+class TestRatioScreener(unittest.TestCase):
+    """
+    Conditions, rankings and incremental refresh over the snapshot matrix
+    """
+
+    def setUp(self):
+        self.table = FakeRatioTable([
+            (1, ROE, 1, pd.Timestamp('2022-12-31'), 10.0),
+            (1, ROE, 1, pd.Timestamp('2023-12-31'), 25.0),
+            (1, PE, 1, pd.Timestamp('2023-12-31'), 4.0),
+            (2, ROE, 1, pd.Timestamp('2023-12-31'), 22.0),
+            (2, PE, 1, pd.Timestamp('2023-12-31'), 8.0),
+            (3, ROE, 1, pd.Timestamp('2021-12-31'), 30.0),
+            (3, PE, 1, pd.Timestamp('2021-12-31'), 5.0),
+            (4, CEMENT_ROE, 1, pd.Timestamp('2023-12-31'), 21.0),
+            (1, ROE, 2, pd.Timestamp('2023-12-31'), 12.0),
+        ])
+        self.screener = RatioScreener(self.table.fetch).build()
+
+    def test_matrix(self):
+        self.assertEqual(self.screener.company_ids.tolist(), [1, 2, 3, 4])
+        self.assertEqual(self.screener.head_ids.tolist(), [ROE, PE, CEMENT_ROE])
+        self.assertEqual(self.screener.values[1][0].tolist()[:2], [25.0, 4.0])
+        self.assertTrue(np.isnan(self.screener.values[2][1]).all())
+        self.assertEqual(len(self.table.queries), 1)
+
+    def test_conditions(self):
+        roe, pe = Condition((ROE,), '>', 20, 'ROE'), Condition((PE,), '<', 6, 'PE')
+
+        result = self.screener.screen([roe, pe], 1)
+
+        self.assertEqual(result['CompanyID'].tolist(), [3, 1])
+        self.assertEqual(result['ROE'].tolist(), [30.0, 25.0])
+        self.assertEqual(result['PE PeriodEnd'].tolist(), [pd.Timestamp('2021-12-31'), pd.Timestamp('2023-12-31')])
+        # Stale reports can be left out
+        self.assertEqual(self.screener.screen([roe, pe], 1, since='2023-01-01')['CompanyID'].tolist(), [1])
+        # Missing values fail their condition
+        self.assertTrue(self.screener.screen([roe, pe], 2).empty)
+        with self.assertRaises(ValueError):
+            Condition((ROE,), '=>', 20)
+
+    def test_ranking(self):
+        roe = Condition((ROE, CEMENT_ROE), '>', 0, 'ROE')
+
+        self.assertEqual(self.screener.screen([roe], 1, top=2)['CompanyID'].tolist(), [3, 1])
+        self.assertEqual(self.screener.screen([roe], 1, descending=False, top=2)['CompanyID'].tolist(), [4, 2])
+        by_pe = self.screener.screen([roe], 1, order_by=Condition((PE,), '>', 0), descending=False)
+        # Company 4 has no P/E and ranks last
+        self.assertEqual(by_pe['CompanyID'].tolist(), [1, 3, 2, 4])
+        self.assertEqual(self.screener.screen([roe], 1, company_ids=[2, 4])['CompanyID'].tolist(), [2, 4])
+
+    def test_refresh(self):
+        self.table.rows = pd.concat([self.table.rows, ratio_rows([
+            (2, PE, 1, pd.Timestamp('2024-03-31'), 5.5),
+            (5, ROE, 1, pd.Timestamp('2024-03-31'), 40.0),
+        ])], ignore_index=True)
+
+        updated = self.screener.refresh()
+
+        # Rows at the old watermark are re-read along with the new ones, but only changes count
+        self.assertEqual(self.table.queries[-1].params, {'since': pd.Timestamp('2023-12-31')})
+        self.assertEqual(updated, 2)
+        self.assertEqual(self.screener.refresh(), 0)
+        result = self.screener.screen([Condition((ROE,), '>', 20), Condition((PE,), '<', 6)], 1)
+        self.assertEqual(result['CompanyID'].tolist(), [3, 1, 2])
+        self.assertEqual(self.screener.screen([Condition((ROE,), '>', 35)], 1)['CompanyID'].tolist(), [5])
+
+    def test_refresh_publishes_a_new_matrix(self):
+        before = self.screener.matrix
+        values = before.values[1].copy()
+        self.table.rows = pd.concat([self.table.rows, ratio_rows([
+            (1, ROE, 1, pd.Timestamp('2024-03-31'), 26.0),
+            (5, ROE, 1, pd.Timestamp('2024-03-31'), 40.0),
+        ])], ignore_index=True)
+
+        self.screener.refresh()
+
+        # A screen still holding the old matrix sees consistent, unchanged arrays
+        self.assertIsNot(self.screener.matrix, before)
+        self.assertEqual(len(before.company_ids), before.values[1].shape[0])
+        np.testing.assert_array_equal(before.values[1], values)
+        self.assertEqual(self.screener.values[1].shape, (5, 3))
+
+    def test_maybe_refresh_skips_while_refreshing(self):
+        self.screener.refreshed_at -= 3600
+        with self.screener._lock:
+            self.screener.maybe_refresh()
+        self.assertEqual(len(self.table.queries), 1)
+
+        self.screener.maybe_refresh()
+        self.assertEqual(len(self.table.queries), 2)
+
+
+class TestScreenCompanies(unittest.TestCase):
+    """
+    screen_companies resolves names against the metadata and screens from memory
+    """
+
+    def setUp(self):
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.table = FakeRatioTable([
+            (1, ROE, 1, pd.Timestamp('2023-12-31'), 25.0),
+            (1, PE, 1, pd.Timestamp('2023-12-31'), 4.0),
+            (2, ROE, 1, pd.Timestamp('2023-12-31'), 22.0),
+            (2, PE, 1, pd.Timestamp('2023-12-31'), 8.0),
+            (4, CEMENT_ROE, 1, pd.Timestamp('2023-12-31'), 21.0),
+        ])
+        self.db.execute_query = self.table.fetch
+
+    def test_screen(self):
+        # The matrix loads on a background thread, never inside the request
+        self.assertTrue(self.db.screen_companies([('Return on Equity', '>', 20)]).empty)
+        self.db.update_ratio_screener_in_background().join()
+
+        result = self.db.screen_companies([('Return on Equity', '>', 20), ('price to earnings', '<', 6)])
+
+        self.assertEqual(result['Symbol'].tolist(), ['UBL'])
+        self.assertEqual(list(result.columns[:4]), ['CompanyID', 'Company', 'Symbol', 'Return on Equity'])
+
+        # Both industries' Return on Equity heads count
+        everyone = self.db.screen_companies([('Return on Equity', '>', 20)])
+        self.assertEqual(everyone['Symbol'].tolist(), ['UBL', 'HBL', 'LUCK'])
+        banks = self.db.screen_companies([('Return on Equity', '>', 20)], sector='commercial banks', top=1)
+        self.assertEqual(banks['Symbol'].tolist(), ['UBL'])
+        self.assertEqual(len(self.table.queries), 1)
+
+        self.assertTrue(self.db.screen_companies([('Dividend Yield', '>', 1)]).empty)
+        self.assertTrue(self.db.screen_companies([('Return on Equity', '>', 1)], sector='Steel').empty)
+
+    def test_refresh_runs_in_the_background(self):
+        self.db.update_ratio_screener_in_background().join()
+        self.db.ratio_screener.refreshed_at -= 3600
+        release = threading.Event()
+        fetch = self.table.fetch
+        self.db.ratio_screener.fetch = lambda query: release.wait(5) and fetch(query)
+
+        # A stale screener answers from the current matrix while one refresh runs
+        self.assertEqual(self.db.screen_companies([('Return on Equity', '>', 20)])['Symbol'].tolist(),
+                         ['UBL', 'HBL', 'LUCK'])
+        update = self.db.ratio_screener_update.thread
+        self.assertTrue(update.is_alive())
+        self.db.screen_companies([('Return on Equity', '>', 20)])
+        self.assertIs(self.db.ratio_screener_update.thread, update)
+        release.set()
+        update.join()
+        self.assertEqual(len(self.table.queries), 2)
+        self.assertFalse(self.db.ratio_screener.is_stale())
+
+
+if __name__ == '__main__':
+    unittest.main()
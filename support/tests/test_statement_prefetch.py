@@ -0,0 +1,180 @@
+'''
+Unit tests for the statement-level fetch and the sibling-metric prefetch
+'''
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.statement_prefetch import PrefetchStats, statement_query
+from support.tests.fake_server import FakeServer, data_rows
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1], 'CompanyName': ['United Bank Limited'], 'Symbol': ['UBL'], 'SectorID': [10]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'statements': pd.DataFrame({'StatementID': [1, 2], 'StatementName': ['Balance Sheet', 'Profit and Loss']}),
+    'heads': pd.DataFrame({'SubHeadID': [11, 12, 13, 21],
+                           'SubHeadName': ['Investments', 'Deposits', 'Share Capital', 'Net Profit'],
+                           'IndustryID': [100, 100, 100, 100], 'StatementID': [1, 1, 1, 2]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2], 'term': ['6M', '12M']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+TABLES = {
+    'tbl_financialrawdata': data_rows([
+        (1, 11, 2, 1, 2023, pd.Timestamp('2023-12-31'), 4000.0),
+        (1, 12, 2, 1, 2023, pd.Timestamp('2023-12-31'), 3700.0),
+        (1, 13, 2, 1, 2023, pd.Timestamp('2023-12-31'), 300.0),
+        (1, 21, 2, 1, 2023, pd.Timestamp('2023-12-31'), 60.0),
+        (1, 11, 2, 1, 2022, pd.Timestamp('2022-12-31'), 3500.0),
+    ]),
+}
+
+
+class TestStatementQuery(unittest.TestCase):
+    """
+    One statement reads every head of a statement, best row per head
+    """
+
+    def test_statement(self):
+        query = statement_query(['tbl_financialrawdata_Quarter', 'tbl_financialrawdata'], 1, 1, 4, 2, fiscal_year=2023)
+
+        self.assertEqual(query.name, 'statement_prefetch')
+        self.assertEqual(query.count('UNION ALL'), 1)
+        self.assertIn('JOIN tbl_statementsname s ON h.StatementID = s.StatementID', query)
+        self.assertIn('PARTITION BY b.SubHeadID ORDER BY b.BranchRank, b.PeriodEnd DESC', query)
+        self.assertEqual(query.params, {'company_id': 1, 'statement_id': 1, 'term_id': 4, 'fiscal_year': 2023,
+                                        'consolidation_id': 2})
+
+        by_period = statement_query(['tbl_financialrawdata'], 1, 1, 4, None, period_end='2023-12-31')
+        self.assertNotIn('consolidation_id', by_period.params)
+        self.assertEqual(by_period.params['period_end'], '2023-12-31')
+        with self.assertRaises(ValueError):
+            statement_query([], 1, 1, 4, 2)
+
+    def test_prefetch_stats(self):
+        stats = PrefetchStats(max_entries=2)
+        stats.record(['a', 'b', 'c'])
+
+        # The oldest key is forgotten beyond max_entries, and each key counts once
+        self.assertFalse(stats.hit('a'))
+        self.assertTrue(stats.hit('b'))
+        self.assertFalse(stats.hit('b'))
+        self.assertEqual(stats.stats(), {'statements': 1, 'prefetched': 3, 'used': 1, 'pending': 1, 'hit_rate': 1 / 3})
+
+
+class TestStatementPrefetch(unittest.TestCase):
+    """
+    Follow-up questions about the same statement are answered from the result cache
+    """
+
+    def setUp(self):
+        self.server = FakeServer(TABLES, METADATA)
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.db.execute_query = self.server.execute_query
+        self.db.session = mock.MagicMock()
+        self.db.question_cache.max_entries = 0
+        self.prefetches = []
+        submit = self.db.prefetch_statement_in_background
+        self.db.prefetch_statement_in_background = lambda *args: self.prefetches.append(submit(*args))
+
+    def ask(self, metric):
+        """Answer a question and let its background prefetch finish, as it does before a follow-up"""
+        response = self.db.get_financial_data('UBL', metric, '12M 2023')
+        while self.prefetches:
+            self.prefetches.pop().result()
+        return response
+
+    def test_follow_up_questions(self):
+        investments = self.ask('Investments')
+        self.assertEqual(investments['value'], 4000.0)
+        self.assertEqual(self.server.names().count('statement_prefetch'), 1)
+
+        self.server.queries.clear()
+        deposits = self.ask('Deposits')
+        capital = self.ask('Share Capital')
+
+        self.assertEqual((deposits['metric'], deposits['value'], deposits['date']),
+                         ('Deposits', 3700.0, '2023-12-31'))
+        self.assertEqual(capital['value'], 300.0)
+        # Both follow-ups hit the prefetched results; the statement is not read again
+        self.assertNotIn('query_plan', self.server.names())
+        self.assertNotIn('statement_prefetch', self.server.names())
+        stats = self.db.get_result_cache_stats()['prefetch']
+        self.assertEqual((stats['statements'], stats['prefetched'], stats['used'], stats['hit_rate']), (1, 2, 2, 1.0))
+
+        # Another statement is fetched with its own query
+        self.assertEqual(self.ask('Net Profit')['value'], 60.0)
+        self.assertEqual(self.server.names().count('statement_prefetch'), 1)
+        stats = self.db.get_result_cache_stats()['prefetch']
+        # Net Profit is the only line item of its statement, so nothing more was prefetched
+        self.assertEqual((stats['statements'], stats['prefetched'], stats['hit_rate']), (2, 2, 1.0))
+
+    def test_prefetch_runs_after_the_answer(self):
+        started, release = threading.Event(), threading.Event()
+        execute_query = self.server.execute_query
+
+        def blocking_execute_query(query, params=None, timeout=None):
+            if getattr(query, 'name', None) == 'statement_prefetch':
+                started.set()
+                release.wait(5)
+            return execute_query(query, params, timeout)
+        self.db.execute_query = blocking_execute_query
+
+        # The answer comes back while the statement query is still running
+        self.assertEqual(self.db.get_financial_data('UBL', 'Investments', '12M 2023')['value'], 4000.0)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(len(self.db.statement_cache), 0)
+        release.set()
+        self.assertEqual(self.prefetches.pop().result(), 2)
+        self.assertEqual(len(self.db.statement_cache), 1)
+
+    def test_close(self):
+        self.db.close()
+
+        # After shutdown the question is still answered, only the prefetch is skipped
+        self.assertEqual(self.db.get_financial_data('UBL', 'Investments', '12M 2023')['value'], 4000.0)
+        self.assertEqual(self.prefetches, [None])
+        self.assertNotIn('statement_prefetch', self.server.names())
+
+    def test_disabled(self):
+        with mock.patch('app.core.database.financial_db.config.STATEMENT_PREFETCH', False):
+            self.db.get_financial_data('UBL', 'Investments', '12M 2023')
+            self.db.get_financial_data('UBL', 'Deposits', '12M 2023')
+
+        self.assertNotIn('statement_prefetch', self.server.names())
+        self.assertEqual(self.server.names().count('query_plan'), 2)
+
+    def test_get_financial_statement(self):
+        statement = self.db.get_financial_statement('UBL', 'balance sheet', '12M 2023')
+
+        self.assertEqual(statement['Metric'].tolist(), ['Investments', 'Deposits', 'Share Capital'])
+        self.server.queries.clear()
+        self.assertEqual(self.db.get_financial_data('UBL', 'Investments', '12M 2023')['value'], 4000.0)
+        self.assertNotIn('query_plan', self.server.names())
+
+        self.assertTrue(self.db.get_financial_statement('UBL', 'Cash Flow', '12M 2023').empty)
+        self.assertTrue(self.db.get_financial_statement('XYZ', 'Balance Sheet', '12M 2023').empty)
+
+        # New data for the company drops the prefetched statement with its results
+        self.db.invalidate_cached_results(1)
+        self.assertEqual(len(self.db.statement_cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+'''
+Unit tests for time-series retrieval and the series cache
+'''
+
+import os
+import re
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.database.financial_db import FinancialDatabase
+from app.core.database.query_context import QueryContext
+from app.core.database.time_series import SERIES_COLUMNS, latest_row, period_row, series_query, to_series_frame
+from support.tests.fake_server import FakeServer, data_rows
+
+METADATA = {
+    'companies': pd.DataFrame({'CompanyID': [1], 'CompanyName': ['United Bank Limited'], 'Symbol': ['UBL'], 'SectorID': [10]}),
+    'sectors': pd.DataFrame({'SectorID': [10], 'SectorName': ['Commercial Banks']}),
+    'industries': pd.DataFrame({'IndustryID': [100], 'IndustryName': ['Banking']}),
+    'industry_sector_mapping': pd.DataFrame({'sectorid': [10], 'industryid': [100]}),
+    'heads': pd.DataFrame({'SubHeadID': [11], 'SubHeadName': ['Net Profit'], 'IndustryID': [100]}),
+    'ratio_heads': pd.DataFrame({'SubHeadID': [100], 'HeadNames': ['Return on Equity'], 'IndustryID': [100]}),
+    'consolidation': pd.DataFrame({'ConsolidationID': [1, 2], 'ConsolidationName': ['Consolidated', 'Unconsolidated']}),
+    'terms': pd.DataFrame({'TermID': [1, 2, 3, 4], 'term': ['3M', '6M', 'TTM', 'Q1']}),
+    'terms_mapping': pd.DataFrame(),
+    'dissection': pd.DataFrame(),
+}
+
+TABLES = {
+    'tbl_financialrawdata': data_rows([
+        (1, 11, 2, 2, 2022, pd.Timestamp('2022-06-30'), 9.0),
+        (1, 11, 2, 2, 2023, pd.Timestamp('2023-06-30'), 10.0),
+        (1, 11, 4, 2, 2023, pd.Timestamp('2023-03-31'), 4.0),
+    ]),
+    'tbl_financialrawdata_Quarter': data_rows([
+        (1, 11, 4, 2, 2023, pd.Timestamp('2023-03-31'), 5.0),
+        (1, 11, 4, 2, 2024, pd.Timestamp('2024-03-31'), 6.0),
+    ]),
+    'tbl_ratiorawdata': data_rows([
+        (1, 100, 2, 2, 2023, pd.Timestamp('2023-06-30'), 0.15),
+    ]),
+}
+
+
+class TestSeriesFrame(unittest.TestCase):
+    """
+    Series frames are PeriodEnd-indexed with compact numeric columns
+    """
+
+    def setUp(self):
+        self.frame = to_series_frame(pd.DataFrame({
+            'Source': ['tbl_financialrawdata_Quarter', 'tbl_financialrawdata', 'tbl_financialrawdata'],
+            'PeriodEnd': ['2024-03-31', '2023-03-31', '2023-06-30'], 'TermID': [4, 4, 2], 'FY': [2024, None, 2023],
+            'Value': ['6', '4', '10'], 'Term': ['Q1', 'Q1', '6M'], 'Unit': 'PKR mn', 'Company': 'United Bank Limited',
+            'Metric': 'Net Profit', 'Consolidation': 'Unconsolidated',
+        }))
+
+    def test_dtypes_and_index(self):
+        self.assertEqual(self.frame.columns.tolist(), SERIES_COLUMNS)
+        self.assertIsInstance(self.frame.index, pd.DatetimeIndex)
+        self.assertTrue(self.frame.index.is_monotonic_increasing)
+        self.assertEqual(self.frame['Value'].dtype, np.float64)
+        self.assertEqual(self.frame['FY'].tolist(), [0, 2023, 2024])
+        self.assertEqual(self.frame['Term'].dtype, 'category')
+        self.assertEqual(self.frame.attrs['unit'], 'PKR mn')
+
+    def test_lookups(self):
+        self.assertEqual(latest_row(self.frame, 'tbl_financialrawdata', term_id=4)['Value'], 4.0)
+        self.assertIsNone(latest_row(self.frame, 'tbl_financialrawdata', term_id=4, fiscal_year=2024))
+        self.assertEqual(latest_row(self.frame, 'tbl_financialrawdata', period_end='2023-06-30')['Value'], 10.0)
+        self.assertEqual(period_row(self.frame, 'Q1 2024')['Value'], 6.0)
+        # A missing FY falls back to the PeriodEnd year
+        self.assertEqual(period_row(self.frame, 'Q1 2023')['Value'], 4.0)
+        self.assertEqual(period_row(self.frame, 'FY 2023')['Value'], 10.0)
+        self.assertIsNone(period_row(self.frame, 'Q1 2022'))
+
+    def test_series_query_reads_every_table(self):
+        query = series_query(['tbl_financialrawdata', 'tbl_financialrawdataTTM'], 1, 11, False, 2)
+        self.assertEqual(query.count('UNION ALL'), 1)
+        self.assertIn('JOIN tbl_headsmaster h', query)
+        self.assertEqual(query.params, {'company_id': 1, 'head_id': 11, 'consolidation_id': 2})
+
+
+class TestTimeSeries(unittest.TestCase):
+    """
+    get_time_series reads a head's history with one query and serves later lookups from memory
+    """
+
+    def setUp(self):
+        self.server = FakeServer(TABLES, METADATA)
+        with mock.patch.object(FinancialDatabase, '_create_engine', return_value=None):
+            self.db = FinancialDatabase('server', 'database')
+        self.db.metadata_cache.update(METADATA)
+        self.db.execute_query = self.server.execute_query
+        self.db.session = mock.MagicMock()
+        self.db.result_cache.max_entries = self.db.question_cache.max_entries = 0
+
+    def series_queries(self):
+        return [query for query in self.server.queries if getattr(query, 'name', None) == 'time_series']
+
+    def test_one_query_across_tables(self):
+        series = self.db.get_time_series('UBL', 'Net Profit', 'unconsolidated')
+
+        self.assertEqual(len(self.series_queries()), 1)
+        self.assertEqual(len(series), 5)
+        self.assertEqual(set(series['Source']), {'tbl_financialrawdata', 'tbl_financialrawdata_Quarter'})
+        self.assertEqual(series.attrs['metric'], 'Net Profit')
+
+        again = self.db.get_time_series('UBL', 'Net Profit', 'unconsolidated')
+        pd.testing.assert_frame_equal(again, series)
+        self.assertEqual(len(self.series_queries()), 1)
+
+        self.assertIsNone(self.db.get_time_series('XYZ', 'Net Profit', 'unconsolidated'))
+        ratios = self.db.get_time_series('UBL', 'Return on Equity', 'unconsolidated')
+        self.assertEqual(ratios['Source'].unique().tolist(), ['tbl_ratiorawdata'])
+
+    def test_cached_series_answers_financial_data(self):
+        questions = [('Net Profit', '6M 2023'), ('Net Profit', 'Q1'), ('Return on Equity', '6M 2023')]
+        expected = [self.db.get_financial_data('UBL', metric, term, 'unconsolidated', context=QueryContext())
+                    for metric, term in questions]
+        self.db.get_time_series('UBL', 'Net Profit', 'unconsolidated')
+        self.db.get_time_series('UBL', 'Return on Equity', 'unconsolidated')
+        self.server.queries.clear()
+
+        answers = [self.db.get_financial_data('UBL', metric, term, 'unconsolidated', context=QueryContext())
+                   for metric, term in questions]
+
+        self.assertEqual(answers, expected)
+        self.assertFalse([query for query in self.server.queries if re.search(r'\bAS Value\b', query, re.I)])
+        # Quarterly terms prefer the Quarter table, as build_financial_query does
+        self.assertEqual(answers[1]['value'], 6.0)
+
+    def test_invalidation_drops_series(self):
+        self.db.get_time_series('UBL', 'Net Profit', 'unconsolidated')
+        self.db.invalidate_cached_results(company_id=1)
+        self.db.get_time_series('UBL', 'Net Profit', 'unconsolidated')
+        self.assertEqual(len(self.series_queries()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()